@@ -21,6 +21,7 @@ from libopensesame import item, debug
 from libqtopensesame import qtplugin
 import imp
 import os.path
+import sys
 
 class eyetracker_calibrate(item.item):
 
@@ -49,19 +50,31 @@ class eyetracker_calibrate(item.item):
 		# default values
 		self._text_eyelink = u'EyeLink'
 		self._text_smi = u'SMI'
+		self._text_iviewx = u'SMI (iViewX remote protocol, any platform)'
 		self._text_sdummy = u'simple dummy mode (does nothing)'
 		self._text_edummy = u'extended dummy mode (use mouse to simulate eye movement)'
 		self.tracker_type = self._text_sdummy
 		self.sacc_vel_thresh = 35
 		self.sacc_acc_thresh = 9500
 		self.cal_target_size = 16
+		self.target_cache = 16
 		self.cal_beep = u'yes'
 		self.force_drift_correct = u'no'
 		self.ip = u'127.0.0.1'
 		self.sendport = 4444
 		self.receiveport = 5555
+		self.continuous_recording = u'no'
 		self.screen_w = 399
 		self.screen_h = 299
+		self.screen_dist = 570
+		self.gaze_filter = u'none'
+		self.shm_name = u''
+		self.stream = u'no'
+		self.stream_tcp_port = 5600
+		self.stream_udp_port = 5601
+		self.worker = u'no'
+		self.quality = u'no'
+		self.link_health = u'no'
 
 		# the parent handles the rest of the construction
 		item.item.__init__(self, name, experiment, string)
@@ -98,6 +111,10 @@ class eyetracker_calibrate(item.item):
 		elif self.get(u'tracker_type') == self._text_smi:
 			libname = u'libsmi'
 
+		# SMI over the remote protocol
+		elif self.get(u'tracker_type') == self._text_iviewx:
+			libname = u'libiviewx'
+
 		# EXTENDED DUMMY
 		elif self.get(u'tracker_type') == self._text_edummy:
 			libname = u'libdummytracker'
@@ -106,22 +123,94 @@ class eyetracker_calibrate(item.item):
 		else:
 			libname = u'libdummy'
 
-		# dynamically load eyetracker library
-		path = os.path.join(os.path.dirname(__file__), u'trackers', u'%s.py' \
-			% libname)
+		# dynamically load eyetracker library. The helper modules in the
+		# trackers folder are imported by the libraries, so the folder needs to
+		# be on the path.
+		trackers = os.path.join(os.path.dirname(__file__), u'trackers')
+		if trackers not in sys.path:
+			sys.path.insert(0, trackers)
+		path = os.path.join(trackers, u'%s.py' % libname)
 		tracker_module = imp.load_source(libname, path)
+
+		# the pre-rendered targets, see libtarget
+		import libtarget
+		libtarget.get_cache(self.experiment, maxlen=self.get(u'target_cache'))
 		tracker_class = getattr(tracker_module, libname)
 		
 		# initialize eyetracker
 		debug.msg(u'loading %s' % libname)
-		self.experiment.eyetracker = tracker_class(
-			self.experiment, \
-			(self.get(u'width'), self.get(u'height')), \
-			data_file=data_file, \
-			saccade_velocity_threshold=self.get(u'sacc_vel_thresh'), \
-			saccade_acceleration_threshold=self.get(u'sacc_acc_thresh'), \
-			force_drift_correct=self.get(u'force_drift_correct')== u'yes'
-			)
+		resolution = self.get(u'width'), self.get(u'height')
+		kwargs = {
+			u'data_file' : data_file,
+			u'saccade_velocity_threshold' : self.get(u'sacc_vel_thresh'),
+			u'saccade_acceleration_threshold' : self.get(u'sacc_acc_thresh'),
+			u'force_drift_correct' : self.get(u'force_drift_correct') == u'yes',
+			u'ip' : self.get(u'ip'),
+			u'sendport' : self.get(u'sendport'),
+			u'receiveport' : self.get(u'receiveport'),
+			u'screen_w' : self.get(u'screen_w'),
+			u'screen_h' : self.get(u'screen_h'),
+			u'screen_dist' : self.get(u'screen_dist'),
+			u'gaze_filter' : self.get(u'gaze_filter'),
+			u'continuous_recording' : self.get(u'continuous_recording') == u'yes'
+			}
+		kwargs = dict((str(key), value) for key, value in kwargs.items())
+		shm_name = None
+		if self.get(u'shm_name') != u'':
+			shm_name = str(self.get(u'shm_name'))
+		# the dummies need the display of the experiment in their sampler
+		# thread, so they always run in this process
+		self._worker = self.get(u'worker') == u'yes' and libname in \
+			[u'libeyelink', u'libsmi']
+		if self._worker:
+			import libworker
+			self.experiment.eyetracker = libworker.proxy(self.experiment, \
+				path, libname, args=(resolution,), kwargs=kwargs, \
+				shm_name=shm_name)
+		else:
+			self.experiment.eyetracker = tracker_class(self.experiment, \
+				resolution, **kwargs)
+
+		# share the samples with other processes on this computer
+		if shm_name != None:
+			self.experiment.eyetracker.start_sampler(shm_name=shm_name)
+
+		# stream samples and events over TCP and UDP; in a worker, the server
+		# runs in the worker as well
+		self._stream_server = None
+		if self.get(u'stream') == u'yes':
+			stream_kwargs = {
+				'tcp_port' : self.get(u'stream_tcp_port'),
+				'udp_port' : self.get(u'stream_udp_port'),
+				'velocity_threshold' : self.get(u'sacc_vel_thresh')
+				}
+			if self._worker:
+				self.experiment.eyetracker.start_stream(**stream_kwargs)
+			else:
+				import libstream
+				self._stream_server = libstream.start( \
+					self.experiment.eyetracker, **stream_kwargs)
+
+		# keep statistics of the data quality of every trial, which are
+		# summarized by eyetracker_stop_recording
+		self.experiment.eyetracker_quality = None
+		if self.get(u'quality') == u'yes':
+			import libquality
+			self.experiment.eyetracker_quality = libquality.start( \
+				self.experiment.eyetracker, \
+				velocity_threshold=self.get(u'sacc_vel_thresh'))
+
+		# count gaps, stalls, and link errors during every trial, which are
+		# summarized by eyetracker_stop_recording
+		self.experiment.eyetracker_health = None
+		if self.get(u'link_health') == u'yes':
+			import libhealth
+			self.experiment.eyetracker_health = libhealth.start( \
+				self.experiment.eyetracker)
+
+		# the state of the eyes for eyetracker_sample, which is started by the
+		# first eyetracker_sample item that needs it (see libstate)
+		self.experiment.eyetracker_state = None
 
 		# update cleanup functions
 		self.experiment.cleanup_functions.append(self.close)
@@ -137,6 +226,18 @@ class eyetracker_calibrate(item.item):
 		"""
 
 		debug.msg(u'starting eyetracker deinitialisation')
+		if self.experiment.eyetracker_quality != None:
+			self.experiment.eyetracker_quality.stop()
+			self.experiment.eyetracker_quality = None
+		if self.experiment.eyetracker_health != None:
+			self.experiment.eyetracker_health.stop()
+			self.experiment.eyetracker_health = None
+		if self.experiment.eyetracker_state != None:
+			self.experiment.eyetracker_state.stop()
+			self.experiment.eyetracker_state = None
+		if self._stream_server != None:
+			self._stream_server.stop()
+			self._stream_server = None
 		self.sleep(100)
 		self.experiment.eyetracker.close()
 		self.experiment.eyetracker = None
@@ -188,16 +289,21 @@ class qteyetracker_calibrate(eyetracker_calibrate, qtplugin.qtplugin):
 		
 		# general
 		self.add_combobox_control("tracker_type", "Tracker type", \
-			[self._text_eyelink, self._text_smi, self._text_sdummy, self._text_edummy], \
+			[self._text_eyelink, self._text_smi, self._text_iviewx, self._text_sdummy, self._text_edummy], \
 			tooltip = "Indicates the tracker type")
 		self.add_checkbox_control("cal_beep", "Calibration beep", \
 			tooltip = "Indicates whether a beep sounds when the calibration target jumps")
 		self.add_spinbox_control("cal_target_size", "Calibration target size", 0, 256,
 			tooltip = "The size of the calibration target in pixels")
+		self.add_spinbox_control("target_cache", "Pre-rendered targets", 1, 256,
+			tooltip = "The number of target displays that is kept in memory, so that they can be shown without delay; every display takes as much memory as a screenshot")
 		self.add_line_edit_control("sacc_vel_thresh", "Saccade velocity threshold", \
 			tooltip = "Saccade detection parameter")
 		self.add_line_edit_control("sacc_acc_thresh", "Saccade acceleration threshold", \
 			tooltip = "Saccade detection parameter")
+		self._filterwidget = self.add_combobox_control("gaze_filter", "Online gaze filter", \
+			[u'none', u'moving average', u'heuristic', u'one-euro'], \
+			tooltip = "Smooths the gaze position that is used for gaze-contingent displays; every filter adds some latency")
 		
 		# EyeLink only
 #		self.add_text("<br><b>EyeLink only</b>")
@@ -214,10 +320,30 @@ class qteyetracker_calibrate(eyetracker_calibrate, qtplugin.qtplugin):
 			tooltip = "port number for iViewX sending")
 		self._receiveportwidget = self.add_line_edit_control("receiveport", "iViewX receive port (SMI)", \
 			tooltip = "port number for iViewX receiving")
-		self._wwidget = self.add_spinbox_control("screen_w", "Physical screen width (SMI)", 0, 9999,
+		self._continuouswidget = self.add_checkbox_control("continuous_recording", "Keep recording between trials (SMI)", \
+			tooltip = "Records from the first start of recording until the end of the experiment; drift checks and trials only mark their start and end with a message")
+		# Geometry
+		self._wwidget = self.add_spinbox_control("screen_w", "Physical screen width", 0, 9999,
 			suffix=u'mm', tooltip = "The width of the screen in millimeters; used for event detection")
-		self._hwidget = self.add_spinbox_control("screen_h", "Physical screen height (SMI)", 0, 9999,
+		self._hwidget = self.add_spinbox_control("screen_h", "Physical screen height", 0, 9999,
 			suffix=u'mm', tooltip = "The height of the screen in millimeters; used for event detection")
+		self._distwidget = self.add_spinbox_control("screen_dist", "Viewing distance", 0, 9999,
+			suffix=u'mm', tooltip = "The distance between the eyes and the screen in millimeters; the SMI measures this during calibration")
+		# Sharing
+		self._shmwidget = self.add_line_edit_control("shm_name", "Shared-memory name", \
+			tooltip = "Publishes all samples in a shared-memory segment with this name, so that other processes can read them with libshm.gaze_reader; leave empty to disable")
+		self._streamwidget = self.add_checkbox_control("stream", "Stream samples and events (TCP/UDP)", \
+			tooltip = "Streams all samples and events to subscribers on this computer; see trackers/libstream.py for the protocol")
+		self._tcpwidget = self.add_spinbox_control("stream_tcp_port", "Stream TCP port", 1, 65535,
+			tooltip = "The TCP port of the stream")
+		self._udpwidget = self.add_spinbox_control("stream_udp_port", "Stream UDP port", 1, 65535,
+			tooltip = "The UDP port of the stream")
+		self._workerwidget = self.add_checkbox_control("worker", "Run tracker in a separate process", \
+			tooltip = "Runs all communication with the tracker in a worker process, so that it does not slow down the display (EyeLink and SMI only)")
+		self._qualitywidget = self.add_checkbox_control("quality", "Monitor data quality per trial", \
+			tooltip = "Keeps track of precision, data loss and drift between start and stop recording; see eyetracker_stop_recording for the thresholds")
+		self._healthwidget = self.add_checkbox_control("link_health", "Monitor link health per trial", \
+			tooltip = "Counts gaps in the samples, stalls of the link, link errors and lost events between start and stop recording, and logs them at stop recording. Unless the tracker queues every sample, gaps and stalls include samples that the sampler thread missed, see trackers/libhealth.py")
 		# version number
 		self.add_text("<br><br><small><b>OpenSesame EyeTracker plug-in v%.2f</b></small>" % self.version)
 
@@ -246,11 +372,21 @@ class qteyetracker_calibrate(eyetracker_calibrate, qtplugin.qtplugin):
 		qtplugin.qtplugin.edit_widget(self)
 		# disable EyeLink and SMI specific widgets
 		self._driftwidget.setDisabled(self.get(u'tracker_type') != self._text_eyelink)
-		self._ipwidget.setDisabled(self.get(u'tracker_type') != self._text_smi)
-		self._sendportwidget.setDisabled(self.get(u'tracker_type') != self._text_smi)
-		self._receiveportwidget.setDisabled(self.get(u'tracker_type') != self._text_smi)
-		self._wwidget.setDisabled(self.get(u'tracker_type') != self._text_smi)
-		self._hwidget.setDisabled(self.get(u'tracker_type') != self._text_smi)
+		self._ipwidget.setDisabled(self.get(u'tracker_type') not in [self._text_smi, self._text_iviewx])
+		self._sendportwidget.setDisabled(self.get(u'tracker_type') not in [self._text_smi, self._text_iviewx])
+		self._receiveportwidget.setDisabled(self.get(u'tracker_type') not in [self._text_smi, self._text_iviewx])
+		self._continuouswidget.setDisabled(self.get(u'tracker_type') not in [self._text_smi, self._text_iviewx])
+		self._wwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._hwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._distwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._filterwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._shmwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._workerwidget.setDisabled(self.get(u'tracker_type') not in [self._text_eyelink, self._text_smi])
+		self._qualitywidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._healthwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._streamwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy)
+		self._tcpwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy or self.get(u'stream') != u'yes')
+		self._udpwidget.setDisabled(self.get(u'tracker_type') == self._text_sdummy or self.get(u'stream') != u'yes')
 		# unlock
 		self.lock = False
 		return self._edit_widget
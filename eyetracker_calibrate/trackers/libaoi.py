@@ -0,0 +1,364 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Areas of interest (AOIs). An aoi_index holds any number of rectangles,
+# circles and polygons in a uniform grid, so that finding the AOI that
+# contains a gaze sample only requires testing the few AOIs that overlap the
+# grid cell of the sample. This keeps hit testing fast enough to run on every
+# sample, also for displays with hundreds of AOIs.
+
+from libopensesame import exceptions
+import libonline
+import libwait
+
+class aoi:
+
+	"""The base class for areas of interest."""
+
+	def __init__(self, name, bbox):
+
+		"""
+		Constructor.
+
+		Arguments:
+		name	--	The name of the AOI.
+		bbox	--	The (left, top, right, bottom) bounding box of the AOI.
+		"""
+
+		self.name = name
+		self.bbox = bbox
+
+	def contains(self, x, y):
+
+		"""<DOC>
+		Checks whether a point falls inside the AOI.
+
+		Arguments:
+		x	--	The horizontal position in pixels.
+		y	--	The vertical position in pixels.
+
+		Returns:
+		True if the point falls inside the AOI, False otherwise.
+		</DOC>"""
+
+		raise NotImplementedError()
+
+	def __repr__(self):
+
+		return u'%s(%s)' % (self.__class__.__name__, self.name)
+
+class rect_aoi(aoi):
+
+	"""A rectangular AOI."""
+
+	def __init__(self, name, x, y, w, h):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		name	--	The name of the AOI.
+		x		--	The left of the rectangle.
+		y		--	The top of the rectangle.
+		w		--	The width of the rectangle.
+		h		--	The height of the rectangle.
+		</DOC>"""
+
+		aoi.__init__(self, name, (x, y, x + w, y + h))
+
+	def contains(self, x, y):
+
+		l, t, r, b = self.bbox
+		return l <= x <= r and t <= y <= b
+
+class circle_aoi(aoi):
+
+	"""A circular AOI."""
+
+	def __init__(self, name, x, y, r):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		name	--	The name of the AOI.
+		x		--	The horizontal center of the circle.
+		y		--	The vertical center of the circle.
+		r		--	The radius of the circle.
+		</DOC>"""
+
+		aoi.__init__(self, name, (x - r, y - r, x + r, y + r))
+		self.x = x
+		self.y = y
+		self.r2 = r ** 2
+
+	def contains(self, x, y):
+
+		return (x - self.x) ** 2 + (y - self.y) ** 2 <= self.r2
+
+class polygon_aoi(aoi):
+
+	"""A polygonal AOI."""
+
+	def __init__(self, name, points):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		name	--	The name of the AOI.
+		points	--	A list of (x, y) tuples with the vertices of the polygon.
+		</DOC>"""
+
+		if len(points) < 3:
+			raise exceptions.runtime_error( \
+				u'Polygon AOI \'%s\' needs at least three points' % name)
+		xs = [p[0] for p in points]
+		ys = [p[1] for p in points]
+		aoi.__init__(self, name, (min(xs), min(ys), max(xs), max(ys)))
+		# The edges are stored once, as (x1, y1, x2, y2) tuples
+		self.edges = [(points[i - 1][0], points[i - 1][1], points[i][0], \
+			points[i][1]) for i in range(len(points))]
+
+	def contains(self, x, y):
+
+		# Even-odd rule: count the edges that a ray to the right crosses
+		l, t, r, b = self.bbox
+		if not (l <= x <= r and t <= y <= b):
+			return False
+		inside = False
+		for x1, y1, x2, y2 in self.edges:
+			if (y1 > y) != (y2 > y) and \
+				x < x1 + (y - y1) * (x2 - x1) / float(y2 - y1):
+				inside = not inside
+		return inside
+
+class aoi_index:
+
+	"""
+	A collection of AOIs in a uniform grid. Every grid cell lists the AOIs
+	whose bounding box overlaps the cell, so a hit test only examines the AOIs
+	in a single cell.
+	"""
+
+	def __init__(self, aois=[], cell_size=None):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		aois		--	A list of AOIs. (default=[])
+		cell_size	--	The size of the grid cells in pixels, or None to #
+						derive the size from the average size of the AOIs. #
+						(default=None)
+		</DOC>"""
+
+		self.aois = []
+		self._cell_size = cell_size
+		self._grid = {}
+		for a in aois:
+			self.aois.append(a)
+		self.build()
+
+	def add(self, a):
+
+		"""<DOC>
+		Adds an AOI and rebuilds the grid.
+
+		Arguments:
+		a	--	An AOI.
+		</DOC>"""
+
+		self.aois.append(a)
+		self.build()
+
+	def build(self):
+
+		"""<DOC>
+		(Re)builds the grid. This is done automatically when AOIs are added.
+		</DOC>"""
+
+		self._grid = {}
+		if len(self.aois) == 0:
+			self.cell_size = 1
+			return
+		if self._cell_size != None:
+			self.cell_size = self._cell_size
+		else:
+			size = 0.
+			for a in self.aois:
+				l, t, r, b = a.bbox
+				size += max(r - l, b - t)
+			self.cell_size = max(1, int(size / len(self.aois)))
+		cs = self.cell_size
+		for a in self.aois:
+			l, t, r, b = a.bbox
+			for col in range(int(l // cs), int(r // cs) + 1):
+				for row in range(int(t // cs), int(b // cs) + 1):
+					self._grid.setdefault((col, row), []).append(a)
+
+	def hit(self, x, y):
+
+		"""<DOC>
+		Finds the AOI that contains a point. If AOIs overlap, the AOI that #
+		was added first is returned.
+
+		Arguments:
+		x	--	The horizontal position in pixels.
+		y	--	The vertical position in pixels.
+
+		Returns:
+		An AOI, or None if the point does not fall inside any AOI.
+		</DOC>"""
+
+		cell = self._grid.get((int(x // self.cell_size), \
+			int(y // self.cell_size)))
+		if cell == None:
+			return None
+		for a in cell:
+			if a.contains(x, y):
+				return a
+		return None
+
+	def hits(self, x, y):
+
+		"""<DOC>
+		Finds all AOIs that contain a point.
+
+		Arguments:
+		x	--	The horizontal position in pixels.
+		y	--	The vertical position in pixels.
+
+		Returns:
+		A list of AOIs.
+		</DOC>"""
+
+		cell = self._grid.get((int(x // self.cell_size), \
+			int(y // self.cell_size)), [])
+		return [a for a in cell if a.contains(x, y)]
+
+	def __len__(self):
+
+		return len(self.aois)
+
+def parse(text, offset=(0, 0)):
+
+	"""<DOC>
+	Creates an aoi_index from a text definition. Each line defines one AOI, #
+	as one of:
+
+		rect [name] [x] [y] [w] [h]
+		circle [name] [x] [y] [r]
+		polygon [name] [x1] [y1] [x2] [y2] [x3] [y3] ...
+
+	Empty lines and lines starting with '#' are ignored.
+
+	Arguments:
+	text	--	The definition.
+
+	Keyword arguments:
+	offset	--	An (x, y) tuple that is added to all coordinates, for #
+				example to convert coordinates that are relative to the #
+				display center. (default=(0, 0))
+
+	Returns:
+	An aoi_index.
+	</DOC>"""
+
+	aois = []
+	ox, oy = offset
+	for line in text.split(u'\n'):
+		l = line.split()
+		if len(l) == 0 or l[0].startswith(u'#'):
+			continue
+		try:
+			shape = l[0]
+			name = l[1]
+			values = [float(v) for v in l[2:]]
+			if shape == u'rect' and len(values) == 4:
+				a = rect_aoi(name, values[0] + ox, values[1] + oy, values[2], \
+					values[3])
+			elif shape == u'circle' and len(values) == 3:
+				a = circle_aoi(name, values[0] + ox, values[1] + oy, values[2])
+			elif shape == u'polygon' and len(values) % 2 == 0:
+				a = polygon_aoi(name, [(values[i] + ox, values[i + 1] + oy) \
+					for i in range(0, len(values), 2)])
+			else:
+				raise ValueError()
+		except (ValueError, IndexError):
+			raise exceptions.runtime_error(u'Invalid AOI definition: \'%s\'' \
+				% line)
+		aois.append(a)
+	return aoi_index(aois)
+
+def wait_for_aoi(tracker, index, fixation=False, leave=False, timeout=None):
+
+	"""<DOC>
+	Waits until gaze enters or leaves an AOI. This is the implementation of #
+	wait_for_aoi() in the tracker libraries.
+
+	If `leave` is False, the function returns as soon as a sample (or the #
+	start of a fixation) falls inside an AOI; this may be immediately. If #
+	`leave` is True, the function waits until gaze has left the AOI that it #
+	was in, and returns the AOI that was left. Missing samples are ignored.
+
+	Arguments:
+	tracker		--	A tracker object.
+	index		--	An aoi_index.
+
+	Keyword arguments:
+	fixation	--	Indicates whether fixation starts (True) or individual #
+					samples (False) should be used. (default=False)
+	leave		--	Indicates whether to wait until gaze leaves (True) or #
+					enters (False) an AOI. (default=False)
+	timeout		--	A timeout in milliseconds, or None for no timeout. #
+					(default=None)
+
+	Returns:
+	A (timestamp, aoi) tuple with the timestamp in experiment time. On a #
+	timeout, the aoi is None.
+	</DOC>"""
+
+	current = None
+	pace = libwait.pacer(getattr(tracker, u'samplerate', 0))
+	t0 = tracker.experiment.time()
+	while True:
+		if timeout != None:
+			remaining = timeout - (tracker.experiment.time() - t0)
+			if remaining <= 0:
+				return tracker.experiment.time(), None
+		if fixation and timeout != None:
+			# wait_for_fixation_start() can't time out, but wait_for_events()
+			# can
+			event, t, pos, endpos = tracker.wait_for_events( \
+				[libonline.STARTFIX], remaining)
+			if event == None:
+				return t, None
+		elif fixation:
+			pos = tracker.wait_for_fixation_start()[1]
+		else:
+			pos = pace.poll(tracker.sample)
+		if pos == None or pos == (-1, -1) or pos == (0, 0):
+			continue
+		a = index.hit(pos[0], pos[1])
+		if not leave:
+			if a != None:
+				return tracker.experiment.time(), a
+		elif current != None and a is not current:
+			return tracker.experiment.time(), current
+		elif a != None:
+			current = a
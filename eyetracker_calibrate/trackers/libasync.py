@@ -0,0 +1,617 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# An asyncio interface to the trackers, for experiments that are driven by an
+# event loop. Instead of blocking, every function returns a future, so that a
+# single event loop can wait for gaze events, key presses and network
+# messages at the same time.
+#
+# The plug-ins run on Python 2, which has no asyncio: this module needs
+# trollius (pip install trollius), the Python 2 port of asyncio, and
+# async_tracker() raises an error without it. With trollius, coroutines are
+# generators that yield From() the futures:
+#
+#	import trollius
+#	from trollius import From
+#
+#	@trollius.coroutine
+#	def trial(gaze):
+#		event = yield From(gaze.wait_for_event(libonline.STARTSACC, \
+#			timeout=2000))
+#		samples = gaze.samples()
+#		while True:
+#			t, x, y, pupil = yield From(samples.get())
+#			...
+#
+#	gaze = libasync.async_tracker(exp.eyetracker)
+#	gaze.loop.run_until_complete(trial(gaze))
+#
+# The module doesn't use the async/await syntax, so that it can be imported
+# by Python 2. Where asyncio itself is available, the futures can be awaited,
+# and samples() and events() work with async for.
+#
+# Samples and events are pushed by the acquisition thread of the tracker (see
+# libsampler): the thread hands new samples to the event loop, which detects
+# events in them (see libonline) and resolves the futures. Nothing polls while
+# the loop is waiting. For a tracker in a worker process (see libworker),
+# whose sampler runs in the worker, a thread reads the shared-memory ring
+# instead.
+#
+# The functions that talk to the tracker, such as start_recording() and
+# log(), run one at a time in a dedicated thread. calibrate() and
+# drift_correction() draw on the display and collect responses, which the
+# display back-ends of OpenSesame only allow in the thread that opened the
+# display. They are therefore handed to the event loop, which runs in that
+# thread, in turn with the other functions. The loop is blocked while they
+# run, as the experiment is during a calibration anyway.
+
+import collections
+import sys
+import threading
+
+try:
+	import asyncio
+except ImportError:
+	try:
+		import trollius as asyncio
+	except ImportError:
+		asyncio = None
+
+import libonline
+import libsampler
+import libwait
+
+if sys.version_info[0] >= 3:
+	_end = StopAsyncIteration
+else:
+	_end = StopIteration
+
+class _serial:
+
+	"""
+	Runs functions one at a time in a thread, and resolves futures. Functions
+	that must run in the thread of the event loop are handed to the loop in
+	turn.
+	"""
+
+	def __init__(self, loop):
+
+		"""
+		Constructor.
+
+		Arguments:
+		loop	--	The event loop.
+		"""
+
+		self.loop = loop
+		self.queue = collections.deque()
+		self.ready = threading.Condition()
+		self.thread = None
+
+	def submit(self, future, func, *args, **kwargs):
+
+		"""
+		Schedules a function.
+
+		Arguments:
+		future	--	A future that is resolved with the result.
+		func	--	The function.
+
+		Returns:
+		The future.
+		"""
+
+		return self._submit(future, func, args, kwargs, False)
+
+	def submit_in_loop(self, future, func, *args, **kwargs):
+
+		"""
+		Schedules a function that runs in the thread of the event loop, after
+		the functions that have been scheduled before.
+
+		Arguments:
+		future	--	A future that is resolved with the result.
+		func	--	The function.
+
+		Returns:
+		The future.
+		"""
+
+		return self._submit(future, func, args, kwargs, True)
+
+	def _submit(self, future, func, args, kwargs, in_loop):
+
+		with self.ready:
+			self.queue.append((future, func, args, kwargs, in_loop))
+			if self.thread == None:
+				self.thread = threading.Thread(target=self._run, \
+					name=u'eyetracker async')
+				self.thread.daemon = True
+				self.thread.start()
+			self.ready.notify()
+		return future
+
+	def _run(self):
+
+		while True:
+			with self.ready:
+				while len(self.queue) == 0:
+					self.ready.wait()
+				future, func, args, kwargs, in_loop = self.queue.popleft()
+			if func == None:
+				return
+			if in_loop:
+				# The next function waits until the loop has run this one
+				done = threading.Event()
+				try:
+					self.loop.call_soon_threadsafe(self._call, future, func, \
+						args, kwargs, done)
+				except RuntimeError:
+					# The loop has been closed
+					continue
+				done.wait()
+				continue
+			try:
+				result = func(*args, **kwargs)
+			except Exception as e:
+				self.loop.call_soon_threadsafe(_resolve, future, None, e)
+			else:
+				self.loop.call_soon_threadsafe(_resolve, future, result, None)
+
+	def _call(self, future, func, args, kwargs, done):
+
+		"""
+		Runs a function in the event loop, and resolves its future.
+
+		Arguments:
+		future	--	The future.
+		func	--	The function.
+		args	--	The positional arguments.
+		kwargs	--	The keyword arguments.
+		done	--	A threading.Event that is set afterwards.
+		"""
+
+		try:
+			if not future.done():
+				_resolve(future, func(*args, **kwargs), None)
+		except Exception as e:
+			_resolve(future, None, e)
+		finally:
+			done.set()
+
+	def stop(self):
+
+		"""Stops the thread after the scheduled functions."""
+
+		with self.ready:
+			if self.thread != None:
+				self.queue.append((None, None, None, None, False))
+				self.ready.notify()
+
+def _resolve(future, result, exception):
+
+	"""
+	Resolves a future, unless it has been cancelled.
+
+	Arguments:
+	future		--	The future.
+	result		--	The result.
+	exception	--	An exception, or None.
+	"""
+
+	if future.done():
+		return
+	if exception != None:
+		future.set_exception(exception)
+	else:
+		future.set_result(result)
+
+class _iterator:
+
+	"""An asynchronous iterator over samples or events."""
+
+	def __init__(self, source, events=None, maxlen=10000):
+
+		"""
+		Constructor.
+
+		Arguments:
+		source	--	An async_tracker.
+
+		Keyword arguments:
+		events	--	A list of event codes, or None to iterate over samples. #
+					(default=None)
+		maxlen	--	The maximum number of items that is kept while nobody #
+					is waiting. Older items are dropped. (default=10000)
+		"""
+
+		self.source = source
+		self.events = events
+		self.items = collections.deque(maxlen=maxlen)
+		self.waiter = None
+		self.closed = False
+
+	def put(self, item):
+
+		"""
+		Adds an item. Called from the event loop.
+
+		Arguments:
+		item	--	The item.
+		"""
+
+		if self.waiter != None and not self.waiter.done():
+			self.waiter.set_result(item)
+			self.waiter = None
+		else:
+			self.items.append(item)
+
+	def get(self):
+
+		"""<DOC>
+		Gets the next item.
+
+		Returns:
+		A future with the item.
+		</DOC>"""
+
+		future = self.source._future()
+		if len(self.items) > 0:
+			future.set_result(self.items.popleft())
+		elif self.closed:
+			future.set_exception(_end())
+		else:
+			self.waiter = future
+		return future
+
+	def close(self):
+
+		"""<DOC>
+		Ends the iteration.
+		</DOC>"""
+
+		self.closed = True
+		self.source._iterators.discard(self)
+		if self.waiter != None and not self.waiter.done():
+			self.waiter.set_exception(_end())
+		self.waiter = None
+
+	def __aiter__(self):
+
+		return self
+
+	__anext__ = get
+
+class async_tracker:
+
+	"""Awaitable functions for a tracker."""
+
+	def __init__(self, tracker, loop=None, velocity_threshold=35):
+
+		"""<DOC>
+		Constructor. Starts the sampler thread of the tracker if it isn't #
+		running yet.
+
+		Arguments:
+		tracker				--	A tracker object.
+
+		Keyword arguments:
+		loop				--	The event loop, or None for the current #
+								event loop. (default=None)
+		velocity_threshold	--	The saccade velocity threshold in degrees #
+								per second that is used for event detection. #
+								(default=35)
+		</DOC>"""
+
+		if asyncio == None:
+			from libopensesame import exceptions
+			raise exceptions.runtime_error( \
+				u'libasync requires trollius on Python 2 (pip install trollius), or asyncio on Python 3')
+		self.tracker = tracker
+		self.loop = loop if loop != None else asyncio.get_event_loop()
+		self._serial = _serial(self.loop)
+		self._pending = collections.deque()
+		self._scheduled = False
+		self._waiters = []
+		self._iterators = set()
+		self._thread = None
+		self._halt = threading.Event()
+		self.latest = None
+		self._reader = libsampler.reader(tracker)
+		if self._reader == None:
+			from libopensesame import exceptions
+			raise exceptions.runtime_error( \
+				u'libasync needs a tracker with a sampler thread')
+		samplerate = self._reader.samplerate
+		if getattr(tracker, u'_reader', None) == None:
+			# The sampler thread runs in this process, and pushes the samples
+			self._reader.close()
+			self._reader = None
+			tracker.sampler.add_listener(self._push)
+		else:
+			# A worker proxy, see libworker
+			self._thread = threading.Thread(target=self._follow, \
+				args=(self._reader,), name=u'eyetracker async reader')
+			self._thread.daemon = True
+			self._thread.start()
+		self.detector = libonline.create(tracker.geometry, samplerate, \
+			velocity_threshold=velocity_threshold)
+
+	def _future(self):
+
+		"""
+		Creates a future on the event loop.
+
+		Returns:
+		A future.
+		"""
+
+		if hasattr(self.loop, u'create_future'):
+			return self.loop.create_future()
+		return asyncio.Future(loop=self.loop)
+
+	def _push(self, sample):
+
+		"""
+		Receives a sample in the sampler thread, and hands it to the event #
+		loop. Samples are passed on in batches, so that the loop is woken up #
+		once for all samples that arrive while it is busy.
+
+		Arguments:
+		sample	--	A (time, x, y, pupil) tuple.
+		"""
+
+		self._pending.append(sample)
+		if not self._scheduled:
+			self._scheduled = True
+			try:
+				self.loop.call_soon_threadsafe(self._dispatch)
+			except RuntimeError:
+				# The loop has been closed
+				pass
+
+	def _follow(self, reader):
+
+		"""
+		Reads the shared-memory ring of a worker, and passes the samples on #
+		like _push() does.
+
+		Arguments:
+		reader	--	A libshm.gaze_reader.
+		"""
+
+		count = reader.count
+		pace = libwait.pacer(reader.samplerate)
+		while not self._halt.is_set():
+			pace.wait()
+			samples, count = reader.since(count)
+			pace.update(len(samples) > 0)
+			for s in samples.tolist():
+				self._push(s)
+
+	def _dispatch(self):
+
+		"""Processes the pending samples in the event loop."""
+
+		self._scheduled = False
+		while len(self._pending) > 0:
+			s = self._pending.popleft()
+			self.latest = s
+			events = self.detector.update(s[0], (s[1], s[2]))
+			for it in list(self._iterators):
+				if it.events == None:
+					it.put(s)
+				else:
+					for e in events:
+						if e[0] in it.events:
+							it.put(e)
+			if len(events) == 0 or len(self._waiters) == 0:
+				continue
+			for waiter in list(self._waiters):
+				future, codes = waiter
+				for e in events:
+					if e[0] in codes:
+						self._waiters.remove(waiter)
+						_resolve(future, e, None)
+						break
+
+	def sample(self):
+
+		"""<DOC>
+		Gets the newest sample that has reached the event loop, without #
+		waiting.
+
+		Returns:
+		A (time, x, y, pupil) tuple, or None if no samples have arrived yet.
+		</DOC>"""
+
+		return self.latest
+
+	def wait_for_event(self, event, timeout=None):
+
+		"""<DOC>
+		Waits for an event, or for one of several events.
+
+		Arguments:
+		event	--	An event code (see libonline), or a list of event codes.
+
+		Keyword arguments:
+		timeout	--	A timeout in milliseconds, or None for no timeout. #
+					(default=None)
+
+		Returns:
+		A future with an (event, time, startpos, endpos) tuple, with the #
+		time in tracker time. On a timeout, the future is resolved with #
+		(None, None, None, None).
+		</DOC>"""
+
+		if type(event) == int:
+			event = [event]
+		future = self._future()
+		waiter = future, set(event)
+		self._waiters.append(waiter)
+		if timeout != None:
+			def expire():
+				if waiter in self._waiters:
+					self._waiters.remove(waiter)
+					_resolve(future, (None, None, None, None), None)
+			handle = self.loop.call_later(timeout / 1000., expire)
+			future.add_done_callback(lambda f: handle.cancel())
+		return future
+
+	def samples(self):
+
+		"""<DOC>
+		Iterates over all new samples: `async for t, x, y, pupil in #
+		gaze.samples()`. With trollius, call get() for every sample instead.
+
+		Returns:
+		An asynchronous iterator.
+		</DOC>"""
+
+		it = _iterator(self)
+		self._iterators.add(it)
+		return it
+
+	def events(self, codes=[libonline.STARTBLINK, libonline.ENDBLINK, \
+		libonline.STARTSACC, libonline.ENDSACC, libonline.STARTFIX, \
+		libonline.ENDFIX]):
+
+		"""<DOC>
+		Iterates over all new events: `async for event, t, startpos, endpos #
+		in gaze.events()`.
+
+		Keyword arguments:
+		codes	--	A list of event codes. (default=all events)
+
+		Returns:
+		An asynchronous iterator.
+		</DOC>"""
+
+		it = _iterator(self, events=set(codes))
+		self._iterators.add(it)
+		return it
+
+	def run(self, name, *args, **kwargs):
+
+		"""<DOC>
+		Calls a function of the tracker in the tracker thread. The functions #
+		of the tracker are called one at a time, in the order in which they #
+		are scheduled.
+
+		Arguments:
+		name	--	The name of the function, e.g. u'log'.
+
+		Returns:
+		A future with the result.
+		</DOC>"""
+
+		return self._serial.submit(self._future(), getattr(self.tracker, name), \
+			*args, **kwargs)
+
+	def start_recording(self):
+
+		"""<DOC>
+		Starts recording. Returns a future.
+		</DOC>"""
+
+		return self.run(u'start_recording')
+
+	def stop_recording(self):
+
+		"""<DOC>
+		Stops recording. Returns a future.
+		</DOC>"""
+
+		return self.run(u'stop_recording')
+
+	def log(self, msg):
+
+		"""<DOC>
+		Writes a message to the data file. Returns a future.
+
+		Arguments:
+		msg	--	The message.
+		</DOC>"""
+
+		return self.run(u'log', msg)
+
+	def run_in_loop(self, name, *args, **kwargs):
+
+		"""<DOC>
+		Calls a function of the tracker in the thread of the event loop, #
+		which must be the thread that opened the display, in turn with the #
+		functions that are called with run(). The event loop is blocked #
+		while the function runs.
+
+		Arguments:
+		name	--	The name of the function, e.g. u'calibrate'.
+
+		Returns:
+		A future with the result.
+		</DOC>"""
+
+		return self._serial.submit_in_loop(self._future(), getattr( \
+			self.tracker, name), *args, **kwargs)
+
+	def drift_correction(self, *args, **kwargs):
+
+		"""<DOC>
+		Performs drift correction in the thread of the event loop (see #
+		run_in_loop()), with the same arguments as drift_correction() of the #
+		tracker. Returns a future with the result.
+		</DOC>"""
+
+		return self.run_in_loop(u'drift_correction', *args, **kwargs)
+
+	def calibrate(self, *args, **kwargs):
+
+		"""<DOC>
+		Calibrates the tracker in the thread of the event loop (see #
+		run_in_loop()), with the same arguments as calibrate() of the #
+		tracker. Returns a future.
+		</DOC>"""
+
+		return self.run_in_loop(u'calibrate', *args, **kwargs)
+
+	def close(self):
+
+		"""<DOC>
+		Detaches from the tracker and closes it. All iterators end, and all #
+		pending waits are cancelled.
+
+		Returns:
+		A future.
+		</DOC>"""
+
+		self._halt.set()
+		if self._thread == None:
+			sampler = getattr(self.tracker, u'sampler', None)
+			if sampler != None:
+				sampler.remove_listener(self._push)
+		else:
+			self._thread.join(1)
+			if not self._thread.is_alive():
+				self._reader.close()
+		for it in list(self._iterators):
+			it.close()
+		for future, codes in self._waiters:
+			future.cancel()
+		self._waiters = []
+		future = self.run(u'close')
+		self._serial.stop()
+		return future
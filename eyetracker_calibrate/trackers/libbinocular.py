@@ -0,0 +1,224 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Binocular samples. An eye_buffer keeps the newest samples of both eyes, with
+# NaN for an eye that is missing, so that the trackers don't have to throw
+# away one eye when they record binocularly.
+#
+# Selecting an eye is a weighted sum over the eye axis of the buffer, so that
+# all selections are computed the same way, without branching:
+#
+#	eye			weights		fallback	result
+#	left		1, 0		0, 0		the left eye
+#	right		0, 1		0, 0		the right eye
+#	average		1, 1		1, 1		the cyclopean average
+#	best		1, 0 / 0, 1	1, 1		the eye with the smallest validation
+#										error, see set_accuracy()
+#
+# The weights are multiplied by the validity of each eye and normalized. If
+# none of the weighted eyes is valid, the fallback weights are used instead,
+# so that average and best use the other eye if one eye is missing.
+#
+# The sampler thread and the main thread may both write to the buffer, so
+# writing and reading the newest samples is serialized with a lock.
+
+import threading
+
+import numpy
+
+LEFT = u'left'
+RIGHT = u'right'
+AVERAGE = u'average'
+BEST = u'best'
+
+class eye_buffer:
+
+	"""A ring of binocular samples."""
+
+	def __init__(self, capacity=1024):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		capacity	--	The number of samples in the buffer. (default=1024)
+		</DOC>"""
+
+		self.capacity = capacity
+		self.time = numpy.zeros(capacity)
+		# Per sample, per eye (left, right): x, y, pupil
+		self.eyes = numpy.empty((capacity, 2, 3))
+		self.eyes.fill(numpy.nan)
+		self.count = 0
+		self._lock = threading.Lock()
+		self.weights = {
+			LEFT : numpy.array([1., 0.]),
+			RIGHT : numpy.array([0., 1.]),
+			AVERAGE : numpy.array([1., 1.]),
+			BEST : numpy.array([1., 1.]),
+			}
+		self.fallback = {
+			LEFT : numpy.array([0., 0.]),
+			RIGHT : numpy.array([0., 0.]),
+			AVERAGE : numpy.array([1., 1.]),
+			BEST : numpy.array([1., 1.]),
+			}
+
+	def set_accuracy(self, left, right):
+
+		"""<DOC>
+		Sets the accuracy of both eyes, e.g. from a validation, which #
+		determines the best eye. Until this is called, BEST is the same as #
+		AVERAGE.
+
+		Arguments:
+		left	--	The error of the left eye, in any unit.
+		right	--	The error of the right eye, in the same unit.
+		</DOC>"""
+
+		if left <= right:
+			self.weights[BEST] = numpy.array([1., 0.])
+		else:
+			self.weights[BEST] = numpy.array([0., 1.])
+
+	def write(self, t, left, right):
+
+		"""<DOC>
+		Adds a sample.
+
+		Arguments:
+		t		--	The timestamp. A sample with the same timestamp as the #
+					newest sample is ignored.
+		left	--	An (x, y, pupil) tuple for the left eye, or None if the #
+					left eye is missing.
+		right	--	An (x, y, pupil) tuple for the right eye, or None if the #
+					right eye is missing.
+		</DOC>"""
+
+		with self._lock:
+			# The same sample may be read more than once, e.g. by the sampler
+			# thread and by sample()
+			last = (self.count - 1) % self.capacity
+			if self.count > 0 and self.time[last] == t:
+				return
+			i = self.count % self.capacity
+			row = self.eyes[i]
+			row.fill(numpy.nan)
+			if left != None:
+				row[0] = left
+			if right != None:
+				row[1] = right
+			self.time[i] = t
+			self.count += 1
+
+	def newest(self, n=1):
+
+		"""<DOC>
+		Gets the newest samples of both eyes.
+
+		Keyword arguments:
+		n	--	The number of samples. (default=1)
+
+		Returns:
+		A (time, eyes) tuple of arrays, oldest first, with time of shape #
+		(n,) and eyes of shape (n, 2, 3). Fewer than n samples are returned #
+		if fewer have been written.
+		</DOC>"""
+
+		with self._lock:
+			count = self.count
+			n = min(n, count, self.capacity)
+			i = numpy.arange(count - n, count) % self.capacity
+			# Fancy indexing copies, so the arrays don't change afterwards
+			return self.time[i], self.eyes[i]
+
+	def select(self, eyes, eye=AVERAGE):
+
+		"""<DOC>
+		Selects or combines the eyes.
+
+		Arguments:
+		eyes	--	An array of shape (n, 2, 3), as returned by newest().
+
+		Keyword arguments:
+		eye		--	LEFT, RIGHT, AVERAGE, or BEST. (default=AVERAGE)
+
+		Returns:
+		An array of shape (n, 3) with x, y and pupil size, which is NaN #
+		where the selection is missing.
+		</DOC>"""
+
+		valid = ~numpy.isnan(eyes[:, :, 0])
+		w = self.weights[eye] * valid
+		w = numpy.where(w.sum(axis=1)[:, None] > 0, w, self.fallback[eye] * \
+			valid)
+		total = w.sum(axis=1)
+		data = numpy.where(valid[:, :, None], eyes, 0.)
+		with numpy.errstate(invalid=u'ignore', divide=u'ignore'):
+			return (data * w[:, :, None]).sum(axis=1) / total[:, None]
+
+	def gaze(self, n=1, eye=AVERAGE):
+
+		"""<DOC>
+		Gets the newest gaze positions and pupil sizes of the selected eye.
+
+		Keyword arguments:
+		n	--	The number of samples. (default=1)
+		eye	--	See select(). (default=AVERAGE)
+
+		Returns:
+		A (time, gaze) tuple of arrays, with time of shape (n,) and gaze of #
+		shape (n, 3).
+		</DOC>"""
+
+		t, eyes = self.newest(n)
+		return t, self.select(eyes, eye)
+
+	def sample(self, eye=AVERAGE):
+
+		"""<DOC>
+		Gets the newest gaze position of the selected eye, like sample() of #
+		the trackers.
+
+		Keyword arguments:
+		eye	--	See select(). (default=AVERAGE)
+
+		Returns:
+		An (x, y) tuple, which is (-1, -1) if the selection is missing.
+		</DOC>"""
+
+		t, g = self.gaze(1, eye)
+		if len(g) == 0 or numpy.isnan(g[0, 0]):
+			return -1, -1
+		return float(g[0, 0]), float(g[0, 1])
+
+	def pupil_size(self, eye=AVERAGE):
+
+		"""<DOC>
+		Gets the newest pupil size of the selected eye.
+
+		Keyword arguments:
+		eye	--	See select(). (default=AVERAGE)
+
+		Returns:
+		The pupil size, which is -1 if the selection is missing.
+		</DOC>"""
+
+		t, g = self.gaze(1, eye)
+		if len(g) == 0 or numpy.isnan(g[0, 2]):
+			return -1
+		return float(g[0, 2])
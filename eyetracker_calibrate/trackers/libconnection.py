@@ -0,0 +1,306 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Connections to trackers that are kept open between runs of an experiment.
+#
+# eyetracker_calibrate loads the tracker libraries with imp.load_source(),
+# which executes them anew for every run, so a connection that is stored in a
+# tracker library is lost, and connecting again takes seconds. The helper
+# modules in the trackers folder are imported normally, so this module, and
+# the connections in it, live as long as the interpreter. The connections are
+# closed when the interpreter exits.
+#
+# A watchdog thread checks the connection at a fixed interval. When the link
+# drops, it reconnects with an exponential backoff, which is capped so that
+# the tracker is picked up quickly once it is back, and tells the tracker
+# library when the link was lost and restored, so that it can resume
+# recording and log the gap. A tracker API that can only be used from the
+# thread that made the link, such as pylink, which also draws on the display,
+# cannot be reconnected from the watchdog thread. In that case the watchdog
+# only tells the library that the link was lost, and the library reconnects
+# from the main thread, at the next call, see the reconnect argument of
+# start_watchdog().
+
+import atexit
+import threading
+
+import libwait
+
+_connections = {}
+
+class connection:
+
+	"""A connection to a tracker, which is kept open between runs."""
+
+	def __init__(self, name, connect, is_connected, disconnect=None):
+
+		"""<DOC>
+		Constructor. This doesn't connect yet, see open().
+
+		Arguments:
+		name			--	The name of the connection.
+		connect			--	A function that connects, and returns the link, #
+							or raises an Exception on failure.
+		is_connected	--	A function that takes the link, and returns #
+							whether it is still connected.
+
+		Keyword arguments:
+		disconnect		--	A function that takes the link, and closes it, or #
+							None. (default=None)
+		</DOC>"""
+
+		self.name = name
+		self._connect = connect
+		self._is_connected = is_connected
+		self._disconnect = disconnect
+		self.link = None
+		# Settings that the tracker library has sent over this link, which
+		# are forgotten when the link is replaced, see settings()
+		self.config = {}
+		# The (lost, restored) times of the gaps, in milliseconds
+		self.gaps = []
+		self.watchdog = None
+		self.lock = threading.RLock()
+
+	def connected(self):
+
+		"""<DOC>
+		Checks whether the link is connected.
+
+		Returns:
+		True if connected, False otherwise.
+		</DOC>"""
+
+		with self.lock:
+			if self.link == None:
+				return False
+			try:
+				return bool(self._is_connected(self.link))
+			except Exception:
+				return False
+
+	def open(self):
+
+		"""<DOC>
+		Connects, unless the link from a previous run is still connected.
+
+		Returns:
+		A (link, new) tuple, where new indicates whether a new link was #
+		made.
+		</DOC>"""
+
+		with self.lock:
+			if self.connected():
+				return self.link, False
+			if self.link != None:
+				# Close the dropped link first, so that its socket and the
+				# state of the tracker API are released
+				self._close_link()
+			self.link = self._connect()
+			self.config = {}
+			return self.link, True
+
+	def _close_link(self):
+
+		"""
+		Closes the link, if there is one.
+		"""
+
+		if self.link != None and self._disconnect != None:
+			try:
+				self._disconnect(self.link)
+			except Exception as e:
+				print(u'libconnection: failed to close %s: %s' % \
+					(self.name, e))
+		self.link = None
+
+	def settings(self, key):
+
+		"""<DOC>
+		Gets the settings that have been sent over this link.
+
+		Arguments:
+		key		--	A key under which the settings are kept, e.g. the #
+					tracker version.
+
+		Returns:
+		A dictionary, which the tracker library can change.
+		</DOC>"""
+
+		return self.config.setdefault(key, {})
+
+	def start_watchdog(self, interval=500, min_backoff=250, max_backoff=4000, \
+		on_lost=None, on_restored=None, reconnect=True):
+
+		"""<DOC>
+		Starts a watchdog thread that supervises the link, see #
+		watchdog.__init__(). A running watchdog is stopped first.
+
+		Returns:
+		The watchdog.
+		</DOC>"""
+
+		self.stop_watchdog()
+		self.watchdog = watchdog(self, interval=interval, \
+			min_backoff=min_backoff, max_backoff=max_backoff, \
+			on_lost=on_lost, on_restored=on_restored, reconnect=reconnect)
+		return self.watchdog
+
+	def stop_watchdog(self):
+
+		"""<DOC>
+		Stops the watchdog thread, if it is running.
+		</DOC>"""
+
+		if self.watchdog != None:
+			self.watchdog.stop()
+			self.watchdog = None
+
+	def close(self):
+
+		"""<DOC>
+		Stops the watchdog and closes the link.
+		</DOC>"""
+
+		self.stop_watchdog()
+		with self.lock:
+			self._close_link()
+		if _connections.get(self.name) is self:
+			del _connections[self.name]
+
+class watchdog(threading.Thread):
+
+	"""A thread that reconnects a connection when its link drops."""
+
+	def __init__(self, connection, interval=500, min_backoff=250, \
+		max_backoff=4000, on_lost=None, on_restored=None, reconnect=True):
+
+		"""<DOC>
+		Constructor. Starts the thread.
+
+		Arguments:
+		connection	--	A connection.
+
+		Keyword arguments:
+		interval	--	The interval between checks in milliseconds. #
+						(default=500)
+		min_backoff	--	The wait after the first failed reconnect in #
+						milliseconds, which doubles after every failure. #
+						(default=250)
+		max_backoff	--	The longest wait between reconnects in #
+						milliseconds. (default=4000)
+		on_lost		--	A function that is called with the time in #
+						milliseconds when the link has dropped, or None. #
+						(default=None)
+		on_restored	--	A function that is called with the time when the #
+						link dropped and the time when it was restored, in #
+						milliseconds, or None. (default=None)
+		reconnect	--	Indicates whether the watchdog reconnects. If not, #
+						it only calls on_lost, and waits until the tracker #
+						library has reconnected with connection.open(). #
+						(default=True)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'%s watchdog' % \
+			connection.name)
+		self.daemon = True
+		self.connection = connection
+		self.interval = interval
+		self.min_backoff = min_backoff
+		self.max_backoff = max_backoff
+		self.on_lost = on_lost
+		self.on_restored = on_restored
+		self.reconnect = reconnect
+		self._halt = threading.Event()
+		self.start()
+
+	def _call(self, func, *args):
+
+		if func == None:
+			return
+		try:
+			func(*args)
+		except Exception as e:
+			print(u'libconnection: error in %s: %s' % (self.name, e))
+
+	def run(self):
+
+		conn = self.connection
+		while not self._halt.wait(self.interval / 1000.):
+			if conn.connected():
+				continue
+			lost = libwait.clock() * 1000
+			print(u'libconnection: lost the connection to %s' % conn.name)
+			self._call(self.on_lost, lost)
+			backoff = self.min_backoff
+			while not self._halt.is_set():
+				if not self.reconnect:
+					if conn.connected():
+						break
+					self._halt.wait(self.interval / 1000.)
+					continue
+				try:
+					conn.open()
+					break
+				except Exception as e:
+					print(u'libconnection: failed to reconnect to %s, ' \
+						u'retrying in %d ms: %s' % (conn.name, backoff, e))
+				self._halt.wait(backoff / 1000.)
+				backoff = min(2 * backoff, self.max_backoff)
+			if self._halt.is_set():
+				break
+			restored = libwait.clock() * 1000
+			conn.gaps.append((lost, restored))
+			print(u'libconnection: reconnected to %s after %d ms' % \
+				(conn.name, restored - lost))
+			self._call(self.on_restored, lost, restored)
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the thread.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive() and threading.current_thread() is not self:
+			self.join(1)
+
+def get(name, connect, is_connected, disconnect=None):
+
+	"""<DOC>
+	Gets the connection with a name, and creates it if necessary. See #
+	connection.__init__() for the arguments.
+
+	Returns:
+	A connection.
+	</DOC>"""
+
+	if name not in _connections:
+		_connections[name] = connection(name, connect, is_connected, \
+			disconnect)
+	return _connections[name]
+
+def close_all():
+
+	"""<DOC>
+	Closes all connections. This is called when the interpreter exits.
+	</DOC>"""
+
+	for conn in list(_connections.values()):
+		conn.close()
+
+atexit.register(close_all)
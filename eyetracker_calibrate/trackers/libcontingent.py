@@ -0,0 +1,504 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Gaze-contingent display changes, such as the boundary paradigm and moving
+# windows. An engine holds triggers, each of which pairs an area (see libaoi)
+# with a canvas that has been prepared in advance. The engine tests every
+# sample against the areas, and shows the canvas of a trigger as soon as gaze
+# enters (or leaves) its area, so that the change appears at the next refresh
+# of the display. From an inline script:
+#
+#	import libcontingent
+#	engine = libcontingent.engine(exp.eyetracker)
+#	engine.add_boundary(512, changed_canvas)
+#	engine.run(timeout=5000)
+#
+# The engine reads every sample from the ring of the sampler thread (see
+# libsampler), in the main thread, because the display can only be flipped
+# from there. Without a sampler, it polls sample() of the tracker.
+#
+# For every change, the engine measures the latency from the triggering sample
+# to the flip, as returned by canvas.show(). The samples are timestamped by the
+# clock of the tracker, so the engine estimates the offset between that clock
+# and the experiment clock from the ring: every sample arrives some time after
+# its timestamp, and the smallest difference between the arrival and the
+# timestamp, over the last seconds, is the offset plus the shortest delay of
+# the link (see clock_offset). The latency is therefore from the sample to the
+# flip, except for that shortest delay. The latency from the moment the
+# sample was seen to the flip is reported as well. Right after the flip, the
+# engine logs a message with the timestamp of the sample, so that the latency
+# from the sample to the message, which the tracker timestamps, can also be
+# computed from the data file.
+#
+# A trigger can also respond to the predicted landing position of a saccade,
+# so that the display changes while the eye is still moving. The predictor
+# gets every sample, and returns an (x, y, time, confidence) tuple once it can
+# tell where a saccade will land, see libpredict.landing_predictor, or the
+# simpler peak_predictor.
+
+import collections
+import math
+
+import numpy
+
+from libopensesame import exceptions
+import libaoi
+import libpredict
+import libsampler
+import libshm
+import libwait
+
+def _missing(x, y):
+
+	return x != x or (x == -1 and y == -1) or (x == 0 and y == 0)
+
+class peak_predictor:
+
+	"""
+	Predicts the landing position of a saccade from its peak velocity. The
+	velocity profile of a saccade is roughly symmetric, so when the velocity
+	starts to drop, the eye has covered about half of the amplitude, in about
+	half of the duration.
+	"""
+
+	def __init__(self, velocity_threshold, drop=.9):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		velocity_threshold	--	The saccade velocity threshold in pixels per #
+								millisecond.
+
+		Keyword arguments:
+		drop				--	The velocity, relative to the peak velocity, #
+								below which the peak is considered to have #
+								passed. (default=.9)
+		</DOC>"""
+
+		self.threshold = velocity_threshold
+		self.drop = drop
+		self.reset()
+
+	def reset(self):
+
+		"""<DOC>
+		Forgets the current saccade.
+		</DOC>"""
+
+		self.prev = None
+		self.start = None
+		self.peak = None
+		self.prediction = None
+
+	def update(self, t, x, y):
+
+		"""<DOC>
+		Adds a sample.
+
+		Arguments:
+		t	--	The timestamp in milliseconds.
+		x	--	The horizontal gaze position.
+		y	--	The vertical gaze position.
+
+		Returns:
+		The predicted (x, y, time, confidence) of the landing of the #
+		current saccade, with the confidence None because it is unknown, #
+		or None if there is no prediction (yet).
+		</DOC>"""
+
+		if _missing(x, y):
+			self.reset()
+			return None
+		prev = self.prev
+		self.prev = t, x, y
+		if prev == None or t <= prev[0]:
+			return self.prediction
+		v = math.sqrt((x - prev[1]) ** 2 + (y - prev[2]) ** 2) / (t - prev[0])
+		if self.start == None:
+			if v > self.threshold:
+				# the saccade started at the previous sample
+				self.start = prev
+				self.peak = v, t, x, y
+			return None
+		if v < self.threshold:
+			# the saccade is over
+			self.start = self.peak = self.prediction = None
+			return None
+		if v > self.peak[0]:
+			self.peak = v, t, x, y
+		elif self.prediction == None and v < self.drop * self.peak[0]:
+			t0, x0, y0 = self.start
+			vp, tp, xp, yp = self.peak
+			self.prediction = 2 * xp - x0, 2 * yp - y0, 2 * tp - t0, None
+		return self.prediction
+
+class clock_offset:
+
+	"""
+	Estimates the offset between the clock of the tracker and the experiment
+	clock from the arrival of samples. The estimate is the smallest
+	difference between the arrival and the timestamp within a sliding
+	window, so that it follows a slow drift between the clocks.
+	"""
+
+	def __init__(self, window=2000):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		window	--	The length of the window in milliseconds of experiment #
+					time. (default=2000)
+		</DOC>"""
+
+		self.window = window
+		# (arrival, difference) tuples with increasing differences, so that
+		# the first is the smallest difference in the window
+		self._min = collections.deque()
+
+	def update(self, arrival, t):
+
+		"""<DOC>
+		Adds the arrival of a sample.
+
+		Arguments:
+		arrival	--	The experiment time at which the sample was read.
+		t		--	The timestamp of the sample.
+		</DOC>"""
+
+		d = arrival - t
+		m = self._min
+		while len(m) > 0 and m[-1][1] >= d:
+			m.pop()
+		m.append((arrival, d))
+		while m[0][0] < arrival - self.window:
+			m.popleft()
+
+	@property
+	def offset(self):
+
+		"""<DOC>
+		The experiment time minus the tracker time, or None if no samples #
+		have arrived.
+		</DOC>"""
+
+		if len(self._min) == 0:
+			return None
+		return self._min[0][1]
+
+class trigger:
+
+	"""A display change that is triggered by gaze."""
+
+	def __init__(self, area, canvas, leave=False, once=True, predict=False, \
+		name=None):
+
+		"""<DOC>
+		Constructor. See engine.add().
+		</DOC>"""
+
+		self.area = area
+		self.canvas = canvas
+		self.leave = leave
+		self.once = once
+		self.predict = predict
+		self.name = area.name if name == None else name
+		self.armed = True
+		# Whether gaze was inside the area at the previous sample, or None if
+		# unknown
+		self.inside = None
+
+	def test(self, x, y):
+
+		"""<DOC>
+		Tests a gaze position.
+
+		Arguments:
+		x	--	The horizontal gaze position.
+		y	--	The vertical gaze position.
+
+		Returns:
+		True if the trigger fires, False otherwise.
+		</DOC>"""
+
+		inside = self.area.contains(x, y)
+		if self.leave:
+			fire = self.inside == True and not inside
+		else:
+			fire = inside and self.inside != True
+		self.inside = inside
+		return fire
+
+class engine:
+
+	"""Shows prepared canvases when gaze enters or leaves areas."""
+
+	def __init__(self, tracker, predictor=None, confidence=.5, log=True):
+
+		"""<DOC>
+		Constructor. The sampler thread of the tracker is started if it #
+		isn't running yet.
+
+		Arguments:
+		tracker		--	A tracker object.
+
+		Keyword arguments:
+		predictor	--	A predictor for triggers that respond to the #
+						landing position of saccades, such as a #
+						peak_predictor, or None to use the #
+						libpredict.landing_predictor of the experiment. #
+						(default=None)
+		confidence	--	The confidence that a prediction needs to fire a #
+						trigger. Predictions without a confidence always #
+						fire. (default=.5)
+		log			--	Indicates whether every change is logged to the #
+						tracker. (default=True)
+		</DOC>"""
+
+		self.tracker = tracker
+		self.experiment = tracker.experiment
+		if predictor == None:
+			predictor = libpredict.get_predictor(tracker)
+		self.predictor = predictor
+		self.confidence = confidence
+		self.log = log
+		self.triggers = []
+		# A dict for every change, see run()
+		self.changes = []
+		self.clock = clock_offset()
+		self.reader = libsampler.reader(tracker)
+		if self.reader != None:
+			self._out = numpy.empty(self.reader.capacity, \
+				dtype=libshm.sample_dtype)
+
+	def add(self, area, canvas, leave=False, once=True, predict=False, \
+		name=None):
+
+		"""<DOC>
+		Adds a trigger.
+
+		Arguments:
+		area	--	A libaoi.aoi.
+		canvas	--	A prepared canvas, which is shown when the trigger fires.
+
+		Keyword arguments:
+		leave	--	Indicates whether the trigger fires when gaze leaves #
+					(True) or enters (False) the area. (default=False)
+		once	--	Indicates whether the trigger fires only once (True), or #
+					every time gaze enters or leaves the area, e.g. for a #
+					moving window that follows gaze from word to word #
+					(False). (default=True)
+		predict	--	Indicates whether the trigger responds to the predicted #
+					landing position of a saccade (True) or to the gaze #
+					position (False). (default=False)
+		name	--	The name of the trigger in the log, or None to use the #
+					name of the area. (default=None)
+
+		Returns:
+		The trigger.
+		</DOC>"""
+
+		t = trigger(area, canvas, leave=leave, once=once, predict=predict, \
+			name=name)
+		self.triggers.append(t)
+		return t
+
+	def add_boundary(self, x, canvas, predict=False, name=u'boundary'):
+
+		"""<DOC>
+		Adds a trigger that fires when gaze crosses an invisible vertical #
+		boundary from left to right, as in the boundary paradigm.
+
+		Arguments:
+		x		--	The horizontal position of the boundary.
+		canvas	--	A prepared canvas.
+
+		Keyword arguments:
+		predict	--	See add(). (default=False)
+		name	--	See add(). (default=u'boundary')
+
+		Returns:
+		The trigger.
+		</DOC>"""
+
+		width = self.experiment.get(u'width')
+		height = self.experiment.get(u'height')
+		area = libaoi.rect_aoi(name, x, -height, width - x + width, \
+			3 * height)
+		return self.add(area, canvas, predict=predict, name=name)
+
+	def remove(self, trigger):
+
+		"""<DOC>
+		Removes a trigger.
+
+		Arguments:
+		trigger	--	A trigger that was returned by add().
+		</DOC>"""
+
+		self.triggers.remove(trigger)
+
+	def _check(self, t, x, y):
+
+		"""
+		Tests a sample against the armed triggers.
+
+		Arguments:
+		t	--	The timestamp of the sample.
+		x	--	The horizontal gaze position.
+		y	--	The vertical gaze position.
+
+		Returns:
+		A list of the triggers that fire.
+		"""
+
+		prediction = self.predictor.update(t, x, y)
+		if _missing(x, y):
+			return []
+		if prediction != None and prediction[3] != None and \
+			prediction[3] < self.confidence:
+			prediction = None
+		fired = []
+		for trigger in self.triggers:
+			if not trigger.armed:
+				continue
+			if trigger.predict:
+				if prediction == None:
+					continue
+				pos = prediction[0], prediction[1]
+			else:
+				pos = x, y
+			if trigger.test(pos[0], pos[1]):
+				fired.append(trigger)
+				# A trigger that fires once doesn't fire again on a later
+				# sample of the same batch
+				if trigger.once:
+					trigger.armed = False
+		return fired
+
+	def _change(self, trigger, t, detected):
+
+		"""
+		Shows the canvas of a trigger, and logs the change.
+
+		Arguments:
+		trigger		--	The trigger.
+		t			--	The timestamp of the triggering sample.
+		detected	--	The experiment time at which the sample was seen.
+		"""
+
+		flip = trigger.canvas.show()
+		offset = self.clock.offset
+		change = {
+			u'name': trigger.name,
+			u'sample_time': t,
+			u'detected': detected,
+			u'flip': flip,
+			u'latency': None if offset == None else flip - (t + offset),
+			u'detect_to_flip': flip - detected,
+			u'predicted': trigger.predict,
+			}
+		self.changes.append(change)
+		if self.log:
+			latency = change[u'latency']
+			self.tracker.log( \
+				u'gc_change %s sample %.1f latency %s detect_to_flip %.1f' % \
+				(trigger.name, t, u'NA' if latency == None else \
+				u'%.1f' % latency, change[u'detect_to_flip']))
+
+	def _done(self):
+
+		once = [t for t in self.triggers if t.once]
+		return len(once) > 0 and not any([t.armed for t in once])
+
+	def run(self, timeout=None):
+
+		"""<DOC>
+		Tests the samples against the triggers, and shows the canvases of #
+		the triggers that fire. If several triggers fire on the same batch #
+		of samples, their canvases are shown in the order in which they #
+		fired, and every change is logged.
+
+		Keyword arguments:
+		timeout	--	The timeout in milliseconds, or None to run until all #
+					triggers that fire only once have fired. (default=None)
+
+		Returns:
+		A list with a dict for every change, with the name of the trigger, #
+		the timestamp of the triggering sample (sample_time), the #
+		experiment time when the sample was seen (detected) and when the #
+		display was flipped (flip), the latency from the sample to the flip #
+		in milliseconds (latency, see clock_offset), the latency from the #
+		moment the sample was seen to the flip (detect_to_flip), and whether #
+		the trigger used the predicted landing position (predicted).
+
+		Exceptions:
+		Raises an exceptions.runtime_error if there is no timeout and no #
+		trigger that fires only once, because the engine would never stop.
+		</DOC>"""
+
+		if timeout == None and not any([t.once for t in self.triggers]):
+			raise exceptions.runtime_error( \
+				u'A gaze-contingent engine without a timeout needs a trigger that fires only once')
+		changes = len(self.changes)
+		self.predictor.reset()
+		samplerate = 0 if self.reader == None else self.reader.samplerate
+		pace = libwait.pacer(samplerate)
+		t0 = self.experiment.time()
+		count = None if self.reader == None else self.reader.count
+		prev = None
+		while not self._done():
+			if timeout != None and self.experiment.time() - t0 >= timeout:
+				break
+			pace.wait()
+			fired = []
+			if self.reader != None:
+				samples, count = self.reader.since(count, out=self._out)
+				pace.update(len(samples) > 0)
+				if len(samples) == 0:
+					continue
+				detected = self.experiment.time()
+				self.clock.update(detected, samples[u'time'][-1])
+				for t, x, y in zip(samples[u'time'], samples[u'x'], \
+					samples[u'y']):
+					for trigger in self._check(t, x, y):
+						fired.append((trigger, t))
+			else:
+				pos = self.tracker.sample()
+				pace.update(pos != prev)
+				if pos == prev:
+					continue
+				prev = pos
+				detected = t = self.experiment.time()
+				# The sample is timestamped in experiment time
+				self.clock.update(detected, t)
+				for trigger in self._check(t, pos[0], pos[1]):
+					fired.append((trigger, t))
+			for trigger, t in fired:
+				self._change(trigger, t, detected)
+		return self.changes[changes:]
+
+	def close(self):
+
+		"""<DOC>
+		Releases the reader of the ring.
+		</DOC>"""
+
+		if self.reader != None:
+			self.reader.close()
+			self.reader = None
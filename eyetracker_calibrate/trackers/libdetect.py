@@ -0,0 +1,369 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Offline event detection. Whereas the tracker libraries detect events online,
+# one sample at a time, the functions in this module process a complete
+# recording at once. All operations work on entire NumPy arrays, so that a
+# one-hour recording at 1000 Hz (3.6 million samples) is processed in a few
+# seconds.
+#
+# Events are returned in the same format for all algorithms, as a structured
+# array with the fields (event, stime, etime, sx, sy, ex, ey). The event field
+# contains the event codes that are also used by wait_for_event() in the
+# tracker libraries (4=ENDBLINK, 6=ENDSACC, 8=ENDFIX), stime and etime are the
+# timestamps of the first and last sample of the event, and (sx, sy) and
+# (ex, ey) are the gaze positions of the first and last sample, just like the
+# start and end positions that are returned by wait_for_saccade_end() and
+# wait_for_fixation_end().
+
+import numpy
+from libgeometry import deg2pix, pix2deg
+
+ENDBLINK = 4
+ENDSACC = 6
+ENDFIX = 8
+
+event_dtype = numpy.dtype([
+	('event', numpy.int8),
+	('stime', numpy.float64),
+	('etime', numpy.float64),
+	('sx', numpy.float64),
+	('sy', numpy.float64),
+	('ex', numpy.float64),
+	('ey', numpy.float64),
+	])
+
+# Sample labels, used internally to mark each sample before the labels are
+# collapsed into events
+_FIX = 0
+_SACC = 1
+_BLINK = 2
+_codes = numpy.array([ENDFIX, ENDSACC, ENDBLINK], dtype=numpy.int8)
+
+def missing(x, y):
+
+	"""<DOC>
+	Determines which samples are missing. The trackers report missing data as #
+	(-1, -1) or (0, 0), and exported data often uses NaN.
+
+	Arguments:
+	x	--	An array of horizontal gaze positions.
+	y	--	An array of vertical gaze positions.
+
+	Returns:
+	A boolean array that is True for missing samples.
+	</DOC>"""
+
+	x = numpy.asarray(x, dtype=float)
+	y = numpy.asarray(y, dtype=float)
+	return ~numpy.isfinite(x) | ~numpy.isfinite(y) | ((x == -1) & (y == -1)) \
+		| ((x == 0) & (y == 0))
+
+def velocity(t, x, y, cmdist=57., pixpercm=None, geometry=None):
+
+	"""<DOC>
+	Computes the sample-to-sample gaze velocity for a complete recording.
+
+	Arguments:
+	t	--	An array of timestamps in milliseconds.
+	x	--	An array of horizontal gaze positions in pixels.
+	y	--	An array of vertical gaze positions in pixels.
+
+	Keyword arguments:
+	cmdist		--	The distance to the display in centimeters. (default=57.)
+	pixpercm	--	The number of pixels per centimeter on the display, or #
+					None to return the velocity in pixels per second. #
+					(default=None)
+	geometry	--	A libgeometry.screen_geometry, or None. If a geometry #
+					is given, the exact visual angle of each movement is #
+					used, and cmdist and pixpercm are ignored. (default=None)
+
+	Returns:
+	An array with the velocity of each sample, relative to the previous #
+	sample, in degrees (or pixels) per second. The first sample, and samples #
+	that follow or are missing data, have a velocity of NaN.
+	</DOC>"""
+
+	t = numpy.asarray(t, dtype=float)
+	x = numpy.asarray(x, dtype=float)
+	y = numpy.asarray(y, dtype=float)
+	if len(t) == 0:
+		return numpy.empty(0)
+	invalid = missing(x, y)
+	v = numpy.empty(len(t))
+	v[0] = numpy.nan
+	if geometry is not None:
+		dist = geometry.angle(x[:-1], y[:-1], x[1:], y[1:])
+	else:
+		dist = numpy.hypot(numpy.diff(x), numpy.diff(y))
+		if pixpercm is not None:
+			dist = pix2deg(cmdist, dist, pixpercm)
+	dt = numpy.diff(t)
+	dt[dt <= 0] = numpy.nan
+	v[1:] = 1000. * dist / dt
+	v[1:][invalid[1:] | invalid[:-1]] = numpy.nan
+	return v
+
+def _sliding(a, w, ufunc):
+
+	"""
+	Applies a ufunc (maximum or minimum) over a sliding window of w samples,
+	using the van Herk/Gil-Werman algorithm so that the cost does not depend on
+	the window size.
+
+	Arguments:
+	a		--	A 1D float array.
+	w		--	The window size in samples.
+	ufunc	--	numpy.maximum or numpy.minimum.
+
+	Returns:
+	An array of len(a)-w+1 values, in which value i applies to a[i:i+w].
+	"""
+
+	n = len(a)
+	nblocks = -(-n // w)
+	fill = -numpy.inf if ufunc is numpy.maximum else numpy.inf
+	padded = numpy.empty(nblocks * w)
+	padded[:n] = a
+	padded[n:] = fill
+	blocks = padded.reshape(nblocks, w)
+	prefix = ufunc.accumulate(blocks, axis=1).ravel()
+	suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+	return ufunc(suffix[:n - w + 1], prefix[w - 1:n])
+
+def _check_units(pixpercm, geometry):
+
+	"""
+	Checks that the thresholds, which are in degrees, can be converted to
+	pixels.
+
+	Arguments:
+	pixpercm	--	The number of pixels per centimeter, or None.
+	geometry	--	A libgeometry.screen_geometry, or None.
+
+	Exceptions:
+	Raises a ValueError if both are None.
+	"""
+
+	if pixpercm is None and geometry is None:
+		raise ValueError( \
+			u'The thresholds are in degrees, so pixpercm or geometry is needed')
+
+def _events(t, x, y, labels):
+
+	"""
+	Collapses an array of per-sample labels into an event array.
+
+	Arguments:
+	t		--	An array of timestamps.
+	x		--	An array of horizontal gaze positions.
+	y		--	An array of vertical gaze positions.
+	labels	--	An array of sample labels (_FIX, _SACC, or _BLINK).
+
+	Returns:
+	A structured array with the event_dtype.
+	"""
+
+	if len(labels) == 0:
+		return numpy.empty(0, dtype=event_dtype)
+	change = numpy.flatnonzero(labels[1:] != labels[:-1]) + 1
+	starts = numpy.concatenate(([0], change))
+	ends = numpy.concatenate((change, [len(labels)])) - 1
+	events = numpy.empty(len(starts), dtype=event_dtype)
+	events['event'] = _codes[labels[starts]]
+	events['stime'] = t[starts]
+	events['etime'] = t[ends]
+	events['sx'] = x[starts]
+	events['sy'] = y[starts]
+	events['ex'] = x[ends]
+	events['ey'] = y[ends]
+	return events
+
+def _min_duration(events, min_fix_dur):
+
+	"""
+	Removes fixations that are shorter than a minimum duration.
+
+	Arguments:
+	events		--	An event array.
+	min_fix_dur	--	The minimum fixation duration in milliseconds.
+
+	Returns:
+	An event array.
+	"""
+
+	if not min_fix_dur:
+		return events
+	short = (events['event'] == ENDFIX) & \
+		(events['etime'] - events['stime'] < min_fix_dur)
+	return events[~short]
+
+def ivt(t, x, y, cmdist=57., pixpercm=None, geometry=None, vel_thresh=35, \
+	acc_thresh=None, min_fix_dur=50):
+
+	"""<DOC>
+	Detects events using a velocity-threshold (I-VT) algorithm. Samples #
+	faster than the velocity threshold, or accelerating or decelerating #
+	faster than the acceleration threshold, are saccadic. Runs of missing #
+	samples are blinks, and the remaining runs of samples are fixations.
+
+	Arguments:
+	t	--	An array of timestamps in milliseconds.
+	x	--	An array of horizontal gaze positions in pixels.
+	y	--	An array of vertical gaze positions in pixels.
+
+	Keyword arguments:
+	cmdist		--	The distance to the display in centimeters. (default=57.)
+	pixpercm	--	The number of pixels per centimeter on the display. #
+					Either pixpercm or geometry is required. (default=None)
+	geometry	--	A libgeometry.screen_geometry, which overrides cmdist #
+					and pixpercm, or None. (default=None)
+	vel_thresh	--	The saccade velocity threshold in degrees per second. #
+					(default=35)
+	acc_thresh	--	The saccade acceleration threshold in degrees per #
+					second**2, or None to use only the velocity threshold. #
+					(default=None)
+	min_fix_dur	--	The minimum fixation duration in milliseconds. #
+					(default=50)
+
+	Returns:
+	A structured array of events, with the fields (event, stime, etime, sx, #
+	sy, ex, ey).
+
+	Exceptions:
+	Raises a ValueError if neither pixpercm nor geometry is given.
+	</DOC>"""
+
+	_check_units(pixpercm, geometry)
+	t = numpy.asarray(t, dtype=float)
+	x = numpy.asarray(x, dtype=float)
+	y = numpy.asarray(y, dtype=float)
+	v = velocity(t, x, y, cmdist, pixpercm, geometry)
+	labels = numpy.zeros(len(t), dtype=numpy.int8)
+	# Comparisons with NaN are False, so samples without a velocity are never
+	# saccadic
+	with numpy.errstate(invalid='ignore'):
+		saccadic = v > vel_thresh
+		if acc_thresh is not None and len(t) > 1:
+			a = numpy.zeros(len(t))
+			a[1:] = 1000. * numpy.diff(v) / numpy.diff(t)
+			saccadic |= numpy.abs(a) > acc_thresh
+	labels[saccadic] = _SACC
+	labels[missing(x, y)] = _BLINK
+	return _min_duration(_events(t, x, y, labels), min_fix_dur)
+
+def idt(t, x, y, cmdist=57., pixpercm=None, geometry=None, disp_thresh=1., \
+	min_fix_dur=100):
+
+	"""<DOC>
+	Detects events using a dispersion-threshold (I-DT) algorithm. A sample #
+	belongs to a fixation if it falls inside a window of at least #
+	`min_fix_dur` ms, in which the dispersion ((max x - min x) + (max y - #
+	min y)) does not exceed the dispersion threshold. The windows are #
+	evaluated for all samples at once, rather than grown one sample at a time, #
+	so that long fixations are the union of overlapping minimum-duration #
+	windows. Runs of missing samples are blinks, and the remaining samples #
+	between fixations are saccades.
+
+	Arguments:
+	t	--	An array of timestamps in milliseconds.
+	x	--	An array of horizontal gaze positions in pixels.
+	y	--	An array of vertical gaze positions in pixels.
+
+	Keyword arguments:
+	cmdist		--	The distance to the display in centimeters. (default=57.)
+	pixpercm	--	The number of pixels per centimeter on the display. #
+					Either pixpercm or geometry is required. (default=None)
+	geometry	--	A libgeometry.screen_geometry, which overrides cmdist #
+					and pixpercm, or None. (default=None)
+	disp_thresh	--	The dispersion threshold in degrees. (default=1.)
+	min_fix_dur	--	The minimum fixation duration in milliseconds. #
+					(default=100)
+
+	Returns:
+	A structured array of events, with the fields (event, stime, etime, sx, #
+	sy, ex, ey).
+
+	Exceptions:
+	Raises a ValueError if neither pixpercm nor geometry is given.
+	</DOC>"""
+
+	_check_units(pixpercm, geometry)
+	t = numpy.asarray(t, dtype=float)
+	x = numpy.asarray(x, dtype=float)
+	y = numpy.asarray(y, dtype=float)
+	n = len(t)
+	invalid = missing(x, y)
+	labels = numpy.empty(n, dtype=numpy.int8)
+	labels[:] = _SACC
+	if geometry is not None:
+		disp_thresh = geometry.deg2pix(disp_thresh)
+	elif pixpercm is not None:
+		disp_thresh = deg2pix(cmdist, disp_thresh, pixpercm)
+	# The window size in samples follows from the (median) sampling interval
+	if n > 1:
+		w = int(round(min_fix_dur / numpy.median(numpy.diff(t)))) + 1
+	else:
+		w = 1
+	w = max(w, 2)
+	if n >= w:
+		# Missing samples make a window invalid, which is achieved by giving
+		# them an infinite spread
+		xmax = numpy.where(invalid, numpy.inf, x)
+		xmin = numpy.where(invalid, -numpy.inf, x)
+		ymax = numpy.where(invalid, numpy.inf, y)
+		ymin = numpy.where(invalid, -numpy.inf, y)
+		disp = _sliding(xmax, w, numpy.maximum) \
+			- _sliding(xmin, w, numpy.minimum) \
+			+ _sliding(ymax, w, numpy.maximum) \
+			- _sliding(ymin, w, numpy.minimum)
+		# A sample is covered if any window that contains it is a valid
+		# fixation window. The number of valid windows that start in (i-w, i]
+		# is obtained from a cumulative sum.
+		valid = numpy.zeros(n + 1, dtype=numpy.int64)
+		valid[1:n - w + 2] = numpy.cumsum(disp <= disp_thresh)
+		valid[n - w + 2:] = valid[n - w + 1]
+		i = numpy.arange(n)
+		covered = valid[i + 1] - valid[numpy.maximum(i - w + 1, 0)] > 0
+		labels[covered] = _FIX
+	labels[invalid] = _BLINK
+	return _min_duration(_events(t, x, y, labels), min_fix_dur)
+
+def detect(t, x, y, algorithm=u'ivt', **kwargs):
+
+	"""<DOC>
+	Detects events in a complete recording, using either the I-VT or the #
+	I-DT algorithm. See ivt() and idt() for the keyword arguments.
+
+	Arguments:
+	t	--	An array of timestamps in milliseconds.
+	x	--	An array of horizontal gaze positions in pixels.
+	y	--	An array of vertical gaze positions in pixels.
+
+	Keyword arguments:
+	algorithm	--	u'ivt' or u'idt'. (default=u'ivt')
+
+	Returns:
+	A structured array of events, with the fields (event, stime, etime, sx, #
+	sy, ex, ey).
+	</DOC>"""
+
+	if algorithm == u'ivt':
+		return ivt(t, x, y, **kwargs)
+	if algorithm == u'idt':
+		return idt(t, x, y, **kwargs)
+	raise ValueError(u'Unknown event detection algorithm: %s' % algorithm)
@@ -0,0 +1,233 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Fixation-triggered drift correction. The newest samples are kept in a
+# fixed-size circular window with running sums, so that adding a sample, and
+# getting the mean position and the dispersion of the window, take constant
+# time regardless of the window size. The window slides: drift correction is
+# accepted as soon as the newest samples rest on the target, rather than only
+# after every complete batch of samples. A jump between two samples (a
+# saccade, a blink) empties the window.
+#
+# The keyboard is only checked at the display rate, rather than once per
+# sample, because checking the keyboard costs far more than a sample at high
+# sampling rates.
+
+import math
+
+import libwait
+
+class fixation_window:
+
+	"""A fixed-size circular window of gaze samples with running statistics."""
+
+	def __init__(self, size):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		size	--	The number of samples in the window.
+		</DOC>"""
+
+		self.size = max(1, int(size))
+		self.x = [0.] * self.size
+		self.y = [0.] * self.size
+		self.reset()
+
+	def reset(self):
+
+		"""<DOC>
+		Empties the window.
+		</DOC>"""
+
+		self.n = 0
+		self.i = 0
+		self.pushed = 0
+		# The sums are taken relative to the first sample, which keeps the
+		# sums of squares small and avoids cancellation
+		self.ref = None
+		self.sx = self.sy = self.sxx = self.syy = 0.
+
+	def push(self, x, y):
+
+		"""<DOC>
+		Adds a sample, and drops the oldest one if the window is full.
+
+		Arguments:
+		x	--	The horizontal position.
+		y	--	The vertical position.
+		</DOC>"""
+
+		if self.ref == None:
+			self.ref = x, y
+		dx = x - self.ref[0]
+		dy = y - self.ref[1]
+		i = self.i
+		if self.n == self.size:
+			ox = self.x[i]
+			oy = self.y[i]
+			self.sx -= ox
+			self.sy -= oy
+			self.sxx -= ox * ox
+			self.syy -= oy * oy
+		else:
+			self.n += 1
+		self.x[i] = dx
+		self.y[i] = dy
+		self.sx += dx
+		self.sy += dy
+		self.sxx += dx * dx
+		self.syy += dy * dy
+		self.i = (i + 1) % self.size
+		# Recompute the sums once per window, so that rounding errors don't
+		# accumulate. This costs one operation per sample on average.
+		self.pushed += 1
+		if self.pushed % self.size == 0:
+			self.sx = math.fsum(self.x[:self.n])
+			self.sy = math.fsum(self.y[:self.n])
+			self.sxx = math.fsum([v * v for v in self.x[:self.n]])
+			self.syy = math.fsum([v * v for v in self.y[:self.n]])
+
+	def full(self):
+
+		"""<DOC>
+		Checks whether the window is full.
+
+		Returns:
+		True or False.
+		</DOC>"""
+
+		return self.n == self.size
+
+	def last(self):
+
+		"""<DOC>
+		Gets the newest sample.
+
+		Returns:
+		An (x, y) tuple, or None if the window is empty.
+		</DOC>"""
+
+		if self.n == 0:
+			return None
+		i = (self.i - 1) % self.size
+		return self.x[i] + self.ref[0], self.y[i] + self.ref[1]
+
+	def mean(self):
+
+		"""<DOC>
+		Gets the mean position.
+
+		Returns:
+		An (x, y) tuple, or None if the window is empty.
+		</DOC>"""
+
+		if self.n == 0:
+			return None
+		return self.ref[0] + self.sx / self.n, self.ref[1] + self.sy / self.n
+
+	def dispersion(self):
+
+		"""<DOC>
+		Gets the dispersion, i.e. the root mean square distance of the #
+		samples to their mean.
+
+		Returns:
+		The dispersion, or 0 if the window is empty.
+		</DOC>"""
+
+		if self.n == 0:
+			return 0.
+		mx = self.sx / self.n
+		my = self.sy / self.n
+		var = self.sxx / self.n - mx * mx + self.syy / self.n - my * my
+		return math.sqrt(max(0., var))
+
+def wait_for_fixation(tracker, pos, min_samples=30, max_dev=60, \
+	reset_threshold=10, max_dispersion=None, keyboard=None, samplerate=0, \
+	skip_duplicates=True, key_interval=1000/60.):
+
+	"""<DOC>
+	Waits until gaze rests on a position, or until a key is pressed. This is #
+	the implementation of fix_triggered_drift_correction() in the tracker #
+	libraries, which handle the outcome.
+
+	Arguments:
+	tracker			--	A tracker object.
+	pos				--	The (x, y) position of the drift-correction target.
+
+	Keyword arguments:
+	min_samples		--	The number of samples in the window. (default=30)
+	max_dev			--	The maximum distance in pixels between the mean #
+						gaze position and pos. (default=60)
+	reset_threshold	--	If the horizontal or vertical distance between two #
+						consecutive samples is larger than this, in pixels, #
+						the window is emptied. (default=10)
+	max_dispersion	--	The maximum dispersion in pixels of the samples in #
+						the window (see fixation_window.dispersion()), or #
+						None for no dispersion criterion. (default=None)
+	keyboard		--	A keyboard with a timeout of 0, or None to not #
+						check the keyboard. Exceptions raised by the #
+						keyboard, e.g. for the escape key, are passed on. #
+						(default=None)
+	samplerate		--	The sampling rate in Hz, or 0 if unknown (see #
+						libwait.pacer). (default=0)
+	skip_duplicates	--	Indicates whether a sample that equals the previous #
+						one is ignored, as a repeated read of the same #
+						sample. If False, one sample is taken per sample #
+						period. (default=True)
+	key_interval	--	The interval in milliseconds at which the keyboard #
+						is checked. (default=1000/60.)
+
+	Returns:
+	A (mean, key) tuple. On success, mean is the mean (x, y) position of the #
+	window and key is None. If a key was pressed, mean is None and key is #
+	the key.
+	</DOC>"""
+
+	window = fixation_window(min_samples)
+	pace = libwait.pacer(samplerate)
+	key_interval /= 1000.
+	next_key = libwait.clock()
+	while True:
+		if keyboard != None and libwait.clock() >= next_key:
+			next_key = libwait.clock() + key_interval
+			key = keyboard.get_key()[0]
+			if key != None:
+				return None, key
+		if skip_duplicates:
+			x, y = pace.poll(tracker.sample)
+			last = window.last()
+			if last != None and last[0] == x and last[1] == y:
+				continue
+		else:
+			pace.tick()
+			x, y = tracker.sample()
+		last = window.last()
+		if last != None and (abs(x - last[0]) > reset_threshold or \
+			abs(y - last[1]) > reset_threshold):
+			window.reset()
+		window.push(x, y)
+		if not window.full():
+			continue
+		mx, my = window.mean()
+		if math.sqrt((mx - pos[0]) ** 2 + (my - pos[1]) ** 2) >= max_dev:
+			continue
+		if max_dispersion != None and window.dispersion() > max_dispersion:
+			continue
+		return (mx, my), None
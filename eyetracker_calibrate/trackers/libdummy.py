@@ -22,7 +22,7 @@ class libdummy:
 	no tracker attached.
 	"""
 
-	def __init__(self, experiment, resolution, data_file=u'default.edf', fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=False):
+	def __init__(self, experiment, resolution, data_file=u'default.edf', fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=False, ip='127.0.0.1', sendport=4444, receiveport=5555, screen_w=399, screen_h=299, screen_dist=570, gaze_filter=u'none', continuous_recording=False):
 		self.experiment = experiment
 	
 	def send_command(self, cmd):
@@ -53,7 +53,7 @@ class libdummy:
 	def prepare_drift_correction(self, pos):
 		pass
 					
-	def fix_triggered_drift_correction(self, pos = None, min_samples = 30, max_dev = 60, reset_threshold = 10):
+	def fix_triggered_drift_correction(self, pos = None, min_samples = 30, max_dev = 60, reset_threshold = 10, max_dispersion = None):
 		self.experiment.sleep(200)
 		return True
 	
@@ -69,14 +69,29 @@ class libdummy:
 	def set_eye_used(self):
 		pass
 
-	def sample(self):
+	def sample(self, eye=None):
+		pass
+
+	def set_gaze_filter(self, kind, **params):
+		pass
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+		pass
+
+	def stop_sampler(self):
 		pass
 	
-	def pupil_size(self):
+	def pupil_size(self, eye=None):
 		pass
 
 	def wait_for_event(self, event):
 		pass
+
+	def wait_for_events(self, events, timeout=None):
+		pass
+
+	def wait_for_aoi(self, index, fixation=False, leave=False, timeout=None):
+		pass
 		
 	def wait_for_saccade_start(self):
 		self.experiment.sleep(100)
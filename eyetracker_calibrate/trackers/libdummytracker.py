@@ -19,13 +19,20 @@ from openexp.keyboard import keyboard
 from openexp.mouse import mouse
 from openexp.canvas import canvas
 from openexp.synth import synth
+from libgeometry import screen_geometry
+import libaoi
+import libdrift
+import libonline
+import libfilter
+import libsampler
+import libwait
 
 
 class libdummytracker:
 
 	"""A dummy class to keep things running if there is no tracker attached."""
 
-	def __init__(self, experiment, resolution, data_file="default.edf", fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=u'yes'):
+	def __init__(self, experiment, resolution, data_file="default.edf", fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=u'yes', ip='127.0.0.1', sendport=4444, receiveport=5555, screen_w=399, screen_h=299, screen_dist=570, gaze_filter=u'none', continuous_recording=False):
 
 		"""Initializes the eyelink dummy object"""
 
@@ -33,12 +40,16 @@ class libdummytracker:
 		self.data_file = data_file
 		self.resolution = resolution
 		self.recording = False
+		self.geometry = screen_geometry(resolution, (screen_w/10.0, screen_h/10.0), screen_dist/10.0)
+		self.gaze_filter = libfilter.create(gaze_filter)
+		self.sampler = None
 
 		self.simulator = mouse(self.experiment)
 		self.simulator.set_timeout(timeout=2)
 
 		self.blinking = False # current 'blinking' condition (MOUSEBUTTONDOWN = eyes closed; MOUSEBUTTONUP = eyes open)
 		self.bbpos = (resolution[0]/2,resolution[1]/2) # before 'blink' position
+		self.detector = libonline.online_detector(fix_thresh=3, spd_thresh=3, skip_duplicates=False) # same thresholds (pixels) as the wait_for_* functions
 
 		# check if blinking functionality is possible
 		if not hasattr(self.simulator, 'get_pressed') or not hasattr(self.simulator, 'set_poesje'):
@@ -124,7 +135,7 @@ class libdummytracker:
 
 		pass
 
-	def fix_triggered_drift_correction(self, pos = None, min_samples = 30, max_dev = 60, reset_threshold = 10):
+	def fix_triggered_drift_correction(self, pos = None, min_samples = 30, max_dev = 60, reset_threshold = 10, max_dispersion = None):
 
 		"""Dummy drift correction (fixation triggered)"""
 
@@ -136,45 +147,17 @@ class libdummytracker:
 		self.prepare_drift_correction(pos)
 		my_keyboard = keyboard(self.experiment, keylist=["escape", "q"], timeout=0)
 
-		# loop until we have sufficient samples
-		lx = []
-		ly = []
-		while len(lx) < min_samples:
-
-			# pressing escape enters the calibration screen
-			if my_keyboard.get_key()[0] != None:
-				self.simulator.set_visible(visible=False)
-				self.recording = False
-				print("libeyelink.fix_triggered_drift_correction(): 'q' pressed")
-				return False
-
-			# collect a sample
-			x, y = self.sample()
-
-			if len(lx) == 0 or x != lx[-1] or y != ly[-1]:
-
-				# if present sample deviates too much from previous sample, reset counting
-				if len(lx) > 0 and (abs(x - lx[-1]) > reset_threshold or abs(y - ly[-1]) > reset_threshold):
-					lx = []
-					ly = []
-
-				# collect samples
-				else:
-					lx.append(x)
-					ly.append(y)
-
-			if len(lx) == min_samples:
-
-				avg_x = sum(lx) / len(lx)
-				avg_y = sum(ly) / len(ly)
-				d = ((avg_x - pos[0]) ** 2 + (avg_y - pos[1]) ** 2)**0.5
+		# wait until the simulated gaze rests on the position; a still mouse
+		# gives identical samples, so these are not skipped
+		mean, key = libdrift.wait_for_fixation(self, pos, min_samples=min_samples, max_dev=max_dev, reset_threshold=reset_threshold, max_dispersion=max_dispersion, keyboard=my_keyboard, samplerate=1000, skip_duplicates=False)
+		self.simulator.set_visible(visible=False)
 
-				if d < max_dev:
-					self.simulator.set_visible(visible=False)
-					return True
-				else:
-					lx = []
-					ly = []
+		# pressing escape enters the calibration screen
+		if key != None:
+			self.recording = False
+			print("libeyelink.fix_triggered_drift_correction(): 'q' pressed")
+			return False
+		return True
 
 	def start_recording(self):
 
@@ -196,6 +179,7 @@ class libdummytracker:
 
 		"""Start dummy recording"""
 
+		self.stop_sampler()
 		if self.recording:
 			self.stop_recording()
 
@@ -204,9 +188,9 @@ class libdummytracker:
 	def set_eye_used(self):
 		pass
 
-	def sample(self):
+	def sample(self, eye=None):
 
-		"""Returns simulated gaze position (=mouse position)"""
+		"""Returns simulated gaze position (=mouse position); both eyes look at the same position, so eye is ignored"""
 
 		if self.blinkfun:
 			if self.blinking:
@@ -222,9 +206,43 @@ class libdummytracker:
 					self.bbpos =  self.simulator.get_pos()[0] # position before blinking
 					self.simulator.set_pos(pos=(self.bbpos[0],self.resolution[1])) # set position to blinking position
 
+		if self.gaze_filter != None:
+			return self.gaze_filter.update(self.experiment.time(), self.simulator.get_pos()[0])
 		return self.simulator.get_pos()[0]
 
-	def pupil_size(self):
+	def set_gaze_filter(self, kind, **params):
+
+		"""Sets the online gaze filter that is applied to the simulated gaze position"""
+
+		self.gaze_filter = libfilter.create(kind, **params)
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		"""Starts a thread that collects the simulated samples at 1000 Hz in a ring buffer, optionally in shared memory, unless it is already running"""
+
+		if self.sampler != None:
+			return self.sampler
+		self.sampler = libsampler.start(self._poll, shm_name=shm_name, capacity=capacity, samplerate=1000)
+		return self.sampler
+
+	def stop_sampler(self):
+
+		"""Stops the sampler thread, if it is running"""
+
+		if self.sampler != None:
+			self.sampler.stop()
+			self.sampler = None
+
+	def _poll(self):
+
+		"""Returns the simulated sample as a (time, x, y, pupil) tuple for the sampler thread"""
+
+		pos, t = self.simulator.get_pos()
+		if self.blinking:
+			return t, -1, -1, 0
+		return t, pos[0], pos[1], 0
+
+	def pupil_size(self, eye=None):
 
 		"""Dummy pupil size"""
 
@@ -249,6 +267,22 @@ class libdummytracker:
 
 		return (self.experiment.time(), ())
 
+	def wait_for_events(self, events, timeout=None):
+
+		"""Waits for the first of several simulated events, in a single pass over the samples"""
+
+		# a simulated blink is reported as missing data to the detector
+		return libonline.wait_for_events(self, self.detector, events, timeout, samplerate=100, sample=self._detector_sample)
+
+	def _detector_sample(self):
+
+		"""Returns simulated gaze position, or (-1,-1) during a simulated blink"""
+
+		pos = self.sample()
+		if self.blinking:
+			return (-1,-1)
+		return pos
+
 	def wait_for_saccade_start(self):
 
 		"""Returns starting time and starting position when a simulated saccade is started"""
@@ -258,7 +292,9 @@ class libdummytracker:
 
 		spos = self.sample() # starting position
 		maxerr = 3 # pixels
+		pace = libwait.pacer(1000)
 		while True:
+			pace.tick()
 			npos = self.sample() # get newest sample
 			if ((spos[0]-npos[0])**2  + (spos[1]-npos[1])**2)**0.5 > maxerr: # Pythagoras
 				break
@@ -290,6 +326,7 @@ class libdummytracker:
 		xl = [] # list for last five samples (x coordinate)
 		yl = [] # list for last five samples (y coordinate)
 		moving = True
+		pace = libwait.pacer(100)
 		while moving:
 			# check positions
 			npos = self.sample()
@@ -304,7 +341,7 @@ class libdummytracker:
 				# remove oldest sample
 				xl.pop(0); yl.pop(0)
 			# wait for a bit, to avoid immediately returning (runs go faster than mouse moves)
-			self.experiment.sleep(10)
+			pace.tick()
 
 		return self.experiment.time(), spos, (xl[len(xl)-1],yl[len(yl)-1])
 
@@ -321,6 +358,7 @@ class libdummytracker:
 		xl = [] # list for last five samples (x coordinate)
 		yl = [] # list for last five samples (y coordinate)
 		moving = True
+		pace = libwait.pacer(100)
 		while moving:
 			npos = self.sample()
 			xl.append(npos[0]) # add newest sample
@@ -332,7 +370,7 @@ class libdummytracker:
 				# remove oldest sample
 				xl.pop(0); yl.pop(0)
 			# wait for a bit, to avoid immediately returning (runs go faster than mouse moves)
-			self.experiment.sleep(10)
+			pace.tick()
 
 		return self.experiment.time(), (xl[len(xl)-1],yl[len(yl)-1])
 
@@ -346,7 +384,9 @@ class libdummytracker:
 		stime, spos = self.wait_for_fixation_start()
 		maxerr = 3 # pixels
 		
+		pace = libwait.pacer(1000)
 		while True:
+			pace.tick()
 			npos = self.sample() # get newest sample
 			if ((spos[0]-npos[0])**2  + (spos[1]-npos[1])**2)**0.5 > maxerr: # Pythagoras
 				break
@@ -361,7 +401,9 @@ class libdummytracker:
 		# of the eyes, a mousebuttonup the opening.
 
 		if self.blinkfun:
+			pace = libwait.pacer(1000)
 			while not self.blinking:
+				pace.tick()
 				pos = self.sample()
 
 			return self.experiment.time(), pos
@@ -379,10 +421,13 @@ class libdummytracker:
 
 		if self.blinkfun:
 			# wait for blink start
+			pace = libwait.pacer(1000)
 			while not self.blinking:
+				pace.tick()
 				spos = self.sample()
 			# wait for blink end
 			while self.blinking:
+				pace.tick()
 				epos = self.sample()
 
 			return self.experiment.time(), epos
@@ -391,6 +436,12 @@ class libdummytracker:
 			print("libeyelink_dummy: blink functionality not available")
 			return self.experiment.time(), (0,0)
 
+	def wait_for_aoi(self, index, fixation=False, leave=False, timeout=None):
+
+		"""Returns time and AOI when simulated gaze enters or leaves an area of interest, or time and None on a timeout"""
+
+		return libaoi.wait_for_aoi(self, index, fixation, leave, timeout)
+
 	def prepare_backdrop(self, canvas):
 		pass
 
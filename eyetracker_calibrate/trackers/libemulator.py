@@ -0,0 +1,467 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# An emulator of iViewX that speaks the remote command protocol over UDP (see
+# libiviewx), so that libiviewx can be run and tested without a tracker. The
+# emulator streams samples from a gaze function, runs calibrations and
+# validations that accept every point by themselves, and answers the other
+# commands like iViewX does.
+#
+# For example, to emulate a tracker on the local machine:
+#
+#	emulator = libemulator.iviewx_emulator(samplerate=250)
+#	tracker = libiviewx.libiviewx(experiment, resolution)
+#	...
+#	tracker.close()
+#	emulator.stop()
+#
+# To test how a receiver copes with a bad network, the emulator can lose,
+# reorder, and delay samples (see set_faults()). measure() and benchmark()
+# measure the latency from the moment a sample is due at the emulator until a
+# receiver has parsed it, and the fraction of samples that doesn't arrive:
+#
+#	python libemulator.py [samplerate ...]
+
+import heapq
+import random
+import select
+import socket
+import threading
+import time
+
+import numpy
+
+import libbinocular
+import libremote
+import libwait
+
+def fixation(x, y, noise=.5):
+
+	"""<DOC>
+	Creates a gaze function that fixates a position, with Gaussian noise.
+
+	Arguments:
+	x		--	The horizontal position.
+	y		--	The vertical position.
+
+	Keyword arguments:
+	noise	--	The standard deviation of the noise in pixels. (default=.5)
+
+	Returns:
+	A function that takes a time in milliseconds, and returns an (x, y, #
+	pupil) tuple.
+	</DOC>"""
+
+	def gaze(t):
+		return random.gauss(x, noise), random.gauss(y, noise), 4.
+	return gaze
+
+def replay(samples):
+
+	"""<DOC>
+	Creates a gaze function that replays recorded samples, in a loop.
+
+	Arguments:
+	samples	--	A list of (x, y, pupil) tuples, one per sample. None, or a #
+				pupil size of 0, is missing data.
+
+	Returns:
+	A function that takes a time in milliseconds, and returns an (x, y, #
+	pupil) tuple or None.
+	</DOC>"""
+
+	index = [0]
+	def gaze(t):
+		s = samples[index[0] % len(samples)]
+		index[0] += 1
+		return s
+	return gaze
+
+class iviewx_emulator(threading.Thread):
+
+	"""An emulator of iViewX, which runs in a thread."""
+
+	def __init__(self, ip='127.0.0.1', sendport=4444, receiveport=5555, \
+		samplerate=250, gaze=None, binocular=False, resolution=(1024, 768), \
+		auto_accept=500, accuracy=(.4, .3), loss=0, reorder=0, jitter=0):
+
+		"""<DOC>
+		Constructor. Starts the emulator.
+
+		Keyword arguments:
+		ip			--	The address to which the samples and replies are #
+						sent. (default='127.0.0.1')
+		sendport	--	The port at which commands are received. (default=4444)
+		receiveport	--	The port to which the samples and replies are #
+						sent. (default=5555)
+		samplerate	--	The sampling rate in Hz, up to 1250 Hz like the #
+						fastest SMI trackers. (default=250)
+		gaze		--	A gaze function, see fixation() and replay(), or #
+						None to fixate the centre of the display. #
+						(default=None)
+		binocular	--	Indicates whether both eyes are sent. (default=False)
+		resolution	--	The size of the calibration area, which can be #
+						changed with ET_CSZ. (default=(1024, 768))
+		auto_accept	--	The time in milliseconds after which a calibration #
+						point is accepted by itself. (default=500)
+		accuracy	--	The (dx, dy) validation error in degrees, which is #
+						reported for every eye. (default=(.4, .3))
+		loss		--	See set_faults(). (default=0)
+		reorder		--	See set_faults(). (default=0)
+		jitter		--	See set_faults(). (default=0)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'iViewX emulator')
+		self.daemon = True
+		self.address = ip, receiveport
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.sock.bind((u'', sendport))
+		self.sock.setblocking(False)
+		self.samplerate = samplerate
+		self.binocular = binocular
+		self.resolution = resolution
+		self.auto_accept = auto_accept
+		self.accuracy = accuracy
+		if gaze == None:
+			gaze = fixation(resolution[0] / 2., resolution[1] / 2.)
+		self.gaze = gaze
+		self.streaming = False
+		self.recording = False
+		self.trial = 0
+		# All commands, and all remarks, in the order in which they arrived
+		self.commands = []
+		self.remarks = []
+		self.saved = None
+		self.set_faults(loss, reorder, jitter)
+		# Statistics: the samples that were due, the samples that were lost on
+		# purpose, and the samples that were sent
+		self.generated = 0
+		self.dropped = 0
+		self.sent = 0
+		# The samples that wait to be sent, as (time, sequence number, line)
+		# tuples in a heap, so that delayed samples can overtake each other
+		self._queue = []
+		self._seq = 0
+		# The points of a running calibration or validation, and the index of
+		# the current point
+		self._points = []
+		self._point = None
+		self._accept = None
+		self._halt = threading.Event()
+		self.start()
+
+	def set_faults(self, loss=0, reorder=0, jitter=0):
+
+		"""<DOC>
+		Sets the faults that are injected into the stream of samples. This #
+		can be changed while the emulator runs.
+
+		Keyword arguments:
+		loss	--	The probability that a sample is lost. (default=0)
+		reorder	--	The probability that a sample is held back until after #
+					the next sample. (default=0)
+		jitter	--	The maximum delay in milliseconds that is added to every #
+					sample, uniformly distributed. A jitter of more than one #
+					sampling interval also reorders samples. (default=0)
+		</DOC>"""
+
+		self.loss = loss
+		self.reorder = reorder
+		self.jitter = jitter
+
+	def _send(self, line):
+
+		try:
+			self.sock.sendto((line + u'\n').encode(u'ascii'), self.address)
+		except socket.error:
+			# Like UDP, the emulator doesn't care whether anyone listens
+			pass
+
+	def _grid(self, n):
+
+		"""
+		Gets the calibration points, as iViewX places them.
+
+		Arguments:
+		n	--	The number of points.
+
+		Returns:
+		A list of (x, y) tuples.
+		"""
+
+		w, h = self.resolution
+		xs = [.1 * w, .5 * w, .9 * w]
+		ys = [.1 * h, .5 * h, .9 * h]
+		points = [(w / 2., h / 2.)] + [(x, y) for y in ys for x in xs \
+			if (x, y) != (w / 2., h / 2.)]
+		if n <= 5:
+			points = points[:1] + [points[i] for i in (1, 3, 6, 8)]
+		return [(int(x), int(y)) for x, y in points[:n]]
+
+	def _start_points(self, points, now):
+
+		self._points = points
+		for i, (x, y) in enumerate(points):
+			self._send(u'ET_PNT %d %d %d' % (i + 1, x, y))
+		self._next_point(0, now)
+
+	def _next_point(self, i, now):
+
+		if i >= len(self._points):
+			self._point = None
+			self._send(u'ET_FIN')
+			return
+		self._point = i
+		self._accept = now + self.auto_accept
+		self._send(u'ET_CHG %d' % (i + 1))
+
+	def handle(self, line, now):
+
+		"""<DOC>
+		Handles a command.
+
+		Arguments:
+		line	--	The command.
+		now		--	The current time in milliseconds.
+		</DOC>"""
+
+		self.commands.append(line)
+		parts = line.split()
+		if len(parts) == 0:
+			return
+		cmd = parts[0]
+		if cmd == u'ET_PNG':
+			self._send(u'ET_PNG')
+		elif cmd == u'ET_STR':
+			self.streaming = True
+		elif cmd == u'ET_EST':
+			self.streaming = False
+		elif cmd == u'ET_REC':
+			self.recording = True
+		elif cmd == u'ET_STP':
+			self.recording = False
+		elif cmd == u'ET_INC':
+			self.trial += 1
+		elif cmd == u'ET_REM':
+			self.remarks.append(line[7:].strip(u'"'))
+		elif cmd == u'ET_SAV':
+			self.saved = line[7:].strip(u'"')
+		elif cmd == u'ET_CSZ' and len(parts) == 3:
+			self.resolution = int(parts[1]), int(parts[2])
+		elif cmd == u'ET_CAL':
+			n = int(parts[1]) if len(parts) > 1 else 9
+			self._send(u'ET_CAL %d' % n)
+			self._start_points(self._grid(n), now)
+		elif cmd == u'ET_VAL':
+			self._send(u'ET_VAL')
+			self._start_points(self._grid(5)[1:], now)
+		elif cmd == u'ET_ACC' and self._point != None:
+			self._next_point(self._point + 1, now)
+		elif cmd == u'ET_BRK':
+			self._point = None
+		elif cmd == u'ET_VLS':
+			for eye in ([u'left', u'right'] if self.binocular else [u'left']):
+				self._send(u'ET_VLS %s %.2f %.2f' % ((eye,) + \
+					tuple(self.accuracy)))
+
+	def sample_line(self, t):
+
+		"""<DOC>
+		Creates a sample line.
+
+		Arguments:
+		t	--	The time in milliseconds.
+
+		Returns:
+		The line.
+		</DOC>"""
+
+		s = self.gaze(t)
+		if s == None:
+			s = 0, 0, 0
+		ts = int(t * 1000)
+		if self.binocular:
+			return u'ET_SPL %d %.2f %.2f %.2f %.2f %.2f %.2f' % (ts, s[0], \
+				s[0], s[1], s[1], s[2], s[2])
+		return u'ET_SPL %d %.2f %.2f %.2f' % (ts, s[0], s[1], s[2])
+
+	def _emit(self, t, interval):
+
+		"""
+		Queues a sample for sending, with the faults that are injected.
+
+		Arguments:
+		t			--	The time at which the sample is due, in milliseconds.
+		interval	--	The sampling interval in milliseconds.
+		"""
+
+		self.generated += 1
+		if self.loss > 0 and random.random() < self.loss:
+			self.dropped += 1
+			return
+		deliver = t
+		if self.jitter > 0:
+			deliver += random.uniform(0, self.jitter)
+		if self.reorder > 0 and random.random() < self.reorder:
+			# later than the next sample, even if that has the largest jitter
+			deliver += 2 * interval + self.jitter
+		self._seq += 1
+		heapq.heappush(self._queue, (deliver, self._seq, self.sample_line(t)))
+
+	def run(self):
+
+		interval = 1000. / self.samplerate
+		due = libwait.clock() * 1000
+		queue = self._queue
+		while not self._halt.is_set():
+			now = libwait.clock() * 1000
+			if self._point != None and now >= self._accept:
+				self._next_point(self._point + 1, now)
+			while now >= due:
+				if self.streaming:
+					self._emit(due, interval)
+				due += interval
+			while queue and queue[0][0] <= now:
+				self._send(heapq.heappop(queue)[2])
+				self.sent += 1
+			wake = min(due, queue[0][0]) if queue else due
+			try:
+				readable = select.select([self.sock], [], [], \
+					max(0, wake - now) / 1000.)[0]
+			except (select.error, ValueError):
+				break
+			while readable:
+				try:
+					data = self.sock.recv(65536)
+				except socket.error:
+					break
+				now = libwait.clock() * 1000
+				for line in data.decode(u'ascii', u'ignore').splitlines():
+					self.handle(line.strip(), now)
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the emulator.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive():
+			self.join(1)
+		self.sock.close()
+
+def measure(sampler, emulator, duration=5):
+
+	"""<DOC>
+	Measures the latency and the loss of samples between the emulator and a #
+	receiver, under the current sampling rate and faults.
+
+	Arguments:
+	sampler		--	The receiver: an object with add_listener() and #
+					remove_listener(), such as a libremote.link, which #
+					receives the samples of the emulator.
+	emulator	--	An iviewx_emulator that is streaming.
+
+	Keyword arguments:
+	duration	--	The duration of the measurement in seconds. (default=5)
+
+	Returns:
+	A dictionary with the results. The latency runs from the moment a sample #
+	is due at the emulator until the receiver has parsed it, which can be #
+	measured because both use libwait.clock().
+	</DOC>"""
+
+	latency = []
+	def listener(s):
+		latency.append(libwait.clock() * 1000 - s[0])
+	generated = emulator.generated
+	dropped = emulator.dropped
+	reordered = getattr(sampler, u'reordered', 0)
+	sampler.add_listener(listener)
+	time.sleep(duration)
+	sampler.remove_listener(listener)
+	generated = emulator.generated - generated
+	received = len(latency)
+	if received == 0:
+		latency = [numpy.nan]
+	latency = numpy.array(latency)
+	return {
+		u'generated': generated,
+		u'lost by the emulator': emulator.dropped - dropped,
+		u'dropped out of order by the receiver': getattr(sampler, \
+			u'reordered', 0) - reordered,
+		u'received': received,
+		u'samples/s': received / float(duration),
+		# samples in flight at the start and the end can make this slightly
+		# negative
+		u'drop rate': max(0, 1 - received / float(max(1, generated))),
+		u'median latency (ms)': numpy.median(latency),
+		u'95th percentile latency (ms)': numpy.percentile(latency, 95),
+		u'max latency (ms)': latency.max(),
+		}
+
+def benchmark(samplerate=1250, duration=5, loss=0, reorder=0, jitter=0, \
+	sendport=4444, receiveport=5555):
+
+	"""<DOC>
+	Runs an emulator and a libremote.link on this computer, and measures the #
+	link, see measure().
+
+	Keyword arguments:
+	samplerate	--	The sampling rate in Hz. (default=1250)
+	duration	--	The duration in seconds. (default=5)
+	loss		--	See iviewx_emulator.set_faults(). (default=0)
+	reorder		--	See iviewx_emulator.set_faults(). (default=0)
+	jitter		--	See iviewx_emulator.set_faults(). (default=0)
+	sendport	--	The command port. (default=4444)
+	receiveport	--	The sample port. (default=5555)
+
+	Returns:
+	A dictionary with the results.
+	</DOC>"""
+
+	emulator = iviewx_emulator(sendport=sendport, receiveport=receiveport, \
+		samplerate=samplerate, loss=loss, reorder=reorder, jitter=jitter)
+	link = libremote.link(u'127.0.0.1', sendport, receiveport, \
+		libbinocular.eye_buffer())
+	try:
+		link.batch([u'ET_FRM "%s"' % libremote.SAMPLE_FORMAT, u'ET_STR', \
+			u'ET_PNG'], [u'ET_PNG'])
+		time.sleep(.2)
+		results = measure(link, emulator, duration)
+		link.send(u'ET_EST')
+	finally:
+		link.stop()
+		emulator.stop()
+	results.update({
+		u'samplerate': samplerate,
+		u'loss': loss,
+		u'reorder': reorder,
+		u'jitter (ms)': jitter,
+		})
+	return results
+
+if __name__ == u'__main__':
+
+	import sys
+	for samplerate in [int(arg) for arg in sys.argv[1:]] or [250, 500, 1250]:
+		for loss, reorder, jitter in [(0, 0, 0), (.01, .01, 2)]:
+			for key, value in sorted(benchmark(samplerate, 2, loss, reorder, \
+				jitter).items()):
+				print(u'%s: %s' % (key, value))
+			print(u'')
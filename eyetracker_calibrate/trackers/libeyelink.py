@@ -30,23 +30,117 @@ from openexp.canvas import canvas
 from openexp.synth import synth
 from openexp.exceptions import response_error
 from libopensesame import exceptions
+from libgeometry import screen_geometry
+import libaoi
+import libbinocular
+import libconnection
+import libdrift
+import libfilter
+import libhealth
+import libsampler
+import libtarget
+import libwait
 import os.path
 import array
 import math
 import tempfile
+import threading
 try:
 	import Image
 except:
 	from PIL import Image
 
-_eyelink = None
+# The code that getNextData() returns when the event queue of the link has
+# overflowed, and events have been lost
+LOST_DATA_EVENT = 0x3F
+
+class command_batch:
+
+	"""
+	A batch of configuration commands, which are sent in one go, after which
+	the failures are reported together. A command that has been sent before
+	over the same connection, to the same tracker version, with the same
+	value, is skipped, so that re-initializing the tracker doesn't send the
+	whole configuration again.
+	"""
+
+	def __init__(self, tracker, cache):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		tracker		--	The pylink tracker.
+		cache		--	A dictionary with the configuration that has been #
+						sent over the current connection, e.g. from #
+						libconnection.connection.settings() for the tracker #
+						version.
+		</DOC>"""
+
+		self.tracker = tracker
+		self.cache = cache
+		self.commands = []
+
+	def key(self, cmd):
+
+		"""<DOC>
+		Gets the setting that a command changes: the part before the '=', #
+		or everything but the last word, e.g. 'button_function 5' for #
+		"button_function 5 'accept_target_fixation'".
+
+		Arguments:
+		cmd		--	A command.
+
+		Returns:
+		The setting.
+		</DOC>"""
+
+		if u'=' in cmd:
+			return cmd.split(u'=', 1)[0].strip()
+		return cmd.rsplit(None, 1)[0]
+
+	def add(self, cmd):
+
+		"""<DOC>
+		Queues a command, unless the same command has been sent before.
+
+		Arguments:
+		cmd		--	The command.
+		</DOC>"""
+
+		if self.cache.get(self.key(cmd)) != cmd:
+			self.commands.append(cmd)
+
+	def send(self):
+
+		"""<DOC>
+		Sends the queued commands, and remembers the ones that succeeded.
+
+		Returns:
+		A list of (command, result) tuples for the commands that failed.
+		</DOC>"""
+
+		failed = []
+		for cmd in self.commands:
+			result = self.tracker.sendCommand(cmd)
+			# older versions of pylink return None
+			if result in (None, 0):
+				self.cache[self.key(cmd)] = cmd
+			else:
+				failed.append((cmd, result))
+		self.commands = []
+		return failed
 
 class libeyelink:
 
 	MAX_TRY = 100
+	# The backoff in milliseconds between attempts to restore the link, see
+	# _restore_link()
+	MIN_BACKOFF = 250
+	MAX_BACKOFF = 4000
 
 
-	def __init__(self, experiment, resolution, data_file=u'default', fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=False, ip='127.0.0.1', sendport=4444, receiveport=5555, screen_w=399, screen_h=299):
+	def __init__(self, experiment, resolution, data_file=u'default', fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=False, ip='127.0.0.1', sendport=4444, receiveport=5555, screen_w=399, screen_h=299, screen_dist=570, gaze_filter=u'none', continuous_recording=False):
 		"""<DOC>
 		Constructor. Initializes the connection to the Eyelink.
 
@@ -74,15 +168,20 @@ class libeyelink:
 		ip			--	ignored by EyeLink
 		sendport		--	ignored by EyeLink
 		receiveport		--	ignored by EyeLink
-		screen_w		--	ignored by EyeLink
-		screen_h		--	ignored by EyeLink
+		screen_w		--	The physical screen width in millimeters. #
+							(default=399)
+		screen_h		--	The physical screen height in millimeters. #
+							(default=299)
+		screen_dist		--	The viewing distance in millimeters. (default=570)
+		gaze_filter		--	The online gaze filter that is applied by #
+							sample(): u'none', u'moving average', #
+							u'heuristic', or u'one-euro'. (default=u'none')
+		continuous_recording	--	ignored by EyeLink
 
 		Returns:
 		True on connection success and False on connection failure.
 		</DOC>"""
 
-		global _eyelink
-
 		stem, ext = os.path.splitext(data_file)
 		if len(stem) > 8 or len(ext) > 4:
 			raise exceptions.runtime_error( \
@@ -90,6 +189,9 @@ class libeyelink:
 
 		self.experiment = experiment
 		self.data_file = data_file
+		# The EDF files of this run; a new file is opened after the link has
+		# been restored, see _restore_link()
+		self.data_files = [data_file]
 		self.resolution = resolution
 		self.recording = False
 		self.cal_beep = True
@@ -101,17 +203,38 @@ class libeyelink:
 		self.left_eye = 0
 		self.right_eye = 1
 		self.binocular = 2
+		# Both eyes of the newest samples, see sample()
+		self.eyes = libbinocular.eye_buffer()
+		# Link errors and event-queue overflows, see libhealth
+		self.health = libhealth.link_counters()
+		# The viewing geometry, for conversions between degrees and pixels
+		self.geometry = screen_geometry(self.resolution, (screen_w / 10., \
+			screen_h / 10.), screen_dist / 10.)
+		self.gaze_filter = libfilter.create(gaze_filter)
+		self.sampler = None
+		# Serializes getNewestSample() and the eye buffer between the sampler
+		# thread and the main thread, see _newest_sample()
+		self._lock = threading.Lock()
+		# The state of _restore_link(), which every call of the tracker goes
+		# through, so it must be set before the first call
+		self._lost = None
+		self._retry = 0
+		self._backoff = self.MIN_BACKOFF
 		
-		# Only initialize the eyelink once
-		if _eyelink == None:
-			try:
-				_eyelink = pylink.EyeLink()
-			except Exception as e:
-				raise exceptions.runtime_error( \
-					u'Failed to connect to the tracker: %s' % e)					
+		# Only connect to the eyelink once: the connection is kept open
+		# between runs, see libconnection
+		self.connection = libconnection.get(u'eyelink', pylink.EyeLink, \
+			lambda link: link.isConnected(), lambda link: link.close())
+		try:
+			link = self.connection.open()[0]
+		except Exception as e:
+			raise exceptions.runtime_error( \
+				u'Failed to connect to the tracker: %s' % e)					
 
-			graphics_env = eyelink_graphics(self.experiment, _eyelink)
-			pylink.openGraphicsEx(graphics_env)				
+		# The graphics environment draws on the display of this run
+		self.graphics = eyelink_graphics(self.experiment, link, \
+			self.connection.settings(u'graphics'))
+		pylink.openGraphicsEx(self.graphics)
 			
 		# Optionally force drift correction. For some reason this must be done
 		# as (one of) the first things otherwise a segmentation fault occurs.
@@ -122,9 +245,51 @@ class libeyelink:
 		pylink.flushGetkeyQueue()
 		pylink.getEYELINK().setOfflineMode()
 
-		# Notify the eyelink of the display resolution
-		self.send_command('screen_pixel_coords =  0 0 %d %d' % ( \
-			self.resolution[0], self.resolution[1]))
+		self.configure()
+
+		# Make sure that we are connected to the eyelink before we start
+		# further communication
+		if not self.connected():
+			raise exceptions.runtime_error( \
+				"Failed to connect to the eyetracker")
+
+		# Reconnect if the link drops during the experiment. pylink draws on
+		# the display of the experiment, so the watchdog only notices that the
+		# link dropped, and the link is restored in the main thread, at the
+		# next call of the tracker, see _restore_link()
+		self.connection.start_watchdog(on_lost=self._link_lost, \
+			reconnect=False)
+
+		# TODO: The code below potentially fixes a bug, but - pending a more
+		# thorough understanding - has been disabled to avoid regressions and
+		# other problems. Discussions on this issue can be found here:
+		# <http://forum.cogsci.nl/index.php?p=/discussion/comment/1161>
+		# <https://www.sr-support.com/showthread.php?3208-Event-data-from-the-link-buffer&p=11979>
+		#
+		# catch pylink bug: pre 1.0.0.28, calling getfloatData() on
+		# start_saccade data returns scrambled events so compare current
+		# version to up-to-date version
+		#cur_v = pylink.version.vernum
+		#utd_v = (1, 0, 0, 28)
+
+		#utd = True
+		#for n in range( len(utd_v) ):
+			#if cur_v[n] < utd_v[n]:
+				#utd = False
+			#if utd == False or cur_v[n] > utd_v[n]:
+				#break
+
+		## if not  up to date, redefine wait_for_saccade_start
+		#if not utd:
+			#self.wait_for_saccade_start = self.__wait_for_saccade_start_pre_10028
+
+	def configure(self):
+
+		"""<DOC>
+		Determines the tracker version, and sends the configuration. Only #
+		the commands that the tracker didn't get over the current #
+		connection yet are sent, see command_batch.
+		</DOC>"""
 
 		# Determine the software version of the tracker
 		self.tracker_software_ver = 0
@@ -135,72 +300,131 @@ class libeyelink:
 			self.tracker_software_ver = int(float(tvstr[(vindex + \
 				len("EYELINK CL")):].strip()))
 
+		# The configuration is sent as one batch, which skips the commands
+		# that the tracker already got over this connection
+		batch = command_batch(pylink.getEYELINK(), \
+			self.connection.settings((self.eyelink_ver, \
+			self.tracker_software_ver)))
+
+		# Notify the eyelink of the display resolution
+		batch.add('screen_pixel_coords =  0 0 %d %d' % ( \
+			self.resolution[0], self.resolution[1]))
+
 		# Some configuration stuff (not sure what the parser and gazemap mean)
 		if self.eyelink_ver >= 2:
-			self.send_command("select_parser_configuration 0")
+			batch.add("select_parser_configuration 0")
 			if self.eyelink_ver == 2: #turn off scenelink camera stuff
-				self.send_command("scene_camera_gazemap = NO")
+				batch.add("scene_camera_gazemap = NO")
 		else:
-			self.send_command("saccade_velocity_threshold = %d" % \
+			batch.add("saccade_velocity_threshold = %d" % \
 				self.saccade_velocity_threshold)
-			self.send_command("saccade_acceleration_threshold = %s" % \
+			batch.add("saccade_acceleration_threshold = %s" % \
 				self.saccade_acceleration_threshold)
 
 		# Set EDF file contents
-		self.send_command( \
+		batch.add( \
 			"file_event_filter = LEFT,RIGHT,FIXATION,SACCADE,BLINK,MESSAGE,BUTTON")
 		if self.tracker_software_ver >= 4:
-			self.send_command( \
+			batch.add( \
 				"file_sample_data  = LEFT,RIGHT,GAZE,AREA,GAZERES,STATUS,HTARGET")
 		else:
-			self.send_command( \
+			batch.add( \
 				"file_sample_data  = LEFT,RIGHT,GAZE,AREA,GAZERES,STATUS")
 
 		# Set link data. This specifies which data is sent through the link and
 		# thus be used in gaze contingent displays
-		self.send_command( \
+		batch.add( \
 			"link_event_filter = LEFT,RIGHT,FIXATION,SACCADE,BLINK,BUTTON")
-		self.send_command( \
+		batch.add( \
 			"link_event_data = GAZE,GAZERES,HREF,AREA,VELOCITY,STATUS")
 		if self.tracker_software_ver >= 4:
-			self.send_command( \
+			batch.add( \
 				"link_sample_data  = LEFT,RIGHT,GAZE,GAZERES,AREA,STATUS,HTARGET")
 		else:
-			self.send_command( \
+			batch.add( \
 				"link_sample_data  = LEFT,RIGHT,GAZE,GAZERES,AREA,STATUS")				
 
 		# Not sure what this means. Maybe the button that is used to end drift
 		# correction?
-		self.send_command("button_function 5 'accept_target_fixation'")
+		batch.add("button_function 5 'accept_target_fixation'")
 
-		# Make sure that we are connected to the eyelink before we start
-		# further communication
-		if not self.connected():
-			raise exceptions.runtime_error( \
-				"Failed to connect to the eyetracker")
+		for cmd, result in batch.send():
+			print u'libeyelink: command "%s" failed (%s)' % (cmd, result)
 
-		# TODO: The code below potentially fixes a bug, but - pending a more
-		# thorough understanding - has been disabled to avoid regressions and
-		# other problems. Discussions on this issue can be found here:
-		# <http://forum.cogsci.nl/index.php?p=/discussion/comment/1161>
-		# <https://www.sr-support.com/showthread.php?3208-Event-data-from-the-link-buffer&p=11979>
-		#
-		# catch pylink bug: pre 1.0.0.28, calling getfloatData() on
-		# start_saccade data returns scrambled events so compare current
-		# version to up-to-date version
-		#cur_v = pylink.version.vernum
-		#utd_v = (1, 0, 0, 28)
+	def _link_lost(self, lost):
 
-		#utd = True
-		#for n in range( len(utd_v) ):
-			#if cur_v[n] < utd_v[n]:
-				#utd = False
-			#if utd == False or cur_v[n] > utd_v[n]:
-				#break
+		"""
+		Counts the loss of the link as a link error, and flags it, so that
+		the link is restored at the next call of the tracker. This is called
+		in the watchdog thread.
 
-		## if not  up to date, redefine wait_for_saccade_start
-		#if not utd:
-			#self.wait_for_saccade_start = self.__wait_for_saccade_start_pre_10028
+		Arguments:
+		lost	--	The time when the link dropped, in milliseconds.
+		"""
+
+		self.health.errors += 1
+		self._lost = lost
+
+	def _data_file_part(self, n):
+
+		"""
+		Gets the name of a later part of the EDF file, which still fits in
+		eight characters.
+
+		Arguments:
+		n	--	The number of the part, from 2.
+
+		Returns:
+		A file name.
+		"""
+
+		stem, ext = os.path.splitext(self.data_file)
+		suffix = u'_%d' % n
+		return stem[:8 - len(suffix)] + suffix + ext
+
+	def _restore_link(self):
+
+		"""
+		Reconnects after the link has dropped, and restores the state of the
+		tracker: the graphics, the configuration, a new EDF file, which
+		close() transfers with the others, and recording. The gap is logged.
+		This is called in the main thread, by the functions that talk to the
+		tracker. While the tracker can't be reached, a new attempt is made
+		after an exponential backoff, so that the calls don't block.
+		"""
+
+		lost = self._lost
+		if lost == None:
+			return
+		now = libwait.clock() * 1000
+		if now < self._retry:
+			return
+		try:
+			# The sampler thread doesn't read from the link while it is
+			# replaced
+			with self._lock:
+				link = self.connection.open()[0]
+		except Exception as e:
+			print(u'libeyelink: failed to reconnect, retrying in %d ms: %s' \
+				% (self._backoff, e))
+			self._retry = now + self._backoff
+			self._backoff = min(2 * self._backoff, self.MAX_BACKOFF)
+			return
+		restored = libwait.clock() * 1000
+		self._lost = None
+		self._retry = 0
+		self._backoff = self.MIN_BACKOFF
+		self.graphics.set_tracker(link, self.connection.settings(u'graphics'))
+		pylink.openGraphicsEx(self.graphics)
+		data_file = self._data_file_part(len(self.data_files) + 1)
+		pylink.getEYELINK().openDataFile(data_file)
+		self.data_files.append(data_file)
+		pylink.getEYELINK().setOfflineMode()
+		self.configure()
+		self.log(u'link_gap %d %d %d' % (lost, restored, restored - lost))
+		self.log(u'data_file %s continues %s' % (data_file, self.data_file))
+		if self.recording:
+			self.start_recording()
 
 	def send_command(self, cmd):
 
@@ -211,6 +435,7 @@ class libeyelink:
 		cmd		--	The eyelink command to be executed.
 		</DOC>"""
 
+		self._restore_link()
 		pylink.getEYELINK().sendCommand(cmd)
 
 	def log(self, msg):
@@ -228,6 +453,7 @@ class libeyelink:
 			msg = msg.encode('ascii','ignore')
 		if type(msg) == str:
 			msg = msg.decode('ascii','ignore')
+		self._restore_link()
 		pylink.getEYELINK().sendMessage(msg)
 
 	def log_var(self, var, val):
@@ -241,6 +467,7 @@ class libeyelink:
 		val		-- The value.
 		</DOC>"""
 
+		self._restore_link()
 		pylink.getEYELINK().sendMessage("var %s %s" % (var, val))
 
 	def status_msg(self, msg):
@@ -280,6 +507,7 @@ class libeyelink:
 		Raises an exceptions.runtime_error on failure.
 		</DOC>"""
 
+		self._restore_link()
 		if self.recording:
 			raise exceptions.runtime_error( \
 				u'Trying to calibrate after recording has started')
@@ -334,6 +562,7 @@ class libeyelink:
 		Raises an exceptions.runtime_error on error.
 		</DOC>"""
 		
+		self._restore_link()
 		self.experiment.eyelink_esc_pressed = False
 		if self.recording:
 			raise exceptions.runtime_error( \
@@ -364,7 +593,7 @@ class libeyelink:
 			raise exceptions.runtime_error( \
 				u'Failed to perform drift correction (waitForBlockStart error)')
 
-	def fix_triggered_drift_correction(self, pos=None, min_samples=30, max_dev=60, reset_threshold=10):
+	def fix_triggered_drift_correction(self, pos=None, min_samples=30, max_dev=60, reset_threshold=10, max_dispersion=None):
 
 		"""<DOC>
 		Performs fixation triggered drift correction. You can return to the #
@@ -380,6 +609,8 @@ class libeyelink:
 		max_dev			--	The maximum allowed deviation. (default=60)
 		reset_threshold	--	The maximum allowed deviation from one sample to #
 							the next (default=10)
+		max_dispersion	--	The maximum allowed dispersion of the stable #
+							samples, or None for no limit. (default=None)
 
 		Returns:
 		True on success, False on failure.
@@ -398,55 +629,34 @@ class libeyelink:
 		self.prepare_drift_correction(pos)
 		my_keyboard = keyboard(self.experiment, keylist=[u'escape', u'q'], \
 			timeout=0)
-		# Loop until we have sufficient samples
-		lx = []
-		ly = []
-		while len(lx) < min_samples:
-			# Pressing escape enters the calibration screen
+		while True:
+			# Wait until gaze rests on the target. Pressing escape enters the
+			# calibration screen.
 			try:
-				key,time = my_keyboard.get_key()
+				mean, key = libdrift.wait_for_fixation(self, pos, \
+					min_samples=min_samples, max_dev=max_dev, \
+					reset_threshold=reset_threshold, \
+					max_dispersion=max_dispersion, keyboard=my_keyboard)
 			except response_error:
-				# self.experiment.eyelink_esc_pressed = True
 				self.confirm_abort_experiment()
-				# self.experiment.eyelink_esc_pressed = False
 				self.recording = False
 				return False
-			else:
-				if key != None: # i.e. 'q' was pressed
-					self.recording = False
-					print u'libeyelink.fix_triggered_drift_correction(): \'q\' pressed'
-					return False
-			# Collect a sample
-			x, y = self.sample()
-			if len(lx) == 0 or x != lx[-1] or y != ly[-1]:
-				# If the current sample deviates too much from the previous one,
-				# reset counting
-				if len(lx) > 0 and (abs(x - lx[-1]) > reset_threshold or abs(y - ly[-1]) > reset_threshold):
-					lx = []
-					ly = []
-				# Collect samples
-				else:
-					lx.append(x)
-					ly.append(y)
-			if len(lx) == min_samples:
-				avg_x = sum(lx) / len(lx)
-				avg_y = sum(ly) / len(ly)
-				d = math.sqrt( (avg_x - pos[0]) ** 2 + (avg_y - pos[1]) ** 2)
-				# Emulate a spacebar press on success
-				pylink.getEYELINK().sendKeybutton(32, 0, pylink.KB_PRESS)
-				# getCalibrationResult() returns 0 on success and an exception
-				# or a non-zero value otherwise
-				result = -1
-				try:
-					result = pylink.getEYELINK().getCalibrationResult()
-				except:
-					lx = []
-					ly = []
-					print u'libeyelink.fix_triggered_drift_correction(): try again'
-				if result != 0:
-					lx = []
-					ly = []
-					print u'libeyelink.fix_triggered_drift_correction(): try again'
+			if key != None: # i.e. 'q' was pressed
+				self.recording = False
+				print u'libeyelink.fix_triggered_drift_correction(): \'q\' pressed'
+				return False
+			# Emulate a spacebar press on success
+			pylink.getEYELINK().sendKeybutton(32, 0, pylink.KB_PRESS)
+			# getCalibrationResult() returns 0 on success and an exception
+			# or a non-zero value otherwise
+			result = -1
+			try:
+				result = pylink.getEYELINK().getCalibrationResult()
+			except:
+				pass
+			if result == 0:
+				break
+			print u'libeyelink.fix_triggered_drift_correction(): try again'
 		# Apply drift correction
 		pylink.getEYELINK().applyDriftCorrect()
 		self.recording = False
@@ -507,7 +717,11 @@ class libeyelink:
 		Raises an exceptions.runtime_error on failure.
 		</DOC>"""
 
+		self._restore_link()
 		self.recording = True
+		if self.sampler != None:
+			# The newest sample of the previous recording is stale
+			self.sampler.latest = None
 		i = 0
 		while True:
 			# Params: write  samples, write event, send samples, send events
@@ -534,6 +748,7 @@ class libeyelink:
 		Stops recording of gaze samples.
 		</DOC>"""
 
+		self._restore_link()
 		self.recording = False
 		pylink.endRealTimeMode()
 		pylink.getEYELINK().setOfflineMode()
@@ -542,28 +757,32 @@ class libeyelink:
 	def close(self):
 
 		"""<DOC>
-		Closes the connection with the eyelink.
+		Closes the data file and transfers it, and the later parts of it #
+		if the link has been restored in between. The connection with the #
+		eyelink is kept open for the next run, see libconnection.
 		</DOC>"""
 
+		self._restore_link()
+		self.connection.stop_watchdog()
+		self.stop_sampler()
 		if self.recording:
 			self.stop_recording()
 		# Close the datafile and transfer it to the experimental pc
 		print u'libeyelink: closing data file'
 		pylink.getEYELINK().closeDataFile()
 		pylink.msecDelay(100)
-		print u'libeyelink: transferring data file'
-		pylink.getEYELINK().receiveDataFile(self.data_file, self.data_file)
-		pylink.msecDelay(100)
-		print u'libeyelink: closing eyelink'
-		pylink.getEYELINK().close()
-		pylink.msecDelay(100)
+		for data_file in self.data_files:
+			print u'libeyelink: transferring data file %s' % data_file
+			pylink.getEYELINK().receiveDataFile(data_file, data_file)
+			pylink.msecDelay(100)
 
 	def set_eye_used(self):
 
 		"""<DOC>
 		Sets the eye_used variable, based on the eyelink's report, which #
 		specifies which eye is being tracked. If both eyes are being tracked, #
-		the left eye is used.
+		both are kept in the eye buffer, and the left eye is used when no #
+		eye is specified.
 
 		Exceptions:
 		Raises an exceptions.runtime_error on failure.
@@ -572,18 +791,27 @@ class libeyelink:
 		self.eye_used = pylink.getEYELINK().eyeAvailable()
 		if self.eye_used == self.right_eye:
 			self.log_var("eye_used", "right")
-		elif self.eye_used == self.left_eye or self.eye_used == self.binocular:
+		elif self.eye_used == self.left_eye:
 			self.log_var("eye_used", "left")
-			self.eye_used = self.left_eye
+		elif self.eye_used == self.binocular:
+			self.log_var("eye_used", "binocular")
 		else:
 			raise exceptions.runtime_error( \
 				u'Failed to determine which eye is being recorded')
 
-	def sample(self):
+	def sample(self, eye=None):
 
 		"""<DOC>
 		Gets the most recent gaze sample.
 
+		Keyword arguments:
+		eye	--	u'left', u'right', u'average' (the cyclopean gaze position, #
+				or the one eye that is available), u'best' (the eye with #
+				the smallest validation error, or the one eye that is #
+				available), or None for the eye that is being recorded, #
+				which is the left eye for binocular recordings. See #
+				libbinocular. (default=None)
+
 		Returns:
 		A tuple (x, y) containing the coordinates of the sample. The value #
 		(-1, -1) indicates missing data.
@@ -595,24 +823,157 @@ class libeyelink:
 		if not self.recording:
 			raise exceptions.runtime_error( \
 				u'Please start recording before collecting eyelink data')
+		self._restore_link()
 		if self.eye_used == None:
 			self.set_eye_used()
-		s = pylink.getEYELINK().getNewestSample()
+		if self.sampler != None:
+			# The sampler thread polls the tracker, so take the newest sample
+			# from it
+			s = self.sampler.latest
+			if s == None:
+				return -1, -1
+			if eye != None:
+				gaze = self.eyes.sample(eye)
+			else:
+				gaze = s[1], s[2]
+			if self.gaze_filter != None:
+				return self.gaze_filter.update(s[0], gaze)
+			return gaze
+		s = self._newest_sample(eye != None)
 		if s == None:
-			gaze = -1, -1
+			return -1, -1
+		elif eye != None:
+			gaze = self.eyes.sample(eye)
 		elif self.eye_used == self.right_eye and s.isRightSample():
 			gaze = s.getRightEye().getGaze()
-		elif self.eye_used == self.left_eye and s.isLeftSample():
+		elif self.eye_used != self.right_eye and s.isLeftSample():
 			gaze = s.getLeftEye().getGaze()
 		else:
 			gaze = -1, -1
+		if self.gaze_filter != None:
+			return self.gaze_filter.update(s.getTime(), gaze)
 		return gaze
 
-	def pupil_size(self):
+	def set_gaze_filter(self, kind, **params):
+
+		"""<DOC>
+		Sets the online gaze filter that is applied by sample(). See #
+		libfilter for the latency that each filter adds.
+
+		Arguments:
+		kind	--	u'none', u'moving average', u'heuristic', or u'one-euro'.
+
+		Keyword arguments:
+		params	--	Parameters for the filter, see libfilter.
+		</DOC>"""
+
+		self.gaze_filter = libfilter.create(kind, **params)
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		"""<DOC>
+		Starts a thread that collects all samples in a ring buffer. If a #
+		name is given, the ring is placed in shared memory, so that other #
+		processes can read the samples with libshm.gaze_reader. If the #
+		thread is already running, it is kept, so that its readers stay #
+		valid; call stop_sampler() first to change the ring.
+
+		Keyword arguments:
+		shm_name	--	The name of the shared-memory segment, or None. #
+						(default=None)
+		capacity	--	The number of samples in the ring. (default=4096)
+
+		Returns:
+		A libsampler.sampler.
+		</DOC>"""
+
+		if self.sampler != None:
+			return self.sampler
+		self.sampler = libsampler.start(self._poll, shm_name=shm_name, \
+			capacity=capacity)
+		return self.sampler
+
+	def stop_sampler(self):
+
+		"""<DOC>
+		Stops the sampler thread, if it is running.
+		</DOC>"""
+
+		if self.sampler != None:
+			self.sampler.stop()
+			self.sampler = None
+
+	def _poll(self):
+
+		"""
+		Gets the newest sample for the sampler thread.
+
+		Returns:
+		A (time, x, y, pupil) tuple, or None if no sample is available.
+		"""
+
+		s = self._newest_sample(True)
+		if s == None:
+			return None
+		if self.eye_used == self.right_eye and s.isRightSample():
+			e = s.getRightEye()
+		elif self.eye_used != self.right_eye and s.isLeftSample():
+			e = s.getLeftEye()
+		elif self.eye_used == None and s.isRightSample():
+			e = s.getRightEye()
+		else:
+			return s.getTime(), -1, -1, -1
+		x, y = e.getGaze()
+		return s.getTime(), x, y, e.getPupilSize()
+
+	def _newest_sample(self, write_eyes=False):
+
+		"""
+		Gets the newest sample from the tracker. The calls of the sampler
+		thread and the main thread are serialized.
+
+		Keyword arguments:
+		write_eyes	--	Indicates whether both eyes of the sample are written
+						into the eye buffer.
+
+		Returns:
+		A pylink sample, or None if no sample is available.
+		"""
+
+		with self._lock:
+			s = pylink.getEYELINK().getNewestSample()
+			if s != None and write_eyes:
+				self._write_eyes(s)
+		return s
+
+	def _write_eyes(self, s):
+
+		"""
+		Writes both eyes of a sample into the eye buffer.
+
+		Arguments:
+		s	--	A pylink sample.
+		"""
+
+		left = right = None
+		if s.isLeftSample():
+			e = s.getLeftEye()
+			if e.getPupilSize() > 0:
+				left = e.getGaze() + (e.getPupilSize(),)
+		if s.isRightSample():
+			e = s.getRightEye()
+			if e.getPupilSize() > 0:
+				right = e.getGaze() + (e.getPupilSize(),)
+		self.eyes.write(s.getTime(), left, right)
+
+	def pupil_size(self, eye=None):
 
 		"""<DOC>
 		Gets the most recent pupil size.
 
+		Keyword arguments:
+		eye	--	The eye, see sample(). (default=None)
+
 		Returns:
 		A float corresponding to the pupil size (in arbitrary units). The #
 		value -1 indicates missing data.
@@ -624,14 +985,24 @@ class libeyelink:
 		if not self.recording:
 			raise exceptions.runtime_error( \
 				u'Please start recording before collecting eyelink data')
+		self._restore_link()
 		if self.eye_used == None:
 			self.set_eye_used()
-		s = pylink.getEYELINK().getNewestSample()
+		if self.sampler != None:
+			# See sample()
+			if eye != None:
+				return self.eyes.pupil_size(eye)
+			if self.sampler.latest == None:
+				return -1
+			return self.sampler.latest[3]
+		s = self._newest_sample(eye != None)
 		if s == None:
 			ps = -1
+		elif eye != None:
+			ps = self.eyes.pupil_size(eye)
 		elif self.eye_used == self.right_eye and s.isRightSample():
 			ps = s.getRightEye().getPupilSize()
-		elif self.eye_used == self.left_eye and s.isLeftSample():
+		elif self.eye_used != self.right_eye and s.isLeftSample():
 			ps = s.getLeftEye().getPupilSize()
 		else:
 			ps = -1
@@ -656,19 +1027,85 @@ class libeyelink:
 		if not self.recording:
 			raise exceptions.runtime_error( \
 				u'Please start recording before collecting eyelink data')
+		self._restore_link()
 		if self.eye_used == None:
 			self.set_eye_used()
 		t_0 = self.experiment.time()
+		# Only wait when the link queue is empty
+		pace = libwait.pacer()
 		while True:
 			d = 0
 			while d != event:
 				d = pylink.getEYELINK().getNextData()
+				if d == 0:
+					pace.wait()
+				else:
+					pace.update()
+				if d == LOST_DATA_EVENT:
+					self.health.overflows += 1
 			# ignore d if its event occured before t_0:
 			float_data = pylink.getEYELINK().getFloatData()
 			if float_data.getTime() - self.get_eyelink_clock_async() > t_0:
 				break
 		return float_data.getTime() - self.get_eyelink_clock_async(), float_data
 
+	def wait_for_events(self, events, timeout=None):
+
+		"""<DOC>
+		Waits until one of several events has occurred. All events are #
+		handled in a single pass over the link data, so that the first event #
+		that matches is returned.
+
+		Arguments:
+		events	--	A list of EyeLink events, such as [pylink.STARTSACC, #
+					pylink.STARTBLINK].
+
+		Keyword arguments:
+		timeout	--	A timeout in milliseconds, or None for no timeout. #
+					(default=None)
+
+		Returns:
+		An (event, timestamp, start_pos, end_pos) tuple with timestamp in #
+		experiment time. Positions that are not available for an event are #
+		None. On a timeout, the tuple is (None, timestamp, None, None).
+
+		Exceptions:
+		Raises an exceptions.runtime_error on failure.
+		</DOC>"""
+
+		if not self.recording:
+			raise exceptions.runtime_error( \
+				u'Please start recording before collecting eyelink data')
+		self._restore_link()
+		if self.eye_used == None:
+			self.set_eye_used()
+		el = pylink.getEYELINK()
+		t_0 = self.experiment.time()
+		pace = libwait.pacer()
+		while True:
+			if timeout != None and self.experiment.time() - t_0 >= timeout:
+				return None, self.experiment.time(), None, None
+			d = el.getNextData()
+			if d == 0:
+				pace.wait()
+				continue
+			pace.update()
+			if d == LOST_DATA_EVENT:
+				self.health.overflows += 1
+			if d not in events:
+				continue
+			# ignore d if its event occured before t_0:
+			float_data = el.getFloatData()
+			t = float_data.getTime() - self.get_eyelink_clock_async()
+			if t <= t_0:
+				continue
+			if d in (pylink.STARTSACC, pylink.STARTFIX):
+				return d, t, float_data.getStartGaze(), None
+			if d in (pylink.ENDSACC, pylink.ENDFIX):
+				return d, t, float_data.getStartGaze(), \
+					float_data.getEndGaze()
+			return d, t, None, None
+
 	def wait_for_saccade_start(self):
 
 		"""<DOC>
@@ -774,6 +1211,32 @@ class libeyelink:
 		t, d = self.wait_for_event(pylink.ENDBLINK)
 		return t
 
+	def wait_for_aoi(self, index, fixation=False, leave=False, timeout=None):
+
+		"""<DOC>
+		Waits until gaze enters or leaves an area of interest.
+
+		Arguments:
+		index		--	A libaoi.aoi_index.
+
+		Keyword arguments:
+		fixation	--	Indicates whether fixation starts (True) or samples #
+						(False) should be used. (default=False)
+		leave		--	Indicates whether to wait until gaze leaves (True) #
+						or enters (False) an AOI. (default=False)
+		timeout		--	A timeout in milliseconds, or None for no timeout. #
+						(default=None)
+
+		Returns:
+		A (timestamp, aoi) tuple with timestamp in experiment time. On a #
+		timeout, the aoi is None.
+
+		Exceptions:
+		Raises an exceptions.runtime_error on failure.
+		</DOC>"""
+
+		return libaoi.wait_for_aoi(self, index, fixation, leave, timeout)
+
 	def confirm_abort_experiment(self):
 	
 		"""
@@ -916,7 +1379,7 @@ class eyelink_graphics(custom_display):
 	fgcolor = 255, 255, 255, 255
 	bgcolor = 0, 0, 0, 255
 
-	def __init__(self, experiment, tracker):
+	def __init__(self, experiment, tracker, settings=None):
 
 		"""
 		Constructor
@@ -924,12 +1387,17 @@ class eyelink_graphics(custom_display):
 		Arguments:
 		experiment -- opensesame experiment
 		tracker -- an eyelink instance
+
+		Keyword arguments:
+		settings -- see set_tracker() (default = None)
 		"""
 
 		pylink.EyeLinkCustomDisplay.__init__(self)
 
 		self.experiment = experiment
 		self.my_canvas = canvas(self.experiment)
+		# Calibration targets are drawn once, and cached by position
+		self.targets = libtarget.get_cache(self.experiment)
 		self.my_keyboard = keyboard(self.experiment, timeout=0)
 		self.my_mouse = mouse(self.experiment)
 
@@ -944,27 +1412,36 @@ class eyelink_graphics(custom_display):
 		self.size = (0,0)
 		self.tmp_file = os.path.join(tempfile.gettempdir(), '__eyelink__.jpg')
 
-		self.set_tracker(tracker)
+		self.set_tracker(tracker, settings)
 		self.last_mouse_state = -1
 		self.experiment.eyelink_esc_pressed = False
 
-	def set_tracker(self, tracker):
+	def set_tracker(self, tracker, settings=None):
 
 		"""
 		Connect the tracker to the graphics environment
 
 		Arguments:
 		tracker -- an eyelink instance
+
+		Keyword arguments:
+		settings -- the configuration that has been sent over the current
+				connection, see command_batch, or None to send all
+				commands (default = None)
 		"""
 
 		self.tracker = tracker
 		self.tracker_version = tracker.getTrackerVersion()
 		if(self.tracker_version >=3):
-			self.tracker.sendCommand("enable_search_limits=YES")
-			self.tracker.sendCommand("track_search_limits=YES")
-			self.tracker.sendCommand("autothreshold_click=YES")
-			self.tracker.sendCommand("autothreshold_repeat=YES")
-			self.tracker.sendCommand("enable_camera_position_detect=YES")
+			batch = command_batch(self.tracker, {} if settings == None else \
+				settings)
+			batch.add("enable_search_limits=YES")
+			batch.add("track_search_limits=YES")
+			batch.add("autothreshold_click=YES")
+			batch.add("autothreshold_repeat=YES")
+			batch.add("enable_camera_position_detect=YES")
+			for cmd, result in batch.send():
+				print u'libeyelink: command "%s" failed (%s)' % (cmd, result)
 
 	def setup_cal_display (self):
 
@@ -1020,11 +1497,7 @@ class eyelink_graphics(custom_display):
 		y -- the y-coordinate of the target
 		"""
 
-		self.my_canvas.clear()
-
-		self.my_canvas.circle(x, y, r=self.experiment.eyelink.cal_target_size, fill=True)
-		self.my_canvas.circle(x, y, r=2, color=self.experiment.background, fill=True)
-		self.my_canvas.show()
+		self.targets.show(x, y, size=self.experiment.eyelink.cal_target_size)
 		if self.experiment.eyelink.cal_beep:
 			self.play_beep(pylink.CAL_TARG_BEEP)
 
@@ -0,0 +1,369 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Online gaze filters. A filter is applied to every new sample in the sample()
+# function of a tracker, so that gaze-contingent displays can use a smooth
+# gaze position. All filters keep their state in preallocated buffers and
+# plain numbers, so that filtering a sample doesn't create any lists or arrays.
+#
+# Filtering always costs latency. The `latency` property of each filter gives
+# the delay, in samples, that the filter adds to a slowly moving gaze position:
+#
+# - moving_average_filter: (n-1)/2 samples for a window of n samples.
+# - heuristic_filter: 1 sample at level 1, and 2 samples at level 2.
+# - one_euro_filter: adaptive. For a stationary or slowly moving eye, the
+#   delay is that of a first-order low-pass filter at min_cutoff Hz, i.e.
+#   samplerate/(2*pi*min_cutoff) samples. During fast movements the cutoff
+#   frequency increases, and the delay drops to (almost) zero.
+
+import array
+import math
+
+# A missing sample, which is passed on unfiltered and resets the filter
+_missing = (-1, -1)
+
+class gaze_filter:
+
+	"""The base class for online gaze filters."""
+
+	def __init__(self):
+
+		self.reset()
+
+	def reset(self):
+
+		"""<DOC>
+		Forgets all previous samples. This is done automatically after #
+		missing data.
+		</DOC>"""
+
+		self._t = None
+		self._out = _missing
+
+	def update(self, t, pos):
+
+		"""<DOC>
+		Filters a sample. A sample with the same timestamp as the previous #
+		sample is not filtered again, so that this function can be called #
+		every time a tracker returns the newest sample, even if no new data #
+		has arrived.
+
+		Arguments:
+		t	--	The timestamp of the sample in milliseconds.
+		pos	--	The (x, y) gaze position.
+
+		Returns:
+		The filtered (x, y) gaze position.
+		</DOC>"""
+
+		if t == self._t:
+			return self._out
+		self._t = t
+		if pos == None or (pos[0] == -1 and pos[1] == -1) or \
+			(pos[0] == 0 and pos[1] == 0):
+			self.reset()
+			self._t = t
+			return pos
+		self._out = self._filter(t, pos[0], pos[1])
+		return self._out
+
+	def _filter(self, t, x, y):
+
+		"""
+		Filters a valid sample.
+
+		Arguments:
+		t	--	The timestamp in milliseconds.
+		x	--	The horizontal gaze position.
+		y	--	The vertical gaze position.
+
+		Returns:
+		An (x, y) tuple.
+		"""
+
+		raise NotImplementedError()
+
+	@property
+	def latency(self):
+
+		"""<DOC>
+		The delay in samples that the filter adds to a slowly moving gaze #
+		position.
+		</DOC>"""
+
+		return 0
+
+class moving_average_filter(gaze_filter):
+
+	"""Averages the last n samples."""
+
+	def __init__(self, n=4):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		n	--	The window size in samples. (default=4)
+		</DOC>"""
+
+		self.n = max(1, int(n))
+		self._xbuf = array.array('d', [0.] * self.n)
+		self._ybuf = array.array('d', [0.] * self.n)
+		gaze_filter.__init__(self)
+
+	def reset(self):
+
+		gaze_filter.reset(self)
+		self._i = 0
+		self._count = 0
+		self._xsum = 0.
+		self._ysum = 0.
+
+	def _filter(self, t, x, y):
+
+		# Running sums: subtract the sample that drops out of the window, add
+		# the new one
+		i = self._i
+		if self._count == self.n:
+			self._xsum -= self._xbuf[i]
+			self._ysum -= self._ybuf[i]
+		else:
+			self._count += 1
+		self._xbuf[i] = x
+		self._ybuf[i] = y
+		self._xsum += x
+		self._ysum += y
+		self._i = (i + 1) % self.n
+		return self._xsum / self._count, self._ysum / self._count
+
+	@property
+	def latency(self):
+
+		return (self.n - 1) / 2.
+
+class heuristic_filter(gaze_filter):
+
+	"""
+	Removes single-sample (level 1) and two-sample (level 2) spikes, like the
+	heuristic filter of the EyeLink (Stampe, 1993). A sample that deviates
+	from both of its neighbours in the same direction is replaced by the
+	neighbour that is closest to it. Each level delays the output by one
+	sample.
+	"""
+
+	def __init__(self, level=1):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		level	--	1 or 2. (default=1)
+		</DOC>"""
+
+		if level not in (1, 2):
+			raise ValueError(u'The heuristic filter level should be 1 or 2')
+		self.level = level
+		self._xbuf = array.array('d', [0.] * 4)
+		self._ybuf = array.array('d', [0.] * 4)
+		gaze_filter.__init__(self)
+
+	def reset(self):
+
+		gaze_filter.reset(self)
+		self._count = 0
+
+	def _filter(self, t, x, y):
+
+		xb = self._xbuf
+		yb = self._ybuf
+		# The buffer holds the last samples, oldest first
+		xb[0] = xb[1]; xb[1] = xb[2]; xb[2] = xb[3]; xb[3] = x
+		yb[0] = yb[1]; yb[1] = yb[2]; yb[2] = yb[3]; yb[3] = y
+		if self._count < 4:
+			self._count += 1
+		# Level 2 first removes two-sample spikes in samples 1 and 2, and
+		# level 1 removes one-sample spikes in sample 2
+		if self.level == 2 and self._count >= 4:
+			self._spike2(xb)
+			self._spike2(yb)
+		if self._count >= 3:
+			self._spike1(xb)
+			self._spike1(yb)
+		if self._count <= self.level:
+			return x, y
+		return xb[3 - self.level], yb[3 - self.level]
+
+	def _spike1(self, b):
+
+		"""
+		Removes a one-sample spike in b[2], which is compared to b[1] and b[3].
+
+		Arguments:
+		b	--	The buffer.
+		"""
+
+		if (b[2] > b[1] and b[2] > b[3]) or (b[2] < b[1] and b[2] < b[3]):
+			if abs(b[2] - b[1]) < abs(b[2] - b[3]):
+				b[2] = b[1]
+			else:
+				b[2] = b[3]
+
+	def _spike2(self, b):
+
+		"""
+		Removes a two-sample spike in b[1] and b[2], which are compared to b[0]
+		and b[3].
+
+		Arguments:
+		b	--	The buffer.
+		"""
+
+		if (b[1] > b[0] and b[2] > b[0] and b[1] > b[3] and b[2] > b[3]) or \
+			(b[1] < b[0] and b[2] < b[0] and b[1] < b[3] and b[2] < b[3]):
+			if abs(b[1] - b[0]) < abs(b[2] - b[3]):
+				b[1] = b[0]
+				b[2] = b[0]
+			else:
+				b[1] = b[3]
+				b[2] = b[3]
+
+	@property
+	def latency(self):
+
+		return self.level
+
+class one_euro_filter(gaze_filter):
+
+	"""
+	A one-euro filter (Casiez, Roussel & Vogel, 2012): a low-pass filter whose
+	cutoff frequency increases with the speed of the eye, so that fixations
+	are smoothed strongly while saccades are followed with little delay.
+	"""
+
+	def __init__(self, min_cutoff=1., beta=.05, d_cutoff=1.):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		min_cutoff	--	The cutoff frequency in Hz for a stationary eye. #
+						(default=1.)
+		beta		--	The increase of the cutoff frequency in Hz for every #
+						pixel per second of gaze speed. (default=.05)
+		d_cutoff	--	The cutoff frequency in Hz for the speed estimate. #
+						(default=1.)
+		</DOC>"""
+
+		self.min_cutoff = min_cutoff
+		self.beta = beta
+		self.d_cutoff = d_cutoff
+		self._rate = None
+		gaze_filter.__init__(self)
+
+	def reset(self):
+
+		gaze_filter.reset(self)
+		self._prev_t = None
+		self._x = 0.
+		self._y = 0.
+		self._dx = 0.
+		self._dy = 0.
+
+	def _alpha(self, cutoff, dt):
+
+		"""
+		Computes the smoothing factor of a first-order low-pass filter.
+
+		Arguments:
+		cutoff	--	The cutoff frequency in Hz.
+		dt		--	The sampling interval in seconds.
+
+		Returns:
+		The smoothing factor.
+		"""
+
+		tau = 1. / (2 * math.pi * cutoff)
+		return 1. / (1. + tau / dt)
+
+	def _filter(self, t, x, y):
+
+		if self._prev_t == None:
+			self._prev_t = t
+			self._x = x
+			self._y = y
+			return x, y
+		dt = (t - self._prev_t) / 1000.
+		if dt <= 0:
+			return self._x, self._y
+		self._rate = 1. / dt
+		self._prev_t = t
+		# Filtered speed
+		a = self._alpha(self.d_cutoff, dt)
+		self._dx += a * ((x - self._x) / dt - self._dx)
+		self._dy += a * ((y - self._y) / dt - self._dy)
+		speed = math.sqrt(self._dx ** 2 + self._dy ** 2)
+		# Filtered position, with a cutoff that depends on the speed
+		a = self._alpha(self.min_cutoff + self.beta * speed, dt)
+		self._x += a * (x - self._x)
+		self._y += a * (y - self._y)
+		return self._x, self._y
+
+	@property
+	def latency(self):
+
+		if self._rate == None:
+			return None
+		return self._rate / (2 * math.pi * self.min_cutoff)
+
+def create(kind, noise=None, **params):
+
+	"""<DOC>
+	Creates a gaze filter. If the RMS noise of the tracker is known, for #
+	example from the SMI noise calibration, the parameters are seeded from #
+	it, unless they are specified explicitly:
+
+	- moving average: the window is the number of samples that is needed to #
+	  bring the noise down to 0.5 pixel, between 2 and 10 samples.
+	- one-euro: beta is chosen so that the cutoff frequency increases by #
+	  25 Hz when the eye moves at 1000 times the noise per second, i.e. #
+	  clearly faster than noise.
+
+	Arguments:
+	kind	--	u'none', u'moving average', u'heuristic', or u'one-euro'.
+
+	Keyword arguments:
+	noise	--	The RMS sample-to-sample noise in pixels, or None. #
+				(default=None)
+	params	--	Additional keyword arguments for the filter.
+
+	Returns:
+	A gaze_filter, or None for u'none'.
+	</DOC>"""
+
+	if kind == u'none':
+		return None
+	if kind == u'moving average':
+		if noise != None and 'n' not in params:
+			params['n'] = min(10, max(2, int(math.ceil((noise / .5) ** 2))))
+		return moving_average_filter(**params)
+	if kind == u'heuristic':
+		return heuristic_filter(**params)
+	if kind == u'one-euro':
+		if noise != None and noise > 0 and 'beta' not in params:
+			params['beta'] = 25. / (1000. * noise)
+		return one_euro_filter(**params)
+	raise ValueError(u'Unknown gaze filter: %s' % kind)
@@ -0,0 +1,304 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+
+def deg2pix(cmdist, angle, pixpercm):
+
+	"""<DOC>
+	Converts a visual angle to a size in pixels, for a stimulus in the center #
+	of the display. All arguments can be either numbers or NumPy arrays.
+
+	Arguments:
+	cmdist		--	The distance to the display in centimeters.
+	angle		--	The size of the stimulus in degrees of visual angle.
+	pixpercm	--	The number of pixels per centimeter on the display.
+
+	Returns:
+	The size in pixels, as a float or an array of floats.
+	</DOC>"""
+
+	return numpy.tan(numpy.radians(angle)) * cmdist * pixpercm
+
+def pix2deg(cmdist, pixels, pixpercm):
+
+	"""<DOC>
+	Converts a size in pixels to a visual angle, for a stimulus in the center #
+	of the display. This is the inverse of deg2pix().
+
+	Arguments:
+	cmdist		--	The distance to the display in centimeters.
+	pixels		--	The size of the stimulus in pixels.
+	pixpercm	--	The number of pixels per centimeter on the display.
+
+	Returns:
+	The size in degrees of visual angle, as a float or an array of floats.
+	</DOC>"""
+
+	return numpy.degrees(numpy.arctan(numpy.asarray(pixels, dtype=float) \
+		/ (float(cmdist) * pixpercm)))
+
+class screen_geometry:
+
+	"""
+	Describes the viewing geometry of a session: the display resolution, the
+	physical size of the display, and the distance between the eyes and the
+	display. The geometry is created once, typically during calibration, after
+	which thresholds and complete gaze trajectories can be converted between
+	pixels and degrees without redoing the trigonometry for every sample.
+
+	Besides the central approximation used by deg2pix() and pix2deg(), the
+	geometry also takes into account that the display is flat: a pixel near
+	the edge of the display subtends a smaller angle than a pixel in the
+	center. For this purpose, per-pixel tables with the eccentricity and the
+	local number of pixels per degree are computed once, when they are first
+	needed.
+	"""
+
+	def __init__(self, resolution, screensize, distance=57., center=None):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		resolution	--	A (width, height) tuple with the display resolution #
+						in pixels.
+		screensize	--	A (width, height) tuple with the physical display #
+						size in centimeters.
+
+		Keyword arguments:
+		distance	--	The distance between the eyes and the display in #
+						centimeters. (default=57.)
+		center		--	The (x, y) position in pixels at which the line of #
+						sight is perpendicular to the display, or None for the #
+						display center. (default=None)
+		</DOC>"""
+
+		self.resolution = int(resolution[0]), int(resolution[1])
+		self.screensize = float(screensize[0]), float(screensize[1])
+		self.distance = float(distance)
+		if center == None:
+			center = self.resolution[0] / 2., self.resolution[1] / 2.
+		self.center = float(center[0]), float(center[1])
+		# The same value that libsmi has always used: the average of the
+		# horizontal and vertical resolution in pixels per centimeter
+		self.pixpercm = (self.resolution[0] / self.screensize[0] + \
+			self.resolution[1] / self.screensize[1]) / 2.
+		# The distance between the eyes and the display in pixels
+		self._pixdist = self.distance * self.pixpercm
+		self._ecc_table = None
+		self._ppd_table = None
+
+	def deg2pix(self, angle):
+
+		"""<DOC>
+		Converts a visual angle to pixels for a stimulus in the display #
+		center. This is the conversion that is used for thresholds.
+
+		Arguments:
+		angle	--	A visual angle in degrees, or an array of angles.
+
+		Returns:
+		The size in pixels, as a float or an array of floats.
+		</DOC>"""
+
+		return deg2pix(self.distance, angle, self.pixpercm)
+
+	def pix2deg(self, pixels):
+
+		"""<DOC>
+		Converts pixels to a visual angle for a stimulus in the display #
+		center.
+
+		Arguments:
+		pixels	--	A size in pixels, or an array of sizes.
+
+		Returns:
+		The size in degrees, as a float or an array of floats.
+		</DOC>"""
+
+		return pix2deg(self.distance, pixels, self.pixpercm)
+
+	def eccentricity(self, x, y):
+
+		"""<DOC>
+		Computes the eccentricity of display positions, i.e. the angle #
+		between the line of sight to a position and the line of sight to the #
+		display center.
+
+		Arguments:
+		x	--	A horizontal position in pixels, or an array of positions.
+		y	--	A vertical position in pixels, or an array of positions.
+
+		Returns:
+		The eccentricity in degrees, as a float or an array of floats.
+		</DOC>"""
+
+		r = numpy.hypot(numpy.asarray(x, dtype=float) - self.center[0], \
+			numpy.asarray(y, dtype=float) - self.center[1])
+		return numpy.degrees(numpy.arctan(r / self._pixdist))
+
+	def angle(self, x1, y1, x2, y2):
+
+		"""<DOC>
+		Computes the exact visual angle between pairs of display positions. #
+		All arguments can be arrays, so that the amplitudes of all #
+		sample-to-sample movements in a trajectory are computed at once: #
+		`angle(x[:-1], y[:-1], x[1:], y[1:])`.
+
+		Arguments:
+		x1	--	The horizontal start position(s) in pixels.
+		y1	--	The vertical start position(s) in pixels.
+		x2	--	The horizontal end position(s) in pixels.
+		y2	--	The vertical end position(s) in pixels.
+
+		Returns:
+		The angle in degrees, as a float or an array of floats.
+		</DOC>"""
+
+		# The angle between the two vectors from the eye to the display
+		# positions, from atan2(|a x b|, a . b), which is accurate for small
+		# angles as well
+		ax = numpy.asarray(x1, dtype=float) - self.center[0]
+		ay = numpy.asarray(y1, dtype=float) - self.center[1]
+		bx = numpy.asarray(x2, dtype=float) - self.center[0]
+		by = numpy.asarray(y2, dtype=float) - self.center[1]
+		d = self._pixdist
+		cx = ay * d - d * by
+		cy = d * bx - ax * d
+		cz = ax * by - ay * bx
+		dot = ax * bx + ay * by + d * d
+		return numpy.degrees(numpy.arctan2(numpy.sqrt(cx * cx + cy * cy + \
+			cz * cz), dot))
+
+	def _tables(self):
+
+		"""Computes the per-pixel eccentricity and pixels-per-degree tables."""
+
+		w, h = self.resolution
+		dx = numpy.arange(w, dtype=numpy.float32) - numpy.float32(self.center[0])
+		dy = numpy.arange(h, dtype=numpy.float32) - numpy.float32(self.center[1])
+		r = numpy.hypot(dx[numpy.newaxis, :], dy[:, numpy.newaxis])
+		theta = numpy.arctan(r / numpy.float32(self._pixdist))
+		cos = numpy.cos(theta)
+		# A displacement towards or away from the display center (radial)
+		# covers D / cos(theta)**2 pixels per radian, and a displacement
+		# around the center (tangential) D / cos(theta). The table holds the
+		# average of both.
+		ppd = numpy.float32(self._pixdist * numpy.pi / 180.) * \
+			(1. / cos ** 2 + 1. / cos) / 2.
+		self._ecc_table = numpy.degrees(theta).astype(numpy.float32)
+		self._ppd_table = ppd.astype(numpy.float32)
+
+	def _index(self, x, y):
+
+		"""
+		Converts display positions to indices into the per-pixel tables.
+
+		Arguments:
+		x	--	A horizontal position in pixels, or an array of positions.
+		y	--	A vertical position in pixels, or an array of positions.
+
+		Returns:
+		A (row, column) tuple of integers or integer arrays.
+		"""
+
+		if self._ppd_table is None:
+			self._tables()
+		col = numpy.clip(numpy.asarray(x), 0, self.resolution[0] - 1)
+		row = numpy.clip(numpy.asarray(y), 0, self.resolution[1] - 1)
+		return row.astype(numpy.intp), col.astype(numpy.intp)
+
+	@property
+	def eccentricity_table(self):
+
+		"""<DOC>
+		A (height, width) array with the eccentricity of every pixel in #
+		degrees. The table is computed when it is first used.
+		</DOC>"""
+
+		if self._ecc_table is None:
+			self._tables()
+		return self._ecc_table
+
+	@property
+	def ppd_table(self):
+
+		"""<DOC>
+		A (height, width) array with the local number of pixels per degree #
+		at every pixel. The table is computed when it is first used.
+		</DOC>"""
+
+		if self._ppd_table is None:
+			self._tables()
+		return self._ppd_table
+
+	def lookup_eccentricity(self, x, y):
+
+		"""<DOC>
+		Looks up the eccentricity of display positions in the per-pixel #
+		table. This is a cheaper alternative to eccentricity().
+
+		Arguments:
+		x	--	A horizontal position in pixels, or an array of positions.
+		y	--	A vertical position in pixels, or an array of positions.
+
+		Returns:
+		The eccentricity in degrees, as a float or an array of floats.
+		</DOC>"""
+
+		return self.eccentricity_table[self._index(x, y)]
+
+	def local_pix2deg(self, x, y, pixels):
+
+		"""<DOC>
+		Converts a size in pixels to degrees, taking into account where on #
+		the display the stimulus (or movement) is. This uses the per-pixel #
+		lookup table, and therefore does not involve any trigonometry. For #
+		example, to convert the sample-to-sample gaze displacements of a #
+		trajectory to degrees: `local_pix2deg(x[1:], y[1:], #
+		numpy.hypot(numpy.diff(x), numpy.diff(y)))`.
+
+		Arguments:
+		x		--	A horizontal position in pixels, or an array of positions.
+		y		--	A vertical position in pixels, or an array of positions.
+		pixels	--	A size in pixels, or an array of sizes.
+
+		Returns:
+		The size in degrees, as a float or an array of floats.
+		</DOC>"""
+
+		return pixels / self.ppd_table[self._index(x, y)]
+
+	def local_deg2pix(self, x, y, angle):
+
+		"""<DOC>
+		Converts a visual angle to pixels, taking into account where on the #
+		display the stimulus (or movement) is. This is the inverse of #
+		local_pix2deg(). For example, a velocity threshold can be converted #
+		to pixels at the current gaze position with a single table lookup.
+
+		Arguments:
+		x		--	A horizontal position in pixels, or an array of positions.
+		y		--	A vertical position in pixels, or an array of positions.
+		angle	--	A visual angle in degrees, or an array of angles.
+
+		Returns:
+		The size in pixels, as a float or an array of floats.
+		</DOC>"""
+
+		return angle * self.ppd_table[self._index(x, y)]
@@ -0,0 +1,302 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The health of the link with the tracker. When the link stalls or fails, the
+# tracker libraries return (-1, -1), just like during a blink, so that lost
+# data is only noticed during the analysis. A link_monitor thread reads the
+# ring of the sampler thread, like libquality.quality_monitor, and checks the
+# timestamps against the sampling rate:
+#
+#	gap			two consecutive samples are more than gap_factor sampling
+#				intervals apart; the samples in between are counted as missing
+#	duplicate	a sample has the same or an earlier timestamp than the sample
+#				before it
+#	stall		no sample has arrived for stall milliseconds; counted once per
+#				stall
+#	unread		the monitor fell behind by more than three quarters of the
+#				capacity of the ring, so that the reader skipped samples (see
+#				libshm.gaze_reader.since()); these are not counted as missing
+#
+# The tracker libraries count what only they can see in their health
+# attribute, a link_counters: errors that the tracker API reports, and
+# overflows of the event queue of the tracker. The monitor adds these to its
+# own counters.
+#
+# The monitor sees the samples that the sampler thread polled, so what it
+# measures is the poller, unless the tracker library reads the samples from a
+# queue that holds every sample the tracker sent, as libremote does. When a
+# library only gets the newest sample at every poll (pylink, iViewX, or the
+# mouse of the dummy), a poll that comes late misses samples, which count as
+# gaps and missing samples although the link delivered them, and a sampler
+# that is slowed down by the main thread looks like a stall. The counters are
+# therefore an upper bound for the problems of the link, which is why
+# eyetracker_calibrate leaves the monitor off by default.
+#
+# Only samples during trials are checked, because the trackers don't deliver
+# samples between trials if they don't record. The counters are kept as live
+# totals, and as a summary of every trial, see link_monitor.stop_trial().
+
+import threading
+
+import numpy
+
+import libsampler
+import libshm
+import libwait
+
+COUNTERS = u'samples', u'gaps', u'missing', u'duplicates', u'stalls', \
+	u'unread', u'errors', u'overflows'
+
+class link_counters:
+
+	"""
+	The counters of a tracker library. Every counter is only increased by a
+	single thread.
+	"""
+
+	def __init__(self):
+
+		"""<DOC>
+		Constructor.
+		</DOC>"""
+
+		# Errors of the tracker API, e.g. a failed iV_GetSample, which are
+		# counted by the thread that polls the tracker
+		self.errors = 0
+		# Overflows of the event queue of the tracker, which are counted by
+		# the thread that reads the events
+		self.overflows = 0
+
+class link_monitor(threading.Thread):
+
+	"""A thread that checks the cadence of the samples in a ring."""
+
+	def __init__(self, reader, samplerate=0, counters=None, gap_factor=1.5, \
+		stall=100, interval=100):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		reader		--	A libshm.gaze_reader.
+
+		Keyword arguments:
+		samplerate	--	The sampling rate in Hz, or 0 to estimate it from #
+						the timestamps. (default=0)
+		counters	--	The link_counters of the tracker, or None. #
+						(default=None)
+		gap_factor	--	The interval between samples, relative to the #
+						sampling interval, above which the samples are #
+						considered to be missing. (default=1.5)
+		stall		--	The time in milliseconds without samples after #
+						which the link is considered to be stalled. #
+						(default=100)
+		interval	--	The interval in milliseconds at which the ring is #
+						read. (default=100)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'eyetracker link monitor')
+		self.daemon = True
+		self.reader = reader
+		self.period = 1000. / samplerate if samplerate > 0 else None
+		self.counters = counters
+		self.gap_factor = gap_factor
+		self.stall = stall
+		self.interval = interval / 1000.
+		self.totals = dict((key, 0) for key in COUNTERS)
+		# The longest interval between samples in the current trial
+		self.longest = 0
+		self.active = False
+		self._trial = dict(self.totals)
+		self._prev = None
+		self._arrival = None
+		self._stalled = False
+		self._count = reader.count
+		self._out = numpy.empty(reader.capacity, dtype=libshm.sample_dtype)
+		self._lock = threading.Lock()
+		self._halt = threading.Event()
+
+	def run(self):
+
+		while not self._halt.wait(self.interval):
+			self.pump()
+
+	def _estimate_period(self, dt):
+
+		"""
+		Estimates the sampling interval from intervals between samples, if
+		the sampling rate is unknown.
+
+		Arguments:
+		dt	--	An array of intervals in milliseconds.
+		"""
+
+		dt = dt[dt > 0]
+		if len(dt) >= 10:
+			self.period = float(numpy.median(dt))
+
+	def pump(self):
+
+		"""<DOC>
+		Checks the samples that have arrived in the ring, if a trial is #
+		going on.
+		</DOC>"""
+
+		with self._lock:
+			dropped = self.reader.dropped
+			samples, count = self.reader.since(self._count, out=self._out)
+			unread = self.reader.dropped - dropped
+			self._count = count
+			if unread > 0:
+				# The interval across the skipped samples is not a gap
+				self._prev = None
+			if not self.active:
+				return
+			totals = self.totals
+			now = libwait.clock() * 1000
+			if len(samples) == 0:
+				if not self._stalled and now - self._arrival > self.stall:
+					self._stalled = True
+					totals[u'stalls'] += 1
+				return
+			self._arrival = now
+			self._stalled = False
+			t = samples[u'time']
+			if self._prev != None:
+				dt = numpy.diff(numpy.concatenate(([self._prev], t)))
+			else:
+				dt = numpy.diff(t)
+			self._prev = t[-1]
+			if self.period == None:
+				self._estimate_period(dt)
+			totals[u'samples'] += len(t)
+			totals[u'unread'] += unread
+			totals[u'duplicates'] += int(numpy.count_nonzero(dt <= 0))
+			if self.period != None and len(dt) > 0:
+				gaps = dt[dt > self.gap_factor * self.period]
+				totals[u'gaps'] += len(gaps)
+				totals[u'missing'] += int(numpy.round(gaps / \
+					self.period).sum()) - len(gaps)
+				self.longest = max(self.longest, float(dt.max()))
+
+	def live(self):
+
+		"""<DOC>
+		Gets the live totals of all counters.
+
+		Returns:
+		A dict with the counters in COUNTERS.
+		</DOC>"""
+
+		with self._lock:
+			totals = dict(self.totals)
+		if self.counters != None:
+			totals[u'errors'] = self.counters.errors
+			totals[u'overflows'] = self.counters.overflows
+		return totals
+
+	def start_trial(self):
+
+		"""<DOC>
+		Starts a new trial. Samples that arrived before this are ignored.
+		</DOC>"""
+
+		self.pump()
+		trial = self.live()
+		with self._lock:
+			self._trial = trial
+			self._count = self.reader.count
+			self._prev = None
+			self._arrival = libwait.clock() * 1000
+			self._stalled = False
+			self.longest = 0
+			self.active = True
+
+	def stop_trial(self):
+
+		"""<DOC>
+		Ends the trial, and gets a summary of it.
+
+		Returns:
+		A dict with the counters in COUNTERS for the trial, the longest #
+		interval between samples in milliseconds (longest_gap), and the #
+		proportion of missing samples (drop_rate).
+		</DOC>"""
+
+		self.pump()
+		live = self.live()
+		with self._lock:
+			self.active = False
+			s = dict((key, live[key] - self._trial[key]) for key in COUNTERS)
+			s[u'longest_gap'] = self.longest
+		expected = s[u'samples'] + s[u'missing'] + s[u'unread']
+		s[u'drop_rate'] = float(s[u'missing'] + s[u'unread']) / expected if \
+			expected > 0 else None
+		return s
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the thread and releases the reader.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive():
+			self.join(1)
+		self.reader.close()
+
+def start(tracker, stall=100):
+
+	"""<DOC>
+	Starts monitoring the link of a tracker. The sampler thread of the #
+	tracker is started if it isn't running yet. This is what #
+	eyetracker_calibrate does when the link monitor is enabled. For a worker #
+	proxy (see libworker), the errors and overflows that the tracker counts #
+	in the worker are not available.
+
+	Arguments:
+	tracker	--	A tracker object.
+
+	Keyword arguments:
+	stall	--	See link_monitor. (default=100)
+
+	Returns:
+	A running link_monitor, or None if the tracker has no samples to #
+	monitor.
+	</DOC>"""
+
+	reader = libsampler.reader(tracker)
+	if reader == None:
+		return None
+	monitor = link_monitor(reader, samplerate=reader.samplerate, \
+		counters=getattr(tracker, u'health', None), stall=stall)
+	monitor.start()
+	return monitor
+
+def get_monitor(experiment):
+
+	"""<DOC>
+	Gets the link monitor of an experiment.
+
+	Arguments:
+	experiment	--	The experiment.
+
+	Returns:
+	A link_monitor, or None if the link monitor is not enabled.
+	</DOC>"""
+
+	return getattr(experiment, u'eyetracker_health', None)
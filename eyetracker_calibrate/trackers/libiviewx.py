@@ -0,0 +1,864 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# An SMI backend that speaks the iViewX remote command protocol over UDP, in
+# pure Python, so that it runs on any platform (libsmi needs the iViewX DLL,
+# which only exists for Windows).
+#
+# Commands are lines of ASCII text, which are sent to the sendport of iViewX.
+# iViewX sends its replies, and the stream of samples, to the receiveport. The
+# protocol as used here:
+#
+#	ET_PNG					ping; answered with ET_PNG
+#	ET_FRM "<format>"		sets the format of the sample lines
+#	ET_STR / ET_EST			starts / ends the stream of samples
+#	ET_SPL <sample>			a sample, see libremote.link._sample()
+#	ET_REC / ET_STP			starts / stops recording to the iViewX buffer
+#	ET_INC					increments the trial number
+#	ET_REM "<text>"			writes a remark (a log message)
+#	ET_SAV "<file>"			saves the recorded data
+#	ET_CSZ <w> <h>			sets the size of the calibration area
+#	ET_CAL <n>				starts an n-point calibration; answered with
+#							ET_CAL <n>, ET_PNT <i> <x> <y> for every point,
+#							ET_CHG <i> whenever point i should be shown, and
+#							ET_FIN when the calibration is done
+#	ET_VAL					starts a validation, with the same replies
+#	ET_VLS					requests the validation result; answered with
+#							ET_VLS <eye> <dx> <dy> for every eye, in degrees
+#	ET_ACC / ET_BRK			accepts the current point / aborts
+#
+# The UDP transport is in libremote.
+#
+# libemulator provides an iViewX emulator that speaks the same protocol, for
+# testing without the tracker.
+
+import math
+
+from openexp.keyboard import keyboard
+from openexp.canvas import canvas
+from openexp.synth import synth
+from openexp.exceptions import response_error
+from libopensesame import exceptions
+
+from libgeometry import screen_geometry
+import libaoi
+import libbinocular
+import libdrift
+import libfilter
+import libhealth
+import libonline
+import libquality
+import libremote
+import libtarget
+import libwait
+
+class libiviewx:
+
+	"""A pure-Python SMI backend for the iViewX remote command protocol."""
+
+	def __init__(self, experiment, resolution, data_file=u'default', \
+		fg_color=(255, 255, 255), bg_color=(0, 0, 0), \
+		saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, \
+		force_drift_correct=False, ip='127.0.0.1', sendport=4444, \
+		receiveport=5555, screen_w=399, screen_h=299, screen_dist=570, \
+		gaze_filter=u'none', continuous_recording=False):
+
+		"""<DOC>
+		Constructor. Connects to iViewX and starts the stream of samples.
+
+		Arguments:
+		experiment		--	The experiment object.
+		resolution		--	A (width, height) tuple.
+
+		Keyword arguments:
+		data_file		--	The name of the IDF file. (default=u'default')
+		fg_color		--	The foreground color for the calibration screen. #
+							(default=255,255,255)
+		bg_color		--	The background color for the calibration screen. #
+							(default=0,0,0)
+		saccade_velocity_threshold		--	The velocity threshold used for #
+											saccade detection. (default=35)
+		saccade_acceleration_threshold	--	The acceleration threshold used #
+											for saccade detection. #
+											(default=9500)
+		force_drift_correct	--	ignored by libiviewx
+		ip				--	The IP address of iViewX. (default='127.0.0.1')
+		sendport		--	The port at which iViewX receives commands. #
+							(default=4444)
+		receiveport		--	The port to which iViewX sends samples and #
+							replies. (default=5555)
+		screen_w		--	The physical screen width in millimeters. #
+							(default=399)
+		screen_h		--	The physical screen height in millimeters. #
+							(default=299)
+		screen_dist		--	The viewing distance in millimeters. (default=570)
+		gaze_filter		--	The online gaze filter that is applied by #
+							sample(): u'none', u'moving average', #
+							u'heuristic', or u'one-euro'. (default=u'none')
+		continuous_recording	--	Indicates whether the tracker keeps #
+									recording from the first #
+									start_recording() until close(), in #
+									which case trials are only marked with #
+									a message. (default=False)
+
+		Exceptions:
+		Raises an exceptions.runtime_error if iViewX doesn't answer.
+		</DOC>"""
+
+		self.experiment = experiment
+		self.outputfile = data_file
+		self.dispsize = resolution
+		self.fgc = fg_color
+		self.bgc = bg_color
+		self.cv = canvas(self.experiment, fgcolor=self.fgc, bgcolor=self.bgc)
+		self.kb = keyboard(self.experiment)
+		self.errorbeep = synth(self.experiment, osc='saw', freq=100, \
+			length=100)
+		self.recording = False
+		self.continuous = continuous_recording
+		self.calibrated = False
+		self.validated = False
+		self.left_eye = 0
+		self.right_eye = 1
+		self.binocular = 2
+		self.eye_used = self.left_eye
+		self.errdist = 2 # degrees
+		self.fixtresh = 1.5 # degrees
+		self.spdtresh = saccade_velocity_threshold # degrees per second
+		self.accthresh = saccade_acceleration_threshold # degrees per second**2
+		self.weightdist = 10 # see libonline.online_detector
+		self.calpoints = 9 # number of calibration points
+		self.validation_points = 1 # see libsmi
+		self.validation_time = 1000 # see libsmi
+		self.validation_settle = 200 # see libsmi
+		self.timeout = 30 # seconds without progress after which a calibration is aborted
+		self.geometry = screen_geometry(self.dispsize, (screen_w / 10., \
+			screen_h / 10.), screen_dist / 10.)
+		self.pxerrdist = self.geometry.deg2pix(self.errdist)
+		self.filterkind = gaze_filter
+		self.gaze_filter = libfilter.create(gaze_filter)
+		self.detector = None # created during validation, see _val()
+		self.prevsample = -1, -1
+		self.eyes = libbinocular.eye_buffer()
+		# Receive errors and overflows of the reply queue, see libhealth
+		self.health = libhealth.link_counters()
+		self.sampler = None # the link, once start_sampler() is called
+		self.samplerate = 0 # estimated from the stream, see _estimate_samplerate()
+
+		# connect, and start the stream in one batch; the answer to the ping
+		# means that the commands before it have arrived as well
+		self.link = libremote.link(ip, sendport, receiveport, self.eyes, \
+			health=self.health)
+		connect = [u'ET_FRM "%s"' % libremote.SAMPLE_FORMAT, u'ET_STR', \
+			u'ET_PNG']
+		for i in range(3):
+			reply = self.link.batch(connect, [u'ET_PNG'])[0]
+			if reply != None:
+				break
+		if reply == None:
+			self.link.stop()
+			raise exceptions.runtime_error( \
+				u'Error in libiviewx.libiviewx.__init__: iViewX at %s:%s does not answer' \
+				% (ip, sendport))
+		self._estimate_samplerate()
+
+		self.log(u'pygaze initiation report start')
+		self.log(u'display resolution: %sx%s' % self.dispsize)
+		self.log(u'samplerate: %s Hz' % self.samplerate)
+		self.log(u'binocular: %s' % self.link.binocular)
+		self.log(u'pygaze initiation report end')
+
+	def _estimate_samplerate(self, timeout=1.):
+
+		"""
+		Estimates the sampling rate from the timestamps of the stream, which
+		the remote protocol doesn't report otherwise.
+
+		Keyword arguments:
+		timeout	--	The maximum time in seconds to wait for samples. #
+					(default=1.)
+		"""
+
+		reader = self.link.ring.reader()
+		end = libwait.clock() + timeout
+		while reader.count < 64 and libwait.clock() < end:
+			libwait.sleep(10)
+		s = reader.newest(64)
+		reader.close()
+		if len(s) < 2:
+			return
+		dt = sorted([b - a for a, b in zip(s[u'time'][:-1], s[u'time'][1:])])
+		median = dt[len(dt) // 2]
+		if median > 0:
+			self.samplerate = int(round(1000. / median))
+
+	def send_command(self, cmd):
+
+		"""<DOC>
+		Sends a remote command to iViewX.
+
+		Arguments:
+		cmd		--	The command.
+		</DOC>"""
+
+		self.link.send(cmd)
+
+	def log(self, msg):
+
+		"""<DOC>
+		Writes a message to the iViewX data file.
+
+		Arguments:
+		msg		--	The message.
+		</DOC>"""
+
+		self.link.send(u'ET_REM "%s"' % msg.replace(u'"', u'\''))
+
+	def log_var(self, var, val):
+
+		"""<DOC>
+		Writes a variable to the iViewX data file.
+
+		Arguments:
+		var		--	The variable name.
+		val		--	The value.
+		</DOC>"""
+
+		self.log(u'var %s %s' % (var, val))
+
+	def status_msg(self, msg):
+
+		"""Not supported by iViewX"""
+
+		pass
+
+	def connected(self):
+
+		"""<DOC>
+		Checks whether iViewX answers.
+
+		Returns:
+		True if iViewX answers, False otherwise.
+		</DOC>"""
+
+		return self.link.batch([u'ET_PNG'], [u'ET_PNG'])[0] != None
+
+	def get_eyelink_clock_async(self):
+
+		"""Not supported by iViewX"""
+
+		return 0
+
+	def calibrate(self, beep=True, target_size=16):
+
+		"""<DOC>
+		Shows a calibration menu, from which the participant can be #
+		calibrated and validated.
+
+		Keyword arguments:
+		beep		--	ignored by libiviewx
+		target_size	--	The diameter of the calibration target in pixels. #
+						(default=16)
+		</DOC>"""
+
+		status = {False : [u'unsuccessful', u'red'], True : [u'successful', \
+			u'green']}
+		self.calibrated = False
+		self.validated = False
+		while True:
+			yc = self.cv.ycenter()
+			ld = 40
+			self.cv.clear()
+			self.cv.text(u'OpenSesame iViewX plug-in', y=yc - 5 * ld)
+			self.cv.text(u'C: Calibration', y=yc - 2 * ld)
+			self.cv.text(u'V: Validation', y=yc - 1 * ld)
+			self.cv.text(u'Q: Exit set-up', y=yc)
+			self.cv.text(u'calibration: %s' % status[self.calibrated][0], \
+				y=yc + 4 * ld, color=status[self.calibrated][1])
+			self.cv.text(u'validation: %s' % status[self.validated][0], \
+				y=yc + 5 * ld, color=status[self.validated][1])
+			self.cv.show()
+			self.kb.get_key(keylist=None, timeout=1)
+			key, presstime = self.kb.get_key(keylist=[u'c', u'v', u'q'], \
+				timeout=None)
+			if key == u'q':
+				return
+			if key == u'v' and not self.calibrated:
+				error = u'Please do a calibration before starting a validation!'
+			elif key == u'c':
+				self.calibrated, error = self._cal(target_size)
+			else:
+				self.validated, error = self._val(target_size)
+			if error != None:
+				self.cv.clear()
+				self.cv.text(error, y=yc - 1 * ld)
+				self.cv.text(u'(press any key to return to menu)', y=yc + ld)
+				self.cv.show()
+				self.kb.get_key(keylist=None, timeout=1)
+				self.kb.get_key(keylist=None, timeout=None)
+
+	def _run_points(self, start, target_size):
+
+		"""
+		Runs a calibration or validation: shows the points that iViewX asks
+		for, until iViewX reports that it is done. Space accepts the current
+		point, escape aborts.
+
+		Arguments:
+		start		--	A list of commands that start the procedure.
+		target_size	--	The diameter of the target in pixels.
+
+		Returns:
+		An error message, or None on success.
+		"""
+
+		points = {}
+		targets = libtarget.get_cache(self.experiment)
+		kb = keyboard(self.experiment, keylist=[u'space', u'escape'], \
+			timeout=0)
+		self.cv.clear()
+		self.cv.show()
+		self.link.flush()
+		self.link.send(*start)
+		deadline = libwait.clock() + self.timeout
+		while True:
+			reply = self.link.expect((u'ET_PNT', u'ET_CHG', u'ET_FIN'), \
+				timeout=1000 / 60. / 1000)
+			if reply == None:
+				try:
+					key = kb.get_key()[0]
+				except response_error:
+					key = u'escape'
+				if key == u'escape':
+					self.link.send(u'ET_BRK')
+					return u'Aborted'
+				if key == u'space':
+					self.link.send(u'ET_ACC')
+				if libwait.clock() > deadline:
+					self.link.send(u'ET_BRK')
+					return u'iViewX did not respond'
+				continue
+			deadline = libwait.clock() + self.timeout
+			parts = reply.split()
+			if parts[0] == u'ET_PNT' and len(parts) >= 4:
+				points[int(parts[1])] = int(parts[2]), int(parts[3])
+				# draw the target in advance
+				targets.get(points[int(parts[1])][0], \
+					points[int(parts[1])][1], size=target_size // 2, \
+					fgcolor=self.fgc, bgcolor=self.bgc)
+			elif parts[0] == u'ET_CHG' and len(parts) >= 2:
+				x, y = points.get(int(parts[1]), (self.dispsize[0] // 2, \
+					self.dispsize[1] // 2))
+				targets.show(x, y, size=target_size // 2, fgcolor=self.fgc, \
+					bgcolor=self.bgc)
+			elif parts[0] == u'ET_FIN':
+				return None
+
+	def _cal(self, target_size):
+
+		"""
+		Calibrates the tracker.
+
+		Arguments:
+		target_size	--	The diameter of the target in pixels.
+
+		Returns:
+		A (success, error) tuple, with error None on success.
+		"""
+
+		error = self._run_points([u'ET_CSZ %d %d' % tuple(self.dispsize), \
+			u'ET_CAL %d' % self.calpoints], target_size)
+		if error != None:
+			return False, u'Calibration failed: %s' % error
+		return True, None
+
+	def _val(self, target_size):
+
+		"""
+		Validates the calibration, measures the noise, and derives the
+		thresholds of the online event detection, like libsmi does.
+
+		Arguments:
+		target_size	--	The diameter of the target in pixels.
+
+		Returns:
+		A (success, error) tuple, with error None on success.
+		"""
+
+		error = self._run_points([u'ET_VAL'], target_size)
+		if error != None:
+			return False, u'Validation failed: %s' % error
+		# the validation result, one reply per eye
+		self.link.send(u'ET_VLS')
+		accuracy = {}
+		for i in range(2 if self.link.binocular else 1):
+			reply = self.link.expect(u'ET_VLS', timeout=1.)
+			if reply == None:
+				break
+			parts = reply.split()
+			try:
+				accuracy[parts[1]] = float(parts[2]), float(parts[3])
+			except (IndexError, ValueError):
+				pass
+		default = (self.errdist, self.errdist)
+		self.accuracy = accuracy.get(u'left', default), accuracy.get( \
+			u'right', default)
+		self.eyes.set_accuracy(sum(self.accuracy[0]), sum(self.accuracy[1]))
+
+		# noise calibration, see libsmi
+		points = libquality.validation_grid(self.dispsize, \
+			self.validation_points)
+		targets = libtarget.get_cache(self.experiment)
+		targets.prepare(points, style=u'fixdot', fgcolor=self.fgc, \
+			bgcolor=self.bgc)
+		filterkind = self.filterkind
+		self.gaze_filter = None
+		data = []
+		for x, y in points:
+			targets.show(x, y, style=u'fixdot', fgcolor=self.fgc, \
+				bgcolor=self.bgc)
+			d = libquality.collect(self.sample, self.validation_time, \
+				samplerate=self.samplerate)
+			data.append(d[d[:, 0] >= d[0, 0] + self.validation_settle] if \
+				len(d) > 0 else d)
+		pooled = libquality.pool([libquality.precision(d[:, 1], d[:, 2]) \
+			for d in data])
+		xrms, yrms = pooled[u'rms_s2s']
+		if math.isnan(xrms) or math.isnan(yrms):
+			return False, u'Validation failed: no samples were received'
+		self.pxdsttresh = xrms, yrms
+		self.set_gaze_filter(filterkind)
+		samplerate = float(self.samplerate if self.samplerate > 0 else 1000)
+		self.pxfixtresh = self.geometry.deg2pix(self.fixtresh)
+		self.pxspdtresh = self.geometry.deg2pix(self.spdtresh / samplerate)
+		self.pxacctresh = self.geometry.deg2pix(self.accthresh / samplerate \
+			** 2)
+		self.detector = libonline.online_detector(self.pxfixtresh, \
+			self.pxspdtresh, acc_thresh=self.pxacctresh, \
+			noise=self.pxdsttresh, weightdist=self.weightdist)
+
+		self.log(u'pygaze calibration report start')
+		self.log(u'accuracy (degrees): LX=%s, LY=%s, RX=%s, RY=%s' % \
+			(self.accuracy[0] + self.accuracy[1]))
+		self.log(u'precision (RMS noise in pixels): X=%s, Y=%s' % \
+			self.pxdsttresh)
+		self.log(u'precision (standard error of RMS noise in pixels): X=%s, Y=%s' \
+			% pooled[u'rms_s2s_se'])
+		self.log(u'fixation threshold: %s pixels' % self.pxfixtresh)
+		self.log(u'speed threshold: %s pixels/sample' % self.pxspdtresh)
+		self.log(u'accuracy threshold: %s pixels/sample**2' % self.pxacctresh)
+		self.log(u'pygaze calibration report end')
+		return True, None
+
+	def drift_correction(self, pos=None, fix_triggered=False):
+
+		"""<DOC>
+		Performs a drift check.
+
+		Keyword arguments:
+		pos				--	The (x, y) position of the target, or None for #
+							the display centre. (default=None)
+		fix_triggered	--	Indicates whether the check is triggered by a #
+							fixation (True) or by the space bar (False). #
+							(default=False)
+
+		Returns:
+		True if the check succeeded, False otherwise.
+		</DOC>"""
+
+		if fix_triggered:
+			return self.fix_triggered_drift_correction(pos)
+		return self.manual_drift_correction(pos)
+
+	def prepare_drift_correction(self, pos):
+
+		"""Not supported by iViewX"""
+
+		pass
+
+	def manual_drift_correction(self, pos=None):
+
+		"""<DOC>
+		Performs a drift check that is triggered by the space bar. Pressing #
+		'q' or escape opens the calibration menu.
+
+		Keyword arguments:
+		pos		--	The (x, y) position of the target, or None for the #
+					display centre. (default=None)
+
+		Returns:
+		True if the check succeeded, False otherwise.
+		</DOC>"""
+
+		if pos == None:
+			pos = self.dispsize[0] / 2, self.dispsize[1] / 2
+		# the stream runs all the time, so no recording is needed
+		while True:
+			pressed, presstime = self.kb.get_key(keylist=[u'space', u'q', \
+				u'escape'], timeout=1)
+			if pressed == None:
+				continue
+			if pressed in (u'escape', u'q'):
+				self.calibrate()
+				return False
+			x, y = self.sample()
+			if math.sqrt((x - pos[0]) ** 2 + (y - pos[1]) ** 2) < \
+				self.pxerrdist:
+				return True
+			self.errorbeep.play()
+
+	def fix_triggered_drift_correction(self, pos=None, min_samples=10, \
+		max_dev=60, reset_threshold=30, max_dispersion=None):
+
+		"""<DOC>
+		Performs a drift check that succeeds as soon as gaze rests on the #
+		target, see libdrift.wait_for_fixation(). Pressing 'q' or escape #
+		opens the calibration menu.
+
+		Keyword arguments:
+		pos				--	The (x, y) position of the target, or None for #
+							the display centre. (default=None)
+		min_samples		--	See libdrift. (default=10)
+		max_dev			--	See libdrift. (default=60)
+		reset_threshold	--	See libdrift. (default=30)
+		max_dispersion	--	See libdrift. (default=None)
+
+		Returns:
+		True if the check succeeded, False otherwise.
+		</DOC>"""
+
+		if pos == None:
+			pos = self.dispsize[0] / 2, self.dispsize[1] / 2
+		kb = keyboard(self.experiment, keylist=[u'escape', u'q'], timeout=0)
+		try:
+			mean, key = libdrift.wait_for_fixation(self, pos, \
+				min_samples=min_samples, max_dev=max_dev, \
+				reset_threshold=reset_threshold, \
+				max_dispersion=max_dispersion, keyboard=kb, \
+				samplerate=self.samplerate)
+		except response_error:
+			key = u'escape'
+		if key != None:
+			self.calibrate()
+			return False
+		return True
+
+	def start_recording(self):
+
+		"""<DOC>
+		Starts recording to the iViewX buffer. With continuous recording, #
+		only the first call starts recording, and further calls write a #
+		start_recording message.
+		</DOC>"""
+
+		if self.continuous and self.recording:
+			self.log(u'start_recording')
+			return
+		# the trial number is increased in the same batch
+		self.link.send(u'ET_INC', u'ET_REC')
+		self.recording = True
+
+	def stop_recording(self):
+
+		"""<DOC>
+		Stops recording to the iViewX buffer. With continuous recording, #
+		this only writes a stop_recording message.
+		</DOC>"""
+
+		if self.continuous:
+			self.log(u'stop_recording')
+			return
+		self.link.send(u'ET_STP')
+		self.recording = False
+
+	def close(self):
+
+		"""<DOC>
+		Saves the data, ends the stream, and closes the connection.
+		</DOC>"""
+
+		self.stop_sampler()
+		commands = [u'ET_STP'] if self.recording else []
+		commands += [u'ET_SAV "%s"' % self.outputfile, u'ET_EST']
+		# the ping makes sure that the commands have been handled before the
+		# socket closes
+		self.link.batch(commands + [u'ET_PNG'], [u'ET_PNG'])
+		self.recording = False
+		self.log_link_stats()
+		self.link.stop()
+
+	def log_link_stats(self):
+
+		"""<DOC>
+		Prints the number of samples that were received, and the number of #
+		samples that were dropped because they arrived out of order.
+		</DOC>"""
+
+		print(u'libiviewx.libiviewx: %d samples received, %d out of order' % \
+			(self.link.received, self.link.reordered))
+
+	def set_eye_used(self):
+
+		"""<DOC>
+		Logs the eye that is used.
+		</DOC>"""
+
+		if self.link.binocular:
+			self.eye_used = self.binocular
+		if self.eye_used == self.right_eye:
+			self.log_var(u'eye_used', u'right')
+		else:
+			self.log_var(u'eye_used', u'left')
+
+	def sample(self, eye=None):
+
+		"""<DOC>
+		Gets the most recent gaze sample from the stream.
+
+		Keyword arguments:
+		eye	--	See libsmi.sample(). (default=None)
+
+		Returns:
+		A tuple (x, y) containing the coordinates of the sample. The value #
+		(-1, -1) indicates missing data.
+		</DOC>"""
+
+		s = self.link.latest
+		if s == None:
+			return -1, -1
+		if eye != None:
+			self.prevsample = self.eyes.sample(eye)
+		else:
+			self.prevsample = s[1], s[2]
+		if self.gaze_filter != None:
+			return self.gaze_filter.update(s[0], self.prevsample)
+		return self.prevsample
+
+	def pupil_size(self, eye=None):
+
+		"""<DOC>
+		Gets the most recent pupil size from the stream.
+
+		Keyword arguments:
+		eye	--	See sample(). (default=None)
+
+		Returns:
+		The pupil size, or -1 for missing data.
+		</DOC>"""
+
+		if eye != None:
+			return self.eyes.pupil_size(eye)
+		s = self.link.latest
+		if s == None:
+			return -1
+		return float(s[3])
+
+	def set_gaze_filter(self, kind, **params):
+
+		"""<DOC>
+		Sets the online gaze filter that is applied by sample().
+
+		Arguments:
+		kind		--	See libfilter.create().
+
+		Keyword arguments:
+		params		--	Parameters for the filter. By default, these are #
+						based on the RMS noise, if the tracker has been #
+						validated.
+		</DOC>"""
+
+		self.filterkind = kind
+		if hasattr(self, u'pxdsttresh') and len(params) == 0:
+			params[u'noise'] = (self.pxdsttresh[0] + self.pxdsttresh[1]) / 2.
+		self.gaze_filter = libfilter.create(kind, **params)
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		"""<DOC>
+		Makes the samples available in a ring. The receive thread always #
+		writes the samples to a ring, so this only replaces that ring by one #
+		that is placed in shared memory if a name is given, and that stores #
+		the sampling rate for the readers. If the ring has already been #
+		replaced, it is kept, so that its readers stay valid.
+
+		Keyword arguments:
+		shm_name	--	See libshm.gaze_ring. (default=None)
+		capacity	--	See libshm.gaze_ring. (default=4096)
+
+		Returns:
+		The link, which acts as a libsampler.sampler.
+		</DOC>"""
+
+		if self.sampler != None:
+			return self.sampler
+		self.link.set_ring(shm_name=shm_name, capacity=capacity, \
+			samplerate=self.samplerate)
+		self.sampler = self.link
+		return self.sampler
+
+	def stop_sampler(self):
+
+		"""<DOC>
+		Stops offering the ring as a sampler. The receive thread keeps #
+		running until close().
+		</DOC>"""
+
+		self.sampler = None
+
+	def prepare_backdrop(self, canvas):
+
+		"""Not supported by iViewX"""
+
+		raise exceptions.runtime_error( \
+			u'prepare_backdrop requires an EyeLink system and the legacy back-end')
+
+	def set_backdrop(self, backdrop):
+
+		"""Not supported by iViewX"""
+
+		raise exceptions.runtime_error( \
+			u'set_backdrop requires an EyeLink system and the legacy back-end')
+
+	def wait_for_aoi(self, index, fixation=False, leave=False, timeout=None):
+
+		"""<DOC>
+		Waits until gaze enters or leaves an area of interest, see #
+		libaoi.wait_for_aoi().
+		</DOC>"""
+
+		return libaoi.wait_for_aoi(self, index, fixation, leave, timeout)
+
+	def wait_for_events(self, events, timeout=None):
+
+		"""<DOC>
+		Waits until one of several events occurs, see #
+		libonline.wait_for_events().
+
+		Arguments:
+		events	--	A list of event codes.
+
+		Keyword arguments:
+		timeout	--	A timeout in milliseconds, or None. (default=None)
+
+		Returns:
+		An (event, time, startpos, endpos) tuple.
+
+		Exceptions:
+		Raises an exceptions.runtime_error if the tracker has not been #
+		validated, because the detection thresholds are derived during #
+		validation.
+		</DOC>"""
+
+		if self.detector == None:
+			raise exceptions.runtime_error( \
+				u'Error in libiviewx.libiviewx.wait_for_events: please calibrate and validate before waiting for events')
+		return libonline.wait_for_events(self, self.detector, events, \
+			timeout, samplerate=self.samplerate)
+
+	def wait_for_event(self, event):
+
+		"""<DOC>
+		Waits for an event.
+
+		Arguments:
+		event	--	An event code: 3 (STARTBLINK), 4 (ENDBLINK), 5 #
+					(STARTSACC), 6 (ENDSACC), 7 (STARTFIX), or 8 (ENDFIX).
+
+		Returns:
+		The return value of the corresponding wait_for_* function.
+		</DOC>"""
+
+		return {
+			3 : self.wait_for_blink_start,
+			4 : self.wait_for_blink_end,
+			5 : self.wait_for_saccade_start,
+			6 : self.wait_for_saccade_end,
+			7 : self.wait_for_fixation_start,
+			8 : self.wait_for_fixation_end,
+			}[event]()
+
+	def wait_for_saccade_start(self):
+
+		"""<DOC>
+		Waits for the start of a saccade.
+
+		Returns:
+		A (time, startpos) tuple.
+		</DOC>"""
+
+		event, t, start, end = self.wait_for_events([libonline.STARTSACC])
+		return t, start
+
+	def wait_for_saccade_end(self):
+
+		"""<DOC>
+		Waits for the end of a saccade.
+
+		Returns:
+		A (time, startpos, endpos) tuple.
+		</DOC>"""
+
+		event, t, start, end = self.wait_for_events([libonline.ENDSACC])
+		return t, start, end
+
+	def wait_for_fixation_start(self):
+
+		"""<DOC>
+		Waits for the start of a fixation.
+
+		Returns:
+		A (time, gazepos) tuple.
+		</DOC>"""
+
+		event, t, start, end = self.wait_for_events([libonline.STARTFIX])
+		return t, start
+
+	def wait_for_fixation_end(self):
+
+		"""<DOC>
+		Waits for the end of a fixation.
+
+		Returns:
+		A (time, gazepos) tuple.
+		</DOC>"""
+
+		event, t, start, end = self.wait_for_events([libonline.ENDFIX])
+		return t, start
+
+	def wait_for_blink_start(self):
+
+		"""<DOC>
+		Waits for the start of a blink.
+
+		Returns:
+		A (time, gazepos) tuple.
+		</DOC>"""
+
+		event, t, start, end = self.wait_for_events([libonline.STARTBLINK])
+		return t, start
+
+	def wait_for_blink_end(self):
+
+		"""<DOC>
+		Waits for the end of a blink.
+
+		Returns:
+		A (time, gazepos) tuple.
+		</DOC>"""
+
+		event, t, start, end = self.wait_for_events([libonline.ENDBLINK])
+		return t, start
@@ -0,0 +1,298 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Online event detection for trackers that do not send events themselves
+# (SMI and the extended dummy). The wait_for_*() functions of these trackers
+# each run their own polling loop, which means that they can only wait for a
+# single kind of event. The online_detector processes one sample at a time and
+# reports all kinds of events, using the same criteria as those functions:
+# the Dalmaijer et al. (2013) velocity and acceleration criteria for saccades,
+# and a window of five stable samples for fixations. This makes it possible to
+# wait for several kinds of events in a single pass over the sample stream.
+#
+# Events are (event, time, startpos, endpos) tuples. The event codes are the
+# ones used by wait_for_event(), and the positions are (x, y) tuples. Start
+# events, and blink ends, do not have an end position, in which case endpos is
+# None.
+
+import math
+
+import libwait
+
+STARTBLINK = 3
+ENDBLINK = 4
+STARTSACC = 5
+ENDSACC = 6
+STARTFIX = 7
+ENDFIX = 8
+
+# States
+_UNKNOWN = 0
+_FIX = 1
+_SACC = 2
+_BLINK = 3
+
+def is_missing(pos):
+
+	"""<DOC>
+	Checks whether a sample is missing data.
+
+	Arguments:
+	pos		--	An (x, y) tuple.
+
+	Returns:
+	True if the sample is missing, False otherwise.
+	</DOC>"""
+
+	return pos == None or (pos[0] == -1 and pos[1] == -1) or \
+		(pos[0] == 0 and pos[1] == 0)
+
+class online_detector:
+
+	"""
+	Detects fixations, saccades and blinks, one sample at a time.
+	"""
+
+	def __init__(self, fix_thresh, spd_thresh, acc_thresh=None, noise=None, \
+		weightdist=10, window=5, skip_duplicates=True):
+
+		"""<DOC>
+		Constructor. All thresholds are in pixels.
+
+		Arguments:
+		fix_thresh	--	The maximum dispersion of the samples in a fixation.
+		spd_thresh	--	The saccade velocity threshold in pixels per sample.
+
+		Keyword arguments:
+		acc_thresh		--	The saccade acceleration threshold in pixels per #
+							sample**2, or None to use only the velocity #
+							threshold. (default=None)
+		noise			--	An (x, y) tuple with the RMS noise in pixels, or #
+							None. If specified, movements that are not #
+							larger than `weightdist` times the noise are #
+							never considered saccadic. A noise of zero is #
+							ignored. (default=None)
+		weightdist		--	See `noise`. (default=10)
+		window			--	The number of stable samples that start a #
+							fixation. (default=5)
+		skip_duplicates	--	Indicates whether samples that are identical to #
+							the previous sample should be ignored. Trackers #
+							that return the previous sample if no new data #
+							is available need this. (default=True)
+		</DOC>"""
+
+		self.fix_thresh = fix_thresh
+		self.spd_thresh = spd_thresh
+		self.acc_thresh = acc_thresh
+		self.noise = noise
+		self.weightdist = weightdist
+		self.window = window
+		self.skip_duplicates = skip_duplicates
+		self.reset()
+
+	def reset(self):
+
+		"""<DOC>
+		Forgets all previous samples.
+		</DOC>"""
+
+		self.state = _UNKNOWN
+		self.prevpos = None
+		self.speed = 0
+		self.startpos = None
+		self._xl = []
+		self._yl = []
+
+	def update(self, t, pos):
+
+		"""<DOC>
+		Processes a sample.
+
+		Arguments:
+		t	--	The timestamp of the sample.
+		pos	--	The (x, y) gaze position of the sample.
+
+		Returns:
+		A list of events that occurred with this sample. The list is usually #
+		empty.
+		</DOC>"""
+
+		events = []
+		# Missing data starts a blink, and a blink ends with the first valid
+		# sample
+		if is_missing(pos):
+			if self.state != _BLINK:
+				if self.state == _FIX:
+					events.append((ENDFIX, t, self.startpos, self.prevpos))
+				events.append((STARTBLINK, t, self.prevpos, None))
+				self.state = _BLINK
+			return events
+		if self.state == _BLINK:
+			events.append((ENDBLINK, t, pos, None))
+			self.reset()
+			self.prevpos = pos
+			return events
+		if self.prevpos == None:
+			self.prevpos = pos
+			self._add(pos)
+			return events
+		if self.skip_duplicates and pos == self.prevpos:
+			return events
+		sx = pos[0] - self.prevpos[0]
+		sy = pos[1] - self.prevpos[1]
+		s1 = math.sqrt(sx ** 2 + sy ** 2) # speed in pixels/sample
+		a = s1 - self.speed # acceleration in pixels/sample**2
+		if self.state == _SACC:
+			# The saccade ends when the eye is slow and decelerating
+			if s1 < self.spd_thresh and (self.acc_thresh == None or \
+				-self.acc_thresh < a < 0):
+				events.append((ENDSACC, t, self.startpos, pos))
+				self.state = _UNKNOWN
+				self._xl = []
+				self._yl = []
+		elif self._saccadic(sx, sy, s1, a):
+			if self.state == _FIX:
+				events.append((ENDFIX, t, self.startpos, self.prevpos))
+			events.append((STARTSACC, t, self.prevpos, None))
+			self.state = _SACC
+			self.startpos = self.prevpos
+		elif self.state == _FIX:
+			if math.sqrt((pos[0] - self.startpos[0]) ** 2 + \
+				(pos[1] - self.startpos[1]) ** 2) > self.fix_thresh:
+				events.append((ENDFIX, t, self.startpos, pos))
+				self.state = _UNKNOWN
+				self._xl = []
+				self._yl = []
+		if self.state == _UNKNOWN and self._add(pos):
+			events.append((STARTFIX, t, pos, None))
+			self.state = _FIX
+			self.startpos = pos
+		self.speed = s1
+		self.prevpos = pos
+		return events
+
+	def _saccadic(self, sx, sy, s1, a):
+
+		"""
+		Applies the saccade start criteria.
+
+		Arguments:
+		sx	--	The horizontal displacement.
+		sy	--	The vertical displacement.
+		s1	--	The speed.
+		a	--	The acceleration.
+
+		Returns:
+		True if the movement is saccadic, False otherwise.
+		"""
+
+		# weighted distance: (sx/tx)**2 + (sy/ty)**2 > 1 means movement larger
+		# than RMS noise; without noise, every movement is larger than noise
+		if self.noise != None and min(self.noise) > 0 and \
+			(sx / self.noise[0]) ** 2 + (sy / self.noise[1]) ** 2 <= \
+			self.weightdist:
+			return False
+		return s1 > self.spd_thresh or (self.acc_thresh != None and \
+			a > self.acc_thresh)
+
+	def _add(self, pos):
+
+		"""
+		Adds a sample to the fixation window.
+
+		Arguments:
+		pos	--	An (x, y) tuple.
+
+		Returns:
+		True if the window is full and stable, False otherwise.
+		"""
+
+		self._xl.append(pos[0])
+		self._yl.append(pos[1])
+		if len(self._xl) > self.window:
+			self._xl.pop(0)
+			self._yl.pop(0)
+		return len(self._xl) == self.window and \
+			math.sqrt((max(self._xl) - min(self._xl)) ** 2 + \
+			(max(self._yl) - min(self._yl)) ** 2) < self.fix_thresh
+
+def create(geometry, samplerate, velocity_threshold=35, fixation_threshold=1.5):
+
+	"""<DOC>
+	Creates a detector for a stream in which every sample is new, such as the #
+	samples of a sampler thread (see libsampler).
+
+	Arguments:
+	geometry	--	A libgeometry.screen_geometry.
+	samplerate	--	The sampling rate in Hz, or 0 if unknown, in which case #
+					1000 Hz is assumed.
+
+	Keyword arguments:
+	velocity_threshold	--	The saccade velocity threshold in degrees per #
+							second. (default=35)
+	fixation_threshold	--	The maximum dispersion of a fixation in degrees. #
+							(default=1.5)
+
+	Returns:
+	An online_detector.
+	</DOC>"""
+
+	if samplerate <= 0:
+		samplerate = 1000.
+	return online_detector(geometry.deg2pix(fixation_threshold), \
+		geometry.deg2pix(velocity_threshold / float(samplerate)), \
+		skip_duplicates=False)
+
+def wait_for_events(tracker, detector, events, timeout=None, samplerate=0, \
+	sample=None):
+
+	"""<DOC>
+	Waits until one of several events occurs, by feeding samples into an #
+	online detector. This is the implementation of wait_for_events() for the #
+	trackers that do not send events themselves.
+
+	Arguments:
+	tracker		--	A tracker object.
+	detector	--	An online_detector.
+	events		--	A list of event codes.
+
+	Keyword arguments:
+	timeout		--	A timeout in milliseconds, or None for no timeout. #
+					(default=None)
+	samplerate	--	The sampling rate in Hz, to which polling is paced (see #
+					libwait), or 0 to estimate it. (default=0)
+	sample		--	A function that returns the newest sample, or None to #
+					use tracker.sample(). (default=None)
+
+	Returns:
+	An (event, timestamp, startpos, endpos) tuple, with the timestamp in #
+	experiment time. On a timeout, the tuple is (None, timestamp, None, None).
+	</DOC>"""
+
+	if sample == None:
+		sample = tracker.sample
+	detector.reset()
+	pace = libwait.pacer(samplerate)
+	t0 = tracker.experiment.time()
+	while True:
+		s = pace.poll(sample)
+		t = tracker.experiment.time()
+		if timeout != None and t - t0 >= timeout:
+			return None, t, None, None
+		for event in detector.update(t, s):
+			if event[0] in events:
+				return event
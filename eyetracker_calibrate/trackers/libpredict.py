@@ -0,0 +1,416 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Online prediction of where and when a saccade lands, from the first samples
+# of the saccade. Detecting the end of a saccade, or waiting for the ENDSACC
+# event of the EyeLink, only tells where the eye went after it got there,
+# which is too late to change the display before the eye lands.
+#
+# The duration of a saccade increases linearly with its amplitude (the main
+# sequence), and its velocity profile has a fixed shape. For an amplitude A,
+# the distance that the eye has covered t milliseconds after the onset is
+# therefore
+#
+#	A * f(t / D(A)),	with D(A) = intercept + slope * A
+#
+# where f is the position profile of a raised cosine velocity profile. The
+# velocity only exceeds the threshold some milliseconds after the true onset,
+# when the eye has already moved, so the predictor measures the distance from
+# the last sample before the threshold was crossed (the reference), and fits
+# how long before the reference the saccade started, as well as the
+# amplitude. It compares every sample with the curve for a grid of amplitudes
+# and onsets, and keeps the sum of squared errors for every pair, so that the
+# fit is updated in constant time per sample. The best pair gives the onset,
+# the landing position, along the current direction of the saccade, and, with
+# D(A), the landing time.
+#
+# The confidence drops with the range of amplitudes that fit about as well as
+# the best one, relative to that amplitude: the amplitudes whose best fit is
+# within four times the variance of the noise of the best fit (a likelihood
+# interval of about two standard errors). Early in a saccade this range is
+# wide, until the velocity peaks.
+#
+# The main sequence starts from values in the literature (Carpenter, 1988),
+# and is refitted, by incremental least squares, to every saccade that the
+# predictor sees, so that it adapts to the participant and the tracker.
+
+import math
+
+import numpy
+
+import libsampler
+import libshm
+import libwait
+
+# The event code of a predicted landing, see wait_for_landing()
+LANDING = 100
+
+# The number of pixels per degree if the geometry is unknown
+_PPD = 35.
+
+def _missing(x, y):
+
+	return x != x or (x == -1 and y == -1) or (x == 0 and y == 0)
+
+def _profile(tau):
+
+	"""
+	Gets the proportion of the amplitude that has been covered, for a raised
+	cosine velocity profile.
+
+	Arguments:
+	tau		--	The time since the onset, relative to the duration, as an
+				array.
+
+	Returns:
+	An array of proportions.
+	"""
+
+	tau = numpy.clip(tau, 0, 1)
+	return tau - numpy.sin(2 * numpy.pi * tau) / (2 * numpy.pi)
+
+class main_sequence:
+
+	"""The linear relation between the amplitude and duration of saccades."""
+
+	def __init__(self, intercept=21., slope=2.2, weight=10):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		intercept	--	The duration in milliseconds of a saccade with a #
+						zero amplitude, before fitting. (default=21.)
+		slope		--	The increase of the duration in milliseconds per #
+						degree, before fitting. (default=2.2)
+		weight		--	The number of saccades that the initial values #
+						count for in the fit. (default=10)
+		</DOC>"""
+
+		self.intercept = intercept
+		self.slope = slope
+		# The sums of the least-squares fit, which start with saccades of 2
+		# and 20 degrees that follow the initial values
+		self._n = 0
+		self._sa = self._sd = self._saa = self._sad = 0.
+		for amplitude in (2., 20.):
+			self._add(amplitude, intercept + slope * amplitude, weight / 2.)
+		# The number of saccades that have been added
+		self.count = 0
+
+	def _add(self, amplitude, duration, weight=1.):
+
+		self._n += weight
+		self._sa += weight * amplitude
+		self._sd += weight * duration
+		self._saa += weight * amplitude ** 2
+		self._sad += weight * amplitude * duration
+
+	def add(self, amplitude, duration):
+
+		"""<DOC>
+		Adds a saccade, and refits the relation.
+
+		Arguments:
+		amplitude	--	The amplitude in degrees.
+		duration	--	The duration in milliseconds.
+		</DOC>"""
+
+		self._add(amplitude, duration)
+		self.count += 1
+		var = self._n * self._saa - self._sa ** 2
+		if var <= 0:
+			return
+		slope = (self._n * self._sad - self._sa * self._sd) / var
+		# Saccades that are larger don't take less time
+		if slope > 0:
+			self.slope = slope
+			self.intercept = (self._sd - slope * self._sa) / self._n
+
+	def duration(self, amplitude):
+
+		"""<DOC>
+		Gets the duration of saccades.
+
+		Arguments:
+		amplitude	--	An amplitude in degrees, or an array of amplitudes.
+
+		Returns:
+		The duration in milliseconds, or an array of durations.
+		</DOC>"""
+
+		return self.intercept + self.slope * amplitude
+
+class landing_predictor:
+
+	"""Predicts the landing position and time of saccades in flight."""
+
+	def __init__(self, geometry=None, velocity_threshold=35, min_samples=3, \
+		noise=.1, sequence=None):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		geometry			--	A libgeometry.screen_geometry, or None to #
+								assume 35 pixels per degree. (default=None)
+		velocity_threshold	--	The saccade velocity threshold in degrees #
+								per second. (default=35)
+		min_samples			--	The number of samples after the onset that #
+								are needed for a prediction. (default=3)
+		noise				--	The noise of the samples in degrees. #
+								(default=.1)
+		sequence			--	A main_sequence, or None to start from the #
+								values in the literature. (default=None)
+		</DOC>"""
+
+		self.geometry = geometry
+		self.threshold = velocity_threshold
+		self.min_samples = min_samples
+		self.noise = noise
+		self.sequence = main_sequence() if sequence == None else sequence
+		# The candidate amplitudes in degrees, and the candidate times in
+		# milliseconds between the onset and the reference sample
+		self.amplitudes = numpy.arange(.5, 40.25, .25)
+		self.shifts = numpy.arange(0, 12.25, .25)
+		# The (x, y, time, confidence) prediction for the current saccade
+		self.prediction = None
+		# The (onset, end, amplitude) of the last saccade, with the times in
+		# milliseconds and the amplitude in degrees
+		self.last = None
+		self.reset()
+
+	def reset(self):
+
+		"""<DOC>
+		Forgets the current saccade, but not the fitted main sequence.
+		</DOC>"""
+
+		self.prev = None
+		# The reference sample, see update()
+		self.onset = None
+		# The estimated (time, x, y) of the onset of the current saccade
+		self.start = None
+		self.prediction = None
+
+	def _angle(self, x1, y1, x2, y2):
+
+		if self.geometry != None:
+			return float(self.geometry.angle(x1, y1, x2, y2))
+		return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2) / _PPD
+
+	def _pixels(self, x0, y0, x, y, amplitude):
+
+		"""
+		Gets the position at an amplitude from the onset, in the direction of
+		the current position.
+
+		Returns:
+		An (x, y) tuple.
+		"""
+
+		covered = self._angle(x0, y0, x, y)
+		if covered <= 0:
+			return x, y
+		scale = amplitude / covered
+		return x0 + (x - x0) * scale, y0 + (y - y0) * scale
+
+	def update(self, t, x, y):
+
+		"""<DOC>
+		Adds a sample.
+
+		Arguments:
+		t	--	The timestamp in milliseconds.
+		x	--	The horizontal gaze position.
+		y	--	The vertical gaze position.
+
+		Returns:
+		The predicted (x, y, time, confidence) of the landing of the #
+		current saccade, with the confidence between 0 and 1, or None if #
+		there is no saccade, or too few samples of it.
+		</DOC>"""
+
+		if _missing(x, y):
+			# A blink, or lost data
+			self.reset()
+			return None
+		prev = self.prev
+		self.prev = t, x, y
+		if prev == None or t <= prev[0]:
+			return self.prediction
+		v = 1000. * self._angle(prev[1], prev[2], x, y) / (t - prev[0])
+		if self.onset == None:
+			if v > self.threshold:
+				# The reference is the previous sample, which the saccade
+				# reached some time after its onset
+				self.onset = prev
+				self.start = None
+				self._durations = self.sequence.duration(self.amplitudes)
+				d = self._durations[:, numpy.newaxis]
+				a = self.amplitudes[:, numpy.newaxis]
+				# The distance covered before the reference, per amplitude
+				# and onset
+				self._before = a * _profile(self.shifts / d)
+				self._sse = numpy.zeros((len(self.amplitudes), \
+					len(self.shifts)))
+				self._n = 0
+				self._fit = None
+			else:
+				return None
+		t0, x0, y0 = self.onset
+		covered = self._angle(x0, y0, x, y)
+		if v <= self.threshold:
+			# The saccade has landed. The velocity profile is symmetric, so
+			# the eye is about as far from the end as the reference was from
+			# the onset.
+			if self._fit != None:
+				i, k = self._fit
+				amplitude = covered + 2 * self._before[i, k]
+				duration = t - t0 + 2 * self.shifts[k]
+				onset = t0 - self.shifts[k]
+			else:
+				amplitude = covered
+				duration = t - t0
+				onset = t0
+			if amplitude >= .5:
+				self.sequence.add(amplitude, duration)
+			self.last = onset, t, amplitude
+			self.onset = None
+			self.prediction = None
+			return None
+		d = self._durations[:, numpy.newaxis]
+		a = self.amplitudes[:, numpy.newaxis]
+		fit = a * _profile((t - t0 + self.shifts) / d) - self._before
+		self._sse += (fit - covered) ** 2
+		self._n += 1
+		if self._n < self.min_samples:
+			return None
+		i, k = numpy.unravel_index(numpy.argmin(self._sse), self._sse.shape)
+		self._fit = i, k
+		best = self._sse[i, k]
+		# Early in a saccade, a small saccade and a large one, which is
+		# slower to get going, fit about equally well. The amplitudes whose
+		# best fit is within four times the variance of the samples, or of
+		# the residuals of the best fit if that is larger, are plausible.
+		var = max(self.noise ** 2, best / self._n)
+		plausible = self.amplitudes[self._sse.min(axis=1) <= best + 4 * var]
+		spread = plausible[-1] - plausible[0]
+		before = self._before[i, k]
+		amplitude = max(self.amplitudes[i], covered + before)
+		confidence = max(0., 1. - spread / amplitude)
+		onset = t0 - self.shifts[k]
+		sx, sy = self._pixels(x0, y0, x, y, -before)
+		self.start = onset, sx, sy
+		lx, ly = self._pixels(x0, y0, x, y, amplitude - before)
+		self.prediction = lx, ly, onset + self._durations[i], confidence
+		return self.prediction
+
+def create(tracker):
+
+	"""<DOC>
+	Creates a landing_predictor with the geometry and the saccade velocity #
+	threshold of a tracker.
+
+	Arguments:
+	tracker	--	A tracker object.
+
+	Returns:
+	A landing_predictor.
+	</DOC>"""
+
+	return landing_predictor(geometry=getattr(tracker, u'geometry', None), \
+		velocity_threshold=getattr(tracker, u'spdtresh', 35))
+
+def get_predictor(tracker):
+
+	"""<DOC>
+	Gets the landing predictor of the experiment of a tracker, and creates #
+	it if necessary, so that the main sequence is fitted to all saccades #
+	of the session.
+
+	Arguments:
+	tracker	--	A tracker object.
+
+	Returns:
+	A landing_predictor.
+	</DOC>"""
+
+	experiment = tracker.experiment
+	predictor = getattr(experiment, u'eyetracker_predictor', None)
+	if predictor == None:
+		predictor = create(tracker)
+		experiment.eyetracker_predictor = predictor
+	return predictor
+
+
+def wait_for_landing(tracker, predictor=None, timeout=None, confidence=.5):
+
+	"""<DOC>
+	Waits until the landing of a saccade can be predicted.
+
+	Arguments:
+	tracker		--	A tracker object.
+
+	Keyword arguments:
+	predictor	--	A landing_predictor, or None to use the predictor of #
+					the experiment, see get_predictor(). (default=None)
+	timeout		--	A timeout in milliseconds, or None for no timeout. #
+					(default=None)
+	confidence	--	The confidence that the prediction needs. (default=.5)
+
+	Returns:
+	An (event, timestamp, startpos, landingpos, landingtime, confidence) #
+	tuple, with event LANDING, the timestamp and the landing time in #
+	experiment time, and the confidence of the prediction. On a timeout, #
+	the tuple is (None, timestamp, None, None, None, None).
+	</DOC>"""
+
+	if predictor == None:
+		predictor = get_predictor(tracker)
+	predictor.reset()
+	reader = libsampler.reader(tracker)
+	experiment = tracker.experiment
+	t0 = experiment.time()
+	try:
+		if reader != None:
+			out = numpy.empty(reader.capacity, dtype=libshm.sample_dtype)
+			pace = libwait.pacer(reader.samplerate)
+			count = reader.count
+		else:
+			pace = libwait.pacer(getattr(tracker, u'samplerate', 0))
+		while True:
+			if reader != None:
+				pace.wait()
+				samples, count = reader.since(count, out=out)
+				pace.update(len(samples) > 0)
+				samples = zip(samples[u'time'], samples[u'x'], samples[u'y'])
+			else:
+				s = pace.poll(tracker.sample)
+				samples = [(experiment.time(), s[0], s[1])]
+			now = experiment.time()
+			if timeout != None and now - t0 >= timeout:
+				return None, now, None, None, None, None
+			for t, x, y in samples:
+				p = predictor.update(t, x, y)
+				if p != None and p[3] >= confidence:
+					start = predictor.start
+					return LANDING, now, (start[1], start[2]), (p[0], p[1]), \
+						now + p[2] - t, p[3]
+	finally:
+		if reader != None:
+			reader.close()
@@ -0,0 +1,662 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Data quality per trial. A quality_monitor follows the shared-memory ring of
+# the sampler thread (see libsampler), a batch of samples every 100 ms, and
+# keeps running statistics of the samples of the current trial:
+#
+#	lost		the proportion of samples without gaze (see valid()), or
+#				missed because the monitor fell behind the ring
+#	rms_s2s		the root mean square of the distances between consecutive
+#				samples during fixations, a measure of precision
+#	std			the pooled standard deviation of the samples around the
+#				centre of each fixation, another measure of precision
+#	drift		the distance between the first fixation of the trial and the
+#				drift-correction target, a measure of accuracy
+#
+# Fixations are the stretches of valid samples between which gaze moves slower
+# than the saccade velocity threshold, or less than a minimum step. The
+# minimum step keeps the noise of fast trackers, which easily moves gaze
+# faster than the threshold from one sample to the next, from breaking up
+# fixations. The statistics of a fixation are
+# Welford-style running statistics (count, mean, and sum of squared
+# deviations), to which a batch is added with the parallel update of Chan et
+# al., so that no sample is kept and the cost per sample is that of a few
+# vectorized operations.
+#
+# The monitor is created by eyetracker_calibrate, and used by
+# eyetracker_start_recording, eyetracker_drift_correct, and
+# eyetracker_stop_recording, see get_monitor().
+#
+# The functions at the end of the module measure precision and accuracy while
+# the participant looks at known targets, such as during the noise
+# calibration of libsmi: collect() samples into a preallocated array, and
+# precision(), accuracy() and pool() compute the statistics with vectorized
+# operations, together with their standard errors. The standard errors assume
+# independent samples, which makes them somewhat optimistic for fast trackers.
+
+import math
+import threading
+
+import numpy
+
+import libsampler
+import libwait
+from libshm import sample_dtype
+
+def valid(x, y):
+
+	"""<DOC>
+	Finds the samples with gaze. Samples without gaze are NaN, (-1, -1), or #
+	(0, 0), which some trackers report when the eyes are lost.
+
+	Arguments:
+	x	--	An array of horizontal positions.
+	y	--	An array of vertical positions.
+
+	Returns:
+	A boolean array.
+	</DOC>"""
+
+	return numpy.isfinite(x) & numpy.isfinite(y) & ~((x == -1) & (y == -1)) \
+		& ~((x == 0) & (y == 0))
+
+class trial_stats:
+
+	"""Running statistics of the samples of one trial, in pixels."""
+
+	def __init__(self, velocity_threshold, min_step, min_fixation=100):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		velocity_threshold	--	The saccade velocity threshold in pixels per #
+								millisecond.
+		min_step			--	The distance in pixels between two samples #
+								below which gaze is always considered to be #
+								still.
+
+		Keyword arguments:
+		min_fixation		--	The minimum duration in milliseconds of the #
+								fixation that is used for the drift #
+								estimate. (default=100)
+		</DOC>"""
+
+		self.velocity_threshold = velocity_threshold
+		self.min_step = min_step
+		self.min_fixation = min_fixation
+		self.target = None
+		self.reset()
+
+	def reset(self):
+
+		"""<DOC>
+		Forgets all samples. The drift-correction target is kept.
+		</DOC>"""
+
+		self.samples = 0
+		self.lost = 0
+		self.s2s_sum = 0.
+		self.s2s_n = 0
+		# The squared deviations and the degrees of freedom of the fixations
+		# that have ended
+		self.pooled_m2 = 0.
+		self.pooled_dof = 0
+		# The fixation that is going on: count, mean, squared deviations, and
+		# the time of its first and last sample
+		self.fix = 0, 0., 0., 0., 0., 0.
+		self.first_fixation = None
+		# The previous (time, x, y), with NaN for a sample without gaze
+		self.last = numpy.nan, numpy.nan, numpy.nan
+
+	def set_target(self, x, y):
+
+		"""<DOC>
+		Sets the position that gaze should be on at the start of the trial, #
+		such as the drift-correction target.
+
+		Arguments:
+		x	--	The horizontal position.
+		y	--	The vertical position.
+		</DOC>"""
+
+		self.target = float(x), float(y)
+
+	def _close(self, fix):
+
+		"""
+		Adds a fixation that has ended to the pooled statistics.
+
+		Arguments:
+		fix		--	A (n, mx, my, m2, t0, t1) tuple.
+		"""
+
+		n, mx, my, m2, t0, t1 = fix
+		if n == 0:
+			return
+		self.pooled_m2 += m2
+		self.pooled_dof += n - 1
+		if self.first_fixation == None and t1 - t0 >= self.min_fixation:
+			self.first_fixation = mx, my
+
+	def update(self, t, x, y, missed=0):
+
+		"""<DOC>
+		Adds a batch of samples.
+
+		Arguments:
+		t		--	An array of timestamps in milliseconds.
+		x		--	An array of horizontal positions.
+		y		--	An array of vertical positions.
+
+		Keyword arguments:
+		missed	--	The number of samples that were skipped before this #
+					batch, which are counted as lost. (default=0)
+		</DOC>"""
+
+		n = len(t)
+		has_gaze = valid(x, y)
+		nvalid = int(has_gaze.sum())
+		self.samples += n + missed
+		self.lost += n - nvalid + missed
+		if missed > 0:
+			self.last = numpy.nan, numpy.nan, numpy.nan
+		if n == 0:
+			return
+		x = numpy.where(has_gaze, x, numpy.nan)
+		y = numpy.where(has_gaze, y, numpy.nan)
+		# The steps into every sample of the batch, starting from the last
+		# sample of the previous batch. A step from or to a sample without
+		# gaze is NaN, and is never a fixation step.
+		dt = numpy.diff(numpy.concatenate(([self.last[0]], t)))
+		dx = numpy.diff(numpy.concatenate(([self.last[1]], x)))
+		dy = numpy.diff(numpy.concatenate(([self.last[2]], y)))
+		d2 = dx * dx + dy * dy
+		limit = numpy.maximum(self.velocity_threshold * dt, self.min_step)
+		with numpy.errstate(invalid=u'ignore'):
+			still = (dt > 0) & (d2 <= limit * limit)
+		self.s2s_sum += float(d2[still].sum())
+		self.s2s_n += int(still.sum())
+		self.last = float(t[-1]), float(x[-1]), float(y[-1])
+		if nvalid == 0:
+			self._close(self.fix)
+			self.fix = 0, 0., 0., 0., 0., 0.
+			return
+		# Every step that is not a fixation step starts a new fixation. The
+		# fixation with index 0 continues the one of the previous batch.
+		seg = numpy.cumsum(~still)[has_gaze]
+		t, x, y = t[has_gaze], x[has_gaze], y[has_gaze]
+		nseg = int(seg[-1]) + 1
+		ns = numpy.bincount(seg, minlength=nseg)
+		has = ns > 0
+		count = numpy.maximum(ns, 1)
+		mx = numpy.bincount(seg, x, nseg) / count
+		my = numpy.bincount(seg, y, nseg) / count
+		m2 = numpy.bincount(seg, (x - mx[seg]) ** 2 + (y - my[seg]) ** 2, \
+			nseg)
+		t0 = t[numpy.searchsorted(seg, numpy.arange(nseg))[has]]
+		t1 = t[numpy.searchsorted(seg, numpy.arange(nseg), side=u'right')[has] \
+			- 1]
+		fixations = list(zip(ns[has].tolist(), mx[has].tolist(), \
+			my[has].tolist(), m2[has].tolist(), t0.tolist(), t1.tolist()))
+		if ns[0] > 0:
+			# Chan et al.: merge the first fixation with the current one
+			na, mxa, mya, m2a, t0a, t1a = self.fix
+			nb, mxb, myb, m2b, t0b, t1b = fixations[0]
+			if na > 0:
+				nab = na + nb
+				ddx = mxb - mxa
+				ddy = myb - mya
+				fixations[0] = nab, mxa + ddx * nb / nab, mya + ddy * nb / \
+					nab, m2a + m2b + (ddx * ddx + ddy * ddy) * na * nb / nab, \
+					t0a, t1b
+		else:
+			self._close(self.fix)
+		for fix in fixations[:-1]:
+			self._close(fix)
+		if has_gaze[-1]:
+			# The last sample has gaze, so its fixation goes on
+			self.fix = fixations[-1]
+		else:
+			self._close(fixations[-1])
+			self.fix = 0, 0., 0., 0., 0., 0.
+
+	def summary(self):
+
+		"""<DOC>
+		Gets the statistics of the samples so far.
+
+		Returns:
+		A dict with the keys samples, lost (a proportion), rms_s2s, std, and #
+		drift (in pixels). A statistic that cannot be computed is None.
+		</DOC>"""
+
+		s = {u'samples' : self.samples, u'lost' : None, u'rms_s2s' : None, \
+			u'std' : None, u'drift' : None}
+		if self.samples > 0:
+			s[u'lost'] = float(self.lost) / self.samples
+		if self.s2s_n > 0:
+			s[u'rms_s2s'] = math.sqrt(self.s2s_sum / self.s2s_n)
+		n, mx, my, m2, t0, t1 = self.fix
+		dof = self.pooled_dof + max(0, n - 1)
+		if dof > 0:
+			s[u'std'] = math.sqrt((self.pooled_m2 + m2) / dof)
+		first = self.first_fixation
+		if first == None and n > 0 and t1 - t0 >= self.min_fixation:
+			first = mx, my
+		if first != None and self.target != None:
+			s[u'drift'] = math.sqrt((first[0] - self.target[0]) ** 2 + \
+				(first[1] - self.target[1]) ** 2)
+		return s
+
+class quality_monitor(threading.Thread):
+
+	"""A thread that keeps the statistics of the current trial."""
+
+	def __init__(self, reader, geometry, velocity_threshold=35, min_step=.2, \
+		min_fixation=100, interval=100):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		reader				--	A libshm.gaze_reader.
+		geometry			--	A libgeometry.screen_geometry, to convert #
+								between pixels and degrees.
+
+		Keyword arguments:
+		velocity_threshold	--	The saccade velocity threshold in degrees #
+								per second. (default=35)
+		min_step			--	The minimum step in degrees, see #
+								trial_stats. (default=.2)
+		min_fixation		--	See trial_stats. (default=100)
+		interval			--	The interval in milliseconds at which the #
+								ring is read. This should be well below the #
+								duration of the ring. (default=100)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'eyetracker quality monitor')
+		self.daemon = True
+		self.reader = reader
+		self.geometry = geometry
+		self.interval = interval / 1000.
+		self.stats = trial_stats(geometry.deg2pix(velocity_threshold) / \
+			1000., geometry.deg2pix(min_step), min_fixation=min_fixation)
+		self.active = False
+		self._count = reader.count
+		self._out = numpy.empty(reader.capacity, dtype=sample_dtype)
+		self._lock = threading.Lock()
+		self._halt = threading.Event()
+
+	def run(self):
+
+		while not self._halt.wait(self.interval):
+			self.pump()
+
+	def pump(self):
+
+		"""<DOC>
+		Adds the samples that have arrived in the ring to the statistics, #
+		if a trial is going on.
+		</DOC>"""
+
+		with self._lock:
+			samples, count = self.reader.since(self._count, out=self._out)
+			missed = count - self._count - len(samples)
+			self._count = count
+			if self.active:
+				self.stats.update(samples[u'time'], samples[u'x'], \
+					samples[u'y'], missed=missed)
+
+	def set_target(self, pos):
+
+		"""<DOC>
+		Sets the position that gaze should be on at the start of the next #
+		trial, see trial_stats.set_target().
+
+		Arguments:
+		pos	--	An (x, y) tuple.
+		</DOC>"""
+
+		with self._lock:
+			self.stats.set_target(pos[0], pos[1])
+
+	def start_trial(self):
+
+		"""<DOC>
+		Starts a new trial. Samples that arrived before this are ignored.
+		</DOC>"""
+
+		with self._lock:
+			self._count = self.reader.count
+			self.stats.reset()
+			self.active = True
+
+	def stop_trial(self):
+
+		"""<DOC>
+		Ends the trial, and gets its statistics in degrees. The drift-#
+		correction target is forgotten.
+
+		Returns:
+		A dict like trial_stats.summary(), with rms_s2s, std, and drift in #
+		degrees.
+		</DOC>"""
+
+		self.pump()
+		with self._lock:
+			self.active = False
+			s = self.stats.summary()
+			self.stats.target = None
+		for key in u'rms_s2s', u'std', u'drift':
+			if s[key] != None:
+				s[key] = float(self.geometry.pix2deg(s[key]))
+		return s
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the thread and releases the reader.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive():
+			self.join(1)
+		self.reader.close()
+
+def check(summary, max_rms_s2s=None, max_std=None, max_lost=None, \
+	max_drift=None):
+
+	"""<DOC>
+	Checks the statistics of a trial against thresholds.
+
+	Arguments:
+	summary		--	A dict as returned by quality_monitor.stop_trial().
+
+	Keyword arguments:
+	max_rms_s2s	--	The maximum RMS-S2S in degrees, or None. (default=None)
+	max_std		--	The maximum STD in degrees, or None. (default=None)
+	max_lost	--	The maximum proportion of lost samples, or None. #
+					(default=None)
+	max_drift	--	The maximum drift in degrees, or None. (default=None)
+
+	Returns:
+	A list with the keys of the statistics that exceed their threshold, #
+	which is empty if the trial passes.
+	</DOC>"""
+
+	failed = []
+	for key, threshold in (u'rms_s2s', max_rms_s2s), (u'std', max_std), \
+		(u'lost', max_lost), (u'drift', max_drift):
+		if threshold != None and summary[key] != None and summary[key] > \
+			threshold:
+			failed.append(key)
+	return failed
+
+def start(tracker, velocity_threshold=35):
+
+	"""<DOC>
+	Starts monitoring the data quality of a tracker. The sampler thread of #
+	the tracker is started if it isn't running yet. This is what #
+	eyetracker_calibrate does when the quality monitor is enabled.
+
+	Arguments:
+	tracker				--	A tracker object.
+
+	Keyword arguments:
+	velocity_threshold	--	See quality_monitor. (default=35)
+
+	Returns:
+	A running quality_monitor, or None if the tracker has no samples to #
+	monitor.
+	</DOC>"""
+
+	reader = libsampler.reader(tracker)
+	if reader == None:
+		return None
+	monitor = quality_monitor(reader, tracker.geometry, \
+		velocity_threshold=velocity_threshold)
+	monitor.start()
+	return monitor
+
+def get_monitor(experiment):
+
+	"""<DOC>
+	Gets the quality monitor of an experiment.
+
+	Arguments:
+	experiment	--	The experiment.
+
+	Returns:
+	A quality_monitor, or None if the quality monitor is not enabled.
+	</DOC>"""
+
+	return getattr(experiment, u'eyetracker_quality', None)
+
+def validation_grid(resolution, points=9, margin=.1):
+
+	"""<DOC>
+	Gets the positions of a validation grid.
+
+	Arguments:
+	resolution	--	The (width, height) of the display in pixels.
+
+	Keyword arguments:
+	points		--	The number of points: 1 (the centre), 5 (the centre and #
+					the corners), 9 (a 3 x 3 grid), or 13 (a 3 x 3 grid and #
+					the centres of its four quadrants). (default=9)
+	margin		--	The distance between the outer points and the edges of #
+					the display, as a proportion of its size. (default=.1)
+
+	Returns:
+	A list of (x, y) tuples, the centre first.
+	</DOC>"""
+
+	if points not in (1, 5, 9, 13):
+		from libopensesame import exceptions
+		raise exceptions.runtime_error( \
+			u'A validation grid has 1, 5, 9, or 13 points, not %s' % points)
+	w, h = resolution
+	l, c, r = margin * w, w / 2., (1 - margin) * w
+	t, m, b = margin * h, h / 2., (1 - margin) * h
+	grid = [(c, m)]
+	if points >= 5:
+		grid += [(l, t), (r, t), (l, b), (r, b)]
+	if points >= 9:
+		grid += [(c, t), (l, m), (r, m), (c, b)]
+	if points >= 13:
+		grid += [((l + c) / 2, (t + m) / 2), ((c + r) / 2, (t + m) / 2), \
+			((l + c) / 2, (m + b) / 2), ((c + r) / 2, (m + b) / 2)]
+	return [(int(round(x)), int(round(y))) for x, y in grid]
+
+def collect(sample, duration, samplerate=0, out=None):
+
+	"""<DOC>
+	Collects new samples for a duration, at the rate of the tracker, into a #
+	preallocated array. A sample is new if it differs from the previous one.
+
+	Arguments:
+	sample		--	A function that returns an (x, y) tuple, such as #
+					sample() of a tracker.
+	duration	--	The duration in milliseconds.
+
+	Keyword arguments:
+	samplerate	--	The sampling rate in Hz, or 0 if unknown (see #
+					libwait.pacer). (default=0)
+	out			--	An array of shape (n, 3) that is reused, or None to #
+					create one. The array grows if it is too small. #
+					(default=None)
+
+	Returns:
+	An array of shape (n, 3) with the time in milliseconds, and the x and y #
+	position of every sample, including samples without gaze.
+	</DOC>"""
+
+	if out is None:
+		out = numpy.empty((int(duration * max(samplerate, 500) / 800.) + 16, \
+			3))
+	pace = libwait.pacer(samplerate)
+	end = libwait.clock() + duration / 1000.
+	n = 0
+	last = None
+	while libwait.clock() < end:
+		s = pace.poll(sample)
+		if s == last:
+			continue
+		last = s
+		if n == len(out):
+			out = numpy.concatenate((out, numpy.empty_like(out)))
+		out[n] = libwait.clock() * 1000., s[0], s[1]
+		n += 1
+	return out[:n]
+
+def precision(x, y):
+
+	"""<DOC>
+	Computes the precision of the samples during a fixation.
+
+	Arguments:
+	x	--	An array of horizontal positions.
+	y	--	An array of vertical positions.
+
+	Returns:
+	A dict with the number of samples, the number of steps (pairs of #
+	consecutive samples with gaze), the proportion of samples without gaze #
+	(lost), and (horizontal, vertical) tuples for the RMS of the distances #
+	between consecutive samples (rms_s2s), the standard deviation (std), #
+	and their standard errors (rms_s2s_se, std_se). Statistics without #
+	samples are NaN.
+	</DOC>"""
+
+	ok = valid(x, y)
+	n = len(x)
+	xy = numpy.column_stack((x, y))
+	# Steps between consecutive samples that both have gaze
+	steps = ok[1:] & ok[:-1]
+	d2 = (numpy.diff(xy, axis=0)[steps]) ** 2
+	k = len(d2)
+	g = xy[ok]
+	m = len(g)
+	with numpy.errstate(invalid=u'ignore', divide=u'ignore'):
+		ms = d2.mean(axis=0) if k > 0 else numpy.array([numpy.nan] * 2)
+		rms = numpy.sqrt(ms)
+		# The delta method: the standard error of the mean squared step,
+		# divided by the derivative of the square root
+		ms_se = d2.std(axis=0, ddof=1) / math.sqrt(k) if k > 1 else \
+			numpy.array([numpy.nan] * 2)
+		rms_se = ms_se / (2 * rms)
+		std = g.std(axis=0, ddof=1) if m > 1 else numpy.array([numpy.nan] * 2)
+		std_se = std / math.sqrt(2 * (m - 1)) if m > 1 else \
+			numpy.array([numpy.nan] * 2)
+	return {
+		u'samples' : n,
+		u'steps' : k,
+		u'lost' : float(n - m) / n if n > 0 else numpy.nan,
+		u'rms_s2s' : tuple(rms.tolist()),
+		u'rms_s2s_se' : tuple(rms_se.tolist()),
+		u'std' : tuple(std.tolist()),
+		u'std_se' : tuple(std_se.tolist()),
+		}
+
+def accuracy(target, x, y):
+
+	"""<DOC>
+	Computes the accuracy of the samples during a fixation on a target.
+
+	Arguments:
+	target	--	The (x, y) position of the target.
+	x		--	An array of horizontal positions.
+	y		--	An array of vertical positions.
+
+	Returns:
+	A dict with the mean (horizontal, vertical) offset of gaze from the #
+	target (offset) and its standard error (offset_se), and the distance #
+	between the mean gaze position and the target (error) with the half #
+	width of its 95% confidence interval (error_ci). Statistics without #
+	samples are NaN.
+	</DOC>"""
+
+	ok = valid(x, y)
+	d = numpy.column_stack((x[ok] - target[0], y[ok] - target[1]))
+	m = len(d)
+	if m == 0:
+		nan = numpy.nan
+		return {u'offset' : (nan, nan), u'offset_se' : (nan, nan), \
+			u'error' : nan, u'error_ci' : nan}
+	offset = d.mean(axis=0)
+	se = d.std(axis=0, ddof=1) / math.sqrt(m) if m > 1 else \
+		numpy.array([numpy.nan] * 2)
+	error = math.sqrt((offset ** 2).sum())
+	# The delta method for the distance
+	with numpy.errstate(invalid=u'ignore', divide=u'ignore'):
+		error_se = math.sqrt(((offset * se) ** 2).sum()) / error if error > 0 \
+			else math.sqrt((se ** 2).sum())
+	return {
+		u'offset' : tuple(offset.tolist()),
+		u'offset_se' : tuple(se.tolist()),
+		u'error' : error,
+		u'error_ci' : 1.96 * error_se,
+		}
+
+def pool(results):
+
+	"""<DOC>
+	Pools the precision of a number of fixations, such as the points of a #
+	validation grid.
+
+	Arguments:
+	results	--	A list of dicts as returned by precision().
+
+	Returns:
+	A dict like precision() returns, in which the RMS is pooled over all #
+	steps, and the standard deviation over all samples, around the mean of #
+	each fixation.
+	</DOC>"""
+
+	samples = numpy.array([r[u'samples'] for r in results], dtype=float)
+	steps = numpy.array([r[u'steps'] for r in results], dtype=float)
+	lost = numpy.array([r[u'lost'] for r in results], dtype=float)
+	kept = numpy.round(samples * (1 - numpy.nan_to_num(lost)))
+	rms = numpy.array([r[u'rms_s2s'] for r in results])
+	rms_se = numpy.array([r[u'rms_s2s_se'] for r in results])
+	std = numpy.array([r[u'std'] for r in results])
+	dof = numpy.maximum(kept - 1, 0)
+	k = steps.sum()
+	m = dof.sum()
+	with numpy.errstate(invalid=u'ignore', divide=u'ignore'):
+		# Weighted sums, in which fixations without steps or samples (and NaN
+		# statistics) have no weight
+		w = steps[:, None] / k
+		prms = numpy.sqrt(numpy.nansum(w * rms ** 2, axis=0)) if k > 0 else \
+			numpy.array([numpy.nan] * 2)
+		# The standard error of the pooled mean square, through the delta
+		# method back to the RMS
+		ms_se = numpy.sqrt(numpy.nansum((w * 2 * rms * rms_se) ** 2, axis=0))
+		prms_se = ms_se / (2 * prms)
+		pstd = numpy.sqrt(numpy.nansum(dof[:, None] * std ** 2, axis=0) / m)
+		pstd_se = pstd / math.sqrt(2 * m) if m > 0 else pstd * numpy.nan
+	return {
+		u'samples' : int(samples.sum()),
+		u'steps' : int(k),
+		u'lost' : float(samples.sum() - kept.sum()) / samples.sum() if \
+			samples.sum() > 0 else numpy.nan,
+		u'rms_s2s' : tuple(prms.tolist()),
+		u'rms_s2s_se' : tuple(prms_se.tolist()),
+		u'std' : tuple(pstd.tolist()),
+		u'std_se' : tuple(pstd_se.tolist()),
+		}
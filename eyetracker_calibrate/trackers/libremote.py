@@ -0,0 +1,336 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The UDP transport of the iViewX remote command protocol (see libiviewx for
+# the commands), apart from the tracker library so that it can be used without
+# OpenSesame, e.g. to benchmark the link against libemulator.
+#
+# A receive thread waits on the socket with select(), and parses every
+# datagram as soon as it arrives: samples are written straight into a sample
+# ring (see libshm), replies are queued for the thread that waits for them.
+# Commands are sent from a non-blocking socket, and commands that don't need
+# an answer in between are sent back to back (see link.send() and
+# link.batch()), so that a batch costs one round trip rather than one per
+# command.
+#
+# Python 2 has no selectors module, so the receive thread uses select()
+# directly, which is the same on every platform for a single socket.
+
+import collections
+import errno
+import select
+import socket
+import threading
+
+import libshm
+import libwait
+
+# The format of the sample lines: timestamp in microseconds, gaze position,
+# and pupil diameter. For binocular recordings, every field but the timestamp
+# holds both eyes, left first.
+SAMPLE_FORMAT = u'%TS %SX %SY %DX'
+
+class link(threading.Thread):
+
+	"""
+	The UDP connection to iViewX, with a thread that receives samples and
+	replies, see the top of this file. The link has the attributes of a libsampler.sampler (ring,
+	latest, add_listener() and remove_listener()), so that it can serve as
+	the sampler of the tracker.
+	"""
+
+	def __init__(self, ip, sendport, receiveport, eyes, capacity=4096, \
+		health=None):
+
+		"""<DOC>
+		Constructor. Opens the socket and starts the receive thread.
+
+		Arguments:
+		ip			--	The IP address of iViewX.
+		sendport	--	The port to which commands are sent.
+		receiveport	--	The port at which samples and replies are received.
+		eyes		--	A libbinocular.eye_buffer, into which both eyes of #
+						every sample are written.
+
+		Keyword arguments:
+		capacity	--	The number of samples in the ring. (default=4096)
+		health		--	A libhealth.link_counters, in which receive errors, #
+						unreadable samples, and replies that overflow the #
+						reply queue are counted, or None. (default=None)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'iViewX receiver')
+		self.daemon = True
+		self.address = ip, sendport
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		# A large receive buffer absorbs bursts of samples while the thread
+		# is not scheduled
+		try:
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+		except socket.error:
+			pass
+		self.sock.bind((u'', receiveport))
+		self.sock.setblocking(False)
+		self.eyes = eyes
+		# The eye that is written to the ring: 0 for left, 1 for right
+		self.eye = 0
+		self.binocular = False
+		self.ring = libshm.gaze_ring(capacity=capacity)
+		# Held while a sample is written, so that the ring can be replaced
+		# safely, see set_ring()
+		self._ringlock = threading.Lock()
+		self.latest = None
+		self.listeners = []
+		# Statistics: received samples, and samples that arrived after a
+		# newer sample and were dropped
+		self.received = 0
+		self.reordered = 0
+		self.health = health
+		self._replies = collections.deque(maxlen=256)
+		self._cond = threading.Condition()
+		self._halt = threading.Event()
+		self.start()
+
+	def add_listener(self, listener):
+
+		"""<DOC>
+		Adds a function that is called with a (time, x, y, pupil) tuple for #
+		every new sample, see libsampler.sampler.add_listener().
+
+		Arguments:
+		listener	--	A function.
+		</DOC>"""
+
+		self.listeners = self.listeners + [listener]
+
+	def remove_listener(self, listener):
+
+		"""<DOC>
+		Removes a listener.
+
+		Arguments:
+		listener	--	A function that was added with add_listener().
+		</DOC>"""
+
+		self.listeners = [l for l in self.listeners if l != listener]
+
+	def set_ring(self, shm_name=None, capacity=4096, samplerate=0):
+
+		"""<DOC>
+		Replaces the sample ring, e.g. by a ring in shared memory.
+
+		Keyword arguments:
+		shm_name	--	See libshm.gaze_ring. (default=None)
+		capacity	--	See libshm.gaze_ring. (default=4096)
+		samplerate	--	See libshm.gaze_ring. (default=0)
+		</DOC>"""
+
+		ring = libshm.gaze_ring(name=shm_name, capacity=capacity, \
+			samplerate=samplerate)
+		with self._ringlock:
+			old = self.ring
+			self.ring = ring
+		old.close()
+
+	def run(self):
+
+		sock = self.sock
+		while not self._halt.is_set():
+			try:
+				readable = select.select([sock], [], [], .1)[0]
+			except (select.error, ValueError):
+				# The socket has been closed
+				break
+			if not readable:
+				continue
+			# Read everything that has arrived, until the socket would block
+			while True:
+				try:
+					data = sock.recv(65536)
+				except socket.error as e:
+					# E.g. a port-unreachable error on Windows, if iViewX
+					# isn't listening yet
+					if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+						self._error()
+					break
+				for line in data.decode(u'ascii', u'ignore').splitlines():
+					if line.startswith(u'ET_SPL'):
+						self._sample(line.split())
+					elif line != u'':
+						with self._cond:
+							if len(self._replies) == self._replies.maxlen \
+								and self.health != None:
+								self.health.overflows += 1
+							self._replies.append(line.strip())
+							self._cond.notify_all()
+
+	def _error(self):
+
+		"""
+		Counts a receive error.
+		"""
+
+		if self.health != None:
+			self.health.errors += 1
+
+	def _sample(self, parts):
+
+		"""
+		Parses a sample line in SAMPLE_FORMAT, and writes the sample to the
+		eye buffer and the ring. A monocular sample has four fields, a
+		binocular sample seven. An eye with a pupil diameter of 0 is missing.
+
+		Arguments:
+		parts	--	The fields of the line, including ET_SPL.
+		"""
+
+		try:
+			v = [float(p) for p in parts[1:]]
+		except ValueError:
+			self._error()
+			return
+		t = v[0] / 1000.
+		if self.latest != None and t <= self.latest[0]:
+			self.reordered += 1
+			return
+		if len(v) == 7:
+			self.binocular = True
+			left = (v[1], v[3], v[5]) if v[5] > 0 else None
+			right = (v[2], v[4], v[6]) if v[6] > 0 else None
+		elif len(v) == 4:
+			self.binocular = False
+			e = (v[1], v[2], v[3]) if v[3] > 0 else None
+			left, right = (e, None) if self.eye == 0 else (None, e)
+		else:
+			self._error()
+			return
+		self.eyes.write(t, left, right)
+		e = right if self.eye == 1 else left
+		if e == None:
+			s = t, -1, -1, -1
+		else:
+			s = t, e[0], e[1], e[2]
+		with self._ringlock:
+			self.ring.write(*s)
+		self.latest = s
+		self.received += 1
+		for listener in self.listeners:
+			listener(s)
+
+	def send(self, *commands):
+
+		"""<DOC>
+		Sends commands back to back, without waiting for replies.
+
+		Arguments:
+		*commands	--	Commands, as strings without a line ending.
+
+		Exceptions:
+		Raises a socket.error if a command cannot be sent.
+		</DOC>"""
+
+		for cmd in commands:
+			data = (cmd + u'\n').encode(u'ascii', u'ignore')
+			while True:
+				try:
+					self.sock.sendto(data, self.address)
+					break
+				except socket.error as e:
+					if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+						raise
+					# The send buffer is full
+					select.select([], [self.sock], [], 1)
+
+	def flush(self):
+
+		"""<DOC>
+		Discards all replies that have not been taken yet.
+		</DOC>"""
+
+		with self._cond:
+			self._replies.clear()
+
+	def expect(self, prefixes, timeout=None):
+
+		"""<DOC>
+		Waits for a reply that starts with one of a number of prefixes, and #
+		takes it from the queue. Other replies stay in the queue.
+
+		Arguments:
+		prefixes	--	A prefix, or a tuple of prefixes.
+
+		Keyword arguments:
+		timeout		--	The timeout in seconds, or None to wait forever. #
+						(default=None)
+
+		Returns:
+		The reply, or None on a timeout.
+		</DOC>"""
+
+		if not isinstance(prefixes, tuple):
+			prefixes = prefixes,
+		deadline = None if timeout == None else libwait.clock() + timeout
+		with self._cond:
+			while True:
+				for reply in self._replies:
+					if reply.startswith(prefixes):
+						self._replies.remove(reply)
+						return reply
+				if deadline == None:
+					self._cond.wait(.1)
+					continue
+				left = deadline - libwait.clock()
+				if left <= 0:
+					return None
+				self._cond.wait(left)
+
+	def batch(self, commands, replies=(), timeout=1.):
+
+		"""<DOC>
+		Sends a batch of commands back to back, and then collects the #
+		replies to them in one pass.
+
+		Arguments:
+		commands	--	A list of commands.
+
+		Keyword arguments:
+		replies		--	A list of prefixes of the expected replies. #
+						(default=())
+		timeout		--	The timeout in seconds for all replies together. #
+						(default=1.)
+
+		Returns:
+		A list with a reply, or None if it didn't arrive, for every prefix.
+		</DOC>"""
+
+		self.send(*commands)
+		deadline = libwait.clock() + timeout
+		return [self.expect(prefix, max(0, deadline - libwait.clock())) \
+			for prefix in replies]
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the thread, and closes the socket and the ring.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive():
+			self.join(1)
+		self.sock.close()
+		self.ring.close()
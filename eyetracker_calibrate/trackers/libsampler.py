@@ -0,0 +1,178 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The acquisition thread. A sampler polls the newest sample of a tracker in the
+# background, and writes every new sample into a gaze_ring (see libshm). This
+# way, the samples are also collected while the experiment itself is busy, and
+# they can be shared with other processes without those processes touching
+# the link with the tracker.
+#
+# The thread polls once per sample, paced by a libwait.pacer: it sleeps until
+# shortly before the next sample is expected, and then polls without sleeping
+# until the sample arrives.
+#
+# Other parts of the plug-ins can register a listener, which is called from the
+# sampler thread for every new sample. Listeners should return quickly.
+
+import threading
+
+import libshm
+import libwait
+
+class sampler(threading.Thread):
+
+	"""A thread that polls a tracker and writes the samples into a ring."""
+
+	def __init__(self, poll, ring, samplerate=0):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		poll		--	A function that returns the newest sample as a #
+						(time, x, y, pupil) tuple, or None if no sample is #
+						available. The function is only called from the #
+						sampler thread.
+		ring		--	A gaze_ring.
+
+		Keyword arguments:
+		samplerate	--	The sampling rate of the tracker in Hz, or 0 if #
+						unknown. (default=0)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'eyetracker sampler')
+		self.daemon = True
+		self.poll = poll
+		self.ring = ring
+		# The pacer of the polling loop, which keeps statistics about the
+		# wake-up error
+		self.pacer = libwait.pacer(samplerate)
+		self.listeners = []
+		# The newest (time, x, y, pupil) tuple, or None
+		self.latest = None
+		self._halt = threading.Event()
+
+	def add_listener(self, listener):
+
+		"""<DOC>
+		Adds a function that is called with a (time, x, y, pupil) tuple for #
+		every new sample. The function is called from the sampler thread.
+
+		Arguments:
+		listener	--	A function.
+		</DOC>"""
+
+		# The list is replaced rather than changed, so that the thread can
+		# iterate over it without a lock
+		self.listeners = self.listeners + [listener]
+
+	def remove_listener(self, listener):
+
+		"""<DOC>
+		Removes a listener.
+
+		Arguments:
+		listener	--	A function that was added with add_listener().
+		</DOC>"""
+
+		self.listeners = [l for l in self.listeners if l != listener]
+
+	def run(self):
+
+		prev = None
+		write = self.ring.write
+		pace = self.pacer
+		# The ring is closed by this thread when it exits, so that it is never
+		# closed under a write, even if stop() gives up waiting
+		try:
+			while not self._halt.is_set():
+				pace.wait()
+				s = self.poll()
+				# The poll may block, so check again before writing
+				if s != None and s[0] != prev and not self._halt.is_set():
+					pace.update()
+					prev = s[0]
+					write(*s)
+					self.latest = s
+					for listener in self.listeners:
+						listener(s)
+		finally:
+			self.ring.close()
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the thread, which releases the ring when it exits. This waits #
+		at most a second for the thread.
+		</DOC>"""
+
+		self._halt.set()
+		if self.ident == None:
+			# The thread has never run, so nothing else will close the ring
+			self.ring.close()
+		elif self.is_alive():
+			self.join(1)
+
+def start(poll, shm_name=None, capacity=4096, samplerate=0):
+
+	"""<DOC>
+	Creates a ring and starts a sampler thread. This is the implementation of #
+	start_sampler() in the tracker libraries.
+
+	Arguments:
+	poll		--	See sampler.
+
+	Keyword arguments:
+	shm_name	--	The name of a shared-memory segment for the ring, or None #
+					to keep the ring within this process. (default=None)
+	capacity	--	The number of samples in the ring. (default=4096)
+	samplerate	--	The sampling rate of the tracker in Hz, or 0 if #
+					unknown. (default=0)
+
+	Returns:
+	A sampler, which is already running.
+	</DOC>"""
+
+	s = sampler(poll, libshm.gaze_ring(shm_name, capacity, samplerate), \
+		samplerate=samplerate)
+	s.start()
+	return s
+
+def reader(tracker):
+
+	"""<DOC>
+	Opens a reader on the ring of the sampler thread of a tracker, and #
+	starts the sampler thread if it isn't running yet. For a worker proxy #
+	(see libworker), whose sampler runs in the worker, the reader is attached #
+	to the shared memory of the proxy, with a read buffer of its own. This is #
+	how the monitors and other consumers of the samples get their reader.
+
+	Arguments:
+	tracker	--	A tracker object.
+
+	Returns:
+	A libshm.gaze_reader, or None if the tracker has no sampler.
+	</DOC>"""
+
+	proxy = getattr(tracker, u'_reader', None)
+	if proxy != None:
+		return libshm.gaze_reader(_mm=proxy._mm)
+	if getattr(tracker, u'sampler', None) == None:
+		tracker.start_sampler()
+	if getattr(tracker, u'sampler', None) == None:
+		return None
+	return tracker.sampler.ring.reader()
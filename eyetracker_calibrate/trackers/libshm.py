@@ -0,0 +1,377 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# A ring buffer of gaze samples in (shared) memory. The tracker backends write
+# every new sample into a gaze_ring from their sampler thread (see
+# libsampler). If the ring has a name, it lives in a named shared-memory
+# segment, and other processes on the same computer can attach a gaze_reader
+# to it. Readers copy the samples from the mapped memory into a NumPy array,
+# which they can reuse from read to read: there is no socket, no
+# serialization, and no extra load on the link with the tracker, no matter how
+# many readers there are. The copy is not zero-copy, because the writer may
+# overwrite a slot as soon as the read is done.
+#
+# Because there is a single writer, the ring is protected by a seqlock rather
+# than by a lock that readers would have to take. The writer makes the
+# sequence number odd before it changes the ring, and even again afterwards.
+# A reader remembers the sequence number and the number of samples, copies what
+# it needs, and then checks whether the writer has (started to) overwrite any
+# of the copied slots in the meantime. If so, the reader retries. Readers
+# therefore never block the writer, and the writer never waits for readers.
+#
+# Layout of the segment (all values little endian):
+#
+#	offset	type		field
+#	0		char[8]		magic, 'OSGAZE01'
+#	8		uint32		capacity, in samples
+#	12		uint32		sample size, in bytes
+#	16		float64		sampling rate in Hz, or 0 if unknown
+#	24		uint64		sequence number
+#	32		uint64		number of samples written since the ring was created
+#	64					capacity samples of four float64s: time (ms), x, y, pupil
+#
+# The newest sample is at index (count - 1) % capacity.
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import numpy
+
+MAGIC = 'OSGAZE01'
+HEADER_SIZE = 64
+sample_dtype = numpy.dtype([('time', '<f8'), ('x', '<f8'), ('y', '<f8'), \
+	('pupil', '<f8')])
+
+_header = struct.Struct('<8sIId')
+_seq = struct.Struct('<Q')
+_seqcount = struct.Struct('<QQ')
+_sample = struct.Struct('<dddd')
+_SEQ = 24
+
+def _path(name):
+
+	"""
+	Gets the path of the file that backs a named segment on systems other than
+	Windows. On Linux, /dev/shm is a memory file system, so the segment never
+	touches the disk.
+
+	Arguments:
+	name	--	The name of the segment.
+
+	Returns:
+	A path.
+	"""
+
+	if os.path.isdir(u'/dev/shm'):
+		return os.path.join(u'/dev/shm', name)
+	return os.path.join(tempfile.gettempdir(), name)
+
+def _map(name, size, create):
+
+	"""
+	Maps a named segment.
+
+	Arguments:
+	name	--	The name of the segment, or None for anonymous memory.
+	size	--	The size of the segment in bytes.
+	create	--	Indicates whether the segment should be created.
+
+	Returns:
+	An mmap object.
+	"""
+
+	if name == None:
+		return mmap.mmap(-1, size)
+	if sys.platform == 'win32':
+		return mmap.mmap(-1, size, tagname=name)
+	path = _path(name)
+	if create:
+		fd = os.open(path, os.O_CREAT | os.O_TRUNC | os.O_RDWR, 0o644)
+		os.ftruncate(fd, size)
+	else:
+		fd = os.open(path, os.O_RDONLY)
+	try:
+		if create:
+			return mmap.mmap(fd, size)
+		return mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+	finally:
+		os.close(fd)
+
+class gaze_ring:
+
+	"""The writing end of a ring of gaze samples."""
+
+	def __init__(self, name=None, capacity=4096, samplerate=0):
+
+		"""<DOC>
+		Constructor.
+
+		Keyword arguments:
+		name		--	The name of the shared-memory segment, or None for a #
+						ring that is only used within this process. #
+						(default=None)
+		capacity	--	The number of samples in the ring. (default=4096)
+		samplerate	--	The sampling rate of the tracker in Hz, which is #
+						stored for the readers, or 0 if unknown. (default=0)
+		</DOC>"""
+
+		self.name = name
+		self.capacity = int(capacity)
+		self.samplerate = samplerate
+		self.size = HEADER_SIZE + self.capacity * _sample.size
+		self._mm = _map(name, self.size, True)
+		_header.pack_into(self._mm, 0, MAGIC, self.capacity, _sample.size, \
+			samplerate)
+		self._seq = 0
+		self.count = 0
+		_seqcount.pack_into(self._mm, _SEQ, 0, 0)
+
+	def write(self, t, x, y, pupil=0):
+
+		"""<DOC>
+		Adds a sample to the ring.
+
+		Arguments:
+		t		--	The timestamp in milliseconds.
+		x		--	The horizontal gaze position.
+		y		--	The vertical gaze position.
+
+		Keyword arguments:
+		pupil	--	The pupil size. (default=0)
+		</DOC>"""
+
+		mm = self._mm
+		self._seq += 1
+		_seq.pack_into(mm, _SEQ, self._seq)
+		_sample.pack_into(mm, HEADER_SIZE + (self.count % self.capacity) * \
+			_sample.size, t, x, y, pupil)
+		self.count += 1
+		self._seq += 1
+		_seqcount.pack_into(mm, _SEQ, self._seq, self.count)
+
+	def reader(self):
+
+		"""<DOC>
+		Creates a reader for this ring in the same process.
+
+		Returns:
+		A gaze_reader.
+		</DOC>"""
+
+		return gaze_reader(_mm=self._mm)
+
+	def close(self):
+
+		"""<DOC>
+		Releases the ring. Readers in this process, which share the memory #
+		of the ring, must not be used anymore. Readers in other processes #
+		keep the memory that they have mapped, but new readers cannot attach #
+		anymore.
+		</DOC>"""
+
+		if self._mm == None:
+			return
+		self._mm.close()
+		self._mm = None
+		if self.name != None and sys.platform != 'win32':
+			try:
+				os.remove(_path(self.name))
+			except OSError:
+				pass
+
+class gaze_reader:
+
+	"""
+	The reading end of a ring of gaze samples. Any number of readers, in any
+	number of processes, can read from the same ring.
+	"""
+
+	def __init__(self, name=None, retries=1000, _mm=None):
+
+		"""<DOC>
+		Constructor. Attaches to a named ring.
+
+		Keyword arguments:
+		name	--	The name of the shared-memory segment. (default=None)
+		retries	--	The number of times that a read is retried when it #
+					overlaps with a write, before giving up. (default=1000)
+		</DOC>"""
+
+		if _mm == None:
+			if sys.platform == 'win32':
+				mm = mmap.mmap(-1, HEADER_SIZE, tagname=name)
+			else:
+				mm = _map(name, HEADER_SIZE, False)
+			magic, capacity, size, samplerate = _header.unpack_from(mm, 0)
+			mm.close()
+			if magic != MAGIC:
+				raise ValueError(u'\'%s\' is not a gaze ring' % name)
+			_mm = _map(name, HEADER_SIZE + capacity * size, False)
+			self._owner = True
+		else:
+			self._owner = False
+		self._mm = _mm
+		self.retries = retries
+		# The number of samples that since() skipped, because the reader had
+		# fallen too far behind
+		self.dropped = 0
+		magic, self.capacity, size, self.samplerate = _header.unpack_from(_mm, 0)
+		# A view on the samples in the ring, in the order in which they are
+		# stored. This doesn't copy anything.
+		self.ring = numpy.frombuffer(_mm, dtype=sample_dtype, \
+			count=self.capacity, offset=HEADER_SIZE)
+
+	@property
+	def count(self):
+
+		"""<DOC>
+		The number of samples that has been written to the ring since it was #
+		created. This increases by one for every new sample.
+		</DOC>"""
+
+		return _seqcount.unpack_from(self._mm, _SEQ)[1]
+
+	def _read(self, n, first, out):
+
+		"""
+		Copies samples from the ring, retrying until the copy is consistent.
+
+		Arguments:
+		n		--	The maximum number of samples.
+		first	--	The count of the first sample to read, or None to read #
+					the newest n samples.
+		out		--	An array, or None.
+
+		Returns:
+		An (array, count) tuple, with count the total number of samples that #
+		had been written when the array was read.
+		"""
+
+		mm = self._mm
+		ring = self.ring
+		cap = self.capacity
+		for i in range(self.retries):
+			seq, count = _seqcount.unpack_from(mm, _SEQ)
+			# Leave a margin between the oldest copied slot and the slot that
+			# the writer writes next, so that a slow read doesn't have to be
+			# retried over and over
+			m = min(n, cap - cap // 4, count)
+			if first != None:
+				m = min(m, max(0, count - first))
+			if out is None or len(out) < m:
+				out = numpy.empty(m, dtype=sample_dtype)
+			end = count % cap
+			start = (count - m) % cap
+			if m == 0:
+				pass
+			elif start < end:
+				out[:m] = ring[start:end]
+			else:
+				out[:cap - start] = ring[start:]
+				out[cap - start:m] = ring[:end]
+			# The copy is consistent if the writer has not touched any of the
+			# copied slots in the meantime. The slots that the writer has
+			# touched are those up to the current count, plus the slot that it
+			# is writing if the sequence number is odd.
+			seq2, count2 = _seqcount.unpack_from(mm, _SEQ)
+			touched = count2 + seq2 % 2
+			if seq % 2 == 1:
+				touched = max(touched, count + 1)
+			if touched - (count - m) <= cap:
+				return out[:m], count
+			time.sleep(0)
+		raise RuntimeError(u'Failed to read a consistent set of samples')
+
+	def newest(self, n=1, out=None):
+
+		"""<DOC>
+		Reads the newest samples. The samples are copied straight from the #
+		shared memory into a (structured) NumPy array with the fields time, #
+		x, y, and pupil. To avoid allocating a new array for every read, an #
+		array can be passed that is reused.
+
+		Keyword arguments:
+		n	--	The number of samples. (default=1)
+		out	--	An array of sample_dtype, or None to create a new array. #
+				(default=None)
+
+		Returns:
+		An array with at most n samples, oldest first. The array is shorter #
+		than n if fewer samples have been written, and never holds more than #
+		three quarters of the capacity of the ring.
+
+		Exceptions:
+		Raises a RuntimeError if the samples could not be read consistently, #
+		which would mean that the writer is much faster than the reader.
+		</DOC>"""
+
+		return self._read(n, None, out)[0]
+
+	def since(self, count, out=None):
+
+		"""<DOC>
+		Reads all samples that have been written after a given number of #
+		samples, so that a consumer can process every sample exactly once:
+
+			samples, n = reader.since(n)
+
+		At most three quarters of the capacity of the ring are read at a #
+		time. If the consumer has fallen further behind, the oldest missed #
+		samples are skipped, and counted in the dropped attribute, so that #
+		they can be told apart from samples that the tracker never sent.
+
+		Arguments:
+		count	--	The count that was returned by the previous call, or 0.
+
+		Keyword arguments:
+		out		--	See newest(). (default=None)
+
+		Returns:
+		A (samples, count) tuple, with the new samples oldest first.
+		</DOC>"""
+
+		samples, new = self._read(self.capacity, count, out)
+		self.dropped += max(0, new - count - len(samples))
+		return samples, new
+
+	def sample(self):
+
+		"""<DOC>
+		Gets the newest gaze position, like sample() of the trackers.
+
+		Returns:
+		An (x, y) tuple, which is (-1, -1) if no samples are available.
+		</DOC>"""
+
+		s = self.newest(1)
+		if len(s) == 0:
+			return -1, -1
+		return float(s[0]['x']), float(s[0]['y'])
+
+	def close(self):
+
+		"""<DOC>
+		Detaches from the ring.
+		</DOC>"""
+
+		self.ring = None
+		if self._owner:
+			self._mm.close()
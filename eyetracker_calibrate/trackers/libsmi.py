@@ -43,7 +43,21 @@ from openexp.exceptions import response_error
 from libopensesame import exceptions
 
 import copy
+import ctypes
 import math
+import threading
+
+from libgeometry import screen_geometry
+import libaoi
+import libbinocular
+import libdrift
+import libonline
+import libfilter
+import libhealth
+import libquality
+import libsampler
+import libtarget
+import libwait
 
 from iViewXAPI import  *
 
@@ -106,30 +120,12 @@ def errorstring(returncode):
 		return codes['unknown']
 
 
-def deg2pix(cmdist, angle, pixpercm):
-
-	"""Returns the value in pixels for given values (internal use)
-	
-	arguments
-	cmdist	-- distance to display in centimeters
-	angle		-- size of stimulus in visual angle
-	pixpercm	-- amount of pixels per centimeter for display
-	
-	returns
-	pixelsize	-- stimulus size in pixels (calculation based on size in
-			   visual angle on display with given properties)
-	"""
-
-	cmsize = math.tan(math.radians(angle)) * float(cmdist)
-	return cmsize * pixpercm
-
-
 # class
 class libsmi:
 
 	"""A class for SMI eye tracker objects"""
 
-	def __init__(self, experiment, resolution, data_file=u'default', fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=False, ip='127.0.0.1', sendport=4444, receiveport=5555, screen_w=399, screen_h=299):
+	def __init__(self, experiment, resolution, data_file=u'default', fg_color=(255, 255, 255), bg_color=(0, 0, 0), saccade_velocity_threshold=35, saccade_acceleration_threshold=9500, force_drift_correct=False, ip='127.0.0.1', sendport=4444, receiveport=5555, screen_w=399, screen_h=299, screen_dist=570, gaze_filter=u'none', continuous_recording=False):
 		"""<DOC>
 		Constructor. Initializes the connection to the Eyelink.
 
@@ -159,6 +155,17 @@ class libsmi:
 		receiveport		--	port number for iViewX receiving (default = 5555)
 		screen_w		--	physical screen width in millimeters (default = 399)
 		screen_h		--	physical screen height in millimeters (default = 299)
+		screen_dist		--	viewing distance in millimeters, used until the #
+						distance has been measured during calibration #
+						(default = 570)
+		gaze_filter		--	online gaze filter that is applied by sample(): #
+						u'none', u'moving average', u'heuristic' or #
+						u'one-euro'; seeded with the RMS noise after #
+						calibration (default = u'none')
+		continuous_recording	--	keep recording from the first #
+						start_recording() until close(); drift checks #
+						and trials then only mark their start and end #
+						with a message (default = False)
 		</DOC>"""
 
 		# properties
@@ -184,12 +191,18 @@ class libsmi:
 		self.participant = "participant"
 		self.connected = False
 		self.recording = False
+		self.continuous = continuous_recording # see start_recording
+		self.transitions = 0 # number of calls to iV_StartRecording/iV_StopRecording that succeeded
+		self.transitiontime = 0.0 # total duration of those calls in milliseconds
+		self.avoided = 0 # number of transitions that were not needed thanks to continuous recording
 		self.calibrated = False
 		self.validated = False
 		self.eye_used = 0 # 0=left, 1=right, 2=binocular
 		self.left_eye = 0
 		self.right_eye = 1
 		self.binocular = 2
+		self.eyes = libbinocular.eye_buffer() # both eyes of the newest samples, see sample()
+		self.health = libhealth.link_counters() # link errors, see libhealth
 		self.cv = canvas(self.experiment, fgcolor=self.fgc, bgcolor=self.bgc)
 		self.kb = keyboard(self.experiment)
 		self.errorbeep = synth(self.experiment, osc='saw', freq=100, length=100)
@@ -200,8 +213,18 @@ class libsmi:
 		self.weightdist = 10 # weighted distance, used for determining whether a movement is due to measurement error (1 is ok, higher is more conservative and will result in only larger saccades to be detected)
 		self.dispsize = resolution # display size in pixels
 		self.screensize = (screen_w/10.0, screen_h/10.0) # display size in cm
+		self.geometry = screen_geometry(self.dispsize, self.screensize, screen_dist/10.0) # replaced by the measured distance in self.calibrate
 		self.prevsample = (-1,-1)
+		self.filterkind = gaze_filter
+		self.gaze_filter = libfilter.create(gaze_filter) # recreated in self.calibrate, with parameters based on the RMS noise
+		self.sampler = None # acquisition thread, see self.start_sampler
+		self._pollsample = CSample() # the sampler thread doesn't share sampleData with the main thread
+		self._lock = threading.Lock() # serializes iV_GetSample between the sampler thread and the main thread, see self._get_sample
+		self.detector = None # online event detector; created in self.calibrate, because it needs the pixel thresholds
 		self.maxtries = 100 # number of samples obtained before giving up (for obtaining accuracy and tracker distance information, as well as starting or stopping recording)
+		self.validation_points = 1 # number of points of the noise calibration (1, 5, 9, or 13; see libquality.validation_grid)
+		self.validation_time = 1000 # time in milliseconds for which every point of the noise calibration is shown
+		self.validation_settle = 200 # time in milliseconds at the start of every point that is ignored, while the eyes move to the point
 
 		# set logger
 		res = iViewXAPI.iV_SetLogger(c_int(1), c_char_p(data_file + '_SMILOG.txt'))
@@ -398,11 +421,20 @@ class libsmi:
 		# # # # #
 		# NOISE CALIBRATION
 
+		# the fixation dots are drawn in advance, so that each appears as soon
+		# as it is needed
+		points = libquality.validation_grid(self.dispsize, self.validation_points)
+		targets = libtarget.get_cache(self.experiment)
+		targets.prepare(points, style=u'fixdot', fgcolor=self.fgc, bgcolor=self.bgc)
+
 		# present instructions
 		yc = self.cv.ycenter()
 		ld = 40
 		self.cv.clear()
-		self.cv.text("Noise calibration: please look at the dot", y = yc - 1 * ld)
+		if len(points) == 1:
+			self.cv.text("Noise calibration: please look at the dot", y = yc - 1 * ld)
+		else:
+			self.cv.text("Noise calibration: please look at the dots", y = yc - 1 * ld)
 		self.cv.text("(press space to start)", y = yc + 1 * ld)
 		self.cv.show()
 
@@ -410,41 +442,41 @@ class libsmi:
 		self.kb.get_key(keylist=None,timeout=1)
 		self.kb.get_key(keylist=['space'], timeout=None)
 
-		# show fixation
-		self.cv.clear()
-		self.cv.fixdot(x=None, y=None, color=self.fgc)
-		self.cv.show()
-
-		# get samples
-		self.start_recording()
-		sl = [self.sample()] # samplelist, prefilled with 1 sample to prevent sl[-1] from producing an error; first sample will be ignored for RMS calculation
-		t0 = self.experiment.time() # starting time
-		while self.experiment.time() - t0 < 1000:
-			s = self.sample() # sample
-			if s != sl[-1] and s != (-1,-1) and s != (0,0):
-				sl.append(s)
-		self.stop_recording()
-
-		# calculate RMS noise
-		Xvar = []
-		Yvar = []
-		for i in range(2,len(sl)):
-			Xvar.append((sl[i][0]-sl[i-1][0])**2)
-			Yvar.append((sl[i][1]-sl[i-1][1])**2)
-		XRMS = (sum(Xvar) / len(Xvar))**0.5
-		YRMS = (sum(Yvar) / len(Yvar))**0.5
+		# get samples at the rate of the tracker, into a preallocated array;
+		# the noise is measured on unfiltered data
+		self.gaze_filter = None
+		started = self._begin()
+		data = []
+		for x, y in points:
+			targets.show(x, y, style=u'fixdot', fgcolor=self.fgc, bgcolor=self.bgc)
+			d = libquality.collect(self.sample, self.validation_time, samplerate=self.samplerate)
+			# ignore the samples during which the eyes move to the point
+			data.append(d[d[:,0] >= d[0,0] + self.validation_settle] if len(d) > 0 else d)
+		self._end(started)
+
+		# calculate RMS noise, standard deviation, and accuracy per point, and
+		# the pooled noise over all points
+		precision = [libquality.precision(d[:,1], d[:,2]) for d in data]
+		accuracy = [libquality.accuracy(pos, d[:,1], d[:,2]) for pos, d in zip(points, data)]
+		pooled = libquality.pool(precision)
+		XRMS, YRMS = pooled['rms_s2s']
+		if math.isnan(XRMS) or math.isnan(YRMS):
+			# without a noise level, the event detection has no threshold for
+			# movements that are larger than noise
+			raise exceptions.runtime_error( \
+				u'Error in libsmi.libsmi.calibrate: no samples were obtained during the noise calibration')
 		self.pxdsttresh = (XRMS, YRMS)
+		self.gaze_filter = libfilter.create(self.filterkind, noise=(XRMS+YRMS)/2.0)
 
-		# calculate pixels per cm
-		pixpercm = (self.dispsize[0]/float(self.screensize[0]) + self.dispsize[1]/float(self.screensize[1])) / 2.0
 		# get accuracy
 		res = 0; i = 0
 		while res != 1 and i < self.maxtries: # multiple tries, in case no (valid) sample is available
 			res = iViewXAPI.iV_GetAccuracy(byref(accuracyData),0) # 0 is for 'no visualization'
 			i += 1
-			self.experiment.sleep(int(self.sampletime)) # wait for sampletime
+			libwait.sleep(self.sampletime) # wait for sampletime
 		if res == 1:
-			self.accuracy = ((accuracyData.deviationLX,accuracyData.deviationLY), (accuracyData.deviationLX,accuracyData.deviationLY)) # dsttresh = (left tuple, right tuple); tuple = (horizontal deviation, vertical deviation) in degrees of visual angle
+			self.accuracy = ((accuracyData.deviationLX,accuracyData.deviationLY), (accuracyData.deviationRX,accuracyData.deviationRY)) # dsttresh = (left tuple, right tuple); tuple = (horizontal deviation, vertical deviation) in degrees of visual angle
+			self.eyes.set_accuracy(sum(self.accuracy[0]), sum(self.accuracy[1])) # the best eye is the one with the smallest deviation
 		else:
 			err = errorstring(res)
 			print("Error in libsmi.libsmi.calibrate: failed to obtain accuracy data; %s" % err)
@@ -453,9 +485,9 @@ class libsmi:
 		# get distance from screen to eyes (information from tracker)
 		res = 0; i = 0
 		while res != 1 and i < self.maxtries: # multiple tries, in case no (valid) sample is available
-			res = iViewXAPI.iV_GetSample(byref(sampleData))
+			res = self._get_sample(sampleData)
 			i += 1
-			self.experiment.sleep(int(self.sampletime)) # wait for sampletime
+			libwait.sleep(self.sampletime) # wait for sampletime
 		if res == 1:
 			screendist = sampleData.leftEye.eyePositionZ / 10.0 # eyePositionZ is in mm; screendist is in cm
 		else:
@@ -463,18 +495,27 @@ class libsmi:
 			print("Error in libsmi.libsmi.calibrate: failed to obtain screen distance; %s" % err)
 			screendist = 57.0
 			print("libsmi.libsmi.calibrate: As an estimate, the screendistance was set to it's default value of 57 cm")
+		# the geometry is built once, with the measured distance, and is then
+		# used for all conversions between degrees and pixels
+		self.geometry = screen_geometry(self.dispsize, self.screensize, screendist)
 		# calculate thresholds based on tracker settings
-		self.pxerrdist = deg2pix(screendist, self.errdist, pixpercm)
-		self.pxfixtresh = self.pxerrdist = deg2pix(screendist, self.fixtresh, pixpercm)
-		self.pxaccuracy = ((deg2pix(screendist, self.accuracy[0][0], pixpercm),deg2pix(screendist, self.accuracy[0][1], pixpercm)), (deg2pix(screendist, self.accuracy[1][0], pixpercm),deg2pix(screendist, self.accuracy[1][1], pixpercm)))
-		self.pxspdtresh = deg2pix(screendist, self.spdtresh/float(self.samplerate), pixpercm) # in pixels per sample
-		self.pxacctresh = deg2pix(screendist, self.accthresh/float(self.samplerate**2), pixpercm) # in pixels per sample**2
+		self.pxerrdist = self.geometry.deg2pix(self.errdist)
+		self.pxfixtresh = self.pxerrdist = self.geometry.deg2pix(self.fixtresh)
+		self.pxaccuracy = tuple([tuple(eye) for eye in self.geometry.deg2pix(self.accuracy).tolist()]) # all four values in one go
+		self.pxspdtresh = self.geometry.deg2pix(self.spdtresh/float(self.samplerate)) # in pixels per sample
+		self.pxacctresh = self.geometry.deg2pix(self.accthresh/float(self.samplerate**2)) # in pixels per sample**2
+		self.detector = libonline.online_detector(self.pxfixtresh, self.pxspdtresh, acc_thresh=self.pxacctresh, noise=self.pxdsttresh, weightdist=self.weightdist)
 
 		# calibration report
 		self.log("pygaze calibration report start")
 		self.log("accuracy (degrees): LX=%s, LY=%s, RX=%s, RY=%s" % (self.accuracy[0][0],self.accuracy[0][1],self.accuracy[1][0],self.accuracy[1][1]))
 		self.log("accuracy (in pixels): LX=%s, LY=%s, RX=%s, RY=%s" % (self.pxaccuracy[0][0],self.pxaccuracy[0][1],self.pxaccuracy[1][0],self.pxaccuracy[1][1]))
 		self.log("precision (RMS noise in pixels): X=%s, Y=%s" % (self.pxdsttresh[0],self.pxdsttresh[1]))
+		self.log("precision (standard error of RMS noise in pixels): X=%s, Y=%s" % pooled['rms_s2s_se'])
+		self.log("precision (STD in pixels): X=%s, Y=%s; standard error: X=%s, Y=%s" % (pooled['std'] + pooled['std_se']))
+		self.log("data loss during noise calibration: %s" % pooled['lost'])
+		for i, (pos, p, a) in enumerate(zip(points, precision, accuracy)):
+			self.log("validation point %d at (%d, %d): error=%.2f pixels (95%% CI +/- %.2f), offset X=%.2f, Y=%.2f, RMS noise X=%.2f, Y=%.2f, STD X=%.2f, Y=%.2f, samples=%d, lost=%.3f" % ((i, pos[0], pos[1], a['error'], a['error_ci']) + a['offset'] + p['rms_s2s'] + p['std'] + (p['samples'], p['lost'])))
 		self.log("distance between participant and display: %s cm" % screendist)
 		self.log("fixation threshold: %s pixels" % self.pxfixtresh)
 		self.log("speed threshold: %s pixels/sample" % self.pxspdtresh)
@@ -509,8 +550,10 @@ class libsmi:
 		Nothing	-- saves data and sets self.connected to False
 		"""
 		
+		self.stop_sampler()
+		self._report_transitions()
 		if self.recording:
-			self.stop_recording()
+			self._stop()
 
 		# save data
 		res = iViewXAPI.iV_SaveData(str(self.outputfile), str(self.description), str(self.participant), 1)
@@ -572,7 +615,7 @@ class libsmi:
 			return self.manual_drift_correction(pos)
 
 
-	def fix_triggered_drift_correction(self, pos=None, min_samples=10, max_dev=60, reset_threshold=30):
+	def fix_triggered_drift_correction(self, pos=None, min_samples=10, max_dev=60, reset_threshold=30, max_dispersion=None):
 
 		"""Performs a fixation triggered drift correction by collecting
 		a number of samples and calculating the average distance from the
@@ -592,6 +635,9 @@ class libsmi:
 					   pixels between two consecutive samples is
 					   larger than this threshold, the sample
 					   collection is reset (default = 30)
+		max_dispersion	-- maximal dispersion (root mean square distance
+					   to the mean) of the samples in pixels, or None
+					   for no limit (default = None)
 		
 		returns
 		checked		-- Boolaan indicating if drift check is ok (True)
@@ -602,46 +648,25 @@ class libsmi:
 		if pos == None:
 			pos = self.dispsize[0] / 2, self.dispsize[1] / 2
 
-		# start recording
-		self.start_recording()
-
-		# loop until we have sufficient samples
-		lx = []
-		ly = []
-		while len(lx) < min_samples:
-
-			# pressing escape enters the calibration screen
-			if self.kb.get_key()[0] in ['escape','q']:
-				print("libsmi.libsmi.fix_triggered_drift_correction: 'q' or 'escape' pressed")
-				return self.calibrate(calibrate=True, validate=True)
-
-			# collect a sample
-			x, y = self.sample()
+		# start recording, unless the tracker is recording already
+		started = self._begin()
 
-			if len(lx) == 0 or x != lx[-1] or y != ly[-1]:
-
-				# if present sample deviates too much from previous sample, reset counting
-				if len(lx) > 0 and (abs(x - lx[-1]) > reset_threshold or abs(y - ly[-1]) > reset_threshold):
-					lx = []
-					ly = []
-
-				# collect samples
-				else:
-					lx.append(x)
-					ly.append(y)
-
-			if len(lx) == min_samples:
+		# wait until gaze rests on the fixation position; the keyboard is
+		# checked without waiting, at the display rate
+		kb = keyboard(self.experiment, keylist=['escape','q'], timeout=0)
+		try:
+			mean, key = libdrift.wait_for_fixation(self, pos, min_samples=min_samples, max_dev=max_dev, reset_threshold=reset_threshold, max_dispersion=max_dispersion, keyboard=kb, samplerate=self.samplerate)
+		except response_error:
+			key = 'escape'
 
-				avg_x = sum(lx) / len(lx)
-				avg_y = sum(ly) / len(ly)
-				d = ((avg_x - pos[0]) ** 2 + (avg_y - pos[1]) ** 2)**0.5
+		# pressing escape enters the calibration screen
+		if key != None:
+			print("libsmi.libsmi.fix_triggered_drift_correction: 'q' or 'escape' pressed")
+			self._end(started)
+			return self.calibrate(calibrate=True, validate=True)
 
-				if d < max_dev:
-					self.stop_recording()
-					return True
-				else:
-					lx = []
-					ly = []
+		self._end(started)
+		return True
 
 
 	def get_eyelink_clock_async(self):
@@ -717,8 +742,8 @@ class libsmi:
 		if pos == None:
 			pos = self.dispsize[0] / 2, self.dispsize[1] / 2
 
-		# start recording
-		self.start_recording()
+		# start recording, unless the tracker is recording already
+		started = self._begin()
 
 		# drift check
 		checked = False
@@ -727,16 +752,16 @@ class libsmi:
 			if pressed:
 				if pressed == 'escape' or pressed == 'q':
 					print("libsmi.libsmi.drift_correction: 'q' or 'escape' pressed")
-					self.stop_recording()
+					self._end(started)
 					return self.calibrate()
 				gazepos = self.sample()
 				if ((gazepos[0]-pos[0])**2  + (gazepos[1]-pos[1])**2)**0.5 < self.pxerrdist:
 					checked = True
-					self.stop_recording()
+					self._end(started)
 					return True
 				else:
 					self.errorbeep.play()
-		self.stop_recording()
+		self._end(started)
 		return False
 
 
@@ -753,11 +778,14 @@ class libsmi:
 
 		pass
 
-	def pupil_size(self):
+	def pupil_size(self, eye=None):
 
 		"""<DOC>
 		Gets the most recent pupil size.
 
+		Keyword arguments:
+		eye	--	The eye, see sample(). (default=None)
+
 		Returns:
 		A float corresponding to the pupil size (in arbitrary units). The #
 		value -1 indicates missing data.
@@ -771,9 +799,19 @@ class libsmi:
 			raise exceptions.runtime_error( \
 				u'Please start recording before collecting eyetracker data')
 
-		res = iViewXAPI.iV_GetSample(byref(sampleData))
+		if self.sampler != None: # the sampler thread receives the new samples
+			if eye != None:
+				return self.eyes.pupil_size(eye)
+			if self.sampler.latest == None:
+				return -1
+			return float(self.sampler.latest[3])
+
+		res = self._get_sample(sampleData)
 
 		if res == 1:
+			if eye != None:
+				self._write_eyes(sampleData)
+				return self.eyes.pupil_size(eye)
 			if self.eye_used == self.left_eye or self.eye_used == self.binocular:
 				return float(sampleData.leftEye.diam)
 			elif self.eye_used == self.right_eye:
@@ -782,11 +820,19 @@ class libsmi:
 			return -1
 
 
-	def sample(self):
+	def sample(self, eye=None):
 		
 		"""<DOC>
 		Gets the most recent gaze sample.
 
+		Keyword arguments:
+		eye	--	u'left', u'right', u'average' (the cyclopean gaze position, #
+				or the one eye that is available), u'best' (the eye with #
+				the smallest validation error, or the one eye that is #
+				available), or None for the eye that is being recorded, #
+				which is the left eye for binocular recordings. See #
+				libbinocular. (default=None)
+
 		Returns:
 		A tuple (x, y) containing the coordinates of the sample. The value #
 		(-1, -1) indicates missing data.
@@ -799,22 +845,162 @@ class libsmi:
 			raise exceptions.runtime_error( \
 				u'Please start recording before collecting eyetracker data')
 
-		res = iViewXAPI.iV_GetSample(byref(sampleData))
+		if self.sampler != None:
+			# the sampler thread receives the new samples (iV_GetSample
+			# returns every sample only once), so take the newest one from it
+			s = self.sampler.latest
+			if s == None:
+				return (-1,-1)
+			if eye != None:
+				self.prevsample = self.eyes.sample(eye)
+			else:
+				self.prevsample = s[1], s[2]
+			t = s[0]
+		else:
+			res = self._get_sample(sampleData)
 
+			if eye != None:
+				if res == 1:
+					self._write_eyes(sampleData)
+				newsample = self.eyes.sample(eye)
+			elif self.eye_used == self.right_eye:
+				newsample = sampleData.rightEye.gazeX, sampleData.rightEye.gazeY
+			else:
+				newsample = sampleData.leftEye.gazeX, sampleData.leftEye.gazeY
+
+			if res == 1:
+				self.prevsample = newsample[:]
+			elif res != 2: # res == 2 means no new data
+				self.health.errors += 1
+#				err = errorstring(res)
+#				print("Error in libsmi.libsmi.sample: failed to obtain sample; %s" % err)
+				return (-1,-1)
+			t = sampleData.timestamp/1000.0 # timestamp is in microseconds
+
+		if self.gaze_filter != None: # the filter ignores samples that it has already seen
+			return self.gaze_filter.update(t, self.prevsample)
+		return self.prevsample
+
+	def set_gaze_filter(self, kind, **params):
+
+		"""Sets the online gaze filter that is applied by sample()
+		
+		arguments
+		kind		-- u'none', u'moving average', u'heuristic' or
+				   u'one-euro'
+		
+		keyword arguments
+		params		-- parameters for the filter (see libfilter); by
+				   default, these are based on the RMS noise if the
+				   tracker has been calibrated
+		
+		returns
+		None
+		"""
+
+		self.filterkind = kind
+		if hasattr(self, 'pxdsttresh') and len(params) == 0:
+			params['noise'] = (self.pxdsttresh[0]+self.pxdsttresh[1])/2.0
+		self.gaze_filter = libfilter.create(kind, **params)
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		"""Starts a thread that collects all samples in a ring buffer; if a
+		name is given, the ring is placed in shared memory, so that other
+		processes can read the samples with libshm.gaze_reader; if the
+		thread is already running, it is kept, so that its readers stay
+		valid
+		
+		keyword arguments
+		shm_name	-- name of the shared-memory segment, or None
+				   (default = None)
+		capacity	-- number of samples in the ring (default = 4096)
+		
+		returns
+		sampler	-- a libsampler.sampler
+		"""
+
+		if self.sampler != None:
+			return self.sampler
+		self.sampler = libsampler.start(self._poll, shm_name=shm_name, capacity=capacity, samplerate=self.samplerate)
+		return self.sampler
+
+	def stop_sampler(self):
+
+		"""Stops the sampler thread, if it is running
+		
+		arguments
+		None
+		
+		returns
+		None
+		"""
+
+		if self.sampler != None:
+			self.sampler.stop()
+			self.sampler = None
+
+	def _poll(self):
+
+		"""Gets the newest sample for the sampler thread (for internal use)
+		
+		arguments
+		None
+		
+		returns
+		sample	-- a (time, x, y, pupil) tuple, with time in milliseconds,
+			   or None if no new sample is available
+		"""
+
+		res = self._get_sample(self._pollsample)
+		if res != 1:
+			if res != 2: # res == 2 means no new data
+				self.health.errors += 1
+			return None
+		self._write_eyes(self._pollsample)
 		if self.eye_used == self.right_eye:
-			newsample = sampleData.rightEye.gazeX, sampleData.rightEye.gazeY
+			eye = self._pollsample.rightEye
 		else:
-			newsample = sampleData.leftEye.gazeX, sampleData.leftEye.gazeY
+			eye = self._pollsample.leftEye
+		return self._pollsample.timestamp/1000.0, eye.gazeX, eye.gazeY, eye.diam
 
-		if res == 1:
-			self.prevsample = newsample[:]
-			return newsample
-		elif res == 2: # no new data
-			return self.prevsample
-		else:
-#			err = errorstring(res)
-#			print("Error in libsmi.libsmi.sample: failed to obtain sample; %s" % err)
-			return (-1,-1)
+	def _get_sample(self, s):
+
+		"""Gets the newest sample (for internal use); the calls of the
+		sampler thread and of the main thread are serialized, because
+		iV_GetSample returns every sample only once: while the sampler runs,
+		the main thread gets a copy of the last sample of the sampler
+		
+		arguments
+		s		-- a CSample, which receives the sample
+		
+		returns
+		res		-- the result of iV_GetSample: 1 for a new sample, 2 if
+				   there is no new data, or an error code
+		"""
+
+		with self._lock:
+			if self.sampler == None or threading.current_thread() is self.sampler:
+				return iViewXAPI.iV_GetSample(byref(s))
+			if self._pollsample.timestamp == 0: # the sampler has no sample yet
+				return 2
+			ctypes.memmove(byref(s), byref(self._pollsample), ctypes.sizeof(CSample))
+			return 1
+
+	def _write_eyes(self, s):
+
+		"""Writes both eyes of a sample into the eye buffer (for internal use)
+		
+		arguments
+		s		-- a CSample; an eye without a pupil is missing
+		"""
+
+		left = right = None
+		if s.leftEye.diam > 0:
+			left = s.leftEye.gazeX, s.leftEye.gazeY, s.leftEye.diam
+		if s.rightEye.diam > 0:
+			right = s.rightEye.gazeX, s.rightEye.gazeY, s.rightEye.diam
+		self.eyes.write(s.timestamp/1000.0, left, right)
 
 
 	def send_command(self, cmd):
@@ -864,7 +1050,9 @@ class libsmi:
 
 	def start_recording(self):
 
-		"""Starts recording eye position
+		"""Starts recording eye position; with continuous recording, the
+		tracker keeps recording after the first call, and further calls only
+		write a 'start_recording' message to the log file
 		
 		arguments
 		None
@@ -874,6 +1062,24 @@ class libsmi:
 				   successfully started
 		"""
 
+		if self.continuous and self.recording:
+			self.avoided += 1
+			self.log("start_recording")
+			return
+		self._start()
+
+
+	def _start(self):
+
+		"""Starts recording eye position, and keeps track of the time that
+		this takes; for internal use
+		
+		returns
+		Nothing	-- sets self.recording to True when recording is
+				   successfully started
+		"""
+
+		t0 = libwait.clock()
 		res = 0; i = 0
 		while res != 1 and i < self.maxtries:
 			res = iViewXAPI.iV_StartRecording()
@@ -881,6 +1087,10 @@ class libsmi:
 		
 		if res == 1:
 			self.recording = True
+			if self.sampler != None: # the newest sample of the previous recording is stale
+				self.sampler.latest = None
+			self.transitions += 1
+			self.transitiontime += (libwait.clock() - t0) * 1000
 		else:
 			self.recording = False
 			err = errorstring(res)
@@ -897,7 +1107,9 @@ class libsmi:
 
 	def stop_recording(self):
 
-		"""Stop recording eye position
+		"""Stop recording eye position; with continuous recording, the
+		tracker keeps recording, and this only writes a 'stop_recording'
+		message to the log file
 		
 		arguments
 		None
@@ -907,6 +1119,24 @@ class libsmi:
 				   successfully started
 		"""
 
+		if self.continuous and self.recording:
+			self.avoided += 1
+			self.log("stop_recording")
+			return
+		self._stop()
+
+
+	def _stop(self):
+
+		"""Stops recording eye position, and keeps track of the time that
+		this takes; for internal use
+		
+		returns
+		Nothing	-- sets self.recording to False when recording is
+				   successfully stopped
+		"""
+
+		t0 = libwait.clock()
 		res = 0; i = 0
 		while res != 1 and i < self.maxtries:
 			res = iViewXAPI.iV_StopRecording()
@@ -914,12 +1144,63 @@ class libsmi:
 		
 		if res == 1:
 			self.recording = False
+			self.transitions += 1
+			self.transitiontime += (libwait.clock() - t0) * 1000
 		else:
 			err = errorstring(res)
 			raise exceptions.runtime_error( \
 				u'Error in libsmi.libsmi.stop_recording: %s' %err)
 
 
+	def _begin(self):
+
+		"""Makes sure that the tracker is recording, e.g. for a drift check;
+		for internal use
+		
+		returns
+		started	-- True if recording was started, False if the tracker
+				   was recording already
+		"""
+
+		if self.recording:
+			if self.continuous:
+				self.avoided += 1
+			return False
+		self._start()
+		return True
+
+
+	def _end(self, started):
+
+		"""Undoes _begin(): stops recording if _begin() started it, unless
+		recording is continuous; for internal use
+		
+		arguments
+		started	-- the return value of _begin()
+		"""
+
+		if self.continuous:
+			self.avoided += 1
+		elif started:
+			self._stop()
+
+
+	def _report_transitions(self):
+
+		"""Writes the number and the duration of the recording transitions
+		to the log file, and the time that continuous recording saved, as
+		estimated from the transitions that did take place; for internal use
+		"""
+
+		if self.transitions == 0:
+			msg = "recording transitions: 0; avoided by continuous recording: %d" % self.avoided
+		else:
+			mean = self.transitiontime / self.transitions
+			msg = "recording transitions: %d, %.2f ms on average; avoided by continuous recording: %d, saving about %.0f ms" % (self.transitions, mean, self.avoided, self.avoided * mean)
+		print("libsmi.libsmi.close: %s" % msg)
+		self.log(msg)
+
+
 	def wait_for_blink_end(self):
 
 		"""Not supported for libsmi (yet)"""
@@ -938,6 +1219,31 @@ class libsmi:
 		return self.experiment.time()
 
 
+	def wait_for_aoi(self, index, fixation=False, leave=False, timeout=None):
+
+		"""Waits until gaze enters or leaves an area of interest
+		
+		arguments
+		index		-- a libaoi.aoi_index
+		
+		keyword arguments
+		fixation	-- Boolean indicating if fixation starts (True) or
+					   samples (False) should be used (default = False)
+		leave		-- Boolean indicating if the function should wait
+					   until gaze leaves (True) or enters (False) an AOI
+					   (default = False)
+		timeout		-- a timeout in milliseconds, or None for no timeout
+					   (default = None)
+		
+		returns
+		time, aoi	-- time is the time in milliseconds (from expstart),
+					   aoi is the libaoi.aoi that was entered or left, or
+					   None on a timeout
+		"""
+
+		return libaoi.wait_for_aoi(self, index, fixation, leave, timeout)
+
+
 	def wait_for_event(self, event):
 
 		"""Waits for event
@@ -973,6 +1279,41 @@ class libsmi:
 		return outcome
 
 
+	def wait_for_events(self, events, timeout=None):
+
+		"""Waits until one of several events occurs; all events are
+		detected in a single pass over the samples, by the same online
+		detection algorithms as the self.wait_for_* methods
+		
+		arguments
+		events		-- a list of integer event codes (see
+					   self.wait_for_event)
+		
+		keyword arguments
+		timeout		-- timeout in milliseconds, or None for no timeout
+					   (default = None)
+		
+		returns
+		event, time, startpos, endpos	-- event is the event code, or
+								   None on a timeout; time is the time
+								   in milliseconds (from expstart);
+								   startpos and endpos are (x,y) gaze
+								   position tuples, or None when not
+								   available for the event
+		
+		exceptions
+		Raises an exceptions.runtime_error if the system has not been
+		validated, because the detection thresholds are derived during
+		validation.
+		"""
+
+		if self.detector == None:
+			raise exceptions.runtime_error( \
+				u'Error in libsmi.libsmi.wait_for_events: please calibrate and validate before waiting for events')
+
+		return libonline.wait_for_events(self, self.detector, events, timeout, samplerate=self.samplerate)
+
+
 	def wait_for_fixation_end(self):
 
 		"""Returns time and gaze position when a fixation is ended;
@@ -996,8 +1337,9 @@ class libsmi:
 
 		stime, spos = self.wait_for_fixation_start()
 		
+		pace = libwait.pacer(self.samplerate)
 		while True:
-			npos = self.sample() # get newest sample
+			npos = pace.poll(self.sample) # get newest sample
 			if npos != (0,0):
 				if ((spos[0]-npos[0])**2  + (spos[1]-npos[1])**2)**0.5 > self.pxfixtresh: # Pythagoras
 					break
@@ -1031,8 +1373,9 @@ class libsmi:
 		xl = [] # list for last five samples (x coordinate)
 		yl = [] # list for last five samples (y coordinate)
 		moving = True
+		pace = libwait.pacer(self.samplerate)
 		while moving:
-			npos = self.sample()
+			npos = pace.poll(self.sample)
 			if npos != (0,0):
 				xl.append(npos[0]) # add newest sample
 				yl.append(npos[1]) # add newest sample
@@ -1072,9 +1415,10 @@ class libsmi:
 
 		# get samples
 		saccadic = True
+		pace = libwait.pacer(self.samplerate)
 		while saccadic:
 			# get new sample
-			newpos = self.sample()
+			newpos = pace.poll(self.sample)
 			if sum(newpos) > 0 and newpos != prevpos:
 				# calculate distance
 				s1 = ((newpos[0]-prevpos[0])**2 + (newpos[1]-prevpos[1])**2)**0.5 # = speed in pixels/sample
@@ -1106,9 +1450,10 @@ class libsmi:
 		"""
 
 		# get starting position (no blinks)
-		newpos = self.sample()
+		pace = libwait.pacer(self.samplerate)
+		newpos = pace.poll(self.sample)
 		while sum(newpos) == 0:
-			newpos = self.sample()
+			newpos = pace.poll(self.sample)
 		prevpos = newpos[:]
 		s0 = 0
 
@@ -1116,11 +1461,11 @@ class libsmi:
 		saccadic = False
 		while not saccadic:
 			# get new sample
-			newpos = self.sample()
+			newpos = pace.poll(self.sample)
 			if sum(newpos) > 0 and newpos != prevpos:
 				# check if distance is larger than accuracy error
 				sx = newpos[0]-prevpos[0]; sy = newpos[1]-prevpos[1]
-				if (sx/self.pxdsttresh[0])**2 + (sy/self.pxdsttresh[1])**2 > self.weightdist: # weigthed distance: (sx/tx)**2 + (sy/ty)**2 > 1 means movement larger than RMS noise
+				if min(self.pxdsttresh) <= 0 or (sx/self.pxdsttresh[0])**2 + (sy/self.pxdsttresh[1])**2 > self.weightdist: # weigthed distance: (sx/tx)**2 + (sy/ty)**2 > 1 means movement larger than RMS noise
 					# calculate distance
 					s1 = ((sx)**2 + (sy)**2)**0.5 # intersampledistance = speed in pixels/sample
 					# calculate acceleration
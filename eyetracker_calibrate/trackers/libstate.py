@@ -0,0 +1,437 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# The current state of the eyes, such as the position of the current
+# fixation, the amplitude of the last saccade, and whether the participant is
+# blinking, for use in conditions and run-if statements. A gaze_state thread
+# reads the ring of the sampler thread, like libquality.quality_monitor, and
+# feeds every sample into a libonline.online_detector.
+#
+# After every batch of samples, the thread publishes a new snapshot: a dict
+# with the fields in FIELDS, which is replaced as a whole and never changed
+# afterwards. Reading the snapshot therefore needs no lock, and doesn't touch
+# the link with the tracker, so that eyetracker_sample can copy fields to
+# experiment variables in every trial, at a negligible cost.
+#
+# Positions are in pixels, durations in milliseconds, and times are the
+# timestamps of the tracker. The fields of a fixation describe the current
+# fixation, or the last one during a saccade or blink. The fields of a saccade
+# describe the last completed saccade. Fields that are not known yet are None.
+#
+# Between start_trial() and stop_trial(), which eyetracker_start_recording and
+# eyetracker_stop_recording call if the trial summary is enabled, the events
+# are also added to a trial_summary: counts, running means, and the dwell time
+# in every AOI, which are updated with every event. A summary therefore costs
+# nothing at the end of a trial, and is available to the next trial.
+
+import threading
+
+import numpy
+
+import libonline
+import libsampler
+import libshm
+
+FIELDS = (
+	u'time',				# the timestamp of the newest sample
+	u'x',					# the gaze position of the newest sample
+	u'y',
+	u'pupil',				# the pupil size of the newest sample
+	u'state',				# fixation, saccade, blink, or unknown
+	u'blinking',			# yes or no
+	u'fixation_x',			# the mean position of the current fixation
+	u'fixation_y',
+	u'fixation_start',		# the start time of the current fixation
+	u'fixation_duration',	# the duration of the current fixation so far
+	u'saccade_start_x',		# the start position of the last saccade
+	u'saccade_start_y',
+	u'saccade_end_x',		# the end position of the last saccade
+	u'saccade_end_y',
+	u'saccade_amplitude',	# the amplitude of the last saccade in degrees
+	u'saccade_duration',	# the duration of the last saccade
+	u'saccade_end',			# the end time of the last saccade
+	u'fixations',			# the number of fixations, saccades, and blinks
+	u'saccades',			# since the state was started
+	u'blinks',
+	)
+
+SUMMARY = u'fixations', u'fixation_mean', u'saccades', \
+	u'saccade_amplitude_mean', u'saccade_duration_mean', u'blinks', \
+	u'blink_duration'
+
+_STATES = {
+	libonline.STARTFIX : u'fixation',
+	libonline.STARTSACC : u'saccade',
+	libonline.STARTBLINK : u'blink',
+	libonline.ENDFIX : u'unknown',
+	libonline.ENDSACC : u'unknown',
+	libonline.ENDBLINK : u'unknown',
+	}
+
+class trial_summary:
+
+	"""Accumulates the events of a trial."""
+
+	def __init__(self, start, aois=None):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		start	--	The start time of the trial, as a timestamp of the tracker.
+
+		Keyword arguments:
+		aois	--	A libaoi.aoi_index, or None. (default=None)
+		</DOC>"""
+
+		self.start = start
+		self.aois = aois
+		self.counts = dict((key, 0) for key in SUMMARY)
+		# The dwell time in every AOI, which is the total duration of the
+		# fixations in it
+		self.dwell = [] if aois == None else [[a.name, 0.] for a in aois.aois]
+		self._index = dict((name, i) for i, (name, dwell) in \
+			enumerate(self.dwell))
+
+	def _mean(self, key, count, value):
+
+		n = self.counts[count]
+		self.counts[key] += (value - self.counts[key]) / float(n)
+
+	def fixation(self, start, end, x, y):
+
+		"""<DOC>
+		Adds a fixation. The part before the start of the trial is ignored.
+
+		Arguments:
+		start	--	The start time.
+		end		--	The end time.
+		x		--	The horizontal mean position.
+		y		--	The vertical mean position.
+		</DOC>"""
+
+		duration = end - max(start, self.start)
+		if duration <= 0:
+			return
+		self.counts[u'fixations'] += 1
+		self._mean(u'fixation_mean', u'fixations', duration)
+		if self.aois != None:
+			a = self.aois.hit(x, y)
+			if a != None:
+				self.dwell[self._index[a.name]][1] += duration
+
+	def saccade(self, start, end, amplitude):
+
+		"""<DOC>
+		Adds a saccade.
+
+		Arguments:
+		start		--	The start time.
+		end			--	The end time.
+		amplitude	--	The amplitude in degrees.
+		</DOC>"""
+
+		self.counts[u'saccades'] += 1
+		self._mean(u'saccade_amplitude_mean', u'saccades', amplitude)
+		self._mean(u'saccade_duration_mean', u'saccades', end - start)
+
+	def blink(self, start, end):
+
+		"""<DOC>
+		Adds a blink, or the part of a blink so far.
+
+		Arguments:
+		start	--	The start time.
+		end		--	The end time, or the time of the newest sample.
+		</DOC>"""
+
+		self.counts[u'blinks'] += 1
+		self.counts[u'blink_duration'] += end - max(start, self.start)
+
+	def summary(self):
+
+		"""<DOC>
+		Gets the summary.
+
+		Returns:
+		A dict with the keys in SUMMARY, with the means None if there #
+		were no fixations or saccades, and dwell: a list of (name, dwell #
+		time) tuples, in the order of the AOIs.
+		</DOC>"""
+
+		s = dict(self.counts)
+		if s[u'fixations'] == 0:
+			s[u'fixation_mean'] = None
+		if s[u'saccades'] == 0:
+			s[u'saccade_amplitude_mean'] = None
+			s[u'saccade_duration_mean'] = None
+		s[u'dwell'] = [tuple(d) for d in self.dwell]
+		return s
+
+class gaze_state(threading.Thread):
+
+	"""A thread that keeps a snapshot of the state of the eyes."""
+
+	def __init__(self, reader, geometry, velocity_threshold=35, interval=10):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		reader				--	A libshm.gaze_reader.
+		geometry			--	A libgeometry.screen_geometry, to convert #
+								between pixels and degrees.
+
+		Keyword arguments:
+		velocity_threshold	--	The saccade velocity threshold in degrees #
+								per second. (default=35)
+		interval			--	The interval in milliseconds at which the #
+								ring is read, and the snapshot is updated. #
+								(default=10)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'eyetracker gaze state')
+		self.daemon = True
+		self.reader = reader
+		self.geometry = geometry
+		self.interval = interval / 1000.
+		self.detector = libonline.create(geometry, reader.samplerate, \
+			velocity_threshold=velocity_threshold)
+		self._state = dict((key, None) for key in FIELDS)
+		self._state.update(state=u'unknown', blinking=u'no', fixations=0, \
+			saccades=0, blinks=0)
+		# The number of samples in the current fixation and the sums of their
+		# positions, or None if there is no fixation
+		self._fix = None
+		self._sacc_start = None
+		self._blink_start = None
+		# The trial_summary of the current trial, or None
+		self.trial = None
+		self.snapshot = dict(self._state)
+		self._count = reader.count
+		self._out = numpy.empty(reader.capacity, dtype=libshm.sample_dtype)
+		self._lock = threading.Lock()
+		self._halt = threading.Event()
+
+	def run(self):
+
+		while not self._halt.wait(self.interval):
+			self.pump()
+
+	def _event(self, event, t, startpos, endpos):
+
+		"""
+		Updates the state with an event of the detector.
+		"""
+
+		s = self._state
+		s[u'state'] = _STATES[event]
+		s[u'blinking'] = u'yes' if event == libonline.STARTBLINK else u'no'
+		if event == libonline.STARTFIX:
+			s[u'fixations'] += 1
+			s[u'fixation_start'] = t
+			self._fix = [0, 0., 0.]
+			return
+		if event == libonline.ENDFIX and self._fix != None and \
+			self._fix[0] > 0:
+			# The fixation may have started and ended within one batch
+			self._fixation(t)
+			if self.trial != None:
+				self.trial.fixation(s[u'fixation_start'], t, \
+					s[u'fixation_x'], s[u'fixation_y'])
+		# The fixation fields keep describing the last fixation
+		self._fix = None
+		if event == libonline.STARTSACC:
+			self._sacc_start = t
+		elif event == libonline.ENDSACC and self._sacc_start != None:
+			s[u'saccades'] += 1
+			s[u'saccade_start_x'], s[u'saccade_start_y'] = startpos
+			s[u'saccade_end_x'], s[u'saccade_end_y'] = endpos
+			s[u'saccade_amplitude'] = float(self.geometry.angle(startpos[0], \
+				startpos[1], endpos[0], endpos[1]))
+			s[u'saccade_duration'] = t - self._sacc_start
+			s[u'saccade_end'] = t
+			if self.trial != None and self._sacc_start >= self.trial.start:
+				self.trial.saccade(self._sacc_start, t, \
+					s[u'saccade_amplitude'])
+		elif event == libonline.STARTBLINK:
+			s[u'blinks'] += 1
+			self._blink_start = t
+		elif event == libonline.ENDBLINK and self._blink_start != None:
+			if self.trial != None and t > self.trial.start:
+				self.trial.blink(self._blink_start, t)
+			self._blink_start = None
+
+	def pump(self):
+
+		"""<DOC>
+		Feeds the samples that have arrived in the ring into the detector, #
+		and publishes a new snapshot.
+		</DOC>"""
+
+		with self._lock:
+			self._pump()
+
+	def _pump(self):
+
+		samples, self._count = self.reader.since(self._count, out=self._out)
+		if len(samples) == 0:
+			return
+		s = self._state
+		detector = self.detector
+		for t, x, y, pupil in zip(samples[u'time'].tolist(), \
+			samples[u'x'].tolist(), samples[u'y'].tolist(), \
+			samples[u'pupil'].tolist()):
+			pos = None if x != x or y != y else (x, y)
+			for event in detector.update(t, pos):
+				self._event(*event)
+			if self._fix != None and pos != None:
+				fix = self._fix
+				fix[0] += 1
+				fix[1] += x
+				fix[2] += y
+		s[u'time'] = t
+		s[u'x'] = x
+		s[u'y'] = y
+		s[u'pupil'] = pupil
+		if self._fix != None and self._fix[0] > 0:
+			self._fixation(t)
+		# Replace the snapshot as a whole, so that readers never see a
+		# partial update
+		self.snapshot = dict(s)
+
+	def _fixation(self, t):
+
+		"""
+		Updates the fields of the current fixation, up to a time.
+		"""
+
+		s = self._state
+		s[u'fixation_x'] = self._fix[1] / self._fix[0]
+		s[u'fixation_y'] = self._fix[2] / self._fix[0]
+		s[u'fixation_duration'] = t - s[u'fixation_start']
+
+	def get(self, field):
+
+		"""<DOC>
+		Gets a field of the current snapshot.
+
+		Arguments:
+		field	--	One of FIELDS.
+
+		Returns:
+		The value of the field, or None if it is not known yet.
+		</DOC>"""
+
+		return self.snapshot[field]
+
+	def start_trial(self, aois=None):
+
+		"""<DOC>
+		Starts summarizing a trial. Events before this are ignored.
+
+		Keyword arguments:
+		aois	--	A libaoi.aoi_index with the AOIs for the dwell times, or #
+					None. (default=None)
+		</DOC>"""
+
+		with self._lock:
+			self._pump()
+			start = self._state[u'time']
+			self.trial = trial_summary(-float(u'inf') if start == None else \
+				start, aois=aois)
+
+	def stop_trial(self):
+
+		"""<DOC>
+		Ends the trial, and gets its summary. A fixation or blink that is #
+		still going on counts up to the newest sample.
+
+		Returns:
+		A dict as returned by trial_summary.summary(), or None if no trial #
+		was started.
+		</DOC>"""
+
+		with self._lock:
+			self._pump()
+			trial = self.trial
+			self.trial = None
+			if trial == None:
+				return None
+			s = self._state
+			if self._fix != None and self._fix[0] > 0:
+				trial.fixation(s[u'fixation_start'], s[u'time'], \
+					self._fix[1] / self._fix[0], self._fix[2] / self._fix[0])
+			elif s[u'state'] == u'blink' and self._blink_start != None:
+				trial.blink(self._blink_start, s[u'time'])
+			return trial.summary()
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the thread and releases the reader.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive():
+			self.join(1)
+		self.reader.close()
+
+def start(tracker, velocity_threshold=35):
+
+	"""<DOC>
+	Starts keeping the state of the eyes for a tracker. The sampler thread #
+	of the tracker is started if it isn't running yet.
+
+	Arguments:
+	tracker				--	A tracker object.
+
+	Keyword arguments:
+	velocity_threshold	--	See gaze_state. (default=35)
+
+	Returns:
+	A running gaze_state, or None if the tracker has no samples.
+	</DOC>"""
+
+	reader = libsampler.reader(tracker)
+	if reader == None:
+		return None
+	state = gaze_state(reader, tracker.geometry, \
+		velocity_threshold=velocity_threshold)
+	state.start()
+	return state
+
+def get_state(experiment):
+
+	"""<DOC>
+	Gets the gaze state of an experiment, and starts it if necessary. It is #
+	stopped by eyetracker_calibrate at the end of the experiment.
+
+	Arguments:
+	experiment	--	The experiment.
+
+	Returns:
+	A gaze_state, or None if the tracker has no samples.
+	</DOC>"""
+
+	state = getattr(experiment, u'eyetracker_state', None)
+	if state == None:
+		tracker = experiment.eyetracker
+		state = start(tracker, velocity_threshold=getattr(tracker, \
+			u'spdtresh', 35))
+		experiment.eyetracker_state = state
+	return state
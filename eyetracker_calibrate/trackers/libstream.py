@@ -0,0 +1,684 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Streaming of samples and events over TCP and UDP, for consumers that cannot
+# use the shared-memory ring (see libshm), for example because they run in a
+# container or on another computer. The server runs in its own thread. Every
+# few milliseconds, it takes the new samples from the ring of the sampler
+# thread, detects events in them, and sends them to the subscribers in
+# batches.
+#
+# Protocol
+# --------
+#
+# A subscriber sends a subscription as a line of JSON, over a TCP connection
+# or in a UDP datagram to the server:
+#
+#	{"samples": true, "decimate": 4, "events": [5, 6]}
+#
+# All fields are optional. `decimate` sends only every n-th sample, and
+# `events` lists the event codes that the subscriber wants (see libonline); by
+# default, all samples and no events are sent. A TCP subscriber can send a new
+# subscription at any time. A UDP subscription expires after UDP_TIMEOUT
+# seconds, so UDP subscribers should repeat their subscription regularly, and
+# can end it with {"unsubscribe": true}.
+#
+# The server sends packets, which consist of a header and `count` records:
+#
+#	header:	magic 'OSGZ', version (uint8), type (uint8), count (uint16),
+#			sequence number (uint32)
+#	sample:	time (ms), x, y, pupil, all float64
+#	event:	code (uint32), 4 padding bytes, time (ms), start x, start y,
+#			end x, end y, all float64; unknown positions are NaN
+#
+# All values are little endian. Over TCP, packets follow each other directly.
+# Over UDP, every datagram holds a single packet, with at most
+# MAX_UDP_SAMPLES samples. The sequence number increases by one for every
+# packet to a subscriber, so that UDP subscribers can detect lost packets.
+#
+# A reference client is included, and running this file as a script
+# benchmarks the throughput of the server on the loopback interface, using a
+# thread that stands in for the tracker.
+
+import json
+import select
+import socket
+import struct
+import threading
+import time
+
+import numpy
+
+MAGIC = 'OSGZ'
+VERSION = 1
+SAMPLES = 1
+EVENTS = 2
+MAX_UDP_SAMPLES = 40
+UDP_TIMEOUT = 10.
+TCP_BUFFER = 1 << 20
+
+header = struct.Struct('<4sBBHI')
+sample_record = struct.Struct('<dddd')
+event_record = struct.Struct('<I4xddddd')
+sample_dtype = numpy.dtype([('time', '<f8'), ('x', '<f8'), ('y', '<f8'), \
+	('pupil', '<f8')])
+event_dtype = numpy.dtype([('event', '<u4'), ('pad', '<u4'), ('time', '<f8'), \
+	('sx', '<f8'), ('sy', '<f8'), ('ex', '<f8'), ('ey', '<f8')])
+
+_nan = float('nan')
+
+class subscriber:
+
+	"""A client of the server, with its subscription."""
+
+	def __init__(self, address, sock=None):
+
+		"""
+		Constructor.
+
+		Arguments:
+		address	--	The address of the client.
+
+		Keyword arguments:
+		sock	--	The TCP socket of the client, or None for a UDP client. #
+					(default=None)
+		"""
+
+		self.address = address
+		self.sock = sock
+		self.samples = True
+		self.decimate = 1
+		self.events = set()
+		self.seq = 0
+		self.phase = 0
+		self.inbuf = ''
+		self.outbuf = ''
+		self.seen = time.time()
+		self.dropped = 0
+
+	def subscribe(self, line):
+
+		"""
+		Applies a subscription.
+
+		Arguments:
+		line	--	A JSON string.
+		"""
+
+		d = json.loads(line)
+		self.samples = bool(d.get(u'samples', True))
+		self.decimate = max(1, int(d.get(u'decimate', 1)))
+		self.events = set(int(e) for e in d.get(u'events', []))
+		self.seen = time.time()
+
+	def packet(self, kind, records, count):
+
+		"""
+		Creates a packet.
+
+		Arguments:
+		kind	--	SAMPLES or EVENTS.
+		records	--	The packed records.
+		count	--	The number of records.
+
+		Returns:
+		A string.
+		"""
+
+		self.seq = (self.seq + 1) & 0xffffffff
+		return header.pack(MAGIC, VERSION, kind, count, self.seq) + records
+
+class server(threading.Thread):
+
+	"""Streams samples and events from a gaze ring over TCP and UDP."""
+
+	def __init__(self, reader, host='127.0.0.1', tcp_port=5600, udp_port=5601, \
+		detector=None, interval=4):
+
+		"""<DOC>
+		Constructor. The server starts listening immediately, but only starts #
+		streaming when the thread is started.
+
+		Arguments:
+		reader		--	A libshm.gaze_reader.
+
+		Keyword arguments:
+		host		--	The interface to listen on. The default only accepts #
+						subscribers on this computer. (default='127.0.0.1')
+		tcp_port	--	The TCP port, or None to disable TCP. (default=5600)
+		udp_port	--	The UDP port, or None to disable UDP. (default=5601)
+		detector	--	A libonline.online_detector that is used to detect #
+						events in the stream, or None to stream only #
+						samples. (default=None)
+		interval	--	The time in milliseconds between batches. #
+						(default=4)
+		</DOC>"""
+
+		threading.Thread.__init__(self, name=u'eyetracker stream server')
+		self.daemon = True
+		self.reader = reader
+		self.detector = detector
+		self.interval = interval
+		self.tcp = None
+		self.udp = None
+		if tcp_port != None:
+			self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.tcp.bind((host, tcp_port))
+			self.tcp.listen(8)
+		if udp_port != None:
+			self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			self.udp.bind((host, udp_port))
+		self.tcp_clients = {}
+		self.udp_clients = {}
+		self.sent = 0
+		self._count = reader.count
+		self._out = numpy.empty(reader.capacity, dtype=sample_dtype)
+		self._halt = threading.Event()
+
+	def run(self):
+
+		interval = self.interval / 1000.
+		next_batch = time.time() + interval
+		while not self._halt.is_set():
+			socks = [s for s in (self.tcp, self.udp) if s != None] + \
+				[c.sock for c in self.tcp_clients.values()]
+			wsocks = [c.sock for c in self.tcp_clients.values() if c.outbuf]
+			timeout = max(0, next_batch - time.time())
+			try:
+				r, w, x = select.select(socks, wsocks, [], timeout)
+			except (select.error, socket.error):
+				# A client socket was closed while we were waiting
+				r, w = [], []
+			for sock in r:
+				self._receive(sock)
+			for sock in w:
+				c = self.tcp_clients.get(sock)
+				if c != None:
+					self._flush(c)
+			if time.time() >= next_batch:
+				next_batch += interval
+				if next_batch < time.time():
+					next_batch = time.time() + interval
+				self.pump()
+		for c in list(self.tcp_clients.values()):
+			self._disconnect(c)
+		for sock in (self.tcp, self.udp):
+			if sock != None:
+				sock.close()
+
+	def _receive(self, sock):
+
+		"""
+		Handles a readable socket: a new TCP connection, a subscription, or a #
+		closed TCP connection.
+
+		Arguments:
+		sock	--	The socket.
+		"""
+
+		if sock is self.tcp:
+			conn, address = sock.accept()
+			conn.setblocking(False)
+			conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			self.tcp_clients[conn] = subscriber(address, conn)
+			return
+		if sock is self.udp:
+			try:
+				data, address = sock.recvfrom(4096)
+			except socket.error:
+				return
+			try:
+				if json.loads(data).get(u'unsubscribe', False):
+					self.udp_clients.pop(address, None)
+					return
+				c = self.udp_clients.get(address)
+				if c == None:
+					c = subscriber(address)
+				c.subscribe(data)
+				self.udp_clients[address] = c
+			except (ValueError, TypeError, AttributeError):
+				pass
+			return
+		c = self.tcp_clients[sock]
+		try:
+			data = sock.recv(4096)
+		except socket.error:
+			data = ''
+		if data == '':
+			self._disconnect(c)
+			return
+		c.inbuf += data
+		while '\n' in c.inbuf:
+			line, c.inbuf = c.inbuf.split('\n', 1)
+			try:
+				c.subscribe(line)
+			except (ValueError, TypeError, AttributeError):
+				pass
+
+	def _disconnect(self, c):
+
+		"""
+		Closes the connection with a TCP subscriber.
+
+		Arguments:
+		c	--	A subscriber.
+		"""
+
+		self.tcp_clients.pop(c.sock, None)
+		try:
+			c.sock.close()
+		except socket.error:
+			pass
+
+	def _flush(self, c):
+
+		"""
+		Sends as much of the output buffer of a TCP subscriber as possible.
+
+		Arguments:
+		c	--	A subscriber.
+		"""
+
+		try:
+			n = c.sock.send(c.outbuf)
+		except socket.error:
+			self._disconnect(c)
+			return
+		c.outbuf = c.outbuf[n:]
+
+	def _send(self, c, data):
+
+		"""
+		Sends a packet to a subscriber. A TCP subscriber that doesn't keep up #
+		is disconnected, rather than slowing down the server.
+
+		Arguments:
+		c		--	A subscriber.
+		data	--	The packet.
+		"""
+
+		if c.sock == None:
+			try:
+				self.udp.sendto(data, c.address)
+			except socket.error:
+				c.dropped += 1
+			return
+		c.outbuf += data
+		if len(c.outbuf) > TCP_BUFFER:
+			self._disconnect(c)
+			return
+		self._flush(c)
+
+	def pump(self):
+
+		"""<DOC>
+		Sends the samples and events that have arrived since the previous #
+		batch. This is called by the server thread.
+		</DOC>"""
+
+		samples, self._count = self.reader.since(self._count, out=self._out)
+		n = len(samples)
+		if n == 0:
+			return
+		self.sent += n
+		now = time.time()
+		for address, c in list(self.udp_clients.items()):
+			if now - c.seen > UDP_TIMEOUT:
+				del self.udp_clients[address]
+		clients = list(self.tcp_clients.values()) + \
+			list(self.udp_clients.values())
+		if len(clients) == 0:
+			if self.detector != None:
+				self._detect(samples)
+			return
+		# Samples are packed once for every decimation factor that is in use
+		packed = {}
+		for c in clients:
+			if not c.samples:
+				continue
+			key = c.decimate, c.phase
+			if key not in packed:
+				packed[key] = samples[c.phase::c.decimate].tostring()
+			data = packed[key]
+			c.phase = (c.phase - n) % c.decimate
+			count = len(data) // sample_record.size
+			if c.sock == None:
+				step = MAX_UDP_SAMPLES * sample_record.size
+				for i in range(0, len(data), step):
+					self._send(c, c.packet(SAMPLES, data[i:i + step], \
+						min(MAX_UDP_SAMPLES, count - i // sample_record.size)))
+			elif count > 0:
+				self._send(c, c.packet(SAMPLES, data, count))
+		if self.detector == None:
+			return
+		events = self._detect(samples)
+		for c in clients:
+			l = [e for e in events if e[0] in c.events]
+			if len(l) > 0:
+				self._send(c, c.packet(EVENTS, ''.join(pack_event(e) \
+					for e in l), len(l)))
+
+	def _detect(self, samples):
+
+		"""
+		Feeds samples into the detector.
+
+		Arguments:
+		samples	--	An array of samples.
+
+		Returns:
+		A list of events.
+		"""
+
+		events = []
+		update = self.detector.update
+		for t, x, y in zip(samples['time'].tolist(), samples['x'].tolist(), \
+			samples['y'].tolist()):
+			events += update(t, (x, y))
+		return events
+
+	def stop(self):
+
+		"""<DOC>
+		Stops the server and closes all connections.
+		</DOC>"""
+
+		self._halt.set()
+		if self.is_alive():
+			self.join(1)
+		elif self.tcp != None or self.udp != None:
+			for sock in (self.tcp, self.udp):
+				if sock != None:
+					sock.close()
+
+def pack_event(event):
+
+	"""<DOC>
+	Packs an event in the format of the stream.
+
+	Arguments:
+	event	--	An (event, time, startpos, endpos) tuple, as returned by #
+				libonline.online_detector.
+
+	Returns:
+	A string.
+	</DOC>"""
+
+	code, t, start, end = event
+	if start == None:
+		start = _nan, _nan
+	if end == None:
+		end = _nan, _nan
+	return event_record.pack(code, t, start[0], start[1], end[0], end[1])
+
+def start(tracker, host='127.0.0.1', tcp_port=5600, udp_port=5601, \
+	velocity_threshold=35):
+
+	"""<DOC>
+	Starts streaming the samples of a tracker. The sampler thread of the #
+	tracker is started if it isn't running yet. Events are detected online in #
+	the stream with libonline, using the geometry of the tracker. This is #
+	what eyetracker_calibrate does when streaming is enabled.
+
+	Arguments:
+	tracker				--	A tracker object.
+
+	Keyword arguments:
+	host				--	See server. (default='127.0.0.1')
+	tcp_port			--	See server. (default=5600)
+	udp_port			--	See server. (default=5601)
+	velocity_threshold	--	The saccade velocity threshold in degrees per #
+							second. (default=35)
+
+	Returns:
+	A running server, or None if the tracker cannot stream samples.
+	</DOC>"""
+
+	import libonline
+	import libsampler
+	reader = libsampler.reader(tracker)
+	if reader == None:
+		return None
+	detector = libonline.create(tracker.geometry, reader.samplerate, \
+		velocity_threshold=velocity_threshold)
+	s = server(reader, host=host, tcp_port=tcp_port, udp_port=udp_port, \
+		detector=detector)
+	s.start()
+	return s
+
+class client:
+
+	"""
+	A reference client for the stream. The client only needs the Python
+	standard library and NumPy, so this class can be copied into other
+	projects.
+	"""
+
+	def __init__(self, host='127.0.0.1', port=5600, protocol=u'tcp', \
+		samples=True, decimate=1, events=[]):
+
+		"""<DOC>
+		Constructor. Connects to the server and subscribes.
+
+		Keyword arguments:
+		host		--	The address of the server. (default='127.0.0.1')
+		port		--	The TCP or UDP port of the server. (default=5600)
+		protocol	--	u'tcp' or u'udp'. (default=u'tcp')
+		samples		--	Indicates whether samples should be streamed. #
+						(default=True)
+		decimate	--	Only every n-th sample is streamed. (default=1)
+		events		--	A list of event codes to stream. (default=[])
+		</DOC>"""
+
+		self.address = host, port
+		self.protocol = protocol
+		self.lost = 0
+		self._seq = None
+		self._buf = ''
+		if protocol == u'tcp':
+			self.sock = socket.create_connection(self.address)
+			self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		else:
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+		self.subscribe(samples, decimate, events)
+
+	def subscribe(self, samples=True, decimate=1, events=[]):
+
+		"""<DOC>
+		Changes the subscription.
+
+		Keyword arguments:
+		samples		--	See the constructor. (default=True)
+		decimate	--	See the constructor. (default=1)
+		events		--	See the constructor. (default=[])
+		</DOC>"""
+
+		self._subscription = json.dumps({u'samples': samples, \
+			u'decimate': decimate, u'events': list(events)}) + '\n'
+		self._subscribed = time.time()
+		if self.protocol == u'tcp':
+			self.sock.sendall(self._subscription)
+		else:
+			self.sock.sendto(self._subscription, self.address)
+
+	def receive(self, timeout=None):
+
+		"""<DOC>
+		Receives the next packet. UDP subscriptions are renewed automatically.
+
+		Keyword arguments:
+		timeout	--	A timeout in seconds, or None to wait indefinitely. #
+					(default=None)
+
+		Returns:
+		A (kind, records) tuple, with kind SAMPLES or EVENTS, and the #
+		records in an array of sample_dtype or event_dtype. On a timeout, #
+		(None, None) is returned.
+		</DOC>"""
+
+		if self.protocol == u'udp' and time.time() - self._subscribed > \
+			UDP_TIMEOUT / 2:
+			self.sock.sendto(self._subscription, self.address)
+			self._subscribed = time.time()
+		self.sock.settimeout(timeout)
+		try:
+			if self.protocol == u'udp':
+				data = self.sock.recv(65536)
+				h = header.unpack_from(data)
+				body = data[header.size:]
+			else:
+				h = header.unpack(self._read(header.size))
+				if h[2] == SAMPLES:
+					body = self._read(h[3] * sample_record.size)
+				else:
+					body = self._read(h[3] * event_record.size)
+		except socket.timeout:
+			return None, None
+		magic, version, kind, count, seq = h
+		if magic != MAGIC:
+			raise ValueError(u'Not a gaze stream')
+		if self._seq != None and seq != (self._seq + 1) & 0xffffffff:
+			self.lost += (seq - self._seq - 1) & 0xffffffff
+		self._seq = seq
+		if kind == SAMPLES:
+			return kind, numpy.frombuffer(body, dtype=sample_dtype, count=count)
+		return kind, numpy.frombuffer(body, dtype=event_dtype, count=count)
+
+	def _read(self, n):
+
+		"""
+		Reads exactly n bytes from the TCP stream.
+
+		Arguments:
+		n	--	The number of bytes.
+
+		Returns:
+		A string.
+		"""
+
+		while len(self._buf) < n:
+			data = self.sock.recv(65536)
+			if data == '':
+				raise socket.error(u'The server closed the connection')
+			self._buf += data
+		data, self._buf = self._buf[:n], self._buf[n:]
+		return data
+
+	def close(self):
+
+		"""<DOC>
+		Ends the subscription.
+		</DOC>"""
+
+		if self.protocol == u'udp':
+			self.sock.sendto(json.dumps({u'unsubscribe': True}), self.address)
+		self.sock.close()
+
+def benchmark(protocol=u'tcp', rate=10000, duration=5, clients=4, decimate=1):
+
+	"""<DOC>
+	Measures the throughput and latency of the server on the loopback #
+	interface. A thread stands in for the tracker and writes samples into a #
+	ring at a fixed rate, with the wall-clock time as timestamp, so that the #
+	clients can compute the latency of every sample.
+
+	Keyword arguments:
+	protocol	--	u'tcp' or u'udp'. (default=u'tcp')
+	rate		--	The sampling rate of the stand-in in Hz. (default=10000)
+	duration	--	The duration in seconds. (default=5)
+	clients		--	The number of clients. (default=4)
+	decimate	--	The decimation factor of the clients. (default=1)
+
+	Returns:
+	A dict with the results.
+	</DOC>"""
+
+	import libshm
+	ring = libshm.gaze_ring(capacity=1 << 16, samplerate=rate)
+	s = server(ring.reader(), tcp_port=0 if protocol == u'tcp' else None, \
+		udp_port=0 if protocol == u'udp' else None)
+	if protocol == u'tcp':
+		port = s.tcp.getsockname()[1]
+	else:
+		port = s.udp.getsockname()[1]
+	s.start()
+	done = threading.Event()
+
+	def standin():
+		# Writes the samples that are due every millisecond
+		t0 = time.time()
+		n = 0
+		while not done.is_set():
+			due = int((time.time() - t0) * rate)
+			while n < due:
+				t = time.time() * 1000.
+				ring.write(t, n % 1000, n % 700, 1)
+				n += 1
+			time.sleep(.001)
+
+	results = []
+
+	def consume():
+		c = client(port=port, protocol=protocol, decimate=decimate)
+		received = 0
+		latency = []
+		while not done.is_set():
+			kind, records = c.receive(timeout=.1)
+			if kind != SAMPLES:
+				continue
+			received += len(records)
+			latency.append(time.time() * 1000. - records['time'][-1])
+		results.append((received, c.lost, latency))
+		c.close()
+
+	threads = [threading.Thread(target=consume) for i in range(clients)]
+	for t in threads:
+		t.start()
+	time.sleep(.2)
+	w = threading.Thread(target=standin)
+	w.start()
+	time.sleep(duration)
+	done.set()
+	w.join()
+	for t in threads:
+		t.join()
+	s.stop()
+	written = ring.count
+	ring.close()
+	latency = numpy.array(sum([r[2] for r in results], []))
+	return {
+		u'protocol': protocol,
+		u'rate': rate,
+		u'clients': clients,
+		u'decimate': decimate,
+		u'written': written,
+		u'received per client': [r[0] for r in results],
+		u'lost packets': [r[1] for r in results],
+		u'samples/s per client': numpy.mean([r[0] for r in results]) / duration,
+		u'median latency (ms)': numpy.median(latency),
+		u'95th percentile latency (ms)': numpy.percentile(latency, 95),
+		}
+
+if __name__ == '__main__':
+
+	import sys
+	for protocol in sys.argv[1:] or [u'tcp', u'udp']:
+		for key, value in sorted(benchmark(protocol).items()):
+			print u'%s: %s' % (key, value)
+		print
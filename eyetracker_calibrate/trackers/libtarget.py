@@ -0,0 +1,191 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Pre-rendered target canvases for calibration and drift correction. Drawing a
+# target means clearing a canvas and drawing shapes onto it, which takes time
+# between the moment at which a target is requested and the moment at which
+# it appears (and sampling starts). A target_cache draws every target once,
+# keyed by its style, position, size and colours, after which showing it only
+# takes a flip. Items can draw their targets during prepare().
+#
+# There is one cache per experiment, which is shared by the items and the
+# tracker libraries, see get_cache(). Every canvas holds a full-screen
+# surface, of about 8 MB at 1920x1080, so the cache is kept small: large
+# enough for the points of a 13-point calibration, which validation reuses, and
+# the drift-correction target. The size can be set in eyetracker_calibrate.
+
+from openexp.canvas import canvas
+
+class target_cache:
+
+	"""A cache of canvases with a single target."""
+
+	def __init__(self, experiment, maxlen=16):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		experiment	--	The experiment.
+
+		Keyword arguments:
+		maxlen		--	The maximum number of canvases that is kept. When #
+						the cache is full, the oldest canvas is dropped. #
+						(default=16)
+		</DOC>"""
+
+		self.experiment = experiment
+		self.canvases = {}
+		self.order = []
+		self.set_maxlen(maxlen)
+
+	def set_maxlen(self, maxlen):
+
+		"""<DOC>
+		Sets the maximum number of canvases, and drops the oldest canvases #
+		if there are more.
+
+		Arguments:
+		maxlen	--	The maximum number of canvases.
+		</DOC>"""
+
+		self.maxlen = max(1, int(maxlen))
+		while len(self.order) > self.maxlen:
+			del self.canvases[self.order.pop(0)]
+
+	def get(self, x, y, size=8, style=u'dot', fgcolor=None, bgcolor=None):
+
+		"""<DOC>
+		Gets the canvas for a target, and draws it if it isn't in the cache.
+
+		Arguments:
+		x		--	The horizontal position.
+		y		--	The vertical position.
+
+		Keyword arguments:
+		size	--	The radius of the target in pixels. (default=8)
+		style	--	u'dot' for a disk with a hole, u'cross' for a cross, or #
+					u'fixdot' for the fixation dot of the canvas. #
+					(default=u'dot')
+		fgcolor	--	The colour of the target, or None for the foreground #
+					of the experiment. (default=None)
+		bgcolor	--	The colour of the background, or None for the #
+					background of the experiment. (default=None)
+
+		Returns:
+		A canvas.
+		</DOC>"""
+
+		if fgcolor == None:
+			fgcolor = self.experiment.foreground
+		if bgcolor == None:
+			bgcolor = self.experiment.background
+		key = style, x, y, size, str(fgcolor), str(bgcolor)
+		if key in self.canvases:
+			return self.canvases[key]
+		c = canvas(self.experiment, fgcolor=fgcolor, bgcolor=bgcolor)
+		if style == u'cross':
+			c.set_penwidth(3)
+			c.line(x - size, y, x + size, y)
+			c.line(x, y - size, x, y + size)
+		elif style == u'fixdot':
+			c.fixdot(x=x, y=y)
+		else:
+			c.circle(x, y, r=size, fill=True)
+			c.circle(x, y, r=2, color=bgcolor, fill=True)
+		if len(self.order) >= self.maxlen:
+			del self.canvases[self.order.pop(0)]
+		self.canvases[key] = c
+		self.order.append(key)
+		return c
+
+	def prepare(self, positions, size=8, style=u'dot', fgcolor=None, \
+		bgcolor=None):
+
+		"""<DOC>
+		Draws the targets for a number of positions in advance.
+
+		Arguments:
+		positions	--	A list of (x, y) tuples.
+
+		Keyword arguments:
+		size		--	See get(). (default=8)
+		style		--	See get(). (default=u'dot')
+		fgcolor		--	See get(). (default=None)
+		bgcolor		--	See get(). (default=None)
+		</DOC>"""
+
+		for x, y in positions:
+			self.get(x, y, size=size, style=style, fgcolor=fgcolor, \
+				bgcolor=bgcolor)
+
+	def show(self, x, y, size=8, style=u'dot', fgcolor=None, bgcolor=None):
+
+		"""<DOC>
+		Shows a target. If the target has been prepared, this only flips #
+		the display.
+
+		Arguments:
+		x		--	The horizontal position.
+		y		--	The vertical position.
+
+		Keyword arguments:
+		size	--	See get(). (default=8)
+		style	--	See get(). (default=u'dot')
+		fgcolor	--	See get(). (default=None)
+		bgcolor	--	See get(). (default=None)
+
+		Returns:
+		The timestamp of the display flip.
+		</DOC>"""
+
+		return self.get(x, y, size=size, style=style, fgcolor=fgcolor, \
+			bgcolor=bgcolor).show()
+
+	def clear(self):
+
+		"""<DOC>
+		Empties the cache.
+		</DOC>"""
+
+		self.canvases = {}
+		self.order = []
+
+def get_cache(experiment, maxlen=None):
+
+	"""<DOC>
+	Gets the target cache of an experiment, and creates it if necessary.
+
+	Arguments:
+	experiment	--	The experiment.
+
+	Keyword arguments:
+	maxlen		--	The maximum number of canvases, or None to keep the #
+					current maximum (or the default of a new cache). #
+					(default=None)
+
+	Returns:
+	A target_cache.
+	</DOC>"""
+
+	cache = getattr(experiment, u'eyetracker_targets', None)
+	if cache == None:
+		cache = target_cache(experiment)
+		experiment.eyetracker_targets = cache
+	if maxlen != None:
+		cache.set_maxlen(maxlen)
+	return cache
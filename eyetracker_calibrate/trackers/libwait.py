@@ -0,0 +1,326 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Precise waiting for the polling loops of the trackers. Sleeping is cheap but
+# imprecise: the operating system wakes a sleeping thread up late, by tens of
+# microseconds on Linux, and by up to a millisecond on Windows even with a
+# 1 ms timer resolution. Spinning is precise but keeps a CPU busy. wait_until()
+# therefore sleeps until shortly before the deadline, and only spins for the
+# last part.
+#
+# A pacer uses this to poll a tracker once per sample: after a new sample has
+# arrived, it sleeps until shortly before the next sample is expected, and
+# then polls without sleeping until that sample arrives. If the sample is
+# overdue (e.g. because the tracker isn't recording), the pacer falls back to
+# polling four times per sample period. Pacers keep track of how late they wake
+# up, see pacer.stats().
+#
+# Run this module to compare the pacer with a busy loop and with fixed
+# sleeps: python libwait.py
+
+import os
+import sys
+import time
+
+if hasattr(time, u'perf_counter'):
+	clock = time.perf_counter
+elif sys.platform == 'win32':
+	clock = time.clock
+else:
+	clock = time.time
+
+if sys.platform == 'win32':
+	# Sleeps on Windows are rounded up to the timer resolution, which is 1 ms
+	# at best, so spin for longer
+	SPIN = 1.5
+	try:
+		import ctypes
+		ctypes.windll.winmm.timeBeginPeriod(1)
+	except Exception:
+		pass
+else:
+	SPIN = .2
+
+def cpu_time():
+
+	"""<DOC>
+	Gets the processor time that this process has used.
+
+	Returns:
+	The user plus system time in seconds.
+	</DOC>"""
+
+	t = os.times()
+	return t[0] + t[1]
+
+def wait_until(deadline, spin=SPIN):
+
+	"""<DOC>
+	Waits until a moment in time, by sleeping until shortly before the #
+	deadline and spinning for the remainder.
+
+	Arguments:
+	deadline	--	The moment, in seconds on the clock() of this module.
+
+	Keyword arguments:
+	spin		--	The time in milliseconds before the deadline from which #
+					on the function spins rather than sleeps. (default=.2 #
+					ms, 1.5 ms on Windows)
+
+	Returns:
+	The time at which the function returned, which is at or just after the #
+	deadline.
+	</DOC>"""
+
+	margin = spin / 1000.
+	while True:
+		now = clock()
+		remaining = deadline - now
+		if remaining <= 0:
+			return now
+		if remaining > margin:
+			time.sleep(remaining - margin)
+
+def sleep(ms, spin=SPIN):
+
+	"""<DOC>
+	Sleeps precisely.
+
+	Arguments:
+	ms		--	The duration in milliseconds.
+
+	Keyword arguments:
+	spin	--	See wait_until(). (default=.2 ms, 1.5 ms on Windows)
+	</DOC>"""
+
+	wait_until(clock() + ms / 1000., spin)
+
+class pacer:
+
+	"""Paces a polling loop to the samples of a tracker."""
+
+	def __init__(self, samplerate=0, spin=SPIN, lead=.9):
+
+		"""<DOC>
+		Constructor. A polling loop calls wait() before it polls, and #
+		update() after it polls, or lets poll() do both:
+
+			pace = libwait.pacer(self.samplerate)
+			while True:
+				x, y = pace.poll(self.sample)
+
+		Keyword arguments:
+		samplerate	--	The sampling rate of the tracker in Hz, or 0 if #
+						unknown. If unknown, the sample period is estimated #
+						from the samples that arrive. (default=0)
+		spin		--	See wait_until(). (default=.2 ms, 1.5 ms on Windows)
+		lead		--	The part of a sample period that the pacer sleeps #
+						after a new sample, which leaves room for jitter in #
+						the arrival of samples. (default=.9)
+		</DOC>"""
+
+		self.fixed = samplerate > 0
+		self.period = 1. / samplerate if self.fixed else .001
+		self.spin = spin
+		self.lead = lead
+		self.arrival = None
+		self.last = None
+		self.wakeups = 0
+		self.error_sum = 0
+		self.error_max = 0
+		self.polls = 0
+		self.samples = 0
+
+	def wait(self):
+
+		"""<DOC>
+		Waits until the next sample is expected. Returns immediately if that #
+		moment has passed, so that the loop polls without sleeping until the #
+		sample arrives.
+		</DOC>"""
+
+		self.polls += 1
+		if self.arrival == None:
+			return
+		deadline = self.arrival + self.lead * self.period
+		now = clock()
+		late = now - deadline
+		if late > 2 * (1 - self.lead) * self.period:
+			# The sample is overdue, or the samples don't change, so stop
+			# spinning and poll a few times per period
+			deadline = now + self.period / 4
+		elif late >= 0:
+			return
+		self._sleep(deadline)
+
+	def _sleep(self, deadline):
+
+		"""
+		Waits until a deadline, and keeps track of the wake-up error.
+
+		Arguments:
+		deadline	--	The deadline in seconds.
+		"""
+
+		error = wait_until(deadline, self.spin) - deadline
+		self.wakeups += 1
+		self.error_sum += error
+		if error > self.error_max:
+			self.error_max = error
+
+	def update(self, new=True):
+
+		"""<DOC>
+		Tells the pacer whether the last poll returned a new sample.
+
+		Keyword arguments:
+		new	--	Indicates whether a new sample arrived. (default=True)
+		</DOC>"""
+
+		if not new:
+			return
+		now = clock()
+		if not self.fixed and self.arrival != None:
+			# A running average of the intervals between samples. Pauses of
+			# more than 100 ms (e.g. between recordings) are capped.
+			self.period += .05 * (min(now - self.arrival, .1) - self.period)
+		self.arrival = now
+		self.samples += 1
+
+	def poll(self, func):
+
+		"""<DOC>
+		Waits until the next sample is expected, and polls it.
+
+		Arguments:
+		func	--	A function that returns the newest sample, such as #
+					sample() of a tracker. A sample is considered new if it #
+					differs from the previous one.
+
+		Returns:
+		The return value of func.
+		</DOC>"""
+
+		self.wait()
+		s = func()
+		self.update(s != self.last)
+		self.last = s
+		return s
+
+	def tick(self):
+
+		"""<DOC>
+		Waits until the next sample period starts, for loops that cannot #
+		tell whether a sample is new.
+		</DOC>"""
+
+		self.polls += 1
+		if self.arrival != None:
+			deadline = self.arrival + self.period
+			if clock() < deadline:
+				self._sleep(deadline)
+		self.update()
+
+	def stats(self):
+
+		"""<DOC>
+		Gets statistics about the waits so far.
+
+		Returns:
+		A dict with the number of samples and polls, the number of sleeps #
+		('wakeups'), and the mean and maximum wake-up error in milliseconds.
+		</DOC>"""
+
+		n = max(1, self.wakeups)
+		return {
+			u'samples' : self.samples,
+			u'polls' : self.polls,
+			u'wakeups' : self.wakeups,
+			u'mean_error' : 1000. * self.error_sum / n,
+			u'max_error' : 1000. * self.error_max,
+			}
+
+def benchmark(samplerate=1000, duration=2):
+
+	"""
+	Compares ways of polling a simulated tracker: a busy loop, a fixed sleep of
+	one sample period (like experiment.sleep(int(sampletime))), a fixed sleep of
+	10 ms, and a pacer. Prints for each how late new samples are seen, how many
+	are missed, and how much processor time is used. Also prints the wake-up
+	error of wait_until() and of time.sleep() for a few durations.
+
+	Keyword arguments:
+	samplerate	--	The sampling rate of the simulated tracker in Hz.
+					(default=1000)
+	duration	--	The duration of each condition in seconds. (default=2)
+	"""
+
+	period = 1. / samplerate
+
+	def run(name, before_poll, after_poll):
+		t0 = clock()
+		c0 = cpu_time()
+		prev = 0
+		delays = []
+		missed = 0
+		while True:
+			before_poll()
+			now = clock()
+			if now - t0 > duration:
+				break
+			n = int((now - t0) / period)
+			new = n != prev
+			if new:
+				missed += n - prev - 1
+				delays.append(now - t0 - n * period)
+				prev = n
+			after_poll(new)
+		cpu = (cpu_time() - c0) / (clock() - t0)
+		delays.sort()
+		print(u'%-14s delay median %6.3f ms, max %6.3f ms, missed %5d, cpu ' \
+			u'%5.1f%%' % (name, 1000 * delays[len(delays) // 2], \
+			1000 * delays[-1], missed, 100 * cpu))
+
+	nothing = lambda *args: None
+	print(u'Polling a simulated %d Hz tracker' % samplerate)
+	run(u'busy loop', nothing, nothing)
+	run(u'sleep(period)', lambda: time.sleep(int(1000 * period) / 1000.), \
+		nothing)
+	run(u'sleep(10 ms)', lambda: time.sleep(.01), nothing)
+	pace = pacer(samplerate)
+	run(u'pacer', pace.wait, pace.update)
+	learn = pacer()
+	run(u'pacer (0 Hz)', learn.wait, learn.update)
+	s = pace.stats()
+	print(u'pacer: %(samples)d samples, %(polls)d polls, %(wakeups)d ' \
+		u'sleeps, wake-up error mean %(mean_error).3f ms, max ' \
+		u'%(max_error).3f ms' % s)
+	print(u'Wake-up error (median, max) for a requested wait')
+	for ms in (.5, 1, 2, 5):
+		for name, func in ((u'wait_until', lambda d: wait_until(d)), \
+			(u'time.sleep', lambda d: time.sleep(max(0, d - clock())))):
+			errors = []
+			for i in range(200):
+				deadline = clock() + ms / 1000.
+				func(deadline)
+				errors.append(clock() - deadline)
+			errors.sort()
+			print(u'%4.1f ms %-10s %6.3f ms %6.3f ms' % (ms, name, \
+				1000 * errors[len(errors) // 2], 1000 * errors[-1]))
+
+if __name__ == u'__main__':
+	benchmark()
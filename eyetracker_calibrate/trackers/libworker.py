@@ -0,0 +1,731 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Runs a tracker library in a separate worker process. All calls into pylink
+# or iViewXAPI, the sampler thread, the polling loops of the wait_for_*()
+# functions, and the stream server then run in the worker, and do not compete
+# with the display loop of the experiment for the GIL.
+#
+# In the experiment, the tracker is replaced by a proxy. The proxy reads
+# samples directly from the shared-memory ring that the sampler thread of the
+# worker writes (see libshm), so sample() and pupil_size() don't involve the
+# worker at all. All other functions are sent to the worker over a command
+# pipe, and the proxy waits for the result.
+#
+# Calibration and drift correction draw on the display of the experiment, and
+# collect key presses. The worker therefore replaces openexp.canvas,
+# openexp.keyboard, openexp.mouse and openexp.synth with stand-ins that send
+# every call back over the pipe. While the proxy waits for a result, it
+# executes these calls on real openexp objects. This costs a round trip per
+# call, which doesn't matter for calibration, but it does mean that the
+# worker should not be used for trackers that use openexp objects in their
+# sampler thread, such as the extended dummy.
+#
+# Times that the worker returns are in experiment time: the clock of the
+# worker is synchronized with experiment.time() when the worker starts.
+#
+# Running this file as a script compares command latency and frame timing
+# between the in-process mode and the worker mode, using a tracker that
+# stands in for a heavily loaded link.
+
+import imp
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+
+import libfilter
+import libshm
+
+if sys.platform == 'win32':
+	_clock = time.clock
+else:
+	_clock = time.time
+
+# The openexp modules that are replaced in the worker
+_remote_modules = [u'canvas', u'keyboard', u'mouse', u'synth']
+
+def _error(e):
+
+	"""
+	Prepares an exception for the pipe. Exceptions that cannot be pickled are
+	replaced by a RuntimeError with the same message.
+
+	Arguments:
+	e	--	An exception.
+
+	Returns:
+	An exception.
+	"""
+
+	import pickle
+	try:
+		pickle.loads(pickle.dumps(e))
+		return e
+	except Exception:
+		return RuntimeError(u'%s: %s' % (e.__class__.__name__, e))
+
+class _channel:
+
+	"""The worker end of the command pipe."""
+
+	def __init__(self, conn):
+
+		"""
+		Constructor.
+
+		Arguments:
+		conn	--	A multiprocessing Connection.
+		"""
+
+		self.conn = conn
+		self.lock = threading.Lock()
+
+	def request(self, msg):
+
+		"""
+		Asks the experiment process to do something, and waits for the result.
+
+		Arguments:
+		msg	--	A message tuple.
+
+		Returns:
+		The result.
+		"""
+
+		with self.lock:
+			self.conn.send(msg)
+			reply = self.conn.recv()
+		if reply[0] == u'error':
+			raise reply[1]
+		return reply[1]
+
+class _remote:
+
+	"""A stand-in in the worker for an openexp object in the experiment."""
+
+	def __init__(self, channel, oid):
+
+		"""
+		Constructor.
+
+		Arguments:
+		channel	--	A _channel.
+		oid		--	The id of the object in the experiment process.
+		"""
+
+		self._channel = channel
+		self._oid = oid
+
+	def __getattr__(self, name):
+
+		if name.startswith(u'__'):
+			raise AttributeError(name)
+		def call(*args, **kwargs):
+			return self._channel.request((u'invoke', self._oid, name, \
+				_refs(args), _refs(kwargs)))
+		return call
+
+def _refs(args):
+
+	"""
+	Replaces stand-ins by references, so that they can be sent over the pipe.
+
+	Arguments:
+	args	--	A tuple or a dict.
+
+	Returns:
+	A tuple or a dict.
+	"""
+
+	if type(args) == dict:
+		return dict((k, (u'__ref__', v._oid) if isinstance(v, _remote) else v) \
+			for k, v in args.items())
+	return tuple((u'__ref__', v._oid) if isinstance(v, _remote) else v \
+		for v in args)
+
+def _install(channel):
+
+	"""
+	Replaces the openexp modules with display functions by stand-ins.
+
+	Arguments:
+	channel	--	A _channel.
+	"""
+
+	for kind in _remote_modules:
+		module = imp.new_module(u'openexp.%s' % kind)
+		setattr(module, kind, _bind(channel, kind))
+		sys.modules[u'openexp.%s' % kind] = module
+
+def _bind(channel, kind):
+
+	"""
+	Creates a factory for stand-ins of a kind of openexp object.
+
+	Arguments:
+	channel	--	A _channel.
+	kind	--	u'canvas', u'keyboard', u'mouse', or u'synth'.
+
+	Returns:
+	A function that takes the same arguments as the openexp constructor.
+	"""
+
+	def factory(experiment, *args, **kwargs):
+		return _remote(channel, channel.request((u'new', kind, _refs(args), \
+			_refs(kwargs))))
+	return factory
+
+class _experiment:
+
+	"""The stand-in for the experiment object in the worker."""
+
+	def __init__(self, info):
+
+		"""
+		Constructor.
+
+		Arguments:
+		info	--	A dict with attributes of the experiment.
+		"""
+
+		self.__dict__.update(info)
+		self.offset = 0
+
+	def time(self):
+
+		return _clock() * 1000. + self.offset
+
+	def sleep(self, ms):
+
+		time.sleep(ms / 1000.)
+
+	def sync(self, t):
+
+		"""
+		Synchronizes the clock with the experiment.
+
+		Arguments:
+		t	--	The current experiment time.
+		"""
+
+		self.offset = t - _clock() * 1000.
+
+def _serve(conn, path, classname, args, kwargs, info, shm_name):
+
+	"""
+	The main function of the worker process.
+
+	Arguments:
+	conn		--	The worker end of the command pipe.
+	path		--	The path to the tracker library.
+	classname	--	The name of the tracker class.
+	args		--	The positional arguments for the tracker, after the #
+					experiment.
+	kwargs		--	The keyword arguments for the tracker.
+	info		--	A dict with attributes of the experiment.
+	shm_name	--	The name of the shared-memory ring.
+	"""
+
+	channel = _channel(conn)
+	_install(channel)
+	experiment = _experiment(info)
+	streams = []
+	try:
+		sys.path.insert(0, os.path.dirname(path))
+		module = imp.load_source(os.path.splitext(os.path.basename(path))[0], \
+			path)
+		tracker = getattr(module, classname)(experiment, *args, **kwargs)
+		tracker.start_sampler(shm_name=shm_name)
+	except Exception as e:
+		conn.send((u'error', _error(e), traceback.format_exc()))
+		return
+	conn.send((u'result', None))
+	while True:
+		msg = conn.recv()
+		try:
+			if msg[0] == u'call':
+				result = getattr(tracker, msg[1])(*msg[2], **msg[3])
+			elif msg[0] == u'get':
+				result = getattr(tracker, msg[1])
+				if callable(result):
+					result = u'__method__'
+			elif msg[0] == u'sync':
+				experiment.sync(msg[1])
+				result = None
+			elif msg[0] == u'stream':
+				import libstream
+				streams.append(libstream.start(tracker, **msg[1]))
+				result = streams[-1] != None
+			elif msg[0] == u'exit':
+				for s in streams:
+					if s != None:
+						s.stop()
+				tracker.stop_sampler()
+				conn.send((u'result', None))
+				return
+		except Exception as e:
+			conn.send((u'error', _error(e), traceback.format_exc()))
+			continue
+		try:
+			conn.send((u'result', result))
+		except Exception as e:
+			conn.send((u'error', _error(e), traceback.format_exc()))
+
+class proxy:
+
+	"""
+	The stand-in for a tracker that runs in a worker process. The proxy has
+	the same functions as the tracker.
+	"""
+
+	def __init__(self, experiment, path, classname, args=(), kwargs={}, \
+		shm_name=None, timeout=30):
+
+		"""<DOC>
+		Constructor. Starts the worker process and waits until the tracker #
+		has been initialized.
+
+		Arguments:
+		experiment	--	The experiment object.
+		path		--	The path to the tracker library.
+		classname	--	The name of the tracker class, which is usually the #
+						name of the library.
+
+		Keyword arguments:
+		args		--	The positional arguments for the tracker, after the #
+						experiment. (default=())
+		kwargs		--	The keyword arguments for the tracker. (default={})
+		shm_name	--	The name of the shared-memory ring, or None to #
+						derive a name from the process id. (default=None)
+		timeout		--	The time in seconds to wait for the worker to start. #
+						(default=30)
+
+		Exceptions:
+		Raises a runtime_error if the tracker cannot be initialized.
+		</DOC>"""
+
+		self.experiment = experiment
+		self._module = sys.modules.get(os.path.splitext(os.path.basename( \
+			path))[0])
+		if shm_name == None:
+			shm_name = u'opensesame_gaze_%d' % os.getpid()
+		self._classname = classname
+		self._objects = {}
+		self._next_oid = 0
+		self.gaze_filter = libfilter.create(kwargs.get(u'gaze_filter', \
+			u'none'))
+		info = {}
+		for attr in [u'width', u'height', u'background', u'foreground', \
+			u'canvas_backend', u'eyelink_esc_pressed']:
+			if hasattr(experiment, attr):
+				info[attr] = getattr(experiment, attr)
+		self._conn, conn = multiprocessing.Pipe()
+		self._process = multiprocessing.Process(target=_serve, args=(conn, \
+			path, classname, args, kwargs, info, shm_name))
+		self._process.daemon = True
+		self._process.start()
+		self._wait(timeout)
+		self._conn.send((u'sync', experiment.time()))
+		self._wait()
+		self._reader = libshm.gaze_reader(shm_name)
+		self._samples = libshm.numpy.empty(1, dtype=libshm.sample_dtype)
+
+	def _wait(self, timeout=None):
+
+		"""
+		Waits for a reply from the worker, while executing the display calls #
+		that the worker sends in the meantime.
+
+		Keyword arguments:
+		timeout	--	A timeout in seconds for the first message, or None. #
+					(default=None)
+
+		Returns:
+		The result.
+		"""
+
+		from libopensesame import exceptions
+		while True:
+			if timeout != None and not self._conn.poll(timeout):
+				raise exceptions.runtime_error( \
+					u'The tracker worker did not respond')
+			msg = self._conn.recv()
+			timeout = None
+			if msg[0] == u'result':
+				return msg[1]
+			if msg[0] == u'error':
+				e = msg[1]
+				if isinstance(e, RuntimeError) or not isinstance(e, Exception):
+					raise exceptions.runtime_error( \
+						u'Error in the tracker worker: %s\n%s' % (e, msg[2]))
+				raise e
+			try:
+				result = self._display(msg)
+			except Exception as e:
+				self._conn.send((u'error', _error(e)))
+			else:
+				self._conn.send((u'result', result))
+
+	def _display(self, msg):
+
+		"""
+		Executes a display call from the worker.
+
+		Arguments:
+		msg	--	The message.
+
+		Returns:
+		The result.
+		"""
+
+		args = tuple(self._objects[a[1]] if type(a) == tuple and len(a) == 2 \
+			and a[0] == u'__ref__' else a for a in msg[-2])
+		kwargs = dict((k, self._objects[v[1]] if type(v) == tuple and \
+			len(v) == 2 and v[0] == u'__ref__' else v) \
+			for k, v in msg[-1].items())
+		if msg[0] == u'new':
+			module = __import__(u'openexp.%s' % msg[1], fromlist=[msg[1]])
+			self._next_oid += 1
+			self._objects[self._next_oid] = getattr(module, msg[1])( \
+				self.experiment, *args, **kwargs)
+			return self._next_oid
+		return getattr(self._objects[msg[1]], msg[2])(*args, **kwargs)
+
+	def _call(self, name, *args, **kwargs):
+
+		"""
+		Calls a function of the tracker in the worker.
+
+		Arguments:
+		name	--	The name of the function.
+
+		Returns:
+		The result.
+		"""
+
+		self._conn.send((u'call', name, args, kwargs))
+		return self._wait()
+
+	def _get(self, name):
+
+		"""
+		Gets an attribute of the tracker in the worker.
+
+		Arguments:
+		name	--	The name of the attribute.
+
+		Returns:
+		The value of the attribute, or u'__method__' for a function.
+		"""
+
+		self._conn.send((u'get', name))
+		return self._wait()
+
+	def __getattr__(self, name):
+
+		if name.startswith(u'_'):
+			raise AttributeError(name)
+		value = self._get(name)
+		if value != u'__method__':
+			return value
+		def call(*args, **kwargs):
+			return self._call(name, *args, **kwargs)
+		self.__dict__[name] = call
+		return call
+
+	def sample(self, eye=None):
+
+		"""<DOC>
+		Gets the most recent gaze sample from the shared-memory ring, without #
+		involving the worker. The ring holds the eye that is being recorded; #
+		other eyes, or combinations of eyes, are requested from the worker.
+
+		Keyword arguments:
+		eye	--	See sample() of the tracker. (default=None)
+
+		Returns:
+		A tuple (x, y) containing the coordinates of the sample. The value #
+		(-1, -1) indicates missing data.
+		</DOC>"""
+
+		if eye != None:
+			return self._call(u'sample', eye=eye)
+		s = self._reader.newest(1, out=self._samples)
+		if len(s) == 0:
+			return -1, -1
+		t, x, y = float(s[0][u'time']), float(s[0][u'x']), float(s[0][u'y'])
+		if self.gaze_filter != None:
+			return self.gaze_filter.update(t, (x, y))
+		return x, y
+
+	def pupil_size(self, eye=None):
+
+		"""<DOC>
+		Gets the most recent pupil size from the shared-memory ring.
+
+		Keyword arguments:
+		eye	--	See sample() of the tracker. (default=None)
+
+		Returns:
+		A float corresponding to the pupil size (in arbitrary units). The #
+		value -1 indicates missing data.
+		</DOC>"""
+
+		if eye != None:
+			return self._call(u'pupil_size', eye=eye)
+		s = self._reader.newest(1, out=self._samples)
+		if len(s) == 0:
+			return -1
+		return float(s[0][u'pupil'])
+
+	def calibrate(self, *args, **kwargs):
+
+		result = self._call(u'calibrate', *args, **kwargs)
+		# The tracker may have seeded its gaze filter with the noise level
+		self.gaze_filter = self._get(u'gaze_filter')
+		return result
+
+	def set_gaze_filter(self, kind, **params):
+
+		self._call(u'set_gaze_filter', kind, **params)
+		self.gaze_filter = self._get(u'gaze_filter')
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		"""<DOC>
+		The worker always runs a sampler with a shared-memory ring, which is #
+		named after the shm_name that was passed to the constructor, so this #
+		function does nothing.
+		</DOC>"""
+
+		pass
+
+	def stop_sampler(self):
+
+		pass
+
+	def start_stream(self, **kwargs):
+
+		"""<DOC>
+		Starts a libstream server in the worker.
+
+		Keyword arguments:
+		kwargs	--	Keyword arguments for libstream.start().
+
+		Returns:
+		True if the server was started, False otherwise.
+		</DOC>"""
+
+		self._conn.send((u'stream', kwargs))
+		return self._wait()
+
+	def prepare_backdrop(self, canvas):
+
+		# This converts a canvas in the experiment, so it is done here
+		tracker_class = getattr(self._module, self._classname)
+		return tracker_class.prepare_backdrop.im_func(self, canvas)
+
+	def set_backdrop(self, backdrop):
+
+		if type(backdrop) != tuple:
+			backdrop = self.prepare_backdrop(backdrop)
+		return self._call(u'set_backdrop', backdrop)
+
+	def close(self):
+
+		"""<DOC>
+		Closes the tracker and stops the worker process.
+		</DOC>"""
+
+		if self._process == None:
+			return
+		try:
+			self._call(u'close')
+			self._conn.send((u'exit',))
+			self._wait(5)
+		finally:
+			self._reader.close()
+			self._process.join(5)
+			if self._process.is_alive():
+				self._process.terminate()
+			self._process = None
+			self._objects = {}
+
+class standin:
+
+	"""
+	A tracker that stands in for a heavily loaded link in benchmark(). Every
+	poll of the sampler thread keeps the GIL busy for a while, like draining
+	the link buffer and parsing events does.
+	"""
+
+	def __init__(self, experiment, resolution, load=.2, **kwargs):
+
+		"""<DOC>
+		Constructor.
+
+		Arguments:
+		experiment	--	The experiment object.
+		resolution	--	A (width, height) tuple.
+
+		Keyword arguments:
+		load		--	The time in milliseconds that every poll takes. #
+						(default=.2)
+		</DOC>"""
+
+		self.experiment = experiment
+		self.resolution = resolution
+		self.load = load
+		self.sampler = None
+		self.gaze_filter = None
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		if self.sampler != None:
+			return self.sampler
+		import libsampler
+		self.sampler = libsampler.start(self._poll, shm_name=shm_name, \
+			capacity=capacity, samplerate=1000)
+		return self.sampler
+
+	def stop_sampler(self):
+
+		if self.sampler != None:
+			self.sampler.stop()
+			self.sampler = None
+
+	def _poll(self):
+
+		t = self.experiment.time()
+		n = 0
+		while self.experiment.time() - t < self.load:
+			n += 1
+		return t, self.resolution[0] / 2, self.resolution[1] / 2, n
+
+	def sample(self, eye=None):
+
+		if self.sampler == None or self.sampler.latest == None:
+			return -1, -1
+		return self.sampler.latest[1:3]
+
+	def log(self, msg):
+
+		pass
+
+	def close(self):
+
+		self.stop_sampler()
+
+class _benchmark_experiment:
+
+	"""A minimal experiment for benchmark()."""
+
+	width = 1024
+	height = 768
+
+	def time(self):
+
+		return _clock() * 1000.
+
+	def sleep(self, ms):
+
+		time.sleep(ms / 1000.)
+
+def benchmark(load=.2, frames=300, work=5, calls=2000):
+
+	"""<DOC>
+	Compares the in-process mode with the worker mode, using the standin #
+	tracker. For each mode, this measures the latency of a command (log()) #
+	and of sample(), and the time that a fixed amount of Python work takes #
+	during every frame of a 60 Hz display loop. In the in-process mode, the #
+	sampler thread competes with this work for the GIL.
+
+	Keyword arguments:
+	load	--	The time in milliseconds that every poll of the tracker #
+				takes. (default=.2)
+	frames	--	The number of frames. (default=300)
+	work	--	The amount of work per frame, in milliseconds without a #
+				tracker. (default=5)
+	calls	--	The number of commands. (default=2000)
+
+	Returns:
+	A dict with, for each mode, the median and 95th percentile of the #
+	command latency (us), the sample() latency (us), and the work per frame #
+	(ms).
+	</DOC>"""
+
+	import numpy
+	experiment = _benchmark_experiment()
+	# Calibrate the amount of work per frame without a tracker
+	t = _clock()
+	n = 0
+	while _clock() - t < .05:
+		for i in range(100):
+			n += 1
+	iterations = int(n / 50. * work)
+
+	def frame():
+		t = _clock()
+		i = 0
+		for j in range(iterations // 100):
+			for k in range(100):
+				i += 1
+		return (_clock() - t) * 1000.
+
+	def measure(tracker):
+		result = {}
+		for name, func in [(u'command', lambda: tracker.log(u'benchmark')), \
+			(u'sample', tracker.sample)]:
+			l = []
+			for i in range(calls):
+				t = _clock()
+				func()
+				l.append((_clock() - t) * 1e6)
+			result[name + u' (us)'] = numpy.median(l), numpy.percentile(l, 95)
+		l = []
+		for i in range(frames):
+			t = _clock()
+			l.append(frame())
+			time.sleep(max(0, 1 / 60. - (_clock() - t)))
+		result[u'work per frame (ms)'] = numpy.median(l), numpy.percentile(l, \
+			95)
+		return result
+
+	results = {}
+	results[u'no tracker'] = {u'work per frame (ms)': \
+		measure(standin(experiment, (1024, 768)))[u'work per frame (ms)']}
+	tracker = standin(experiment, (1024, 768), load=load)
+	tracker.start_sampler()
+	results[u'in-process'] = measure(tracker)
+	tracker.close()
+	tracker = proxy(experiment, os.path.abspath(__file__).replace(u'.pyc', \
+		u'.py'), u'standin', args=((1024, 768),), kwargs={u'load': load})
+	time.sleep(.2)
+	results[u'worker'] = measure(tracker)
+	tracker.close()
+	return results
+
+if __name__ == '__main__':
+
+	for mode, result in sorted(benchmark().items()):
+		print mode
+		for key, value in sorted(result.items()):
+			print u'\t%s: median %.1f, 95th percentile %.1f' % (key, value[0], \
+				value[1])
@@ -17,7 +17,6 @@ along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
 
 from libopensesame import item, exceptions
 from libqtopensesame import qtplugin
-import openexp.canvas
 import os.path
 import imp
 from PyQt4 import QtGui, QtCore
@@ -65,6 +64,26 @@ class eyetracker_drift_correct(item.item):
 		if not hasattr(self.experiment, "eyetracker"):
 			raise exceptions.runtime_error("Please connect to the eyetracker using the the eyetracker_calibrate plugin before using any other eyetracker plugins")
 
+		try:
+			x = int(self.get("xpos", _eval=True))
+			y = int(self.get("ypos", _eval=True))
+		except:
+			raise exceptions.runtime_error("Please use numeric values for the coordinates in eyetracker_drift_correct item '%s'" % self.name)
+
+		if not self.has("coordinates") or self.get("coordinates") == "relative":
+			x += self.get("width") / 2
+			y += self.get("height") / 2
+		self._pos = x, y
+
+		# Draw the fixation cross in advance, so that showing it is only a
+		# flip. The canvases are cached (and shared with the tracker
+		# libraries, which are on the path once the tracker is connected), so
+		# the cross is only drawn once for every position.
+		import libtarget
+		self._target = libtarget.get_cache(self.experiment).get(x, y, size=5, \
+			style=u'cross', fgcolor=self.get("foreground"), \
+			bgcolor=self.get("background"))
+
 		# Report success
 		return True
 
@@ -76,28 +95,21 @@ class eyetracker_drift_correct(item.item):
 
 		self.set_item_onset()
 
-		try:
-			x = int(self.get("xpos", _eval=True))
-			y = int(self.get("ypos", _eval=True))
-		except:
-			raise exceptions.runtime_error("Please use numeric values for the coordinates in eyetracker_drift_correct item '%s'" % self.name)
-
-		if not self.has("coordinates") or self.get("coordinates") == "relative":
-			x += self.get("width") / 2
-			y += self.get("height") / 2
-
-		# Draw a fixation cross
-		c = openexp.canvas.canvas(self.experiment, self.get("background"), self.get("foreground"))
-		c.set_penwidth(3)
-		c.line(x - 5, y, x + 5, y)
-		c.line(x, y - 5, x, y + 5)
-		c.show()
+		# Show the fixation cross
+		self._target.show()
 		# Do drift correction
-		while not self.experiment.eyetracker.drift_correction( (x, y), \
+		while not self.experiment.eyetracker.drift_correction(self._pos, \
 			self.get("mode") == self._mode_auto):
 			
 			self.experiment.eyetracker.calibrate()
-			c.show()
+			self._target.show()
+
+		# The first fixation of the trial should be on the target, which
+		# gives an estimate of the drift (see libquality)
+		import libquality
+		monitor = libquality.get_monitor(self.experiment)
+		if monitor != None:
+			monitor.set_target(self._pos)
 
 		# Report success
 		return True
@@ -0,0 +1,144 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from libopensesame import item, exceptions
+from libqtopensesame import qtplugin
+import os.path
+from PyQt4 import QtGui, QtCore
+
+class eyetracker_sample(item.item):
+
+	"""
+	A plug-in that copies the current state of the eyes to experiment
+	variables, for use in conditions and run-if statements
+	"""
+
+	def __init__(self, name, experiment, string=None):
+
+		"""
+		Constructor
+
+		Arguments:
+		name		--	item name
+		experiment	--	an experiment object
+
+		Keyword arguments:
+		string		--	a definitional string (default=None)
+		"""
+
+		self.item_type = "eyetracker_sample"
+		self.fields = "x y state fixation_x fixation_y saccade_amplitude blinking"
+		self.prefix = "eyetracker_"
+		self.description = \
+			"Copies the current gaze position, fixation, saccade, and blink state to variables"
+		item.item.__init__(self, name, experiment, string)
+
+	def prepare(self):
+
+		"""
+		Prepare the plug-in
+
+		Returns:
+		True
+		"""
+
+		item.item.prepare(self)
+		if not hasattr(self.experiment, "eyetracker"):
+			raise exceptions.runtime_error( \
+				"Please connect to the eyetracker using the the eyetracker_calibrate plugin before using any other eyetracker plugins")
+		# The trackers folder is made importable by eyetracker_calibrate
+		import libstate
+		self._fields = []
+		for field in self.eval_text(self.get("fields")).split():
+			if field not in libstate.FIELDS:
+				raise exceptions.runtime_error( \
+					"Unknown field '%s' in eyetracker_sample item '%s'. The fields are: %s" \
+					% (field, self.name, ", ".join(libstate.FIELDS)))
+			self._fields.append((field, self.get("prefix") + field))
+		self._state = libstate.get_state(self.experiment)
+		return True
+
+	def run(self):
+
+		"""
+		Run the plug-in
+
+		Returns:
+		True
+		"""
+
+		self.set_item_onset()
+		if self._state == None:
+			snapshot = {}
+		else:
+			snapshot = self._state.snapshot
+		for field, var in self._fields:
+			val = snapshot.get(field)
+			if val == None:
+				val = "NA"
+			self.experiment.set(var, val)
+		return True
+
+class qteyetracker_sample(eyetracker_sample, qtplugin.qtplugin):
+
+	"""GUI part of the plug-in"""
+
+	def __init__(self, name, experiment, string=None):
+
+		"""
+		Constructor
+
+		Arguments:
+		name		--	item name
+		experiment	--	an experiment object
+
+		Keyword arguments:
+		string		--	a definitional string (default=None)
+		"""
+
+		eyetracker_sample.__init__(self, name, experiment, string)
+		qtplugin.qtplugin.__init__(self, __file__)
+
+	def init_edit_widget(self):
+
+		"""Initialize the controls"""
+
+		self.lock = True
+		qtplugin.qtplugin.init_edit_widget(self, False)
+		self.add_line_edit_control("fields", "Fields", tooltip= \
+			"The fields to copy, separated by spaces: time, x, y, pupil, state (fixation, saccade, blink, or unknown), blinking (yes or no), fixation_x, fixation_y, fixation_start, fixation_duration, saccade_start_x, saccade_start_y, saccade_end_x, saccade_end_y, saccade_amplitude (degrees), saccade_duration, saccade_end, fixations, saccades, blinks")
+		self.add_line_edit_control("prefix", "Variable prefix", tooltip= \
+			"Every field is stored as a variable with this prefix, e.g. eyetracker_x")
+		self.add_stretch()
+		self.lock = True
+
+	def apply_edit_changes(self):
+
+		"""Apply the controls"""
+
+		if not qtplugin.qtplugin.apply_edit_changes(self, False) or self.lock:
+			return
+		self.experiment.main_window.refresh(self.name)
+
+	def edit_widget(self):
+
+		"""Update the controls"""
+
+		self.lock = True
+		qtplugin.qtplugin.edit_widget(self)
+		self.lock = False
+		return self._edit_widget
@@ -49,6 +49,11 @@ class eyetracker_start_recording(item.item):
 		
 		if not hasattr(self, "log_msg"):
 			self.log_msg = "start_trial"
+		# The trial summary, which eyetracker_stop_recording logs
+		if not hasattr(self, "summary"):
+			self.summary = "no"
+		if not hasattr(self, "summary_aois"):
+			self.summary_aois = ""
 						
 	def prepare(self):
 	
@@ -64,6 +69,18 @@ class eyetracker_start_recording(item.item):
 		# dynamically loaded
 		if not hasattr(self.experiment, "eyetracker"):
 			raise exceptions.runtime_error("Please connect to the eyetracker using the the eyetracker_calibrate plugin before using any other eyetracker plugins")
+
+		# The AOIs for the dwell times of the trial summary. The trackers
+		# folder is made importable by eyetracker_calibrate.
+		self._aois = None
+		if self.get("summary") == "yes":
+			import libaoi
+			if not self.has("coordinates") or self.get("coordinates") == "relative":
+				offset = self.get("width") / 2, self.get("height") / 2
+			else:
+				offset = 0, 0
+			self._aois = libaoi.parse(self.eval_text(self.get("summary_aois")), \
+				offset)
 				
 		# Report success
 		return True
@@ -78,6 +95,22 @@ class eyetracker_start_recording(item.item):
 		self.set_item_onset()
 	
 		self.experiment.eyetracker.start_recording()
+		# Start the data-quality statistics of the trial, if enabled
+		import libquality
+		monitor = libquality.get_monitor(self.experiment)
+		if monitor != None:
+			monitor.start_trial()
+		# And the link-health counters
+		import libhealth
+		monitor = libhealth.get_monitor(self.experiment)
+		if monitor != None:
+			monitor.start_trial()
+		# And the trial summary
+		if self.get("summary") == "yes":
+			import libstate
+			state = libstate.get_state(self.experiment)
+			if state != None:
+				state.start_trial(aois=self._aois)
 		self.experiment.eyetracker.status_msg(self.eval_text(self.get("log_msg")))
 		self.experiment.eyetracker.log(self.eval_text(self.get("log_msg")))
 				
@@ -116,6 +149,8 @@ class qteyetracker_start_recording(eyetracker_start_recording, qtplugin.qtplugin
 		# Pass the word on to the parent		
 		qtplugin.qtplugin.init_edit_widget(self, False)			
 		self.add_line_edit_control("log_msg", "Log message", default = "start_trial", tooltip = "A message to write to the eyetracker logfile.", min_width = 400)
+		self.add_checkbox_control("summary", "Summarize the trial", tooltip = "Counts fixations, saccades, and blinks, with their mean durations and amplitudes, and the dwell time in every AOI, which eyetracker_stop_recording stores as variables and logs")
+		self.add_editor_control("summary_aois", "Areas of interest for the dwell times", tooltip = "The AOIs, one per line, as 'rect [name] [x] [y] [w] [h]', 'circle [name] [x] [y] [r]', or 'polygon [name] [x1] [y1] [x2] [y2] ...'. The dwell time of every AOI is stored as eyetracker_dwell_[name].")
 		
 		# Add a stretch to the edit_vbox, so that the controls do not
 		# stretch to the bottom of the window.
@@ -49,6 +49,17 @@ class eyetracker_stop_recording(item.item):
 		
 		if not hasattr(self, "log_msg"):
 			self.log_msg = "stop_trial"
+		# Data-quality thresholds; empty means no threshold
+		if not hasattr(self, "quality_max_rms_s2s"):
+			self.quality_max_rms_s2s = ""
+		if not hasattr(self, "quality_max_std"):
+			self.quality_max_std = ""
+		if not hasattr(self, "quality_max_lost"):
+			self.quality_max_lost = ""
+		if not hasattr(self, "quality_max_drift"):
+			self.quality_max_drift = ""
+		if not hasattr(self, "quality_recalibrate"):
+			self.quality_recalibrate = "no"
 						
 	def prepare(self):
 	
@@ -79,10 +90,131 @@ class eyetracker_stop_recording(item.item):
 
 		self.experiment.eyetracker.status_msg(self.eval_text(self.get("log_msg")))	
 		self.experiment.eyetracker.log(self.eval_text(self.get("log_msg")))	
+		import libquality
+		monitor = libquality.get_monitor(self.experiment)
+		summary = None
+		if monitor != None:
+			summary = monitor.stop_trial()
+		import libhealth
+		monitor = libhealth.get_monitor(self.experiment)
+		health = None
+		if monitor != None:
+			health = monitor.stop_trial()
+		# The trial summary, if eyetracker_start_recording started it
+		state = getattr(self.experiment, "eyetracker_state", None)
+		trial = None
+		if state != None:
+			trial = state.stop_trial()
 		self.experiment.eyetracker.stop_recording()
+		if trial != None:
+			self.trial_summary(trial)
+		if health != None:
+			self.health(health)
+		if summary != None:
+			self.quality(summary)
 				
 		# Report success
 		return True
+
+	def threshold(self, var):
+
+		"""
+		Gets a data-quality threshold.
+
+		Arguments:
+		var		--	The name of the threshold variable.
+
+		Returns:
+		The threshold as a float, or None if there is no threshold.
+		"""
+
+		val = self.get(var, _eval=True)
+		if val == "":
+			return None
+		try:
+			return float(val)
+		except:
+			raise exceptions.runtime_error("Please use numeric values for the data-quality thresholds in eyetracker_stop_recording item '%s'" % self.name)
+
+	def trial_summary(self, summary):
+
+		"""
+		Logs the summary of the trial as a single message, and sets it as
+		experiment variables: eyetracker_trial_[key] for the counts and means,
+		and eyetracker_dwell_[name] for the dwell time in every AOI.
+
+		Arguments:
+		summary	--	A dict as returned by libstate.gaze_state.stop_trial().
+		"""
+
+		import libstate
+		msg = "summary"
+		for key in libstate.SUMMARY:
+			val = summary[key]
+			if val == None:
+				val = "NA"
+			elif type(val) == float:
+				val = "%.1f" % val
+			self.experiment.set("eyetracker_trial_" + key, val)
+			msg += " %s %s" % (key, val)
+		for name, dwell in summary["dwell"]:
+			self.experiment.set("eyetracker_dwell_" + name, dwell)
+			msg += " dwell_%s %.0f" % (name, dwell)
+		self.experiment.eyetracker.log(msg)
+
+	def health(self, summary):
+
+		"""
+		Logs the link health of the trial, and sets the counters as
+		experiment variables.
+
+		Arguments:
+		summary	--	A dict as returned by libhealth.link_monitor.stop_trial().
+		"""
+
+		import libhealth
+		msg = "link"
+		for key in libhealth.COUNTERS + ("longest_gap", "drop_rate"):
+			val = summary[key]
+			if val == None:
+				val = "NA"
+			elif type(val) == float:
+				val = "%.4f" % val
+			self.experiment.set("eyetracker_link_" + key, val)
+			msg += " %s %s" % (key, val)
+		self.experiment.eyetracker.log(msg)
+
+	def quality(self, summary):
+
+		"""
+		Logs the data quality of the trial, and recalibrates if it is below the
+		thresholds and recalibration is enabled.
+
+		Arguments:
+		summary	--	A dict as returned by libquality.quality_monitor.stop_trial().
+		"""
+
+		import libquality
+		msg = "quality samples %d" % summary["samples"]
+		for key in "lost", "rms_s2s", "std", "drift":
+			val = summary[key]
+			if val == None:
+				self.experiment.set("eyetracker_quality_" + key, "NA")
+				msg += " %s NA" % key
+			else:
+				self.experiment.set("eyetracker_quality_" + key, val)
+				msg += " %s %.4f" % (key, val)
+		self.experiment.eyetracker.log(msg)
+		failed = libquality.check(summary, \
+			max_rms_s2s=self.threshold("quality_max_rms_s2s"), \
+			max_std=self.threshold("quality_max_std"), \
+			max_lost=self.threshold("quality_max_lost"), \
+			max_drift=self.threshold("quality_max_drift"))
+		self.experiment.set("eyetracker_quality_failed", " ".join(failed))
+		if len(failed) > 0:
+			self.experiment.eyetracker.log("quality failed %s" % " ".join(failed))
+			if self.get("quality_recalibrate") == "yes":
+				self.experiment.eyetracker.calibrate()
 					
 class qteyetracker_stop_recording(eyetracker_stop_recording, qtplugin.qtplugin):
 
@@ -116,6 +248,12 @@ class qteyetracker_stop_recording(eyetracker_stop_recording, qtplugin.qtplugin):
 		# Pass the word on to the parent		
 		qtplugin.qtplugin.init_edit_widget(self, False)			
 		self.add_line_edit_control("log_msg", "Log message", default = "stop_trial", tooltip = "A message to write to the eyetracker logfile.", min_width = 400)
+		# Data quality, only if it is monitored (see eyetracker_calibrate)
+		self.add_line_edit_control("quality_max_rms_s2s", "Maximum RMS-S2S (deg)", tooltip = "The maximum sample-to-sample precision of a trial; leave empty for no maximum")
+		self.add_line_edit_control("quality_max_std", "Maximum STD (deg)", tooltip = "The maximum standard deviation of gaze during fixations; leave empty for no maximum")
+		self.add_line_edit_control("quality_max_lost", "Maximum data loss (proportion)", tooltip = "The maximum proportion of lost samples; leave empty for no maximum")
+		self.add_line_edit_control("quality_max_drift", "Maximum drift (deg)", tooltip = "The maximum distance between the first fixation and the drift-correction target; leave empty for no maximum")
+		self.add_checkbox_control("quality_recalibrate", "Recalibrate if the data quality is too low", tooltip = "Calibrates the tracker after a trial that exceeds one of the maximums")
 		
 		# Add a stretch to the edit_vbox, so that the controls do not
 		# stretch to the bottom of the window.
@@ -43,8 +43,28 @@ class eyetracker_wait(item.item):
 		self._efix = "Fixation end"
 		self._sblink = "Blink start"
 		self._eblink = "Blink end"
+		self._sample_enter = "Gaze enters AOI"
+		self._sample_leave = "Gaze leaves AOI"
+		self._fix_enter = "Fixation starts in AOI"
+		self._fix_leave = "Fixation leaves AOI"
+		self._landing = "Saccade landing (predicted)"
+		
+		# Use static numbers to avoid importing pylink
+		self._codes = [
+			(self._ssacc, 5, "also_ssacc"), #pylink.STARTSACC
+			(self._esacc, 6, "also_esacc"), #pylink.ENDSACC
+			(self._sfix, 7, "also_sfix"), #pylink.STARTFIX
+			(self._efix, 8, "also_efix"), #pylink.ENDFIX
+			(self._sblink, 3, "also_sblink"), #pylink.STARTBLINK
+			(self._eblink, 4, "also_eblink"), #pylink.ENDBLINK
+			]
 		
 		self.event = self._ssacc
+		self.aois = ""
+		self.timeout = "infinite"
+		self.confidence = .5
+		for label, code, var in self._codes:
+			setattr(self, var, "no")
 		
 		# Provide a short accurate description of the items functionality
 		self.description = "Wait for event plugin for the eyetracker series of eye trackers (SR-Research)"
@@ -67,21 +87,43 @@ class eyetracker_wait(item.item):
 		if not hasattr(self.experiment, "eyetracker"):
 			raise exceptions.runtime_error("Please connect to the eyetracker using the the eyetracker_calibrate plugin before using any other eyetracker plugins")
 		
-		# Use static numbers to avoid importing pylink			
-		if self.event == self._ssacc:
-			self._event = 5 #pylink.STARTSACC
-		elif self.event == self._esacc:
-			self._event = 6 #pylink.ENDSACC
-		elif self.event == self._sfix:
-			self._event = 7 #pylink.STARTFIX
-		elif self.event == self._efix:
-			self._event = 8 #pylink.ENDFIX
-		elif self.event == self._sblink:
-			self._event = 3 #pylink.STARTBLINK
-		elif self.event == self._eblink:
-			self._event = 4 #pylink.ENDBLINK
-		else:
-			raise exceptions.runtime_error("An unknown event was specified in eyetracker_wait item '%s'" % self.name)										
+		# Collect the event codes: the main event, plus any additional events
+		# that have been ticked. The first of these events ends the item.
+		self._event = None
+		self._events = []
+		self._labels = {}
+		for label, code, var in self._codes:
+			self._labels[code] = label
+			if self.event == label:
+				self._event = code
+				self._events.insert(0, code)
+			elif self.get(var) == "yes":
+				self._events.append(code)
+		if self._event == None:
+			if self.event not in (self._sample_enter, self._sample_leave, \
+				self._fix_enter, self._fix_leave, self._landing):
+				raise exceptions.runtime_error("An unknown event was specified in eyetracker_wait item '%s'" % self.name)										
+			self._events = []
+			
+		# The landing predictor of the experiment, which keeps fitting the
+		# main sequence across trials. The trackers folder is made importable
+		# by eyetracker_calibrate.
+		if self.event == self._landing:
+			import libpredict
+			self._predictor = libpredict.get_predictor(self.experiment.eyetracker)
+			self._labels[libpredict.LANDING] = self._landing
+			
+		# Build the AOI index now, so that hit testing is fast during the run
+		# phase.
+		elif self._event == None:
+			import libaoi
+			if not self.has("coordinates") or self.get("coordinates") == "relative":
+				offset = self.get("width") / 2, self.get("height") / 2
+			else:
+				offset = 0, 0
+			self._aois = libaoi.parse(self.eval_text(self.get("aois")), offset)
+			if len(self._aois) == 0:
+				raise exceptions.runtime_error("Please define at least one AOI in eyetracker_wait item '%s'" % self.name)
 				
 		# Report success
 		return True
@@ -93,11 +135,91 @@ class eyetracker_wait(item.item):
 		to the display and waiting for the specified duration.
 		"""
 		
-		self.experiment.eyetracker.wait_for_event(self._event)	
+		if self.event == self._landing:
+			import libpredict
+			t0 = self.time()
+			ret = libpredict.wait_for_landing(self.experiment.eyetracker, \
+				self._predictor, self._timeout(), \
+				self.get("confidence", _eval=True))
+			self.store_event(ret[:4], t0)
+			if ret[0] == None:
+				self.experiment.set("eyetracker_landing_time", "NA")
+				self.experiment.set("eyetracker_confidence", "NA")
+			else:
+				self.experiment.set("eyetracker_landing_time", ret[4] - t0)
+				self.experiment.set("eyetracker_confidence", ret[5])
+		elif self._event == None:
+			ret = self.experiment.eyetracker.wait_for_aoi(self._aois, \
+				fixation=self.event in (self._fix_enter, self._fix_leave), \
+				leave=self.event in (self._sample_leave, self._fix_leave), \
+				timeout=self._timeout())
+			# The simple dummy doesn't return anything
+			if ret == None:
+				self.experiment.set("eyetracker_aoi", "")
+			elif ret[1] == None:
+				self.experiment.set("eyetracker_aoi", "timeout")
+			else:
+				self.experiment.set("eyetracker_aoi", ret[1].name)
+		else:
+			t0 = self.time()
+			ret = self.experiment.eyetracker.wait_for_events(self._events, \
+				self._timeout())
+			self.store_event(ret, t0)
 		self.set_item_onset()
 				
 		# Report success
 		return True
+
+	def _timeout(self):
+
+		"""
+		Gets the timeout.
+
+		Returns:
+		The timeout in milliseconds, or None for no timeout.
+		"""
+
+		timeout = self.get("timeout", _eval=True)
+		if timeout == "infinite":
+			return None
+		try:
+			return float(timeout)
+		except:
+			raise exceptions.runtime_error("Please use a numeric value or 'infinite' for the timeout in eyetracker_wait item '%s'" % self.name)
+
+	def store_event(self, ret, t0):
+
+		"""
+		Stores the event that ended the wait as experiment variables:
+		eyetracker_event, eyetracker_latency (relative to the start of the
+		wait), eyetracker_start_x, eyetracker_start_y, eyetracker_end_x, and
+		eyetracker_end_y. Values that are not available are set to 'NA'.
+
+		Arguments:
+		ret	--	An (event, timestamp, start_pos, end_pos) tuple, as returned by
+				wait_for_events(), or None.
+		t0	--	The start time of the wait.
+		"""
+
+		# The simple dummy doesn't return anything
+		if ret == None:
+			ret = None, None, None, None
+		event, t, spos, epos = ret
+		if event == None:
+			self.experiment.set("eyetracker_event", "timeout")
+		else:
+			self.experiment.set("eyetracker_event", self._labels[event])
+		if t == None:
+			self.experiment.set("eyetracker_latency", "NA")
+		else:
+			self.experiment.set("eyetracker_latency", t - t0)
+		for pos, prefix in ((spos, "eyetracker_start"), (epos, "eyetracker_end")):
+			if pos == None:
+				self.experiment.set(prefix + "_x", "NA")
+				self.experiment.set(prefix + "_y", "NA")
+			else:
+				self.experiment.set(prefix + "_x", pos[0])
+				self.experiment.set(prefix + "_y", pos[1])
 					
 class qteyetracker_wait(eyetracker_wait, qtplugin.qtplugin):
 
@@ -130,7 +252,12 @@ class qteyetracker_wait(eyetracker_wait, qtplugin.qtplugin):
 		
 		# Pass the word on to the parent		
 		qtplugin.qtplugin.init_edit_widget(self, False)			
-		self.add_combobox_control("event", "Event", [self._ssacc, self._esacc, self._sfix, self._efix, self._sblink, self._eblink], tooltip = "The eyetracker event to wait for")
+		self.add_combobox_control("event", "Event", [self._ssacc, self._esacc, self._sfix, self._efix, self._sblink, self._eblink, self._sample_enter, self._sample_leave, self._fix_enter, self._fix_leave, self._landing], tooltip = "The eyetracker event to wait for")
+		for label, code, var in self._codes:
+			self.add_checkbox_control(var, "Or: %s" % label.lower(), tooltip = "Also stop waiting on this event; the event that occurs first is stored as eyetracker_event")
+		self.add_line_edit_control("timeout", "Timeout", default = "infinite", tooltip = "A timeout in milliseconds, or 'infinite'. On a timeout, eyetracker_event, or eyetracker_aoi for the AOI events, is set to 'timeout'.")
+		self.add_line_edit_control("confidence", "Minimum confidence", default = ".5", tooltip = "For a predicted saccade landing: the confidence (0 - 1) that the prediction needs. The predicted landing position is stored as eyetracker_end_x and eyetracker_end_y, the predicted landing time as eyetracker_landing_time, and the confidence as eyetracker_confidence.")
+		self.add_editor_control("aois", "Areas of interest", tooltip = "The AOIs, one per line, as 'rect [name] [x] [y] [w] [h]', 'circle [name] [x] [y] [r]', or 'polygon [name] [x1] [y1] [x2] [y2] ...'. The name of the AOI is stored as eyetracker_aoi.")
 		
 		# Add a stretch to the edit_vbox, so that the controls do not
 		# stretch to the bottom of the window.
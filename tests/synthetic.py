@@ -0,0 +1,82 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+# Synthetic gaze data for the tests. Importing this module also puts the
+# trackers folder on the path, so that the tests can import the helper
+# modules like eyetracker_calibrate does.
+
+import math
+import os
+import sys
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+	u'..', u'eyetracker_calibrate', u'trackers'))
+
+# The pixels per degree of the synthetic data
+PPD = 35.
+
+# The phases of trial(), in milliseconds
+SACCADE_START = 300.
+SACCADE_DURATION = 46.
+BLINK_START = 600
+BLINK_END = 700
+
+def raised_cosine(tau):
+
+	"""
+	Gets the proportion of the amplitude that a saccade with a raised cosine
+	velocity profile has covered.
+
+	Arguments:
+	tau	--	The time since the onset, relative to the duration.
+
+	Returns:
+	A proportion.
+	"""
+
+	tau = min(max(tau, 0.), 1.)
+	return tau - math.sin(2 * math.pi * tau) / (2 * math.pi)
+
+def trial(noise=.3, seed=1):
+
+	"""
+	Generates a trial at 1000 Hz: a fixation at (300, 400), a saccade to
+	(700, 400), a fixation there with a blink in the middle, and the rest of
+	the fixation.
+
+	Keyword arguments:
+	noise	--	The standard deviation of the noise in pixels.
+	seed	--	The seed of the noise.
+
+	Returns:
+	A (t, x, y) tuple of arrays, with (-1, -1) during the blink.
+	"""
+
+	rng = numpy.random.RandomState(seed)
+	t = numpy.arange(1000, dtype=float)
+	x = numpy.array([300. + 400. * raised_cosine((i - SACCADE_START) / \
+		SACCADE_DURATION) for i in t])
+	y = numpy.zeros(len(t)) + 400.
+	x += rng.normal(0, noise, len(t))
+	y += rng.normal(0, noise, len(t))
+	blink = (t >= BLINK_START) & (t < BLINK_END)
+	x[blink] = -1
+	y[blink] = -1
+	return t, x, y
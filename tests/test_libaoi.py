@@ -0,0 +1,105 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import synthetic
+# libaoi raises OpenSesame exceptions, so it can only be tested where
+# OpenSesame is installed
+try:
+	from libopensesame import exceptions
+	import libaoi
+except ImportError:
+	libaoi = None
+
+@unittest.skipIf(libaoi == None, u'OpenSesame is not installed')
+class test_libaoi(unittest.TestCase):
+
+	def test_shapes(self):
+
+		rect = libaoi.rect_aoi(u'rect', 100, 100, 200, 50)
+		self.assertEqual(rect.bbox, (100, 100, 300, 150))
+		self.assertTrue(rect.contains(100, 150))
+		self.assertFalse(rect.contains(301, 120))
+		circle = libaoi.circle_aoi(u'circle', 500, 500, 50)
+		self.assertEqual(circle.bbox, (450, 450, 550, 550))
+		self.assertTrue(circle.contains(530, 530))
+		self.assertFalse(circle.contains(545, 545))
+		# A concave, L-shaped polygon
+		polygon = libaoi.polygon_aoi(u'polygon', [(0, 0), (100, 0), \
+			(100, 20), (20, 20), (20, 100), (0, 100)])
+		self.assertEqual(polygon.bbox, (0, 0, 100, 100))
+		self.assertTrue(polygon.contains(90, 10))
+		self.assertTrue(polygon.contains(10, 90))
+		self.assertFalse(polygon.contains(50, 50))
+		self.assertRaises(exceptions.runtime_error, libaoi.polygon_aoi, \
+			u'line', [(0, 0), (10, 10)])
+
+	def test_index(self):
+
+		big = libaoi.rect_aoi(u'big', 0, 0, 400, 400)
+		small = libaoi.circle_aoi(u'small', 200, 200, 20)
+		far = libaoi.rect_aoi(u'far', 900, 700, 50, 50)
+		for cell_size in (None, 16, 1000):
+			index = libaoi.aoi_index([big, small, far], cell_size=cell_size)
+			self.assertEqual(len(index), 3)
+			# The AOI that was added first wins
+			self.assertEqual(index.hit(200, 200), big)
+			self.assertEqual(index.hits(200, 200), [big, small])
+			self.assertEqual(index.hit(920, 720), far)
+			self.assertEqual(index.hit(600, 600), None)
+			self.assertEqual(index.hits(-50, -50), [])
+		index = libaoi.aoi_index()
+		self.assertEqual(index.hit(0, 0), None)
+		index.add(small)
+		self.assertEqual(index.hit(200, 210), small)
+
+	def test_trial(self):
+
+		# The fixations of the synthetic trial fall in two AOIs, and the
+		# saccade passes through neither
+		index = libaoi.parse(u'circle start 300 400 30\n' \
+			u'circle end 700 400 30')
+		t, x, y = synthetic.trial()
+		names = []
+		for i in range(len(t)):
+			a = index.hit(x[i], y[i])
+			name = None if a == None else a.name
+			if len(names) == 0 or names[-1] != name:
+				names.append(name)
+		self.assertEqual(names, [u'start', None, u'end', None, u'end'])
+
+	def test_parse(self):
+
+		index = libaoi.parse(u'''# A comment
+
+rect button -50 -25 100 50
+circle dot 0 0 5
+polygon triangle 0 0 10 0 0 10
+''', offset=(512, 384))
+		self.assertEqual([a.name for a in index.aois], [u'button', u'dot', \
+			u'triangle'])
+		self.assertEqual(index.aois[0].bbox, (462, 359, 562, 409))
+		self.assertEqual(index.hit(512, 384).name, u'button')
+		self.assertEqual(index.aois[2].bbox, (512, 384, 522, 394))
+		for line in (u'rect button 1 2 3', u'ellipse e 0 0 1 1', \
+			u'circle dot x 0 5', u'rect', u'polygon p 0 0 1 1 2'):
+			self.assertRaises(exceptions.runtime_error, libaoi.parse, line)
+
+if __name__ == u'__main__':
+	unittest.main()
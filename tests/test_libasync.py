@@ -0,0 +1,144 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import threading
+import unittest
+
+import synthetic
+import libasync
+import libgeometry
+import libonline
+
+class stub_ring:
+
+	"""A ring that is its own reader."""
+
+	samplerate = 1000
+
+	def reader(self):
+
+		return self
+
+	def close(self):
+
+		pass
+
+class stub_sampler:
+
+	"""A stand-in for libsampler.sampler, whose samples are pushed by hand."""
+
+	def __init__(self):
+
+		self.ring = stub_ring()
+		self.listeners = []
+
+	def add_listener(self, listener):
+
+		self.listeners.append(listener)
+
+	def remove_listener(self, listener):
+
+		self.listeners.remove(listener)
+
+	def push(self, sample):
+
+		for listener in self.listeners:
+			listener(sample)
+
+class stub_tracker:
+
+	"""A tracker that records the thread in which it is called."""
+
+	def __init__(self):
+
+		self.geometry = libgeometry.screen_geometry((1024, 768), (40., 30.))
+		self.sampler = stub_sampler()
+		self.calls = []
+
+	def _call(self, name):
+
+		self.calls.append((name, threading.current_thread()))
+		return name
+
+	def log(self, msg):
+
+		return self._call(u'log')
+
+	def calibrate(self):
+
+		return self._call(u'calibrate')
+
+	def drift_correction(self, pos=None, fix_triggered=False):
+
+		return self._call(u'drift_correction')
+
+	def close(self):
+
+		return self._call(u'close')
+
+@unittest.skipIf(libasync.asyncio == None, u'asyncio or trollius is not installed')
+class test_async_tracker(unittest.TestCase):
+
+	def setUp(self):
+
+		self.loop = libasync.asyncio.new_event_loop()
+		self.tracker = stub_tracker()
+		self.gaze = libasync.async_tracker(self.tracker, loop=self.loop)
+
+	def tearDown(self):
+
+		self.loop.run_until_complete(self.gaze.close())
+		self.loop.close()
+
+	def test_display_in_loop_thread(self):
+
+		# calibrate() and drift_correction() run in the thread of the loop,
+		# in turn with the functions that run in the tracker thread
+		futures = [self.gaze.log(u'a'), self.gaze.calibrate(), \
+			self.gaze.log(u'b'), self.gaze.drift_correction()]
+		results = self.loop.run_until_complete(libasync.asyncio.gather( \
+			*futures))
+		self.assertEqual(results, [u'log', u'calibrate', u'log', \
+			u'drift_correction'])
+		self.assertEqual([name for name, thread in self.tracker.calls], \
+			results)
+		main = threading.current_thread()
+		for name, thread in self.tracker.calls:
+			self.assertEqual(thread == main, name != u'log')
+
+	def test_wait_for_event(self):
+
+		t, x, y = synthetic.trial()
+		future = self.gaze.wait_for_event(libonline.STARTBLINK)
+		def feed():
+			for i in range(len(t)):
+				self.tracker.sampler.push((t[i], x[i], y[i], 4.))
+		self.loop.call_soon(feed)
+		event = self.loop.run_until_complete(future)
+		self.assertEqual(event[:2], (libonline.STARTBLINK, \
+			synthetic.BLINK_START))
+		self.assertEqual(self.gaze.sample()[0], t[-1])
+
+	def test_timeout(self):
+
+		event = self.loop.run_until_complete(self.gaze.wait_for_event( \
+			libonline.STARTSACC, timeout=10))
+		self.assertEqual(event, (None, None, None, None))
+
+if __name__ == u'__main__':
+	unittest.main()
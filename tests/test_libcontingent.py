@@ -0,0 +1,167 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import synthetic
+import libwait
+# libcontingent raises OpenSesame exceptions, so it can only be tested where
+# OpenSesame is installed
+try:
+	from libopensesame import exceptions
+	import libaoi
+	import libcontingent
+except ImportError:
+	libcontingent = None
+
+class stub_experiment:
+
+	"""An experiment with a clock and a display size."""
+
+	def time(self):
+
+		return 1000. * libwait.clock()
+
+	def get(self, var):
+
+		return {u'width' : 1024, u'height' : 768}[var]
+
+class stub_canvas:
+
+	"""A prepared canvas, which records when it is shown."""
+
+	def __init__(self, experiment, shown):
+
+		self.experiment = experiment
+		self.shown = shown
+
+	def show(self):
+
+		self.shown.append(self)
+		return self.experiment.time()
+
+class stub_tracker:
+
+	"""A tracker without a sampler thread, which replays the synthetic trial."""
+
+	def __init__(self):
+
+		self.experiment = stub_experiment()
+		self.sampler = None
+		self.messages = []
+		t, self.x, self.y = synthetic.trial()
+		self.i = 0
+
+	def start_sampler(self):
+
+		pass
+
+	def sample(self):
+
+		i = min(self.i, len(self.x) - 1)
+		self.i += 1
+		return self.x[i], self.y[i]
+
+	def log(self, msg):
+
+		self.messages.append(msg)
+
+@unittest.skipIf(libcontingent == None, u'OpenSesame is not installed')
+class test_libcontingent(unittest.TestCase):
+
+	def test_trigger(self):
+
+		area = libaoi.rect_aoi(u'right', 500, 0, 500, 800)
+		enter = libcontingent.trigger(area, None)
+		leave = libcontingent.trigger(area, None, leave=True)
+		self.assertEqual([enter.test(x, 400) for x in (100, 600, 700, 100, \
+			600)], [False, True, False, False, True])
+		self.assertEqual([leave.test(x, 400) for x in (100, 600, 700, 100, \
+			600)], [False, False, False, True, False])
+		self.assertEqual(enter.name, u'right')
+
+	def test_clock_offset(self):
+
+		clock = libcontingent.clock_offset(window=100)
+		self.assertEqual(clock.offset, None)
+		# The sample timestamps are 1000 ms behind, and arrive after 1 to
+		# 3 ms
+		for i, delay in enumerate([3, 1, 2, 3, 2]):
+			clock.update(1000 + 10 * i + delay, 10 * i)
+		self.assertEqual(clock.offset, 1001)
+		# The smallest delay leaves the window
+		clock.update(1200, 200 - 2)
+		self.assertEqual(clock.offset, 1002)
+
+	def test_peak_predictor(self):
+
+		t, x, y = synthetic.trial(noise=0)
+		predictor = libcontingent.peak_predictor(2.)
+		predictions = []
+		for i in range(int(synthetic.BLINK_START)):
+			p = predictor.update(t[i], x[i], y[i])
+			if p != None:
+				predictions.append((t[i], p))
+		self.assertTrue(len(predictions) > 0)
+		seen, (px, py, pt, confidence) = predictions[0]
+		# The prediction is made around the peak velocity, halfway
+		self.assertLess(seen, synthetic.SACCADE_START + \
+			synthetic.SACCADE_DURATION * .75)
+		self.assertAlmostEqual(px, 700, delta=20)
+		self.assertAlmostEqual(py, 400, delta=1)
+		self.assertAlmostEqual(pt, synthetic.SACCADE_START + \
+			synthetic.SACCADE_DURATION, delta=5)
+		self.assertEqual(confidence, None)
+		self.assertEqual(predictor.update(1000, -1, -1), None)
+
+	def test_engine(self):
+
+		# Two triggers that fire on the same sample are both shown and
+		# logged, in order
+		tracker = stub_tracker()
+		shown = []
+		engine = libcontingent.engine(tracker, \
+			predictor=libcontingent.peak_predictor(2.))
+		first = stub_canvas(tracker.experiment, shown)
+		second = stub_canvas(tracker.experiment, shown)
+		engine.add_boundary(500, first, name=u'first')
+		engine.add(libaoi.rect_aoi(u'second', 500, 0, 524, 768), second)
+		changes = engine.run(timeout=5000)
+		self.assertEqual(shown, [first, second])
+		self.assertEqual([c[u'name'] for c in changes], [u'first', u'second'])
+		self.assertEqual(len(tracker.messages), 2)
+		self.assertTrue(tracker.messages[0].startswith(u'gc_change first'))
+		for change in changes:
+			self.assertTrue(change[u'detect_to_flip'] >= 0)
+		# The boundary was crossed during the saccade
+		self.assertTrue(synthetic.SACCADE_START < tracker.i < \
+			synthetic.SACCADE_START + synthetic.SACCADE_DURATION)
+		# Both triggers have fired, so the engine is done
+		self.assertEqual(engine.run(), [])
+
+	def test_endless(self):
+
+		tracker = stub_tracker()
+		engine = libcontingent.engine(tracker, \
+			predictor=libcontingent.peak_predictor(2.))
+		engine.add(libaoi.circle_aoi(u'window', 300, 400, 50), None, \
+			once=False)
+		self.assertRaises(exceptions.runtime_error, engine.run)
+
+if __name__ == u'__main__':
+	unittest.main()
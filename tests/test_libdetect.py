@@ -0,0 +1,100 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import numpy
+
+import synthetic
+import libdetect
+
+class test_libdetect(unittest.TestCase):
+
+	def test_missing(self):
+
+		m = libdetect.missing([1, -1, 0, numpy.nan, 5], [1, -1, 0, 2, 0])
+		self.assertEqual(m.tolist(), [False, True, True, True, False])
+
+	def test_velocity(self):
+
+		t = numpy.arange(10.)
+		v = libdetect.velocity(t, 100 + 2 * t, 100 + 0 * t)
+		self.assertTrue(numpy.isnan(v[0]))
+		self.assertTrue(numpy.allclose(v[1:], 2000.))
+		v = libdetect.velocity(t, [-1] + [100] * 9, [-1] + [100] * 9)
+		self.assertTrue(numpy.isnan(v[:2]).all())
+		self.assertEqual(len(libdetect.velocity([], [], [])), 0)
+
+	def test_ivt(self):
+
+		t, x, y = synthetic.trial()
+		# At 57 cm, a centimeter is about a degree, so 140 degrees per second
+		# is about 5000 pixels per second
+		events = libdetect.ivt(t, x, y, pixpercm=synthetic.PPD, \
+			vel_thresh=140)
+		self.assertEqual(events[u'event'].tolist(), [libdetect.ENDFIX, \
+			libdetect.ENDSACC, libdetect.ENDFIX, libdetect.ENDBLINK, \
+			libdetect.ENDFIX])
+		sacc = events[1]
+		self.assertAlmostEqual(sacc[u'stime'], synthetic.SACCADE_START, \
+			delta=10)
+		self.assertAlmostEqual(sacc[u'etime'], synthetic.SACCADE_START + \
+			synthetic.SACCADE_DURATION, delta=10)
+		blink = events[3]
+		self.assertEqual((blink[u'stime'], blink[u'etime']), \
+			(synthetic.BLINK_START, synthetic.BLINK_END - 1))
+
+	def test_idt(self):
+
+		t, x, y = synthetic.trial()
+		events = libdetect.idt(t, x, y, pixpercm=synthetic.PPD, \
+			disp_thresh=.3)
+		codes = events[u'event'].tolist()
+		self.assertEqual(codes.count(libdetect.ENDFIX), 3)
+		self.assertEqual(codes.count(libdetect.ENDBLINK), 1)
+		fix = events[events[u'event'] == libdetect.ENDFIX]
+		self.assertAlmostEqual(fix[1][u'sx'], 700, delta=10)
+
+	def test_acceleration(self):
+
+		# The eye jumps to a constant speed, and stops abruptly. The velocity
+		# threshold is never crossed, but both the acceleration and the
+		# deceleration are saccadic.
+		t = numpy.arange(100.)
+		x = 100 + 5 * numpy.clip(t - 50, 0, 10)
+		y = numpy.zeros(100) + 400
+		events = libdetect.ivt(t, x, y, pixpercm=synthetic.PPD, \
+			vel_thresh=1000, acc_thresh=50000, min_fix_dur=0)
+		sacc = events[events[u'event'] == libdetect.ENDSACC]
+		self.assertEqual(sacc[u'stime'].tolist(), [51, 61])
+
+	def test_units(self):
+
+		t, x, y = synthetic.trial()
+		self.assertRaises(ValueError, libdetect.ivt, t, x, y)
+		self.assertRaises(ValueError, libdetect.idt, t, x, y)
+
+	def test_detect(self):
+
+		t, x, y = synthetic.trial()
+		self.assertEqual(libdetect.detect(t, x, y, pixpercm=synthetic.PPD, \
+			vel_thresh=140).tolist(), libdetect.ivt(t, x, y, \
+			pixpercm=synthetic.PPD, vel_thresh=140).tolist())
+
+if __name__ == u'__main__':
+	unittest.main()
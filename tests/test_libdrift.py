@@ -0,0 +1,74 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import math
+import unittest
+
+import numpy
+
+import synthetic
+import libdrift
+
+class test_fixation_window(unittest.TestCase):
+
+	def test_empty(self):
+
+		window = libdrift.fixation_window(10)
+		self.assertFalse(window.full())
+		self.assertEqual(window.last(), None)
+		self.assertEqual(window.mean(), None)
+		self.assertEqual(window.dispersion(), 0)
+
+	def test_trial(self):
+
+		# The running statistics match NumPy over the last samples, through
+		# the saccade and for far more samples than the window holds
+		t, x, y = synthetic.trial()
+		size = 25
+		window = libdrift.fixation_window(size)
+		for i in range(synthetic.BLINK_START):
+			window.push(x[i], y[i])
+			self.assertEqual(window.full(), i >= size - 1)
+			self.assertEqual(window.last(), (x[i], y[i]))
+			if i % 7 > 0:
+				continue
+			wx = x[max(0, i - size + 1):i + 1]
+			wy = y[max(0, i - size + 1):i + 1]
+			mx, my = window.mean()
+			self.assertAlmostEqual(mx, wx.mean(), places=9)
+			self.assertAlmostEqual(my, wy.mean(), places=9)
+			self.assertAlmostEqual(window.dispersion(), math.sqrt( \
+				wx.var() + wy.var()), places=6)
+		# In the fixation, the dispersion is about the noise
+		self.assertAlmostEqual(window.dispersion(), .3 * math.sqrt(2), \
+			delta=.15)
+		window.reset()
+		self.assertFalse(window.full())
+		self.assertEqual(window.mean(), None)
+
+	def test_precision(self):
+
+		# Far from the origin, the sums are still precise
+		window = libdrift.fixation_window(100)
+		rng = numpy.random.RandomState(1)
+		for i in range(1000):
+			window.push(1e7 + rng.normal(), 1e7)
+		self.assertAlmostEqual(window.dispersion(), 1, delta=.2)
+
+if __name__ == u'__main__':
+	unittest.main()
@@ -0,0 +1,146 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import types
+import unittest
+
+import synthetic
+# libeyelink draws with OpenSesame, so it can only be tested where OpenSesame
+# is installed. pylink, which needs the tracker, is replaced by a stub.
+try:
+	import libconnection
+	import libeyelink
+except ImportError:
+	libeyelink = None
+
+class stub_eyelink:
+
+	"""A stand-in for pylink.EyeLink, which records what it is sent."""
+
+	def __init__(self):
+
+		self.commands = []
+		self.messages = []
+		self.data_files = []
+
+	def isConnected(self):
+
+		return True
+
+	def close(self):
+
+		pass
+
+	def sendCommand(self, cmd):
+
+		self.commands.append(cmd)
+		return 0
+
+	def sendMessage(self, msg):
+
+		self.messages.append(msg)
+		return 0
+
+	def openDataFile(self, data_file):
+
+		self.data_files.append(data_file)
+
+	def setOfflineMode(self):
+
+		pass
+
+	def getTrackerVersion(self):
+
+		return 3
+
+	def getTrackerVersionString(self):
+
+		return u'EYELINK CL 4.56'
+
+def stub_pylink(tracker):
+
+	"""Creates a stand-in for the pylink module around a stub_eyelink."""
+
+	pylink = types.ModuleType('pylink')
+	pylink.EyeLink = lambda: tracker
+	pylink.getEYELINK = lambda: tracker
+	pylink.openGraphicsEx = lambda graphics: None
+	pylink.flushGetkeyQueue = lambda: None
+	return pylink
+
+class stub_graphics:
+
+	"""A stand-in for eyelink_graphics, which draws on the display."""
+
+	def __init__(self, experiment, tracker, settings=None):
+
+		self.set_tracker(tracker, settings)
+
+	def set_tracker(self, tracker, settings=None):
+
+		self.tracker = tracker
+
+class stub_experiment:
+
+	pass
+
+@unittest.skipIf(libeyelink == None, u'OpenSesame is not installed')
+class test_libeyelink(unittest.TestCase):
+
+	def setUp(self):
+
+		self.tracker = stub_eyelink()
+		# pylink is not there if it failed to import
+		self.pylink = getattr(libeyelink, u'pylink', None)
+		self.graphics = libeyelink.eyelink_graphics
+		libeyelink.pylink = stub_pylink(self.tracker)
+		libeyelink.eyelink_graphics = stub_graphics
+
+	def tearDown(self):
+
+		if self.pylink == None:
+			del libeyelink.pylink
+		else:
+			libeyelink.pylink = self.pylink
+		libeyelink.eyelink_graphics = self.graphics
+		libconnection.close_all()
+
+	def test_force_drift_correct(self):
+
+		# The drift-correction command is sent before anything else, through
+		# the same path that restores a lost link
+		eyelink = libeyelink.libeyelink(stub_experiment(), (1024, 768), \
+			data_file=u'test.edf', force_drift_correct=True)
+		self.assertEqual(self.tracker.commands[0], \
+			u'driftcorrect_cr_disable = OFF')
+		self.assertEqual(self.tracker.data_files, [u'test.edf'])
+		self.assertTrue(u'screen_pixel_coords =  0 0 1024 768' in \
+			self.tracker.commands)
+		self.assertEqual(eyelink._lost, None)
+
+	def test_configuration_cache(self):
+
+		# A second run over the same connection doesn't send the
+		# configuration again
+		libeyelink.libeyelink(stub_experiment(), (1024, 768))
+		n = len(self.tracker.commands)
+		libeyelink.libeyelink(stub_experiment(), (1024, 768))
+		self.assertEqual(len(self.tracker.commands), n)
+
+if __name__ == u'__main__':
+	unittest.main()
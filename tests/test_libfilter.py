@@ -0,0 +1,101 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import math
+import unittest
+
+import numpy
+
+import synthetic
+import libfilter
+
+def rms_s2s(samples):
+
+	"""Gets the RMS sample-to-sample distance of a list of (x, y) tuples."""
+
+	d = numpy.diff(numpy.array(samples, dtype=float), axis=0)
+	return math.sqrt(numpy.mean(numpy.sum(d ** 2, axis=1)))
+
+class test_libfilter(unittest.TestCase):
+
+	def filters(self):
+
+		return [libfilter.moving_average_filter(), \
+			libfilter.heuristic_filter(), libfilter.heuristic_filter(level=2), \
+			libfilter.one_euro_filter()]
+
+	def test_noise(self):
+
+		t, x, y = synthetic.trial(noise=2.)
+		n = int(synthetic.SACCADE_START)
+		raw = zip(x[:n], y[:n])
+		for f in self.filters():
+			out = [f.update(t[i], raw[i]) for i in range(n)]
+			self.assertLess(rms_s2s(out[20:]), rms_s2s(raw[20:]), \
+				f.__class__.__name__)
+			self.assertAlmostEqual(numpy.mean(out[20:], axis=0)[0], 300, \
+				delta=1)
+
+	def test_step(self):
+
+		# After a step, every filter settles on the new position
+		for f in self.filters():
+			for i in range(100):
+				pos = f.update(i, (100., 100.) if i < 50 else (300., 100.))
+			self.assertAlmostEqual(pos[0], 300, delta=1, \
+				msg=f.__class__.__name__)
+			self.assertGreaterEqual(f.latency, 0)
+		self.assertEqual(libfilter.moving_average_filter(n=5).latency, 2)
+
+	def test_repeat(self):
+
+		for f in self.filters():
+			first = f.update(0, (100., 100.))
+			second = f.update(1, (110., 100.))
+			self.assertEqual(f.update(1, (500., 500.)), second)
+
+	def test_missing(self):
+
+		for f in self.filters():
+			for i in range(10):
+				f.update(i, (100., 100.))
+			self.assertEqual(f.update(10, (-1, -1)), (-1, -1))
+			self.assertEqual(f.update(11, (0, 0)), (0, 0))
+			# The filter starts over after missing data
+			pos = f.update(12, (300., 200.))
+			self.assertAlmostEqual(pos[0], 300)
+			self.assertAlmostEqual(pos[1], 200)
+
+	def test_create(self):
+
+		self.assertEqual(libfilter.create(u'none'), None)
+		self.assertRaises(ValueError, libfilter.create, u'kalman')
+		self.assertEqual(libfilter.create(u'moving average', noise=1.).n, 4)
+		self.assertEqual(libfilter.create(u'moving average', noise=.1).n, 2)
+		self.assertEqual(libfilter.create(u'moving average', noise=5.).n, 10)
+		self.assertEqual(libfilter.create(u'moving average', noise=1., \
+			n=3).n, 3)
+		self.assertAlmostEqual(libfilter.create(u'one-euro', \
+			noise=.5).beta, .05)
+		self.assertAlmostEqual(libfilter.create(u'one-euro', noise=0).beta, \
+			libfilter.one_euro_filter().beta)
+		self.assertTrue(isinstance(libfilter.create(u'heuristic'), \
+			libfilter.heuristic_filter))
+
+if __name__ == u'__main__':
+	unittest.main()
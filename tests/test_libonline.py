@@ -0,0 +1,92 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import synthetic
+import libgeometry
+import libonline
+
+def run(detector, t, x, y):
+
+	"""Feeds samples to a detector and collects the events."""
+
+	events = []
+	for i in range(len(t)):
+		events += detector.update(t[i], (x[i], y[i]))
+	return events
+
+class test_online_detector(unittest.TestCase):
+
+	def test_trial(self):
+
+		t, x, y = synthetic.trial()
+		events = run(libonline.online_detector(20, 4), t, x, y)
+		self.assertEqual([e[0] for e in events], [libonline.STARTFIX, \
+			libonline.ENDFIX, libonline.STARTSACC, libonline.ENDSACC, \
+			libonline.STARTFIX, libonline.ENDFIX, libonline.STARTBLINK, \
+			libonline.ENDBLINK, libonline.STARTFIX])
+		times = dict((e[0], e[1]) for e in events)
+		self.assertAlmostEqual(times[libonline.STARTSACC], \
+			synthetic.SACCADE_START, delta=10)
+		self.assertAlmostEqual(times[libonline.ENDSACC], \
+			synthetic.SACCADE_START + synthetic.SACCADE_DURATION, delta=10)
+		self.assertEqual(times[libonline.STARTBLINK], synthetic.BLINK_START)
+		self.assertEqual(times[libonline.ENDBLINK], synthetic.BLINK_END)
+		endsacc = events[3]
+		self.assertAlmostEqual(endsacc[2][0], 300, delta=10)
+		self.assertAlmostEqual(endsacc[3][0], 700, delta=10)
+
+	def test_noise(self):
+
+		t, x, y = synthetic.trial()
+		n = int(synthetic.SACCADE_START)
+		# The fixation noise is far below the weighted distance, so a
+		# threshold below the noise does not start any saccades in the fixation
+		events = run(libonline.online_detector(20, .1, noise=(1., 1.)), \
+			t[:n], x[:n], y[:n])
+		self.assertEqual([e[0] for e in events], [libonline.STARTFIX])
+		# A noise of zero is ignored
+		events = run(libonline.online_detector(20, 4, noise=(0, 0)), t, x, y)
+		self.assertEqual(len([e for e in events if e[0] == \
+			libonline.STARTSACC]), 1)
+
+	def test_duplicates(self):
+
+		detector = libonline.online_detector(20, 4)
+		for i in range(10):
+			events = detector.update(i, (100, 100))
+		# Identical samples never fill the fixation window
+		self.assertEqual(events, [])
+		self.assertEqual(detector.state, libonline._UNKNOWN)
+		detector = libonline.online_detector(20, 2, skip_duplicates=False)
+		events = run(detector, range(10), [100] * 10, [100] * 10)
+		self.assertEqual([e[0] for e in events], [libonline.STARTFIX])
+
+	def test_create(self):
+
+		geometry = libgeometry.screen_geometry((1024, 768), (40., 30.))
+		detector = libonline.create(geometry, 500)
+		self.assertAlmostEqual(detector.fix_thresh, geometry.deg2pix(1.5))
+		self.assertAlmostEqual(detector.spd_thresh, geometry.deg2pix(.07))
+		self.assertFalse(detector.skip_duplicates)
+		self.assertAlmostEqual(libonline.create(geometry, 0).spd_thresh, \
+			geometry.deg2pix(.035))
+
+if __name__ == u'__main__':
+	unittest.main()
@@ -0,0 +1,83 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+import synthetic
+import libpredict
+
+def saccade(amplitude, duration, onset=100.3, x0=200., ppd=35., n=300):
+
+	"""
+	Generates a noise-free horizontal saccade with a raised cosine velocity
+	profile, sampled at 1000 Hz.
+
+	Returns:
+	A list of (t, x, y) tuples.
+	"""
+
+	return [(float(t), x0 + ppd * amplitude * synthetic.raised_cosine((t - \
+		onset) / duration), 300.) for t in range(n)]
+
+class test_landing_predictor(unittest.TestCase):
+
+	def _first_confident(self, amplitude, noise):
+
+		predictor = libpredict.landing_predictor(noise=noise)
+		duration = predictor.sequence.duration(amplitude)
+		for t, x, y in saccade(amplitude, duration):
+			p = predictor.update(t, x, y)
+			if p != None and p[3] >= .5:
+				return t, (p[0] - 200.) / 35., p[2], 100.3 + duration
+		self.fail(u'No confident prediction for %s degrees' % amplitude)
+
+	def test_confident_before_landing(self):
+
+		for noise in (.1, .01):
+			for amplitude in (3., 8., 15.):
+				t, predicted, landing, end = self._first_confident(amplitude, \
+					noise)
+				self.assertLess(t, end)
+				self.assertAlmostEqual(predicted, amplitude, \
+					delta=.15 * amplitude)
+				self.assertAlmostEqual(landing, end, delta=3)
+
+	def test_onset(self):
+
+		predictor = libpredict.landing_predictor()
+		for t, x, y in saccade(8., predictor.sequence.duration(8.))[:120]:
+			predictor.update(t, x, y)
+		self.assertAlmostEqual(predictor.start[0], 100.3, delta=1)
+		self.assertAlmostEqual(predictor.start[1], 200., delta=.2 * 35)
+
+	def test_main_sequence(self):
+
+		predictor = libpredict.landing_predictor()
+		for t, x, y in saccade(10., 50.):
+			predictor.update(t, x, y)
+		onset, end, amplitude = predictor.last
+		self.assertAlmostEqual(amplitude, 10., delta=.5)
+		self.assertEqual(predictor.sequence.count, 1)
+
+	def test_missing(self):
+
+		predictor = libpredict.landing_predictor()
+		self.assertEqual(predictor.update(0, -1, -1), None)
+		self.assertEqual(predictor.onset, None)
+
+if __name__ == u'__main__':
+	unittest.main()
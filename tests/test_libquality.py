@@ -0,0 +1,157 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import math
+import unittest
+
+import numpy
+
+import synthetic
+import libquality
+
+def fixation(n=1000, noise=.5, pos=(500., 300.), seed=1):
+
+	"""Generates the samples of a fixation with white noise."""
+
+	rng = numpy.random.RandomState(seed)
+	return pos[0] + rng.normal(0, noise, n), pos[1] + rng.normal(0, noise, n)
+
+class test_trial_stats(unittest.TestCase):
+
+	def stats(self, batch):
+
+		t, x, y = synthetic.trial()
+		stats = libquality.trial_stats(3., .5)
+		stats.set_target(300, 400)
+		for i in range(0, len(t), batch):
+			stats.update(t[i:i + batch], x[i:i + batch], y[i:i + batch])
+		return stats.summary()
+
+	def test_trial(self):
+
+		s = self.stats(1000)
+		self.assertEqual(s[u'samples'], 1000)
+		self.assertAlmostEqual(s[u'lost'], .1)
+		# The noise is .3 pixel in each direction
+		self.assertAlmostEqual(s[u'rms_s2s'], .3 * 2, delta=.05)
+		# The slow start and end of the saccade add to the fixations
+		self.assertAlmostEqual(s[u'std'], .3 * math.sqrt(2), delta=.15)
+		self.assertLess(s[u'drift'], .1)
+
+	def test_batches(self):
+
+		# The statistics don't depend on how the samples are batched
+		s = self.stats(1000)
+		for batch in (1, 7, 100):
+			s2 = self.stats(batch)
+			for key in s:
+				self.assertAlmostEqual(s[key], s2[key], places=9)
+
+	def test_missed(self):
+
+		stats = libquality.trial_stats(3., .5)
+		self.assertEqual(stats.summary()[u'lost'], None)
+		stats.update(numpy.arange(10.), numpy.zeros(10) + 100, \
+			numpy.zeros(10) + 100, missed=10)
+		s = stats.summary()
+		self.assertEqual((s[u'samples'], s[u'lost']), (20, .5))
+		self.assertEqual(s[u'drift'], None)
+
+	def test_check(self):
+
+		s = {u'samples' : 100, u'lost' : .2, u'rms_s2s' : .5, u'std' : None, \
+			u'drift' : 2.}
+		self.assertEqual(libquality.check(s), [])
+		self.assertEqual(libquality.check(s, max_rms_s2s=.4, max_std=.1, \
+			max_lost=.3, max_drift=1.), [u'rms_s2s', u'drift'])
+
+class test_validation(unittest.TestCase):
+
+	def test_valid(self):
+
+		self.assertEqual(libquality.valid(numpy.array([1, -1, 0, numpy.nan, \
+			0]), numpy.array([1, -1, 0, 1, 5])).tolist(), [True, False, \
+			False, False, True])
+
+	def test_grid(self):
+
+		for points in (1, 5, 9, 13):
+			grid = libquality.validation_grid((1000, 800), points)
+			self.assertEqual(len(grid), points)
+			self.assertEqual(len(set(grid)), points)
+			self.assertEqual(grid[0], (500, 400))
+			for x, y in grid:
+				self.assertTrue(100 <= x <= 900 and 80 <= y <= 720)
+		self.assertEqual(libquality.validation_grid((1000, 800), 5, \
+			margin=0)[1:], [(0, 0), (1000, 0), (0, 800), (1000, 800)])
+
+	def test_precision(self):
+
+		x, y = fixation(noise=.5)
+		x[:50] = -1
+		y[:50] = -1
+		p = libquality.precision(x, y)
+		self.assertEqual((p[u'samples'], p[u'steps']), (1000, 949))
+		self.assertAlmostEqual(p[u'lost'], .05)
+		for i in range(2):
+			# The RMS of the difference of two samples with white noise is
+			# the noise times the square root of two
+			self.assertAlmostEqual(p[u'rms_s2s'][i], .5 * math.sqrt(2), \
+				delta=3 * p[u'rms_s2s_se'][i])
+			self.assertAlmostEqual(p[u'std'][i], .5, delta=3 * p[u'std_se'][i])
+		p = libquality.precision(numpy.array([]), numpy.array([]))
+		self.assertEqual(p[u'steps'], 0)
+		self.assertTrue(numpy.isnan(p[u'rms_s2s']).all())
+
+	def test_accuracy(self):
+
+		x, y = fixation(noise=.5, pos=(503., 296.))
+		a = libquality.accuracy((500, 300), x, y)
+		self.assertAlmostEqual(a[u'offset'][0], 3, delta=3 * \
+			a[u'offset_se'][0])
+		self.assertAlmostEqual(a[u'offset'][1], -4, delta=3 * \
+			a[u'offset_se'][1])
+		self.assertAlmostEqual(a[u'error'], 5, delta=1.5 * a[u'error_ci'])
+		self.assertLess(a[u'error_ci'], .1)
+		a = libquality.accuracy((500, 300), numpy.zeros(5) - 1, \
+			numpy.zeros(5) - 1)
+		self.assertTrue(numpy.isnan(a[u'error']))
+
+	def test_pool(self):
+
+		# Pooling fixations with the same noise gives the same precision as
+		# each of them, with a smaller standard error
+		results = [libquality.precision(*fixation(n=200, noise=.5, \
+			seed=seed)) for seed in range(5)]
+		p = libquality.pool(results)
+		self.assertEqual((p[u'samples'], p[u'steps']), (1000, 995))
+		self.assertEqual(p[u'lost'], 0)
+		for i in range(2):
+			self.assertAlmostEqual(p[u'rms_s2s'][i], .5 * math.sqrt(2), \
+				delta=3 * p[u'rms_s2s_se'][i])
+			self.assertAlmostEqual(p[u'std'][i], .5, delta=3 * p[u'std_se'][i])
+			self.assertLess(p[u'std_se'][i], results[0][u'std_se'][i])
+		# A fixation without gaze doesn't change the pooled precision
+		empty = libquality.precision(numpy.zeros(10) - 1, numpy.zeros(10) - 1)
+		p2 = libquality.pool(results + [empty])
+		self.assertAlmostEqual(p2[u'rms_s2s'][0], p[u'rms_s2s'][0])
+		self.assertAlmostEqual(p2[u'std'][0], p[u'std'][0])
+		self.assertAlmostEqual(p2[u'lost'], 10 / 1010.)
+
+if __name__ == u'__main__':
+	unittest.main()
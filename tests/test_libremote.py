@@ -0,0 +1,124 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import socket
+import time
+import unittest
+
+import numpy
+
+import synthetic
+import libbinocular
+import libemulator
+import libremote
+
+def free_port():
+
+	"""Gets a UDP port that is free on this computer."""
+
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind((u'127.0.0.1', 0))
+	port = sock.getsockname()[1]
+	sock.close()
+	return port
+
+def wait_until(condition, timeout=2.):
+
+	"""Waits until a condition is met, and returns whether it was met."""
+
+	deadline = time.time() + timeout
+	while not condition():
+		if time.time() > deadline:
+			return False
+		time.sleep(.01)
+	return True
+
+class test_round_trip(unittest.TestCase):
+
+	"""A libremote.link that talks to a libemulator.iviewx_emulator."""
+
+	def connect(self, **kwargs):
+
+		sendport = free_port()
+		receiveport = free_port()
+		self.emulator = libemulator.iviewx_emulator(sendport=sendport, \
+			receiveport=receiveport, samplerate=500, **kwargs)
+		self.link = libremote.link(u'127.0.0.1', sendport, receiveport, \
+			libbinocular.eye_buffer())
+		self.assertEqual(self.link.batch([u'ET_FRM "%s"' % \
+			libremote.SAMPLE_FORMAT, u'ET_STR', u'ET_PNG'], [u'ET_PNG']), \
+			[u'ET_PNG'])
+
+	def tearDown(self):
+
+		self.link.stop()
+		self.emulator.stop()
+
+	def test_samples(self):
+
+		self.connect(gaze=libemulator.fixation(100, 200, noise=0))
+		self.assertTrue(wait_until(lambda: self.link.received >= 50))
+		self.assertEqual(self.link.latest[1:], (100, 200, 4))
+		samples = self.link.ring.reader().newest(50)
+		self.assertEqual(len(samples), 50)
+		self.assertTrue((samples[u'x'] == 100).all())
+		self.assertTrue((samples[u'y'] == 200).all())
+		# 500 Hz
+		self.assertAlmostEqual(numpy.median(numpy.diff(samples[u'time'])), 2, \
+			delta=.1)
+		self.assertEqual(self.link.reordered, 0)
+		self.link.send(u'ET_EST')
+		self.assertTrue(wait_until(lambda: not self.emulator.streaming))
+		self.assertEqual(self.emulator.commands[:3], [u'ET_FRM "%s"' % \
+			libremote.SAMPLE_FORMAT, u'ET_STR', u'ET_PNG'])
+
+	def test_commands(self):
+
+		self.connect()
+		self.link.send(u'ET_REM "trial 1"', u'ET_INC')
+		self.assertTrue(wait_until(lambda: self.emulator.trial == 1))
+		self.assertEqual(self.emulator.remarks, [u'trial 1'])
+		# Replies that aren't expected stay in the queue
+		self.link.send(u'ET_VLS', u'ET_PNG')
+		self.assertEqual(self.link.expect(u'ET_PNG', 1.), u'ET_PNG')
+		self.assertTrue(self.link.expect(u'ET_VLS', 1.).startswith( \
+			u'ET_VLS left'))
+		self.assertEqual(self.link.expect(u'ET_VLS', .05), None)
+
+	def test_missing(self):
+
+		# The synthetic trial, with the blink as samples without a pupil
+		t, x, y = synthetic.trial()
+		self.connect(gaze=libemulator.replay([None if x[i] == -1 else \
+			(x[i], y[i], 4.) for i in range(len(t))]))
+		self.assertTrue(wait_until(lambda: self.link.received >= 1000))
+		samples = self.link.ring.reader().newest(1000)
+		lost = (samples[u'x'] == -1) & (samples[u'y'] == -1)
+		self.assertEqual(lost.sum(), 100)
+
+	def test_reorder(self):
+
+		self.connect(gaze=libemulator.fixation(100, 200))
+		self.emulator.set_faults(reorder=.2)
+		self.assertTrue(wait_until(lambda: self.link.reordered >= 10))
+		# Samples that arrive late are dropped, so the ring stays in order
+		samples = self.link.ring.reader().newest(self.link.received)
+		self.assertTrue((numpy.diff(samples[u'time']) > 0).all())
+
+if __name__ == u'__main__':
+	unittest.main()
@@ -0,0 +1,127 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import itertools
+import threading
+import unittest
+
+import synthetic
+import libsampler
+import libshm
+
+class stub_tracker:
+
+	"""A tracker that replays the synthetic trial at its own pace."""
+
+	def __init__(self):
+
+		t, x, y = synthetic.trial()
+		self.samples = itertools.cycle(zip(t, x, y))
+		self.t = 0
+		self.sampler = None
+		self.started = 0
+
+	def _poll(self):
+
+		t, x, y = next(self.samples)
+		self.t += 1
+		return self.t, x, y, 4.
+
+	def start_sampler(self, shm_name=None, capacity=4096):
+
+		self.started += 1
+		self.sampler = libsampler.start(self._poll, shm_name=shm_name, \
+			capacity=capacity, samplerate=1000)
+
+	def stop_sampler(self):
+
+		if self.sampler != None:
+			self.sampler.stop()
+			self.sampler = None
+
+class stub_proxy:
+
+	"""A worker proxy, which only has the reader of a shared-memory ring."""
+
+	def __init__(self, ring):
+
+		self._reader = ring.reader()
+
+class test_reader(unittest.TestCase):
+
+	def test_sampler(self):
+
+		# The sampler is started once, and every consumer gets a reader of
+		# its own
+		tracker = stub_tracker()
+		try:
+			first = libsampler.reader(tracker)
+			second = libsampler.reader(tracker)
+			self.assertEqual(tracker.started, 1)
+			self.assertFalse(first is second)
+			self.assertEqual(first.samplerate, 1000)
+		finally:
+			tracker.stop_sampler()
+
+	def test_proxy(self):
+
+		ring = libshm.gaze_ring(capacity=16)
+		ring.write(1, 100, 200)
+		proxy = stub_proxy(ring)
+		reader = libsampler.reader(proxy)
+		self.assertFalse(reader is proxy._reader)
+		self.assertEqual(reader.sample(), (100., 200.))
+		ring.close()
+
+	def test_no_sampler(self):
+
+		tracker = stub_tracker()
+		tracker.start_sampler = lambda: None
+		self.assertEqual(libsampler.reader(tracker), None)
+
+class test_sampler(unittest.TestCase):
+
+	def test_stop(self):
+
+		# The poll blocks for longer than stop() waits, so the ring must stay
+		# open until the thread exits, and the sample must not be written
+		polling = threading.Event()
+		release = threading.Event()
+		def poll():
+			polling.set()
+			release.wait()
+			return 1, 100, 200, 4.
+		s = libsampler.start(poll, capacity=16)
+		polling.wait(1)
+		s.stop()
+		self.assertTrue(s.is_alive())
+		self.assertNotEqual(s.ring._mm, None)
+		release.set()
+		s.join(1)
+		self.assertFalse(s.is_alive())
+		self.assertEqual(s.latest, None)
+		self.assertEqual(s.ring._mm, None)
+
+	def test_stop_unstarted(self):
+
+		s = libsampler.sampler(lambda: None, libshm.gaze_ring(capacity=16))
+		s.stop()
+		self.assertEqual(s.ring._mm, None)
+
+if __name__ == u'__main__':
+	unittest.main()
@@ -0,0 +1,95 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import unittest
+
+import numpy
+
+import synthetic
+import libshm
+
+class test_gaze_ring(unittest.TestCase):
+
+	def test_newest(self):
+
+		ring = libshm.gaze_ring(capacity=16, samplerate=500)
+		reader = ring.reader()
+		self.assertEqual(reader.sample(), (-1, -1))
+		self.assertEqual(len(reader.newest(4)), 0)
+		for i in range(40):
+			ring.write(i, 10 * i, 20 * i, 3)
+		self.assertEqual(reader.count, 40)
+		self.assertEqual(reader.samplerate, 500)
+		self.assertEqual(reader.sample(), (390., 780.))
+		samples = reader.newest(5)
+		self.assertEqual(samples[u'time'].tolist(), range(35, 40))
+		self.assertEqual(samples[u'pupil'].tolist(), [3] * 5)
+		# Never more than three quarters of the capacity
+		self.assertEqual(len(reader.newest(100)), 12)
+		ring.close()
+
+	def test_since(self):
+
+		ring = libshm.gaze_ring(capacity=16)
+		reader = ring.reader()
+		out = numpy.empty(16, dtype=libshm.sample_dtype)
+		count = 0
+		times = []
+		t, x, y = synthetic.trial()
+		for i in range(100):
+			ring.write(t[i], x[i], y[i])
+			if i % 5 == 4:
+				samples, count = reader.since(count, out)
+				times += samples[u'time'].tolist()
+		# A reader that keeps up gets every sample exactly once
+		self.assertEqual(times, t[:100].tolist())
+		self.assertEqual(reader.dropped, 0)
+		samples, count = reader.since(count)
+		self.assertEqual((len(samples), count), (0, 100))
+		# A reader that falls behind gets the newest samples, and counts the
+		# samples that it skipped
+		for i in range(40):
+			ring.write(100 + i, 0, 0)
+		samples, count = reader.since(count)
+		self.assertEqual(count, 140)
+		self.assertEqual(samples[u'time'].tolist(), range(128, 140))
+		self.assertEqual(reader.dropped, 28)
+		ring.close()
+
+	def test_named(self):
+
+		name = u'osgaze-test-%d' % os.getpid()
+		ring = libshm.gaze_ring(name, capacity=32, samplerate=1000)
+		try:
+			for i in range(10):
+				ring.write(i, i, 2 * i)
+			reader = libshm.gaze_reader(name)
+			self.assertEqual(reader.capacity, 32)
+			self.assertEqual(reader.samplerate, 1000)
+			self.assertEqual(reader.count, 10)
+			self.assertEqual(reader.sample(), (9., 18.))
+			ring.write(10, 100, 200)
+			self.assertEqual(reader.sample(), (100., 200.))
+			reader.close()
+		finally:
+			ring.close()
+		self.assertRaises(Exception, libshm.gaze_reader, name)
+
+if __name__ == u'__main__':
+	unittest.main()
@@ -0,0 +1,147 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import synthetic
+import libgeometry
+import libshm
+import libstate
+
+class stub_aoi:
+
+	def __init__(self, name):
+
+		self.name = name
+
+class stub_index:
+
+	"""An AOI index with a left and a right half of the display."""
+
+	def __init__(self):
+
+		self.aois = [stub_aoi(u'left'), stub_aoi(u'right')]
+
+	def hit(self, x, y):
+
+		return self.aois[0] if x < 512 else self.aois[1]
+
+class test_trial_summary(unittest.TestCase):
+
+	def test_empty(self):
+
+		s = libstate.trial_summary(0).summary()
+		self.assertEqual(s[u'fixations'], 0)
+		self.assertEqual(s[u'fixation_mean'], None)
+		self.assertEqual(s[u'saccade_amplitude_mean'], None)
+		self.assertEqual(s[u'dwell'], [])
+
+	def test_events(self):
+
+		trial = libstate.trial_summary(100, aois=stub_index())
+		# Only the part of a fixation after the start of the trial counts
+		trial.fixation(50, 200, 300, 400)
+		trial.fixation(250, 550, 700, 400)
+		trial.saccade(200, 240, 10.)
+		trial.saccade(550, 570, 2.)
+		trial.blink(600, 700)
+		s = trial.summary()
+		self.assertEqual(s[u'fixations'], 2)
+		self.assertEqual(s[u'fixation_mean'], 200)
+		self.assertEqual(s[u'saccades'], 2)
+		self.assertEqual(s[u'saccade_amplitude_mean'], 6)
+		self.assertEqual(s[u'saccade_duration_mean'], 30)
+		self.assertEqual(s[u'blinks'], 1)
+		self.assertEqual(s[u'blink_duration'], 100)
+		self.assertEqual(s[u'dwell'], [(u'left', 100), (u'right', 300)])
+
+	def test_before_start(self):
+
+		trial = libstate.trial_summary(100)
+		trial.fixation(0, 100, 300, 400)
+		self.assertEqual(trial.summary()[u'fixations'], 0)
+
+class test_gaze_state(unittest.TestCase):
+
+	def setUp(self):
+
+		self.ring = libshm.gaze_ring(capacity=4096, samplerate=1000)
+		self.geometry = libgeometry.screen_geometry((1024, 768), (40., 30.))
+		# The noise of the synthetic trial exceeds the default threshold at
+		# 1000 Hz
+		self.state = libstate.gaze_state(self.ring.reader(), self.geometry, \
+			velocity_threshold=100)
+		self.t, self.x, self.y = synthetic.trial()
+
+	def tearDown(self):
+
+		self.state.stop()
+		self.ring.close()
+
+	def write(self, start, end):
+
+		for i in range(start, end):
+			self.ring.write(self.t[i], self.x[i], self.y[i])
+		self.state.pump()
+
+	def test_snapshot(self):
+
+		self.assertEqual(self.state.get(u'state'), u'unknown')
+		self.assertEqual(self.state.get(u'fixation_x'), None)
+		self.write(0, int(synthetic.SACCADE_START))
+		before = self.state.snapshot
+		self.assertEqual(before[u'state'], u'fixation')
+		self.assertAlmostEqual(before[u'fixation_x'], 300, delta=1)
+		self.write(int(synthetic.SACCADE_START), synthetic.BLINK_START + 50)
+		# A snapshot is never changed after it has been published
+		self.assertEqual(before[u'saccades'], 0)
+		self.assertEqual(self.state.get(u'state'), u'blink')
+		self.assertEqual(self.state.get(u'blinking'), u'yes')
+		self.assertEqual(self.state.get(u'saccades'), 1)
+		self.assertAlmostEqual(self.state.get(u'saccade_amplitude'), \
+			self.geometry.pix2deg(400), delta=.5)
+		self.assertAlmostEqual(self.state.get(u'saccade_end_x'), 700, \
+			delta=10)
+		# The fixation fields keep describing the last fixation
+		self.assertAlmostEqual(self.state.get(u'fixation_x'), 700, delta=1)
+
+	def test_trial(self):
+
+		self.assertEqual(self.state.stop_trial(), None)
+		self.write(0, 200)
+		self.state.start_trial(aois=stub_index())
+		self.write(200, len(self.t))
+		s = self.state.stop_trial()
+		self.assertEqual(self.state.trial, None)
+		self.assertEqual(s[u'saccades'], 1)
+		self.assertAlmostEqual(s[u'saccade_duration_mean'], \
+			synthetic.SACCADE_DURATION, delta=15)
+		self.assertEqual(s[u'blinks'], 1)
+		self.assertEqual(s[u'blink_duration'], \
+			synthetic.BLINK_END - synthetic.BLINK_START)
+		# The fixation that started before the trial, the one before the
+		# blink, and the one that is still going on
+		self.assertEqual(s[u'fixations'], 3)
+		dwell = dict(s[u'dwell'])
+		self.assertAlmostEqual(dwell[u'left'], synthetic.SACCADE_START - \
+			200, delta=15)
+		self.assertAlmostEqual(dwell[u'left'] + dwell[u'right'], \
+			s[u'fixations'] * s[u'fixation_mean'])
+
+if __name__ == u'__main__':
+	unittest.main()
@@ -0,0 +1,106 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import synthetic
+import libwait
+
+class fake_clock:
+
+	"""A clock that only advances when told to."""
+
+	def __init__(self):
+
+		self.now = 0.
+
+	def __call__(self):
+
+		return self.now
+
+class test_wait(unittest.TestCase):
+
+	def test_wait_until(self):
+
+		deadline = libwait.clock() + .005
+		self.assertTrue(libwait.wait_until(deadline) >= deadline)
+		# A deadline in the past returns immediately
+		now = libwait.clock()
+		self.assertTrue(libwait.wait_until(now - 1) >= now)
+
+	def test_sleep(self):
+
+		t0 = libwait.clock()
+		libwait.sleep(5)
+		self.assertTrue(libwait.clock() - t0 >= .005)
+
+class test_pacer(unittest.TestCase):
+
+	def setUp(self):
+
+		self.clock = libwait.clock
+
+	def tearDown(self):
+
+		libwait.clock = self.clock
+
+	def test_wait(self):
+
+		pace = libwait.pacer(500)
+		# Before the first sample, the pacer doesn't sleep
+		pace.wait()
+		self.assertEqual(pace.wakeups, 0)
+		pace.update()
+		pace.wait()
+		self.assertTrue(libwait.clock() >= pace.arrival + pace.lead * \
+			pace.period)
+		s = pace.stats()
+		self.assertEqual(s[u'samples'], 1)
+		self.assertEqual(s[u'polls'], 2)
+		self.assertEqual(s[u'wakeups'], 1)
+		self.assertTrue(s[u'max_error'] >= s[u'mean_error'] >= 0)
+
+	def test_period(self):
+
+		# Without a sampling rate, the period converges to the intervals
+		# between the samples
+		libwait.clock = clock = fake_clock()
+		pace = libwait.pacer()
+		for i in range(200):
+			pace.update()
+			clock.now += .004
+		self.assertAlmostEqual(pace.period, .004, places=5)
+		# A sampling rate is not changed by the samples
+		pace = libwait.pacer(1000)
+		for i in range(10):
+			pace.update()
+			clock.now += .004
+		self.assertEqual(pace.period, .001)
+
+	def test_poll(self):
+
+		pace = libwait.pacer(1000)
+		samples = iter([(1, 2), (1, 2), (3, 4)])
+		for i in range(3):
+			pace.poll(lambda: next(samples))
+		# A sample is only new if it differs from the previous one
+		self.assertEqual(pace.samples, 2)
+		self.assertEqual(pace.polls, 3)
+
+if __name__ == u'__main__':
+	unittest.main()